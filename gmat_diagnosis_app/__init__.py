@@ -1 +1,7 @@
- 
\ No newline at end of file
+import pandas as pd
+
+# Copy-on-write for the whole app (the default from pandas 3.0): filtered frames
+# and shallow copies share memory until one side is modified, so the analysis
+# pipeline does not need defensive deep copies of the per-session data.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
@@ -35,13 +35,13 @@ def run_diagnosis(df_final_for_diagnosis, time_pressure_map):
         # Pre-calculate V average times if V is present
         v_avg_time_per_type = {}
         if 'V' in SUBJECTS:
-            df_v_temp = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == 'V'].copy()
+            df_v_temp = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == 'V']
             if not df_v_temp.empty and 'question_time' in df_v_temp.columns and 'question_type' in df_v_temp.columns:
                 df_v_temp.loc[:, 'question_time'] = pd.to_numeric(df_v_temp['question_time'], errors='coerce')
                 v_avg_time_per_type = df_v_temp.dropna(subset=['question_time']).groupby('question_type')['question_time'].mean().to_dict()
 
         for subject in SUBJECTS:
-            df_subj = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == subject].copy()
+            df_subj = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == subject]
             time_pressure = time_pressure_map.get(subject, False)
             subj_results, subj_report, df_subj_diagnosed = None, None, None
 
@@ -51,7 +51,7 @@ def run_diagnosis(df_final_for_diagnosis, time_pressure_map):
                 elif subject == 'DI':
                     # Corrected: Filter df_subj from df_final_for_diagnosis, not st.session_state.processed_df for current run
                     if df_final_for_diagnosis is not None and 'DI' in df_final_for_diagnosis['Subject'].unique(): # Check if DI data exists in the current prepared data
-                        df_di_for_diag = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == 'DI'].copy()
+                        df_di_for_diag = df_final_for_diagnosis[df_final_for_diagnosis['Subject'] == 'DI']
                         # Enhanced Debugging for df_di_for_diag before calling run_di_diagnosis_logic
                         if 'msr_group_total_time' not in df_di_for_diag.columns:
                             pass # Logged error, DI diagnosis might fail or produce incorrect results
@@ -85,7 +85,7 @@ def run_simulation(df_input_for_sim):
                 continue
 
             # Filter valid responses for later difficulty assignment
-            valid_responses = user_df_subj[~user_df_subj['is_invalid']].copy()
+            valid_responses = user_df_subj[~user_df_subj['is_invalid']]
             if valid_responses.empty:
                 st.warning(f"  {subject}: 所有題目均被標記為無效，Theta 模擬仍基於完整序列。", icon="⚠️")
 
@@ -153,7 +153,7 @@ def prepare_dataframes_for_diagnosis(all_simulation_histories, final_thetas,
     
     try:
         for subject in SUBJECTS:
-            user_df_subj = df_combined_input_with_invalids[df_combined_input_with_invalids['Subject'] == subject].copy()
+            user_df_subj = df_combined_input_with_invalids[df_combined_input_with_invalids['Subject'] == subject]
             sim_history_df = all_simulation_histories.get(subject)
             final_theta = final_thetas.get(subject)
 
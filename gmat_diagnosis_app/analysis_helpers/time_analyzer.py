@@ -6,6 +6,16 @@ from gmat_diagnosis_app.constants.thresholds import THRESHOLDS # Import THRESHOL
 import logging # Re-added import
 from gmat_diagnosis_app.constants.config import RC_GROUP_TARGET_TIME_ADJUSTMENT # 修改為絕對導入路徑
 
+def _first_in_group(df_group_rows, group_col, value_col):
+    """
+    Value of value_col on the first row of each group, aligned to the rows of df_group_rows.
+
+    Unlike groupby().first(), a missing value on the first row is kept rather than skipped.
+    """
+    first_rows = df_group_rows.groupby(group_col, sort=False).head(1)
+    first_values = pd.Series(first_rows[value_col].to_numpy(), index=first_rows[group_col].to_numpy())
+    return df_group_rows[group_col].map(first_values)
+
 def _calculate_overtime_q(df_q, pressure, thresholds):
     """Calculates overtime mask for Q section."""
     threshold = thresholds['OVERTIME_PRESSURE'] if pressure else thresholds['OVERTIME_NO_PRESSURE']
@@ -30,17 +40,11 @@ def _calculate_overtime_di(df_di, pressure, thresholds):
     # --- MSR Group Overtime --- 
     msr_group_overtime = pd.Series(False, index=df_di.index)
     if 'msr_group_id' in df_di.columns and 'msr_group_total_time' in df_di.columns:
-        # Iterate over unique group_ids for MSR questions to apply group logic once per group
-        unique_msr_groups = df_di.loc[(df_di['question_type'] == 'MSR') & (df_di['msr_group_id'].notna()), 'msr_group_id'].unique()
-        for group_id in unique_msr_groups:
-            group_data = df_di[(df_di['msr_group_id'] == group_id) & (df_di['question_type'] == 'MSR')]
-            if group_data.empty: continue
-
-            actual_group_total_time = group_data['msr_group_total_time'].iloc[0] # Assuming consistent within group post-preprocessing
-            target_time_for_group = msr_target_times.get('pressure' if pressure else 'no_pressure', 6.0 if pressure else 7.0) # Default from DI Doc
-
-            if actual_group_total_time > target_time_for_group:
-                msr_group_overtime.loc[group_data.index] = True
+        # Group total of each MSR group, taken from its first question (consistent within group post-preprocessing)
+        msr_group_rows = df_di[(df_di['question_type'] == 'MSR') & df_di['msr_group_id'].notna()]
+        actual_group_total_time = _first_in_group(msr_group_rows, 'msr_group_id', 'msr_group_total_time')
+        target_time_for_group = msr_target_times.get('pressure' if pressure else 'no_pressure', 6.0 if pressure else 7.0) # Default from DI Doc
+        msr_group_overtime.loc[actual_group_total_time.index[actual_group_total_time > target_time_for_group]] = True
     else:
         warnings.warn("DI overtime: Missing 'msr_group_id' or 'msr_group_total_time' column. Cannot calculate MSR group overtime.", UserWarning, stacklevel=3)
 
@@ -122,67 +126,51 @@ def _calculate_overtime_v(df_v, pressure, thresholds):
         first_q_rc_mask = rc_mask & df_v['rc_group_id'].notna() & (df_v['rc_reading_time'] != 0)      
         df_v.loc[first_q_rc_mask, 'adjusted_rc_time'] = df_v.loc[first_q_rc_mask, 'q_time_numeric'] - df_v.loc[first_q_rc_mask, 'rc_reading_time']
         
-        # 針對每個RC組進行評估
-        unique_rc_groups = df_v.loc[rc_mask & df_v['rc_group_id'].notna(), 'rc_group_id'].unique()
-        for group_id in unique_rc_groups:
-            group_data = df_v[(df_v['rc_group_id'] == group_id) & rc_mask]
-            if group_data.empty: continue
-
-            num_questions_in_group = group_data['rc_group_num_questions'].iloc[0]
-            group_total_time = group_data['rc_group_total_time'].iloc[0]
-            
-            target_key = f"{int(num_questions_in_group)}Q" if num_questions_in_group in [3,4] else None
-            if target_key and target_key in rc_group_targets:
-                group_target_times = rc_group_targets[target_key]
-                target_time_for_group = group_target_times['pressure'] if pressure else group_target_times['no_pressure']
-                
-                # 方案四：根據整組表現分類
-                if group_total_time <= target_time_for_group:
-                    # 整組表現良好
-                    df_v.loc[group_data.index, 'rc_group_performance'] = RC_GROUP_PERFORMANCE_CATEGORIES['GOOD']
-                    
-                    # 使用更寬容的單題標準
-                    adjusted_ind_threshold = rc_ind_threshold + RC_INDIVIDUAL_TOLERANCE_WHEN_GROUP_GOOD
-                    is_rc_ind_overtime = (df_v.loc[group_data.index, 'adjusted_rc_time'] > adjusted_ind_threshold).fillna(False)
-                    overtime_mask.loc[group_data.index[is_rc_ind_overtime]] = True
-                    
-                    # 標記單題寬容度資訊
-                    df_v.loc[group_data.index, 'rc_tolerance_applied'] = True
-                    
-                elif group_total_time <= (target_time_for_group + RC_GROUP_TARGET_TIME_ADJUSTMENT):
-                    # 整組表現尚可
-                    df_v.loc[group_data.index, 'rc_group_performance'] = RC_GROUP_PERFORMANCE_CATEGORIES['ACCEPTABLE']
-                    
-                    # 使用標準閾值判斷單題
-                    is_rc_ind_overtime = (df_v.loc[group_data.index, 'adjusted_rc_time'] > rc_ind_threshold).fillna(False)
-                    overtime_mask.loc[group_data.index[is_rc_ind_overtime]] = True
-                    
-                    # 標記未應用寬容度
-                    df_v.loc[group_data.index, 'rc_tolerance_applied'] = False
-                    
-                else:
-                    # 整組表現不佳
-                    df_v.loc[group_data.index, 'rc_group_performance'] = RC_GROUP_PERFORMANCE_CATEGORIES['POOR']
-                    
-                    # 整組標記為overtime
-                    overtime_mask.loc[group_data.index] = True
-                    
-                    # 標記未應用寬容度
-                    df_v.loc[group_data.index, 'rc_tolerance_applied'] = False
-                    
-                    # 標識"元兇"（超時最嚴重的題目）
-                    time_deviations = df_v.loc[group_data.index, 'adjusted_rc_time'] - rc_ind_threshold
-                    time_deviations = time_deviations.fillna(0)
-                    if not time_deviations.empty:
-                        # 至少標記一個元兇（如果有超時的話）
-                        culprits = time_deviations[time_deviations > 0]
-                        if not culprits.empty:
-                            worst_offenders = culprits.nlargest(min(2, len(culprits))).index
-                            df_v.loc[worst_offenders, 'rc_overtime_culprit'] = True
-                            
-                            # 標記嚴重元兇（超時超過1分鐘）
-                            severe_offenders = time_deviations[time_deviations > 1.0].index
-                            df_v.loc[severe_offenders, 'rc_severe_overtime_culprit'] = True
+        # 每個RC組的題數與總時間取自組內第一題，整組一次評估
+        rc_group_rows = df_v[rc_mask & df_v['rc_group_id'].notna()]
+        num_questions_in_group = _first_in_group(rc_group_rows, 'rc_group_id', 'rc_group_num_questions')
+        group_total_time = _first_in_group(rc_group_rows, 'rc_group_id', 'rc_group_total_time')
+
+        # 只有3題或4題且有目標時間的組才評估
+        target_time_by_size = {
+            num_q: rc_group_targets[f"{num_q}Q"]['pressure' if pressure else 'no_pressure']
+            for num_q in (3, 4) if f"{num_q}Q" in rc_group_targets
+        }
+        target_time_for_group = num_questions_in_group.map(target_time_by_size)
+        has_target = target_time_for_group.notna()
+        group_index = rc_group_rows.index[has_target]
+        target_time_for_group = target_time_for_group[has_target]
+        group_total_time = group_total_time[has_target]
+
+        if not group_index.empty:
+            # 方案四：根據整組表現分類（總時間缺失時視為不佳）
+            is_good = group_total_time <= target_time_for_group
+            is_acceptable = ~is_good & (group_total_time <= target_time_for_group + RC_GROUP_TARGET_TIME_ADJUSTMENT)
+            is_poor = ~is_good & ~is_acceptable
+            performance = pd.Series(RC_GROUP_PERFORMANCE_CATEGORIES['POOR'], index=group_index)
+            performance[is_acceptable] = RC_GROUP_PERFORMANCE_CATEGORIES['ACCEPTABLE']
+            performance[is_good] = RC_GROUP_PERFORMANCE_CATEGORIES['GOOD']
+            df_v.loc[group_index, 'rc_group_performance'] = performance
+
+            # 良好組使用更寬容的單題標準，尚可組使用標準閾值，不佳組整組標記為overtime
+            adjusted_rc_time = df_v.loc[group_index, 'adjusted_rc_time']
+            ind_threshold = pd.Series(float(rc_ind_threshold), index=group_index)
+            ind_threshold[is_good] = rc_ind_threshold + RC_INDIVIDUAL_TOLERANCE_WHEN_GROUP_GOOD
+            is_rc_overtime = is_poor | (adjusted_rc_time > ind_threshold).fillna(False)
+            overtime_mask.loc[group_index[is_rc_overtime.to_numpy()]] = True
+
+            # 標記單題寬容度資訊
+            df_v.loc[group_index, 'rc_tolerance_applied'] = is_good
+
+            # 不佳組標識"元兇"：每組超時最嚴重的至多兩題（同分時取較前者）
+            time_deviations = (adjusted_rc_time[is_poor] - rc_ind_threshold).fillna(0)
+            culprits = time_deviations[time_deviations > 0]
+            if not culprits.empty:
+                culprit_rank = culprits.groupby(rc_group_rows.loc[culprits.index, 'rc_group_id'], sort=False).rank(method='first', ascending=False)
+                df_v.loc[culprit_rank.index[culprit_rank <= 2], 'rc_overtime_culprit'] = True
+
+                # 標記嚴重元兇（超時超過1分鐘）
+                df_v.loc[time_deviations.index[time_deviations > 1.0], 'rc_severe_overtime_culprit'] = True
 
     # 保留這些列以供診斷使用
     cols_to_keep = ['rc_group_performance', 'rc_tolerance_applied', 'rc_overtime_culprit', 'rc_severe_overtime_culprit', 'adjusted_rc_time']
@@ -236,7 +224,7 @@ def calculate_overtime(df, time_pressure_status_map):
         if not subject_mask.any():
             continue
 
-        df_subj = df[subject_mask].copy() # Work on a copy for this section
+        df_subj = df[subject_mask] # Filtering returns a new frame (copy-on-write)
         pressure = time_pressure_status_map.get(subject, False)
         subj_thresholds = THRESHOLDS.get(subject)
 
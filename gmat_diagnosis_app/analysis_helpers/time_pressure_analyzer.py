@@ -11,6 +11,76 @@ import streamlit as st
 
 from gmat_diagnosis_app.constants.thresholds import THRESHOLDS
 
+# Time-pressure parameters: (THRESHOLDS key, older key some subjects use instead, default).
+# A subject without either key uses the Q value, then the default.
+TIME_PRESSURE_PARAMS = {
+    'time_diff_pressure': ('TIME_DIFF_PRESSURE', 'TIME_PRESSURE_DIFF_MIN', 3.0),
+    'last_third_fraction': ('LAST_THIRD_FRACTION', None, 2/3),
+    'fast_end_min': ('INVALID_FAST_END_MIN', 'INVALID_HASTY_MIN', 1.0),
+}
+
+# Slack (minutes) for the float rounding of summed question times when they are
+# compared with a threshold, so the verdict does not depend on the summation order
+TIME_SUM_TOLERANCE = 1e-9
+
+def _time_pressure_params(thresholds):
+    """Resolves the time-pressure parameters of every subject in thresholds into a DataFrame indexed by subject."""
+    fallback = thresholds.get('Q', {})
+    params = {}
+    for subject, subject_thresholds in thresholds.items():
+        subject_params = {'max_allowed_time': subject_thresholds['MAX_ALLOWED_TIME']}
+        for name, (key, older_key, default) in TIME_PRESSURE_PARAMS.items():
+            candidates = [subject_thresholds.get(key), subject_thresholds.get(older_key) if older_key else None, fallback.get(key)]
+            subject_params[name] = next((value for value in candidates if value is not None), default)
+        params[subject] = subject_params
+    return pd.DataFrame.from_dict(params, orient='index')
+
+def compute_time_pressure(df, thresholds=THRESHOLDS, group_keys=('Subject',)):
+    """
+    Time-pressure verdict of every section in one pass.
+
+    A section is under time pressure when its total time leaves at most
+    TIME_DIFF_PRESSURE minutes of MAX_ALLOWED_TIME unused and at least one
+    question in the last third (by question_position) took less than
+    INVALID_FAST_END_MIN minutes.
+
+    Args:
+        df (pd.DataFrame): Question rows with 'Subject', 'question_time' and 'question_position'.
+        thresholds (dict): Thresholds by subject (THRESHOLDS); other subjects are ignored.
+        group_keys (tuple): Columns identifying a section, e.g. ('student_id', 'Subject')
+            for a frame holding several students.
+
+    Returns:
+        pd.DataFrame: One row per section (indexed by group_keys) with total_time,
+        time_diff, time_diff_check, fast_end_questions and time_pressure.
+    """
+    keys = list(group_keys)
+    params = _time_pressure_params(thresholds)
+    in_scope = df['Subject'].isin(params.index)
+    frame = df.loc[in_scope, keys].assign(
+        question_time=pd.to_numeric(df.loc[in_scope, 'question_time'], errors='coerce'),
+        question_position=pd.to_numeric(df.loc[in_scope, 'question_position'], errors='coerce'),
+    )
+
+    # Total time over every row of the section
+    total_time = frame.groupby(keys, sort=False)['question_time'].sum()
+    result = total_time.to_frame('total_time')
+    section_params = params.reindex(result.index.get_level_values('Subject'))
+    result['time_diff'] = section_params['max_allowed_time'].to_numpy() - result['total_time']
+    result['time_diff_check'] = result['time_diff'] <= section_params['time_diff_pressure'].to_numpy() + TIME_SUM_TOLERANCE
+
+    # Last third of the questions with a position, in position order (one sorted pass)
+    ordered = frame.dropna(subset=['question_position']).sort_values(keys + ['question_position'], kind='mergesort')
+    grouped = ordered.groupby(keys, sort=False)
+    rank = grouped.cumcount()
+    last_third_start = (grouped['question_position'].transform('size')
+                        * ordered['Subject'].map(params['last_third_fraction'])).astype(int)
+    fast_end = (rank >= last_third_start) & (ordered['question_time'] < ordered['Subject'].map(params['fast_end_min']))
+    result['fast_end_questions'] = fast_end.groupby([ordered[key] for key in keys], sort=False).any().reindex(result.index, fill_value=False).astype(bool)
+
+    result['time_pressure'] = result['time_diff_check'] & result['fast_end_questions']
+    return result
+
 def calculate_time_pressure(df_combined_input):
     """
     Calculate time pressure for each subject.
@@ -23,84 +93,9 @@ def calculate_time_pressure(df_combined_input):
         bool: Success status of the operation.
     """
     try:
-        time_pressure_map = {}
-        
-        q_total_time = pd.to_numeric(df_combined_input.loc[df_combined_input['Subject'] == 'Q', 'question_time'], errors='coerce').sum()
-        v_total_time = pd.to_numeric(df_combined_input.loc[df_combined_input['Subject'] == 'V', 'question_time'], errors='coerce').sum()
-        di_total_time = pd.to_numeric(df_combined_input.loc[df_combined_input['Subject'] == 'DI', 'question_time'], errors='coerce').sum()
-
-        # --- Q Time Pressure Calculation ---
-        q_df = df_combined_input[df_combined_input['Subject'] == 'Q'].copy()
-        q_df['question_time'] = pd.to_numeric(q_df['question_time'], errors='coerce')
-        q_df['question_position'] = pd.to_numeric(q_df['question_position'], errors='coerce')
-        q_df = q_df.sort_values('question_position').dropna(subset=['question_position'])
-
-        time_diff_q = THRESHOLDS['Q']['MAX_ALLOWED_TIME'] - q_total_time
-        time_diff_check = time_diff_q <= THRESHOLDS['Q']['TIME_DIFF_PRESSURE']
-
-        fast_end_questions_exist_q = False
-        if not q_df.empty:
-            total_q_questions = len(q_df)
-            last_third_start_index_q = int(total_q_questions * THRESHOLDS['Q']['LAST_THIRD_FRACTION'])
-            last_third_q_df = q_df.iloc[last_third_start_index_q:]
-            if not last_third_q_df.empty:
-                comparison_series_q = (last_third_q_df['question_time'] < THRESHOLDS['Q']['INVALID_FAST_END_MIN'])
-                if hasattr(comparison_series_q, 'any') and callable(comparison_series_q.any):
-                    fast_end_questions_exist_q = comparison_series_q.any()
-
-        time_pressure_q = time_diff_check and fast_end_questions_exist_q
-
-        # --- V Time Pressure Calculation (Corrected Logic) ---
-        v_df = df_combined_input[df_combined_input['Subject'] == 'V'].copy()
-        v_df['question_time'] = pd.to_numeric(v_df['question_time'], errors='coerce')
-        v_df['question_position'] = pd.to_numeric(v_df['question_position'], errors='coerce')
-        v_df = v_df.sort_values('question_position').dropna(subset=['question_position'])
-        
-        time_diff_v = THRESHOLDS['V']['MAX_ALLOWED_TIME'] - v_total_time
-        v_time_diff_pressure_threshold = THRESHOLDS['V'].get('TIME_DIFF_PRESSURE', THRESHOLDS['Q'].get('TIME_DIFF_PRESSURE', 3.0))
-        v_last_third_fraction = THRESHOLDS['V'].get('LAST_THIRD_FRACTION', THRESHOLDS['Q'].get('LAST_THIRD_FRACTION', 2/3))
-        v_invalid_fast_end_min = THRESHOLDS['V'].get('INVALID_FAST_END_MIN', THRESHOLDS['V'].get('INVALID_HASTY_MIN', 1.0))
-
-        time_diff_check_v = time_diff_v <= v_time_diff_pressure_threshold
-        fast_end_questions_exist_v = False
-        if not v_df.empty:
-            total_v_questions = len(v_df)
-            if total_v_questions > 0:
-                last_third_start_index_v = int(total_v_questions * v_last_third_fraction)
-                last_third_v_df = v_df.iloc[last_third_start_index_v:]
-                if not last_third_v_df.empty:
-                    comparison_series_v = (last_third_v_df['question_time'] < v_invalid_fast_end_min)
-                    if hasattr(comparison_series_v, 'any') and callable(comparison_series_v.any):
-                        fast_end_questions_exist_v = comparison_series_v.any()
-
-        time_pressure_v = time_diff_check_v and fast_end_questions_exist_v
-
-        # --- DI Time Pressure Calculation (Corrected Logic - similar to Q/V) ---
-        di_df = df_combined_input[df_combined_input['Subject'] == 'DI'].copy()
-        di_df['question_time'] = pd.to_numeric(di_df['question_time'], errors='coerce')
-        di_df['question_position'] = pd.to_numeric(di_df['question_position'], errors='coerce')
-        di_df = di_df.sort_values('question_position').dropna(subset=['question_position'])
-
-        time_diff_di = THRESHOLDS['DI']['MAX_ALLOWED_TIME'] - di_total_time
-        di_time_diff_pressure_threshold = THRESHOLDS['DI'].get('TIME_DIFF_PRESSURE', THRESHOLDS['DI'].get('TIME_PRESSURE_DIFF_MIN', 3.0))
-        di_last_third_fraction = THRESHOLDS['DI'].get('LAST_THIRD_FRACTION', THRESHOLDS['Q'].get('LAST_THIRD_FRACTION', 2/3))
-        di_invalid_fast_end_min = THRESHOLDS['DI'].get('INVALID_FAST_END_MIN', 1.0)
-
-        time_diff_check_di = time_diff_di <= di_time_diff_pressure_threshold
-        fast_end_questions_exist_di = False
-        if not di_df.empty:
-            total_di_questions = len(di_df)
-            if total_di_questions > 0:
-                last_third_start_index_di = int(total_di_questions * di_last_third_fraction)
-                last_third_di_df = di_df.iloc[last_third_start_index_di:]
-                if not last_third_di_df.empty:
-                    comparison_series_di = (last_third_di_df['question_time'] < di_invalid_fast_end_min)
-                    if hasattr(comparison_series_di, 'any') and callable(comparison_series_di.any):
-                        fast_end_questions_exist_di = comparison_series_di.any()
-
-        time_pressure_di = time_diff_check_di and fast_end_questions_exist_di
-
-        time_pressure_map = {'Q': time_pressure_q, 'V': time_pressure_v, 'DI': time_pressure_di}
+        section_pressure = compute_time_pressure(df_combined_input, THRESHOLDS)['time_pressure']
+        # Subjects without questions are never under time pressure
+        time_pressure_map = {subject: bool(section_pressure.get(subject, False)) for subject in ['Q', 'V', 'DI']}
         return time_pressure_map, True
         
     except Exception as e:
@@ -109,6 +104,25 @@ def calculate_time_pressure(df_combined_input):
             st.error(f"計算時間壓力時出錯: {e}")
         return {}, False
 
+# Group rule of calculate_and_apply_invalid_logic by subject: (group id column, question type)
+GROUP_INVALID_RULES = {
+    'V': ('rc_group_id', 'Reading Comprehension'),
+    'DI': ('msr_group_id', 'MSR'),
+}
+
+def _fast_group_ids(df, group_col, ft_avg_group_time):
+    """
+    Ids of the groups whose total time is below half of ft_avg_group_time per question.
+    Totals and counts cover every row of df with the id and are computed once per group.
+    """
+    if not (pd.notna(ft_avg_group_time) and ft_avg_group_time > 0):
+        return []
+    group_ids = df[group_col]
+    times = pd.to_numeric(df['question_time'], errors='coerce').groupby(group_ids, sort=False)
+    group_total_time = times.sum()
+    num_q_in_group = times.size()
+    return group_total_time.index[group_total_time < ft_avg_group_time * num_q_in_group * 0.5 - TIME_SUM_TOLERANCE]
+
 def calculate_and_apply_invalid_logic(df_input, time_pressure_map_param, subject_thresholds_param):
     """
     Calculate invalid markers for questions under time pressure.
@@ -121,7 +135,8 @@ def calculate_and_apply_invalid_logic(df_input, time_pressure_map_param, subject
     Returns:
         tuple: (DataFrame with invalids, avg times dict, first third avg times dict)
     """
-    df_output = df_input.copy()
+    # Lazy copy (copy-on-write): df_input is left untouched by the updates below
+    df_output = df_input.copy(deep=False)
     if 'is_invalid' not in df_output.columns:
         df_output['is_invalid'] = False
     else:
@@ -137,7 +152,7 @@ def calculate_and_apply_invalid_logic(df_input, time_pressure_map_param, subject
             calculated_ft_avg_times[subject_code] = {}
             continue
 
-        current_subj_df = df_output[subj_df_mask].copy()
+        current_subj_df = df_output[subj_df_mask]
         current_subj_df['question_time'] = pd.to_numeric(current_subj_df['question_time'], errors='coerce')
         current_subj_df['question_position'] = pd.to_numeric(current_subj_df['question_position'], errors='coerce')
         current_subj_df = current_subj_df.sort_values('question_position').reset_index(drop=True)
@@ -162,79 +177,34 @@ def calculate_and_apply_invalid_logic(df_input, time_pressure_map_param, subject
             last_third_fraction = subject_thresholds_param.get(subject_code, {}).get('LAST_THIRD_FRACTION', subject_thresholds_param['Q']['LAST_THIRD_FRACTION'])
             last_third_start_index = int(total_questions_subj * last_third_fraction)
             
-            original_indices_to_check = df_output[subj_df_mask].iloc[last_third_start_index:].index
-
-            for original_idx in original_indices_to_check:
-                row = df_output.loc[original_idx]
-                q_time = pd.to_numeric(row['question_time'], errors='coerce')
-                q_type = row['question_type']
-                
-                ft_avg_time_for_q_type = ft_avg_time.get(q_type, np.nan)
-                is_abnormally_fast = False
-                
-                # 對於Q科目，完全依賴time_pressure狀態來判斷無效數據
-                if subject_code == 'Q':
-                    # 嚴格遵循MD文檔規則：
-                    # 1. 絕對過快: question_time < 0.5分鐘
-                    if pd.notna(q_time) and q_time < 0.5:
-                        is_abnormally_fast = True
-                    
-                    # 2. 絕對倉促: question_time < 1.0分鐘
-                    if not is_abnormally_fast and pd.notna(q_time) and q_time < 1.0:
-                        is_abnormally_fast = True
-                    
-                    # 3&4. 相對單題倉促: question_time < 前期平均時間的50%
-                    if not is_abnormally_fast and pd.notna(q_time) and pd.notna(ft_avg_time_for_q_type) and ft_avg_time_for_q_type > 0:
-                        if q_time < (ft_avg_time_for_q_type * 0.5):
-                            is_abnormally_fast = True
-                    
-                    # 僅在time_pressure為True時才標記為無效（已由外層if is_pressure確保）
-                    if is_abnormally_fast and not df_output.loc[original_idx, 'is_invalid']:
-                        df_output.loc[original_idx, 'is_invalid'] = True
-                # 對其他科目保持原有邏輯
-                else:
-                    if pd.notna(q_time) and q_time < 0.5: 
-                        is_abnormally_fast = True
-                    
-                    if not is_abnormally_fast and pd.notna(q_time) and q_time < 1.0: 
-                        is_abnormally_fast = True
-                    
-                    if not is_abnormally_fast and pd.notna(q_time) and pd.notna(ft_avg_time_for_q_type) and ft_avg_time_for_q_type > 0:
-                        if q_time < (ft_avg_time_for_q_type * 0.5):
-                            is_abnormally_fast = True
-                    
-                    if not is_abnormally_fast and subject_code == 'V' and q_type == 'Reading Comprehension':
-                        rc_group_id_val = row.get('rc_group_id')
-                        if pd.notna(rc_group_id_val):
-                            current_rc_group_df = df_output[df_output['rc_group_id'] == rc_group_id_val]
-                            group_total_time = pd.to_numeric(current_rc_group_df['question_time'], errors='coerce').sum()
-                            num_q_in_group = len(current_rc_group_df)
-                            ft_avg_rc_time_v = ft_avg_time.get('Reading Comprehension', np.nan)
-
-                            if pd.notna(ft_avg_rc_time_v) and ft_avg_rc_time_v > 0 and num_q_in_group > 0:
-                                if group_total_time < (ft_avg_rc_time_v * num_q_in_group * 0.5):
-                                    for g_idx in current_rc_group_df.index:
-                                        if g_idx in original_indices_to_check:
-                                            df_output.loc[g_idx, 'is_invalid'] = True
-                                    is_abnormally_fast = True
-                    
-                    elif not is_abnormally_fast and subject_code == 'DI' and q_type == 'MSR':
-                        msr_group_id_val = row.get('msr_group_id')
-                        if pd.notna(msr_group_id_val):
-                            current_msr_group_df = df_output[df_output['msr_group_id'] == msr_group_id_val]
-                            group_total_time_msr = pd.to_numeric(current_msr_group_df['question_time'], errors='coerce').sum()
-                            num_q_in_msr_group = len(current_msr_group_df)
-                            ft_avg_msr_time_di = ft_avg_time.get('MSR', np.nan)
-                            
-                            if pd.notna(ft_avg_msr_time_di) and ft_avg_msr_time_di > 0 and num_q_in_msr_group > 0:
-                                if group_total_time_msr < (ft_avg_msr_time_di * num_q_in_msr_group * 0.5):
-                                    for g_idx in current_msr_group_df.index:
-                                        if g_idx in original_indices_to_check:
-                                            df_output.loc[g_idx, 'is_invalid'] = True
-                                    is_abnormally_fast = True 
-
-                    if is_abnormally_fast and not df_output.loc[original_idx, 'is_invalid']:
-                        df_output.loc[original_idx, 'is_invalid'] = True
+            # Last third in the order of the rows (not by question position)
+            indices_to_check = df_output.index[subj_df_mask.to_numpy()][last_third_start_index:]
+            rows_to_check = df_output.loc[indices_to_check]
+            q_time = pd.to_numeric(rows_to_check['question_time'], errors='coerce')
+            q_type = rows_to_check['question_type']
+            ft_avg_time_for_q_type = q_type.map(ft_avg_time).astype(float)
+
+            # NaN times fail every comparison, so they never count as fast
+            # 1. 絕對過快: question_time < 0.5分鐘
+            absolute_fast = q_time < 0.5
+            # 2. 絕對倉促: question_time < 1.0分鐘
+            hasty = q_time < 1.0
+            # 3&4. 相對單題倉促: question_time < 前期平均時間的50%
+            relative_fast = (ft_avg_time_for_q_type > 0) & (q_time < ft_avg_time_for_q_type * 0.5)
+            is_abnormally_fast = absolute_fast | hasty | relative_fast
+
+            # V 閱讀理解題組 / DI MSR 題組：題組總時間 < 前期該題型平均時間 × 題數 × 50%
+            # 時，題組在後三分之一內的所有題目都標記為無效（Q 僅依單題規則）
+            group_rule = GROUP_INVALID_RULES.get(subject_code)
+            if group_rule and group_rule[0] in df_output.columns:
+                group_col, group_q_type = group_rule
+                fast_group_ids = _fast_group_ids(df_output, group_col, ft_avg_time.get(group_q_type, np.nan))
+                group_ids = rows_to_check[group_col]
+                # A group is checked from its questions of that type that are not already fast on their own
+                triggering = ~is_abnormally_fast & (q_type == group_q_type) & group_ids.notna() & group_ids.isin(fast_group_ids)
+                is_abnormally_fast |= group_ids.isin(group_ids[triggering].unique())
+
+            df_output.loc[indices_to_check[is_abnormally_fast.to_numpy()], 'is_invalid'] = True
 
     # After all automatic invalid logic, merge manual invalid flags
     if 'is_manually_invalid' in df_output.columns:
@@ -0,0 +1,223 @@
+"""
+Memory benchmark for the analysis pipeline.
+
+Runs complete analyses outside of Streamlit: the pasted score report of each
+subject goes through process_subject_tab, combine_input_data and run_analysis,
+exactly as in the app. For every analysis the peak resident set size (RSS)
+reached while it ran is reported, together with the memory it leaves behind
+in the session state. Per-session memory is what limits how many concurrent
+users a worker can host, so run this before and after changes to how the
+pipeline copies DataFrames.
+
+Peak RSS per analysis needs Linux (/proc/self/clear_refs resets the
+high-water mark); elsewhere the process-wide peak is reported. --trace-python
+also reports the tracemalloc peak of Python allocations (much slower).
+
+Usage:
+    python -m gmat_diagnosis_app.analysis_memory_benchmark --runs 5
+"""
+
+import argparse
+import gc
+import random
+import resource
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+import streamlit as st
+from streamlit import config as st_config
+from streamlit.logger import set_log_level
+
+from gmat_diagnosis_app import preprocess_helpers
+from gmat_diagnosis_app.analysis_orchestrator import run_analysis
+from gmat_diagnosis_app.constants.config import (
+    SUBJECTS,
+    BASE_RENAME_MAP,
+    MAX_FILE_SIZE_BYTES,
+    REQUIRED_ORIGINAL_COLS
+)
+from gmat_diagnosis_app.session_manager import init_session_state
+from gmat_diagnosis_app.ui.input_tabs import combine_input_data
+from gmat_diagnosis_app.utils.data_processing import process_subject_tab
+from gmat_diagnosis_app.utils.validation import validate_dataframe
+
+# Questions per section of a GMAT Focus exam
+SECTION_QUESTION_COUNTS = {'Q': 21, 'V': 23, 'DI': 20}
+
+SECTION_CONTENT = {
+    'Q': {
+        'Content Domain': ['Algebra', 'Arithmetic'],
+        'Question Type': ['REAL', 'PURE'],
+        'Fundamental Skills': ['Equal/Unequal/ALG', 'Rates/Ratio/Percent', 'Value/Order/Factors', 'Counting/Sets/Series/Prob/Stats'],
+    },
+    'V': {
+        'Content Domain': ['N/A'],
+        'Question Type': ['Critical Reasoning', 'Reading Comprehension'],
+        'Fundamental Skills': ['Plan/Construct', 'Identify Stated Idea', 'Identify Inferred Idea', 'Analysis/Critique'],
+    },
+    'DI': {
+        'Content Domain': ['Math Related', 'Non-Math Related'],
+        'Question Type': ['Data Sufficiency', 'Two-part analysis', 'Multi-source reasoning', 'Graph and Table'],
+        'Fundamental Skills': ['N/A'],
+    },
+}
+
+
+class _BenchmarkTab:
+    """Stand-in for a subject tab: provides the pasted report and accepts the preview unchanged."""
+
+    def __init__(self, pasted_data, time_pressure):
+        self.pasted_data = pasted_data
+        self.time_pressure = time_pressure
+
+    def file_uploader(self, *args, **kwargs):
+        return None
+
+    def text_area(self, *args, **kwargs):
+        return self.pasted_data
+
+    def radio(self, *args, **kwargs):
+        return self.time_pressure
+
+    def data_editor(self, df, **kwargs):
+        return df
+
+    def __getattr__(self, name):
+        # Display-only calls (caption, divider, success, warning, ...)
+        return lambda *args, **kwargs: None
+
+
+def generate_score_report(subject, rng):
+    """Returns a synthetic score report of one section as pasted CSV text."""
+    content = SECTION_CONTENT[subject]
+    rows = []
+    for position in range(1, SECTION_QUESTION_COUNTS[subject] + 1):
+        rows.append({
+            'Question': position,
+            'Response Time (Minutes)': round(rng.uniform(0.3, 4.5), 2),
+            'Performance': rng.choice(['Correct', 'Correct', 'Incorrect']),
+            'Content Domain': rng.choice(content['Content Domain']),
+            'Question Type': rng.choice(content['Question Type']),
+            'Fundamental Skills': rng.choice(content['Fundamental Skills']),
+        })
+    return pd.DataFrame(rows).to_csv(index=False)
+
+
+def _rss_kb(field):
+    """Reads VmRSS / VmHWM (kB) from /proc/self/status, or None when unavailable."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith(f"{field}:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def _reset_peak_rss():
+    """Resets the RSS high-water mark (Linux only). Returns True on success."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as clear_refs:
+            clear_refs.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def run_single_analysis(rng, trace_python=False):
+    """
+    Runs one analysis from pasted reports to session results.
+
+    Args:
+        rng: random.Random generating the synthetic score reports
+        trace_python: also measure the peak of Python allocations with tracemalloc
+
+    Returns:
+        Dictionary with the success flag, duration and memory figures (kB)
+    """
+    gc.collect()
+    rss_before = _rss_kb('VmRSS')
+    per_analysis_peak = _reset_peak_rss()
+    if trace_python:
+        tracemalloc.start()
+    started = time.perf_counter()
+
+    input_dfs = {}
+    for subject in SUBJECTS:
+        tab = _BenchmarkTab(generate_score_report(subject, rng), rng.choice(['0', '1']))
+        input_dfs[subject], _, _ = process_subject_tab(
+            subject,
+            tab,
+            BASE_RENAME_MAP,
+            MAX_FILE_SIZE_BYTES,
+            preprocess_helpers.suggest_invalid_questions,
+            validate_dataframe,
+            REQUIRED_ORIGINAL_COLS
+        )
+    df_combined_input, _, _ = combine_input_data(input_dfs, SUBJECTS)
+    success = df_combined_input is not None and run_analysis(df_combined_input) is not False
+
+    duration = time.perf_counter() - started
+    traced_peak = None
+    if trace_python:
+        traced_peak = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    gc.collect()
+    rss_after = _rss_kb('VmRSS')
+    if per_analysis_peak:
+        peak_rss = _rss_kb('VmHWM')
+    else:
+        # ru_maxrss is in kB on Linux but in bytes on macOS
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            peak_rss //= 1024
+    return {
+        "success": success and st.session_state.get('diagnosis_complete', False),
+        "seconds": duration,
+        "rss_before_kb": rss_before,
+        "peak_rss_kb": peak_rss,
+        "peak_is_per_analysis": per_analysis_peak,
+        "peak_increase_kb": peak_rss - rss_before if per_analysis_peak and rss_before is not None else None,
+        "retained_kb": rss_after - rss_before if rss_before is not None and rss_after is not None else None,
+        "traced_peak_kb": traced_peak,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Peak memory per analysis of the GMAT diagnosis pipeline.")
+    parser.add_argument('--runs', type=int, default=5, help="number of analyses to run")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the synthetic score reports")
+    parser.add_argument('--trace-python', action='store_true', help="also report the tracemalloc peak")
+    args = parser.parse_args(argv)
+
+    # Bare-mode Streamlit warns about the missing script context on every call.
+    # Parsing the config resets the log level, so parse it before lowering it.
+    st_config.get_option('logger.level')
+    set_log_level('error')
+    init_session_state()
+    rng = random.Random(args.seed)
+
+    def megabytes(kb):
+        return f"{kb / 1024:.1f}" if kb is not None else "n/a"
+
+    print(f"pandas {pd.__version__}, copy-on-write: {pd.get_option('mode.copy_on_write')}")
+    print(f"{'run':>3}  {'ok':>3}  {'seconds':>8}  {'rss before MB':>13}  {'peak rss MB':>11}  "
+          f"{'peak increase MB':>16}  {'retained MB':>11}  {'python peak MB':>14}")
+    results = []
+    for run in range(1, args.runs + 1):
+        result = run_single_analysis(rng, args.trace_python)
+        results.append(result)
+        peak = megabytes(result["peak_rss_kb"]) + ("" if result["peak_is_per_analysis"] else "*")
+        print(f"{run:>3}  {'yes' if result['success'] else 'no':>3}  {result['seconds']:>8.2f}  "
+              f"{megabytes(result['rss_before_kb']):>13}  {peak:>11}  {megabytes(result['peak_increase_kb']):>16}  "
+              f"{megabytes(result['retained_kb']):>11}  {megabytes(result['traced_peak_kb']):>14}")
+    if results and not results[0]["peak_is_per_analysis"]:
+        print("* process-wide peak: the per-analysis RSS high-water mark needs Linux")
+    return results
+
+
+if __name__ == '__main__':
+    main()
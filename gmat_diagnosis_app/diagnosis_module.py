@@ -56,7 +56,7 @@ def run_diagnosis(df):
         logging.error(f"Invalid input DataFrame. Missing required columns: {missing_cols}")
         return error_msg, pd.DataFrame()
 
-    df_processed = df.copy()
+    df_processed = df.copy(deep=False)
 
     # --- Data Type Conversion and Cleaning ---
     try:
@@ -192,7 +192,7 @@ def run_diagnosis(df):
         if subject_code not in subjects_present:
             continue # Skip if subject not in the input data
 
-        df_subj = df_processed[df_processed['Subject'] == subject_code].copy() # Copy needed before passing to external func
+        df_subj = df_processed[df_processed['Subject'] == subject_code]
         if df_subj.empty:
             # logging.info(f"Skipping {subject_code} diagnosis: No data for this subject.")
             continue
@@ -5,22 +5,35 @@ This module provides functions for batch processing and exporting GMAT diagnosis
 """
 
 import csv
+import gzip
+import io
+import itertools
 import os
 import datetime
 import json
-from typing import List, Dict, Any
-from collections import defaultdict
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Iterable, Iterator, Optional, Set, TextIO
+
+import pandas as pd
+import xlsxwriter
 
 # Import the CSV data service module
 from gmat_diagnosis_app.services.csv_data_service import (
-    get_all_gmat_performance_records,
-    get_all_subjective_report_records,
+    get_gmat_performance_dataframe,
+    get_subjective_reports_dataframe,
+    iter_all_gmat_performance_records,
+    iter_all_subjective_report_records,
     GMAT_PERFORMANCE_HEADERS,
     STUDENT_SUBJECTIVE_REPORTS_HEADERS,
-    add_gmat_performance_record,
+    add_gmat_performance_frame,
     add_subjective_report_record,
+    validate_gmat_performance_frame,
     get_student_gmat_performance_records,
-    get_student_subjective_reports
+    get_student_subjective_reports,
+    get_student_performance_summaries
 )
 
 # Import the CSV data analysis services
@@ -30,17 +43,65 @@ from gmat_diagnosis_app.services.csv_data_analysis import (
     identify_student_strengths_weaknesses,
     get_progress_over_time
 )
+from gmat_diagnosis_app.utils.excel_utils import (
+    add_excel_formats,
+    excel_sheet_name,
+    prepare_excel_frame,
+    write_excel_sheet
+)
 
+# Rows read, validated and written at a time by the streaming importer
+IMPORT_CHUNK_SIZE = 5000
+# Error messages kept per chunk in the import report
+IMPORT_ERRORS_PER_CHUNK = 20
 
-def batch_import_gmat_performance_data(import_file_path: str) -> Dict[str, Any]:
+# Export file formats: plain files, one .gz per file, or one .zip archive per export
+EXPORT_COMPRESSIONS = (None, "gzip", "zip")
+# Student bundles written concurrently by export_students_data
+EXPORT_MAX_WORKERS = 4
+# Students whose sheets are prepared ahead of the cohort workbook writer, per worker
+COHORT_PREFETCH_PER_WORKER = 2
+
+# Columns of the per-student sheets of the cohort workbook (column name -> sheet header)
+COHORT_SHEET_COLUMN_MAP = {
+    "test_instance_id": "測驗",
+    "test_date": "測驗日期",
+    "question_position": "題號",
+    "question_type": "題型",
+    "question_fundamental_skill": "考察能力",
+    "content_domain": "內容領域",
+    "question_difficulty": "難度",
+    "question_time": "用時(分)",
+    "is_correct": "答對"
+}
+COHORT_SUMMARY_SHEET = "總覽"
+COHORT_SUMMARY_HEADERS = [
+    "學生ID", "科目", "工作表", "測驗次數", "總題數", "答對題數",
+    "整體正確率", "平均測驗正確率", "最近測驗日期", "主要優勢", "主要弱點"
+]
+
+
+def stream_import_gmat_performance_data(
+    import_file_path: str,
+    chunk_size: Optional[int] = None,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None
+) -> Dict[str, Any]:
     """
-    Import GMAT performance data from a CSV file.
+    Import GMAT performance data from a CSV file in fixed-size chunks.
+    
+    Each chunk is validated with vectorized checks, filtered against the
+    duplicate digest index and written in one append, so memory stays bounded by
+    the chunk size and the run time is linear in the file size.
     
     Args:
         import_file_path: Path to the CSV file to import
+        chunk_size: Number of rows read, validated and written at a time
+                    (defaults to IMPORT_CHUNK_SIZE)
+        progress_callback: Called with the report of each chunk after it is written
+                           (defaults to printing a progress line)
         
     Returns:
-        Dictionary containing import statistics
+        Dictionary containing import statistics and one report per chunk
     """
     if not os.path.exists(import_file_path):
         return {
@@ -49,64 +110,102 @@ def batch_import_gmat_performance_data(import_file_path: str) -> Dict[str, Any]:
             "records_imported": 0
         }
     
+    # Validate the CSV has the required headers
+    with open(import_file_path, 'r', newline='') as csvfile:
+        fieldnames = next(csv.reader(csvfile), [])
+    missing_headers = [h for h in GMAT_PERFORMANCE_HEADERS if h not in fieldnames and h != "record_timestamp"]
+    if missing_headers:
+        return {
+            "success": False,
+            "message": f"Import file missing required headers: {', '.join(missing_headers)}",
+            "records_imported": 0
+        }
+    import_columns = [h for h in GMAT_PERFORMANCE_HEADERS if h != "record_timestamp"]
+    if chunk_size is None:
+        chunk_size = IMPORT_CHUNK_SIZE
+    
+    totals = {"rows": 0, "imported": 0, "duplicates": 0, "invalid": 0, "failed": 0}
+    test_instances = set()
+    chunk_reports = []
     try:
-        # Read records from import file
-        import_records = []
-        with open(import_file_path, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            
-            # Validate the CSV has the required headers
-            missing_headers = [h for h in GMAT_PERFORMANCE_HEADERS if h not in reader.fieldnames and h != "record_timestamp"]
-            if missing_headers:
-                return {
-                    "success": False,
-                    "message": f"Import file missing required headers: {', '.join(missing_headers)}",
-                    "records_imported": 0
-                }
-            
-            # Read all records
-            for row in reader:
-                import_records.append(row)
-        
-        if not import_records:
-            return {
-                "success": False,
-                "message": "Import file contains no data records",
-                "records_imported": 0
+        # Values are kept as strings, as csv.DictReader would return them
+        chunks = pd.read_csv(import_file_path, dtype=str, keep_default_na=False,
+                             usecols=import_columns, chunksize=chunk_size)
+        for chunk_number, chunk in enumerate(chunks, start=1):
+            chunk = chunk[import_columns]
+            errors = validate_gmat_performance_frame(chunk)
+            invalid = errors != ''
+            report = {
+                "chunk": chunk_number,
+                "rows": len(chunk),
+                "imported": 0,
+                "duplicates": 0,
+                "invalid": int(invalid.sum()),
+                # Only the first few messages, with their line number in the import file
+                "errors": [
+                    f"Line {index + 2}: {message}"
+                    for index, message in errors[invalid].head(IMPORT_ERRORS_PER_CHUNK).items()
+                ]
             }
-        
-        # Group records by test_instance_id for batch processing
-        test_instances = defaultdict(list)
-        for record in import_records:
-            test_instances[record.get("test_instance_id", "unknown")].append(record)
-        
-        # Import records using the data service
-        success_count = 0
-        failed_count = 0
-        test_instances_processed = 0
-        
-        for test_id, records in test_instances.items():
-            success = add_gmat_performance_record(records)
-            if success:
-                success_count += len(records)
-                test_instances_processed += 1
+            valid_rows = chunk[~invalid]
+            try:
+                written = add_gmat_performance_frame(valid_rows)
+                report["imported"] = written["written"]
+                report["duplicates"] = written["duplicates"]
+                test_instances.update(valid_rows["test_instance_id"].unique())
+            except Exception as e:
+                report["failed"] = len(valid_rows)
+                report["errors"].append(f"Error writing chunk: {str(e)}")
+            
+            for key in totals:
+                totals[key] += report.get(key, 0)
+            chunk_reports.append(report)
+            if progress_callback is not None:
+                progress_callback(report)
             else:
-                failed_count += len(records)
-        
-        return {
-            "success": failed_count == 0,
-            "message": f"Import completed with {success_count} records imported successfully and {failed_count} failures",
-            "records_imported": success_count,
-            "records_failed": failed_count,
-            "test_instances_processed": test_instances_processed
-        }
-        
+                print(f"Imported chunk {chunk_number}: {report['imported']} of {report['rows']} records "
+                      f"({report['duplicates']} duplicates, {report['invalid']} invalid)")
     except Exception as e:
         return {
             "success": False,
             "message": f"Error importing data: {str(e)}",
+            "records_imported": totals["imported"],
+            "chunks": chunk_reports
+        }
+    
+    if totals["rows"] == 0:
+        return {
+            "success": False,
+            "message": "Import file contains no data records",
             "records_imported": 0
         }
+    
+    # Duplicates count as handled, as in add_gmat_performance_record
+    records_failed = totals["invalid"] + totals["failed"]
+    return {
+        "success": records_failed == 0,
+        "message": f"Import completed with {totals['imported'] + totals['duplicates']} records imported successfully and {records_failed} failures",
+        "records_imported": totals["imported"] + totals["duplicates"],
+        "records_written": totals["imported"],
+        "records_duplicate": totals["duplicates"],
+        "records_failed": records_failed,
+        "test_instances_processed": len(test_instances),
+        "chunks": chunk_reports
+    }
+
+
+def batch_import_gmat_performance_data(import_file_path: str) -> Dict[str, Any]:
+    """
+    Import GMAT performance data from a CSV file.
+    Streams the file in chunks (see stream_import_gmat_performance_data).
+    
+    Args:
+        import_file_path: Path to the CSV file to import
+        
+    Returns:
+        Dictionary containing import statistics
+    """
+    return stream_import_gmat_performance_data(import_file_path)
 
 
 def batch_import_subjective_reports(import_file_path: str) -> Dict[str, Any]:
@@ -178,39 +277,118 @@ def batch_import_subjective_reports(import_file_path: str) -> Dict[str, Any]:
         }
 
 
-def export_student_data(student_id: str, export_dir: str) -> Dict[str, Any]:
+class _ExportBundle:
     """
-    Export all data for a specific student to CSV files.
-    
-    Args:
-        student_id: The ID of the student to export data for
-        export_dir: Directory to save the exported files
-        
-    Returns:
-        Dictionary containing export statistics
+    Destination of the files of one export: plain files in ``export_dir``,
+    one ``.gz`` file each (compression='gzip'), or the members of a single
+    ``<archive_name>.zip`` archive (compression='zip'). Files and the archive
+    are only created when something is written to them.
     """
-    # Ensure export directory exists
+
+    def __init__(self, export_dir: str, archive_name: str, compression: Optional[str] = None):
+        if compression not in EXPORT_COMPRESSIONS:
+            raise ValueError(f"Unknown export compression: {compression!r} (expected None, 'gzip' or 'zip')")
+        self.export_dir = export_dir
+        self.compression = compression
+        self.archive_path = os.path.join(export_dir, f"{archive_name}.zip")
+        self._archive: Optional[zipfile.ZipFile] = None
+
+    def file_path(self, filename: str) -> str:
+        """Path reported for a written file (the archive path for zip exports)."""
+        if self.compression == "zip":
+            return self.archive_path
+        if self.compression == "gzip":
+            return os.path.join(self.export_dir, filename + ".gz")
+        return os.path.join(self.export_dir, filename)
+
+    @contextmanager
+    def open(self, filename: str) -> Iterator[TextIO]:
+        """Opens ``filename`` of the bundle for writing text (csv module newline handling)."""
+        if self.compression == "zip":
+            if self._archive is None:
+                self._archive = zipfile.ZipFile(self.archive_path, "w", compression=zipfile.ZIP_DEFLATED)
+            with self._archive.open(filename, "w") as member:
+                with io.TextIOWrapper(member, encoding="utf-8", newline="") as textfile:
+                    yield textfile
+        elif self.compression == "gzip":
+            with gzip.open(self.file_path(filename), "wt", encoding="utf-8", newline="") as textfile:
+                yield textfile
+        else:
+            with open(self.file_path(filename), "w", newline="") as textfile:
+                yield textfile
+
+    def close(self) -> None:
+        if self._archive is not None:
+            self._archive.close()
+            self._archive = None
+
+
+def _ensure_export_dir(export_dir: str, compression: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Checks the export compression and creates the export directory; returns the
+    error result if either fails.
+    """
+    if compression not in EXPORT_COMPRESSIONS:
+        return {
+            "success": False,
+            "message": f"Unknown export compression: {compression!r}",
+            "files_created": 0
+        }
     if not os.path.exists(export_dir):
         try:
-            os.makedirs(export_dir)
+            os.makedirs(export_dir, exist_ok=True)
         except Exception as e:
             return {
                 "success": False,
                 "message": f"Error creating export directory: {str(e)}",
                 "files_created": 0
             }
+    return None
+
+
+def _stream_csv(bundle: _ExportBundle, filename: str, headers: List[str],
+                records: Iterable[Dict[str, str]],
+                on_record: Optional[Callable[[Dict[str, str]], None]] = None) -> int:
+    """
+    Writes records to a CSV file of the bundle as they are read, calling
+    ``on_record`` for each one. Nothing is created when there are no records.
     
-    # Get student data
-    performance_records = get_student_gmat_performance_records(student_id)
-    subjective_reports = get_student_subjective_reports(student_id)
-    
-    if not performance_records and not subjective_reports:
-        return {
-            "success": False,
-            "message": f"No data found for student: {student_id}",
-            "files_created": 0
-        }
+    Returns:
+        Number of records written
+    """
+    records = iter(records)
+    first_record = next(records, None)
+    if first_record is None:
+        return 0
+    count = 0
+    with bundle.open(filename) as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=headers)
+        writer.writeheader()
+        for record in itertools.chain([first_record], records):
+            writer.writerow(record)
+            if on_record is not None:
+                on_record(record)
+            count += 1
+    return count
+
+
+def _write_frame_csv(bundle: _ExportBundle, filename: str, frame: pd.DataFrame) -> None:
+    """Writes a frame of stored string values in the same format as csv.DictWriter."""
+    with bundle.open(filename) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(list(frame.columns))
+        writer.writerows(frame.itertuples(index=False, name=None))
+
+
+def _write_student_bundle(student_id: str, export_dir: str, performance_frame: pd.DataFrame,
+                          subjective_frame: pd.DataFrame, compression: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Writes the performance CSV, subjective CSV and JSON summary of one student.
     
+    Returns:
+        The result dictionary of export_student_data
+    """
+    bundle = _ExportBundle(export_dir, f"{student_id}_export", compression)
     files_created = 0
     export_results = {
         "performance_export": {
@@ -225,84 +403,46 @@ def export_student_data(student_id: str, export_dir: str) -> Dict[str, Any]:
         }
     }
     
-    # Export performance data if available
-    if performance_records:
-        performance_file = os.path.join(export_dir, f"{student_id}_performance_export.csv")
+    try:
+        for key, frame, filename, label in (
+            ("performance_export", performance_frame, f"{student_id}_performance_export.csv", "performance data"),
+            ("subjective_export", subjective_frame, f"{student_id}_subjective_export.csv", "subjective reports"),
+        ):
+            if frame.empty:
+                continue
+            try:
+                _write_frame_csv(bundle, filename, frame)
+                files_created += 1
+                export_results[key] = {
+                    "success": True,
+                    "records_exported": len(frame),
+                    "file_path": bundle.file_path(filename)
+                }
+            except Exception as e:
+                export_results[key] = {
+                    "success": False,
+                    "message": f"Error exporting {label}: {str(e)}",
+                    "records_exported": 0,
+                    "file_path": bundle.file_path(filename)
+                }
         
+        # Create summary report
         try:
-            with open(performance_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
-                writer.writeheader()
-                writer.writerows(performance_records)
-                
-            files_created += 1
-            export_results["performance_export"] = {
-                "success": True,
-                "records_exported": len(performance_records),
-                "file_path": performance_file
-            }
-            
-        except Exception as e:
-            export_results["performance_export"] = {
-                "success": False,
-                "message": f"Error exporting performance data: {str(e)}",
-                "records_exported": 0,
-                "file_path": performance_file
+            summary = {
+                "student_id": student_id,
+                "export_timestamp": datetime.datetime.now().isoformat(),
+                "total_performance_records": len(performance_frame),
+                "total_subjective_reports": len(subjective_frame),
+                # Count records by section, in order of first appearance
+                "sections_taken": dict(Counter(performance_frame["gmat_section"]))
             }
-    
-    # Export subjective reports if available
-    if subjective_reports:
-        subjective_file = os.path.join(export_dir, f"{student_id}_subjective_export.csv")
-        
-        try:
-            with open(subjective_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-                writer.writeheader()
-                writer.writerows(subjective_reports)
-                
+            with bundle.open(f"{student_id}_summary_report.json") as jsonfile:
+                json.dump(summary, jsonfile, indent=2)
             files_created += 1
-            export_results["subjective_export"] = {
-                "success": True,
-                "records_exported": len(subjective_reports),
-                "file_path": subjective_file
-            }
-            
         except Exception as e:
-            export_results["subjective_export"] = {
-                "success": False,
-                "message": f"Error exporting subjective reports: {str(e)}",
-                "records_exported": 0,
-                "file_path": subjective_file
-            }
-    
-    # Create summary report
-    summary_file = os.path.join(export_dir, f"{student_id}_summary_report.json")
-    
-    try:
-        # Generate a summary of the student's data
-        summary = {
-            "student_id": student_id,
-            "export_timestamp": datetime.datetime.now().isoformat(),
-            "total_performance_records": len(performance_records),
-            "total_subjective_reports": len(subjective_reports),
-            "sections_taken": {}
-        }
-        
-        # Count records by section
-        for record in performance_records:
-            section = record["gmat_section"]
-            if section not in summary["sections_taken"]:
-                summary["sections_taken"][section] = 0
-            summary["sections_taken"][section] += 1
-        
-        # Write summary to file
-        with open(summary_file, 'w') as jsonfile:
-            json.dump(summary, jsonfile, indent=2)
-            
-        files_created += 1
-        
-    except Exception as e:
-        print(f"Error creating summary report: {str(e)}")
+            print(f"Error creating summary report: {str(e)}")
+    finally:
+        bundle.close()
     
     return {
         "success": files_created > 0,
@@ -312,170 +452,238 @@ def export_student_data(student_id: str, export_dir: str) -> Dict[str, Any]:
     }
 
 
-def export_all_data(export_dir: str) -> Dict[str, Any]:
+def export_student_data(student_id: str, export_dir: str, compression: Optional[str] = None) -> Dict[str, Any]:
     """
-    Export all GMAT performance and subjective report data to CSV files.
+    Export all data for a specific student to CSV files.
     
     Args:
+        student_id: The ID of the student to export data for
         export_dir: Directory to save the exported files
+        compression: None (plain files), 'gzip' (one .gz per file) or 'zip' (one archive)
         
     Returns:
         Dictionary containing export statistics
     """
-    # Ensure export directory exists
-    if not os.path.exists(export_dir):
-        try:
-            os.makedirs(export_dir)
-        except Exception as e:
-            return {
-                "success": False,
-                "message": f"Error creating export directory: {str(e)}",
-                "files_created": 0
-            }
+    # Check the compression and ensure export directory exists
+    error = _ensure_export_dir(export_dir, compression)
+    if error:
+        return error
     
-    # Get all data
-    performance_records = get_all_gmat_performance_records()
-    subjective_reports = get_all_subjective_report_records()
+    # Get student data
+    performance_frame = get_gmat_performance_dataframe(student_id=student_id)
+    subjective_frame = get_subjective_reports_dataframe(student_id=student_id)
     
-    if not performance_records and not subjective_reports:
+    if performance_frame.empty and subjective_frame.empty:
         return {
             "success": False,
-            "message": "No data found in the system",
+            "message": f"No data found for student: {student_id}",
             "files_created": 0
         }
     
+    return _write_student_bundle(student_id, export_dir, performance_frame, subjective_frame, compression)
+
+
+def export_students_data(
+    export_dir: str,
+    student_ids: Optional[List[str]] = None,
+    compression: Optional[str] = None,
+    max_workers: int = EXPORT_MAX_WORKERS
+) -> Dict[str, Any]:
+    """
+    Export the export_student_data bundle of many students from one read of the data.
+    Both tables are read once and split by student; the bundles are written in parallel.
+    
+    Args:
+        export_dir: Directory to save the exported files
+        student_ids: Students to export (default: every student with data)
+        compression: None (plain files), 'gzip' (one .gz per file) or 'zip' (one archive per student)
+        max_workers: Number of bundles written concurrently
+        
+    Returns:
+        Dictionary containing export statistics and the export_student_data result of each student
+    """
+    error = _ensure_export_dir(export_dir, compression)
+    if error:
+        return error
+    
+    performance_frame = get_gmat_performance_dataframe()
+    subjective_frame = get_subjective_reports_dataframe()
+    performance_rows = performance_frame.groupby("student_id", sort=False).indices
+    subjective_rows = subjective_frame.groupby("student_id", sort=False).indices
+    if student_ids is None:
+        student_ids = list(dict.fromkeys(list(performance_rows) + list(subjective_rows)))
+    
+    student_results: Dict[str, Dict[str, Any]] = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {}
+        for student_id in student_ids:
+            if student_id not in performance_rows and student_id not in subjective_rows:
+                student_results[student_id] = {
+                    "success": False,
+                    "message": f"No data found for student: {student_id}",
+                    "files_created": 0
+                }
+                continue
+            futures[student_id] = executor.submit(
+                _write_student_bundle,
+                student_id,
+                export_dir,
+                performance_frame.iloc[performance_rows.get(student_id, [])],
+                subjective_frame.iloc[subjective_rows.get(student_id, [])],
+                compression,
+            )
+        for student_id, future in futures.items():
+            try:
+                student_results[student_id] = future.result()
+            except Exception as e:
+                student_results[student_id] = {
+                    "success": False,
+                    "message": f"Error exporting student {student_id}: {str(e)}",
+                    "files_created": 0
+                }
+    
+    students_exported = sum(1 for result in student_results.values() if result["success"])
+    return {
+        "success": students_exported == len(student_ids),
+        "message": f"Exported data for {students_exported} of {len(student_ids)} students",
+        "students_exported": students_exported,
+        "files_created": sum(result["files_created"] for result in student_results.values()),
+        "student_results": {student_id: student_results[student_id] for student_id in student_ids}
+    }
+
+
+def export_all_data(export_dir: str, compression: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Export all GMAT performance and subjective report data to CSV files.
+    Records are streamed to the files in one pass, which also collects the
+    statistics of the JSON summary.
+    
+    Args:
+        export_dir: Directory to save the exported files
+        compression: None (plain files), 'gzip' (one .gz per file) or 'zip' (one archive)
+        
+    Returns:
+        Dictionary containing export statistics
+    """
+    # Check the compression and ensure export directory exists
+    error = _ensure_export_dir(export_dir, compression)
+    if error:
+        return error
+    
     files_created = 0
     export_timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     export_results = {}
+    bundle = _ExportBundle(export_dir, f"gmat_export_{export_timestamp}", compression)
+    
+    # Summary statistics, collected while writing the performance records
+    student_ids: Set[str] = set()
+    section_counts = {"Q": 0, "DI": 0, "V": 0}
     
-    # Export performance data if available
-    if performance_records:
-        performance_file = os.path.join(export_dir, f"gmat_performance_export_{export_timestamp}.csv")
+    def count_performance_record(record: Dict[str, str]) -> None:
+        student_ids.add(record["student_id"])
+        if record["gmat_section"] in section_counts:
+            section_counts[record["gmat_section"]] += 1
+    
+    performance_count = subjective_count = 0
+    try:
+        for key, filename, headers, records, on_record, label in (
+            ("performance_export", f"gmat_performance_export_{export_timestamp}.csv", GMAT_PERFORMANCE_HEADERS,
+             iter_all_gmat_performance_records(), count_performance_record, "performance data"),
+            ("subjective_export", f"subjective_reports_export_{export_timestamp}.csv", STUDENT_SUBJECTIVE_REPORTS_HEADERS,
+             iter_all_subjective_report_records(), None, "subjective reports"),
+        ):
+            try:
+                count = _stream_csv(bundle, filename, headers, records, on_record)
+            except Exception as e:
+                export_results[key] = {
+                    "success": False,
+                    "message": f"Error exporting {label}: {str(e)}",
+                    "records_exported": 0,
+                    "file_path": bundle.file_path(filename)
+                }
+                continue
+            if key == "performance_export":
+                performance_count = count
+            else:
+                subjective_count = count
+            if count:
+                files_created += 1
+                export_results[key] = {
+                    "success": True,
+                    "records_exported": count,
+                    "file_path": bundle.file_path(filename)
+                }
         
-        try:
-            with open(performance_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
-                writer.writeheader()
-                writer.writerows(performance_records)
-                
-            files_created += 1
-            export_results["performance_export"] = {
-                "success": True,
-                "records_exported": len(performance_records),
-                "file_path": performance_file
-            }
-            
-        except Exception as e:
-            export_results["performance_export"] = {
+        if not performance_count and not subjective_count and not export_results:
+            return {
                 "success": False,
-                "message": f"Error exporting performance data: {str(e)}",
-                "records_exported": 0,
-                "file_path": performance_file
+                "message": "No data found in the system",
+                "files_created": 0
             }
-    
-    # Export subjective reports if available
-    if subjective_reports:
-        subjective_file = os.path.join(export_dir, f"subjective_reports_export_{export_timestamp}.csv")
         
+        # Create summary report
+        summary_filename = f"export_summary_{export_timestamp}.json"
         try:
-            with open(subjective_file, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-                writer.writeheader()
-                writer.writerows(subjective_reports)
-                
+            summary = {
+                "export_timestamp": datetime.datetime.now().isoformat(),
+                "total_performance_records": performance_count,
+                "total_subjective_reports": subjective_count,
+                "unique_students": len(student_ids),
+                "performance_sections": section_counts
+            }
+            with bundle.open(summary_filename) as jsonfile:
+                json.dump(summary, jsonfile, indent=2)
             files_created += 1
-            export_results["subjective_export"] = {
+            export_results["summary"] = {
                 "success": True,
-                "records_exported": len(subjective_reports),
-                "file_path": subjective_file
+                "file_path": bundle.file_path(summary_filename)
             }
-            
         except Exception as e:
-            export_results["subjective_export"] = {
+            export_results["summary"] = {
                 "success": False,
-                "message": f"Error exporting subjective reports: {str(e)}",
-                "records_exported": 0,
-                "file_path": subjective_file
+                "message": f"Error creating summary report: {str(e)}"
             }
-    
-    # Create summary report
-    summary_file = os.path.join(export_dir, f"export_summary_{export_timestamp}.json")
-    
-    try:
-        # Extract unique student IDs
-        student_ids = set()
-        for record in performance_records:
-            student_ids.add(record["student_id"])
-        
-        # Generate a summary of the export
-        summary = {
-            "export_timestamp": datetime.datetime.now().isoformat(),
-            "total_performance_records": len(performance_records),
-            "total_subjective_reports": len(subjective_reports),
-            "unique_students": len(student_ids),
-            "performance_sections": {
-                "Q": sum(1 for r in performance_records if r["gmat_section"] == "Q"),
-                "DI": sum(1 for r in performance_records if r["gmat_section"] == "DI"),
-                "V": sum(1 for r in performance_records if r["gmat_section"] == "V")
-            }
-        }
-        
-        # Write summary to file
-        with open(summary_file, 'w') as jsonfile:
-            json.dump(summary, jsonfile, indent=2)
-            
-        files_created += 1
-        export_results["summary"] = {
-            "success": True,
-            "file_path": summary_file
-        }
-        
-    except Exception as e:
-        export_results["summary"] = {
-            "success": False,
-            "message": f"Error creating summary report: {str(e)}"
-        }
+    finally:
+        bundle.close()
     
     return {
         "success": files_created > 0,
         "message": f"Exported {files_created} files containing all system data",
         "files_created": files_created,
         "records_exported": {
-            "performance_records": len(performance_records),
-            "subjective_reports": len(subjective_reports)
+            "performance_records": performance_count,
+            "subjective_reports": subjective_count
         },
         "export_details": export_results
     }
 
 
-def generate_consolidated_student_report(student_id: str, output_file: str) -> Dict[str, Any]:
+def _build_consolidated_report(student_id: str) -> Optional[Dict[str, Any]]:
     """
-    Generate a consolidated JSON report for a specific student.
+    Build the consolidated report of one student (section statistics, strengths and
+    weaknesses, progress and time pressure analysis).
     
-    Args:
-        student_id: The ID of the student to generate a report for
-        output_file: Path to save the generated report
-        
     Returns:
-        Dictionary containing the report generation results
+        The report dictionary, or None if the student has no performance data
     """
-    # Get student data
-    performance_records = get_student_gmat_performance_records(student_id)
+    # Get student data (the per-test-instance summaries instead of every question record)
+    summaries = get_student_performance_summaries(student_id)
+    if summaries is None:
+        summaries = [
+            {"gmat_section": record["gmat_section"], "total_questions": 1}
+            for record in get_student_gmat_performance_records(student_id)
+        ]
     subjective_reports = get_student_subjective_reports(student_id)
     
-    if not performance_records:
-        return {
-            "success": False,
-            "message": f"No performance data found for student: {student_id}",
-            "report_generated": False
-        }
+    if not summaries:
+        return None
     
     # Initialize the consolidated report
     report = {
         "student_id": student_id,
         "report_generation_timestamp": datetime.datetime.now().isoformat(),
         "data_summary": {
-            "total_performance_records": len(performance_records),
+            "total_performance_records": sum(summary["total_questions"] for summary in summaries),
             "total_subjective_reports": len(subjective_reports)
         },
         "section_stats": {},
@@ -485,7 +693,7 @@ def generate_consolidated_student_report(student_id: str, output_file: str) -> D
     }
     
     # Calculate statistics for each section the student has taken
-    sections_taken = set(record["gmat_section"] for record in performance_records)
+    sections_taken = dict.fromkeys(summary["gmat_section"] for summary in summaries)
     
     for section in sections_taken:
         report["section_stats"][section] = calculate_student_section_stats(student_id, section)
@@ -496,6 +704,28 @@ def generate_consolidated_student_report(student_id: str, output_file: str) -> D
     if subjective_reports:
         report["time_pressure_analysis"] = analyze_time_pressure_impact(student_id)
     
+    return report
+
+
+def generate_consolidated_student_report(student_id: str, output_file: str) -> Dict[str, Any]:
+    """
+    Generate a consolidated JSON report for a specific student.
+    
+    Args:
+        student_id: The ID of the student to generate a report for
+        output_file: Path to save the generated report
+        
+    Returns:
+        Dictionary containing the report generation results
+    """
+    report = _build_consolidated_report(student_id)
+    if report is None:
+        return {
+            "success": False,
+            "message": f"No performance data found for student: {student_id}",
+            "report_generated": False
+        }
+    
     # Save the consolidated report to the output file
     try:
         # Create the directory if it doesn't exist
@@ -518,4 +748,193 @@ def generate_consolidated_student_report(student_id: str, output_file: str) -> D
             "success": False,
             "message": f"Error generating consolidated report: {str(e)}",
             "report_generated": False
-        } 
\ No newline at end of file
+        } 
+
+
+def _cohort_sheet_frame(records: pd.DataFrame) -> pd.DataFrame:
+    """
+    Turn the stored (string) performance records of one student and section into
+    the columns prepare_excel_frame formats, ordered by test date, test and position.
+    """
+    frame = records.assign(
+        question_position=pd.to_numeric(records["question_position"], errors="coerce"),
+        question_difficulty=pd.to_numeric(records["question_difficulty"], errors="coerce"),
+        question_time=pd.to_numeric(records["question_time_minutes"], errors="coerce"),
+        is_correct=records["is_correct"].astype(str).str.strip().isin(["1", "True", "true"])
+    )
+    test_order = {test_id: i for i, test_id in enumerate(dict.fromkeys(frame["test_instance_id"]))}
+    frame = frame.assign(_test_order=frame["test_instance_id"].map(test_order))
+    return frame.sort_values(["test_date", "_test_order", "question_position"], kind="mergesort")
+
+
+def _cohort_summary_row(student_id: str, section: str, sheet_name: str, report: Dict[str, Any]) -> List[Any]:
+    """One row of the cohort summary sheet, from the consolidated report of the student."""
+    stats = report["section_stats"].get(section, {})
+    analysis = report["strengths_weaknesses"].get(section, {})
+    test_dates = [test["test_date"] for test in stats.get("test_instances", []) if test.get("test_date")]
+    return [
+        student_id,
+        section,
+        sheet_name,
+        stats.get("total_tests", 0),
+        stats.get("total_questions_answered", 0),
+        stats.get("total_correct_answers", 0),
+        stats.get("overall_accuracy", 0),
+        stats.get("avg_test_accuracy", 0),
+        max(test_dates) if test_dates else "",
+        ", ".join(item["skill"] for item in analysis.get("top_strengths", [])),
+        ", ".join(item["skill"] for item in analysis.get("top_weaknesses", []))
+    ]
+
+
+def _prepare_cohort_student(student_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Prepare everything the cohort workbook needs for one student (run by the workers):
+    the formatted sheet frame of each section and the consolidated report. Only this
+    student's records are read. Returns None if the student has no performance data.
+    """
+    records = get_gmat_performance_dataframe(student_id=student_id)
+    if records.empty:
+        return None
+    sections = []
+    for section, section_records in records.groupby("gmat_section", sort=False):
+        df_excel, _ = prepare_excel_frame(_cohort_sheet_frame(section_records), COHORT_SHEET_COLUMN_MAP, sort_rows=False)
+        sections.append((section, df_excel))
+    return {"sections": sections, "report": _build_consolidated_report(student_id)}
+
+
+def _discard_workbook(workbook: Optional[xlsxwriter.Workbook], output_file: str) -> None:
+    """Closes a workbook whose export failed (releasing its temporary files) and removes the partial file."""
+    if workbook is not None:
+        try:
+            workbook.close()
+        except Exception as e:
+            print(f"Error closing cohort workbook: {e}")
+    if os.path.exists(output_file):
+        try:
+            os.remove(output_file)
+        except OSError as e:
+            print(f"Error removing partial cohort workbook: {e}")
+
+
+def export_cohort_workbook(
+    output_file: str,
+    student_ids: Optional[List[str]] = None,
+    max_workers: int = EXPORT_MAX_WORKERS
+) -> Dict[str, Any]:
+    """
+    Export one Excel workbook for a cohort: a summary sheet followed by one sheet
+    per student and section, formatted like the single-student to_excel export.
+    
+    Workers read and prepare the sheet data and consolidated report of each student
+    in parallel, querying only that student's records; a single writer assembles the
+    workbook in student order. The workbook uses xlsxwriter's constant_memory mode
+    and only a bounded number of students is loaded or prepared at a time, so the
+    export itself does not hold the whole cohort in memory (the storage backend may
+    still cache its tables, e.g. the CSV backend).
+    
+    Args:
+        output_file: Path of the .xlsx file to create
+        student_ids: Students to export (default: every student with performance data)
+        max_workers: Number of students prepared concurrently
+        
+    Returns:
+        Dictionary containing export statistics
+    """
+    if student_ids is None:
+        # Streamed, so only the distinct IDs are kept
+        student_ids = list(dict.fromkeys(record["student_id"] for record in iter_all_gmat_performance_records()))
+    no_data_result = {
+        "success": False,
+        "message": "No performance data found for the requested students",
+        "students_exported": 0,
+        "sheets_created": 0
+    }
+    if not student_ids:
+        return no_data_result
+    
+    try:
+        # Create the directory if it doesn't exist
+        output_dir = os.path.dirname(output_file)
+        if output_dir and not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+        workbook = xlsxwriter.Workbook(output_file, {"constant_memory": True})
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error creating cohort workbook: {str(e)}",
+            "students_exported": 0,
+            "sheets_created": 0
+        }
+    
+    completed = False
+    students_exported = sheets_created = 0
+    skipped_students: List[str] = []
+    failed_students: Dict[str, str] = {}
+    try:
+        formats = add_excel_formats(workbook)
+        percent_format = workbook.add_format({"num_format": "0.0%"})
+        used_sheet_names = {COHORT_SUMMARY_SHEET.lower()}
+        summary_sheet = workbook.add_worksheet(COHORT_SUMMARY_SHEET)
+        summary_sheet.write_row(0, 0, COHORT_SUMMARY_HEADERS, formats["header"])
+        summary_sheet.set_column(0, len(COHORT_SUMMARY_HEADERS) - 1, 14)
+        summary_sheet.set_column(6, 7, 14, percent_format)
+        summary_sheet.set_column(9, 10, 40)
+        summary_row = 1
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Sliding window: a new student is submitted whenever one is written
+            pending = deque()
+            remaining = iter(student_ids)
+            
+            def submit(student_id: str) -> None:
+                pending.append((student_id, executor.submit(_prepare_cohort_student, student_id)))
+            
+            for student_id in itertools.islice(remaining, max_workers * COHORT_PREFETCH_PER_WORKER):
+                submit(student_id)
+            while pending:
+                student_id, future = pending.popleft()
+                for next_student_id in itertools.islice(remaining, 1):
+                    submit(next_student_id)
+                try:
+                    prepared = future.result()
+                except Exception as e:
+                    failed_students[student_id] = str(e)
+                    continue
+                if prepared is None:
+                    skipped_students.append(student_id)
+                    continue
+                report = prepared["report"]
+                for section, df_excel in prepared["sections"]:
+                    sheet_name = excel_sheet_name(f"{student_id}_{section}", used_sheet_names)
+                    write_excel_sheet(workbook, formats, sheet_name, df_excel, COHORT_SHEET_COLUMN_MAP)
+                    sheets_created += 1
+                    if report is not None:
+                        summary_sheet.write_row(summary_row, 0, _cohort_summary_row(student_id, section, sheet_name, report))
+                        summary_row += 1
+                students_exported += 1
+        if students_exported == 0 and not failed_students:
+            return no_data_result
+        workbook.close()
+        completed = True
+    except Exception as e:
+        return {
+            "success": False,
+            "message": f"Error writing cohort workbook: {str(e)}",
+            "students_exported": 0,
+            "sheets_created": 0
+        }
+    finally:
+        # No partial workbook is left behind if the export did not complete
+        if not completed:
+            _discard_workbook(workbook, output_file)
+    
+    return {
+        "success": students_exported == len(student_ids),
+        "message": f"Exported {sheets_created} sheets for {students_exported} of {len(student_ids)} students",
+        "students_exported": students_exported,
+        "sheets_created": sheets_created,
+        "skipped_students": skipped_students,
+        "failed_students": failed_students,
+        "report_file": output_file
+    }
@@ -2,82 +2,110 @@
 CSV Data Analysis for GMAT Diagnosis App
 
 This module provides functions to analyze GMAT diagnosis data stored in CSV files.
+Statistics are computed with pandas groupby aggregations over the stored
+records; the cohort variants return the same results for every student from a
+single read of the data. The per-student functions read the materialized
+per-test-instance summaries (services/storage/summary_store.py) and only fall
+back to the question records when the summary store cannot be read.
 """
 
-from typing import List, Dict, Any
-from collections import defaultdict
+from typing import List, Dict, Any, Optional
+
+import numpy as np
+import pandas as pd
 
 # Import the CSV data service module
 from gmat_diagnosis_app.services.csv_data_service import (
-    get_all_gmat_performance_records,
-    get_all_subjective_report_records,
-    get_student_gmat_performance_records,
-    get_student_section_performance_records,
-    get_test_instance_gmat_performance_records,
-    get_student_subjective_reports
+    get_gmat_performance_dataframe,
+    get_subjective_reports_dataframe,
+    get_student_performance_summaries,
+)
+from gmat_diagnosis_app.services.storage.aggregates import (
+    SKILL_COLUMNS,
+    difficulty_levels,
+    tally,
+    test_instance_aggregates,
 )
+from gmat_diagnosis_app.services.storage.summary_store import SUMMARY_COUNTS
 
 
-def calculate_student_section_stats(student_id: str, gmat_section: str) -> Dict[str, Any]:
+def _average(total: float, valid: int, count: int) -> float:
+    """Mean of a test instance's values, or 0 if any value was not numeric."""
+    return float(total) / count if count > 0 and valid == count else 0
+
+
+def _tally(student_ids: np.ndarray, values: np.ndarray, correct: np.ndarray) -> Dict[str, Dict[str, Dict[str, int]]]:
     """
-    Calculate statistics for a specific student and GMAT section.
-    
-    Args:
-        student_id: The ID of the student to calculate statistics for
-        gmat_section: The section to calculate statistics for ('Q', 'DI', or 'V')
-        
+    Count correct / total answers per (student, value), skipping empty values.
+
     Returns:
-        Dictionary containing the calculated statistics
+        {student_id: {value: {"correct": int, "total": int}}}, values in order of first appearance
     """
-    section_records = get_student_section_performance_records(student_id, gmat_section)
-    
-    if not section_records:
-        return {
-            "student_id": student_id,
-            "gmat_section": gmat_section,
-            "total_tests": 0,
-            "message": "No records found for this student and section"
-        }
-    
-    # Group records by test_instance_id
-    test_instances = defaultdict(list)
-    for record in section_records:
-        test_instances[record["test_instance_id"]].append(record)
-    
+    return {key[0]: counts for key, counts in tally((student_ids,), values, correct).items()}
+
+
+def _summary_aggregates(summaries: List[Dict[str, Any]]) -> pd.DataFrame:
+    """
+    Build the test_instance_aggregates frame of one student from their stored summaries.
+    Summaries of a test instance that spans several sections are combined.
+    """
+    frame = pd.DataFrame(summaries, columns=["student_id", "test_instance_id"] + SUMMARY_COUNTS)
+    if frame.duplicated(["student_id", "test_instance_id"]).any():
+        aggregations = {column: "sum" for column in SUMMARY_COUNTS}
+        aggregations.update({"first_date": "first", "last_date": "last"})
+        frame = frame.groupby(["student_id", "test_instance_id"], sort=False, as_index=False).agg(aggregations)
+    return frame
+
+
+def _summary_tally(summaries: List[Dict[str, Any]], column: str) -> Dict[str, Dict[str, int]]:
+    """Add up one tally column ({value: [correct, total]}) of a student's summaries."""
+    counts: Dict[str, Dict[str, int]] = {}
+    for summary in summaries:
+        for value, (correct_count, total) in summary[column].items():
+            entry = counts.setdefault(value, {"correct": 0, "total": 0})
+            entry["correct"] += correct_count
+            entry["total"] += total
+    return counts
+
+
+def _student_aggregates(student_id: str, gmat_section: Optional[str] = None) -> pd.DataFrame:
+    """
+    Per-test-instance aggregates of one student, from the summary store or, if it
+    cannot be read, from the student's question records.
+    """
+    summaries = get_student_performance_summaries(student_id, gmat_section)
+    if summaries is not None:
+        return _summary_aggregates(summaries)
+    filters = {"student_id": student_id}
+    if gmat_section is not None:
+        filters["gmat_section"] = gmat_section
+    return test_instance_aggregates(get_gmat_performance_dataframe(**filters))
+
+
+def _section_stats(student_id: str, gmat_section: str, aggregates: pd.DataFrame) -> Dict[str, Any]:
     # Calculate statistics for each test instance
     test_stats = []
-    for test_id, records in test_instances.items():
-        correct_count = sum(1 for r in records if r["is_correct"] == '1')
-        total_questions = len(records)
-        accuracy = correct_count / total_questions if total_questions > 0 else 0
-        
-        # Calculate average question time
-        try:
-            avg_question_time = sum(float(r["question_time_minutes"]) for r in records) / total_questions
-        except (ValueError, ZeroDivisionError):
-            avg_question_time = 0
-        
-        # Calculate test date
-        test_date = records[0]["test_date"] if records else "Unknown"
-        
+    for row in aggregates.itertuples(index=False):
+        total_questions = int(row.total_questions)
+        correct_count = int(row.correct_count)
         test_stats.append({
-            "test_instance_id": test_id,
-            "test_date": test_date,
+            "test_instance_id": row.test_instance_id,
+            "test_date": row.first_date,
             "total_questions": total_questions,
             "correct_count": correct_count,
-            "accuracy": accuracy,
-            "avg_question_time_minutes": avg_question_time
+            "accuracy": correct_count / total_questions if total_questions > 0 else 0,
+            "avg_question_time_minutes": _average(row.time_sum, row.time_valid, total_questions)
         })
-    
+
     # Calculate overall statistics
     total_questions = sum(stats["total_questions"] for stats in test_stats)
     total_correct = sum(stats["correct_count"] for stats in test_stats)
     overall_accuracy = total_correct / total_questions if total_questions > 0 else 0
     avg_test_accuracy = sum(stats["accuracy"] for stats in test_stats) / len(test_stats)
-    
+
     # Sort test instances by date
     test_stats.sort(key=lambda x: x["test_date"], reverse=True)
-    
+
     return {
         "student_id": student_id,
         "gmat_section": gmat_section,
@@ -90,40 +118,59 @@ def calculate_student_section_stats(student_id: str, gmat_section: str) -> Dict[
     }
 
 
-def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
+def calculate_student_section_stats(student_id: str, gmat_section: str) -> Dict[str, Any]:
     """
-    Analyze the impact of subjective time pressure on student performance.
-    
+    Calculate statistics for a specific student and GMAT section.
+
     Args:
-        student_id: The ID of the student to analyze
-        
+        student_id: The ID of the student to calculate statistics for
+        gmat_section: The section to calculate statistics for ('Q', 'DI', or 'V')
+
     Returns:
-        Dictionary containing the analysis results
+        Dictionary containing the calculated statistics
     """
-    # Get student's performance records
-    performance_records = get_student_gmat_performance_records(student_id)
-    
-    # Get student's subjective reports
-    subjective_reports = get_student_subjective_reports(student_id)
-    
-    if not performance_records or not subjective_reports:
+    aggregates = _student_aggregates(student_id, gmat_section)
+
+    if aggregates.empty:
         return {
             "student_id": student_id,
-            "analysis_complete": False,
-            "message": "Insufficient data for analysis"
+            "gmat_section": gmat_section,
+            "total_tests": 0,
+            "message": "No records found for this student and section"
         }
-    
-    # Create lookup dictionary for subjective reports
-    report_lookup = {
-        report["test_instance_id"]: report
-        for report in subjective_reports
+
+    return _section_stats(student_id, gmat_section, aggregates)
+
+
+def calculate_cohort_section_stats(gmat_section: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Calculate calculate_student_section_stats for every student with records in a section.
+
+    Args:
+        gmat_section: The section to calculate statistics for ('Q', 'DI', or 'V')
+
+    Returns:
+        Dictionary mapping student_id to the same dictionary calculate_student_section_stats returns
+    """
+    aggregates = test_instance_aggregates(get_gmat_performance_dataframe(gmat_section=gmat_section))
+    return {
+        student_id: _section_stats(student_id, gmat_section, student_aggregates)
+        for student_id, student_aggregates in aggregates.groupby("student_id", sort=False)
     }
-    
-    # Group performance records by test_instance_id
-    test_instances = defaultdict(list)
-    for record in performance_records:
-        test_instances[record["test_instance_id"]].append(record)
-    
+
+
+def _merge_subjective_reports(aggregates: pd.DataFrame, reports: pd.DataFrame) -> pd.DataFrame:
+    """
+    Attach each test instance's subjective report (the last one if there are several),
+    keeping only test instances that have a report.
+    """
+    lookup = reports.drop_duplicates(["student_id", "test_instance_id"], keep="last")[
+        ["student_id", "test_instance_id", "subjective_time_pressure", "gmat_section"]
+    ]
+    return aggregates.merge(lookup, on=["student_id", "test_instance_id"], how="inner", sort=False)
+
+
+def _time_pressure_impact(student_id: str, merged: pd.DataFrame) -> Dict[str, Any]:
     # Analyze performance with and without time pressure
     pressure_results = {
         "with_pressure": {
@@ -141,36 +188,21 @@ def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
             "section_counts": {"Q": 0, "DI": 0, "V": 0}
         }
     }
-    
-    # Calculate statistics for each test instance
-    for test_id, records in test_instances.items():
-        if test_id not in report_lookup:
-            continue
-            
-        report = report_lookup[test_id]
-        category = "with_pressure" if report["subjective_time_pressure"] == '1' else "without_pressure"
-        section = report["gmat_section"]
-        
-        # Update section counts
-        pressure_results[category]["section_counts"][section] += 1
-        
-        # Update test counts
-        pressure_results[category]["count"] += 1
-        
-        # Calculate and update question statistics
-        correct_count = sum(1 for r in records if r["is_correct"] == '1')
-        total_questions = len(records)
-        
-        pressure_results[category]["total_questions"] += total_questions
-        pressure_results[category]["correct_count"] += correct_count
-        
-        # Update average question time
-        try:
-            total_time = sum(float(r["question_time_minutes"]) for r in records)
-            pressure_results[category]["avg_question_time"] += total_time
-        except ValueError:
-            pass
-    
+
+    # Tests with any non-numeric question time contribute no time
+    merged = merged.assign(
+        category=np.where(merged["subjective_time_pressure"].to_numpy() == '1', "with_pressure", "without_pressure"),
+        time_total=np.where(merged["time_valid"] == merged["total_questions"], merged["time_sum"], 0.0),
+    )
+    for category, group in merged.groupby("category", sort=False):
+        data = pressure_results[category]
+        data["count"] = len(group)
+        data["total_questions"] = int(group["total_questions"].sum())
+        data["correct_count"] = int(group["correct_count"].sum())
+        data["avg_question_time"] = float(group["time_total"].sum())
+        for section, count in group["gmat_section"].value_counts(sort=False).items():
+            data["section_counts"][section] = data["section_counts"].get(section, 0) + int(count)
+
     # Calculate final averages
     for category in ["with_pressure", "without_pressure"]:
         data = pressure_results[category]
@@ -179,18 +211,18 @@ def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
             data["accuracy"] = data["correct_count"] / data["total_questions"] if data["total_questions"] > 0 else 0
         else:
             data["accuracy"] = 0
-    
+
     # Calculate performance difference
     performance_diff = {}
-    if (pressure_results["with_pressure"]["count"] > 0 and 
+    if (pressure_results["with_pressure"]["count"] > 0 and
         pressure_results["without_pressure"]["count"] > 0):
-        
-        accuracy_diff = (pressure_results["without_pressure"]["accuracy"] - 
+
+        accuracy_diff = (pressure_results["without_pressure"]["accuracy"] -
                         pressure_results["with_pressure"]["accuracy"])
-        
-        time_diff = (pressure_results["without_pressure"]["avg_question_time"] - 
+
+        time_diff = (pressure_results["without_pressure"]["avg_question_time"] -
                     pressure_results["with_pressure"]["avg_question_time"])
-        
+
         performance_diff = {
             "accuracy_difference": accuracy_diff,
             "time_difference": time_diff,
@@ -201,7 +233,7 @@ def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
             "analysis_complete": False,
             "message": "Insufficient data for comparison (need tests both with and without time pressure)"
         }
-    
+
     return {
         "student_id": student_id,
         "with_pressure": pressure_results["with_pressure"],
@@ -210,33 +242,75 @@ def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
     }
 
 
-def identify_student_strengths_weaknesses(student_id: str, gmat_section: str) -> Dict[str, Any]:
+def _insufficient_time_pressure_data(student_id: str) -> Dict[str, Any]:
+    return {
+        "student_id": student_id,
+        "analysis_complete": False,
+        "message": "Insufficient data for analysis"
+    }
+
+
+def analyze_time_pressure_impact(student_id: str) -> Dict[str, Any]:
     """
-    Identify a student's strengths and weaknesses based on their performance.
-    
+    Analyze the impact of subjective time pressure on student performance.
+
     Args:
         student_id: The ID of the student to analyze
-        gmat_section: The section to analyze ('Q', 'DI', or 'V')
-        
+
     Returns:
         Dictionary containing the analysis results
     """
-    section_records = get_student_section_performance_records(student_id, gmat_section)
-    
-    if not section_records:
-        return {
-            "student_id": student_id,
-            "gmat_section": gmat_section,
-            "analysis_complete": False,
-            "message": "No records found for this student and section"
-        }
-    
-    # Initialize analysis structures
+    # Get student's performance records and subjective reports
+    aggregates = _student_aggregates(student_id)
+    subjective_reports = get_subjective_reports_dataframe(student_id=student_id)
+
+    if aggregates.empty or subjective_reports.empty:
+        return _insufficient_time_pressure_data(student_id)
+
+    merged = _merge_subjective_reports(aggregates, subjective_reports)
+    return _time_pressure_impact(student_id, merged)
+
+
+def analyze_cohort_time_pressure_impact() -> Dict[str, Dict[str, Any]]:
+    """
+    Run analyze_time_pressure_impact for every student from one read of each table.
+
+    Returns:
+        Dictionary mapping student_id to the same dictionary analyze_time_pressure_impact returns
+    """
+    aggregates = test_instance_aggregates(get_gmat_performance_dataframe())
+    subjective_reports = get_subjective_reports_dataframe()
+    merged = _merge_subjective_reports(aggregates, subjective_reports)
+    merged_by_student = dict(tuple(merged.groupby("student_id", sort=False)))
+
+    students_with_records = set(aggregates["student_id"])
+    students_with_reports = set(subjective_reports["student_id"])
+    student_ids = list(dict.fromkeys(list(aggregates["student_id"]) + list(subjective_reports["student_id"])))
+
+    results = {}
+    for student_id in student_ids:
+        if student_id not in students_with_records or student_id not in students_with_reports:
+            results[student_id] = _insufficient_time_pressure_data(student_id)
+        else:
+            results[student_id] = _time_pressure_impact(
+                student_id, merged_by_student.get(student_id, merged.iloc[0:0])
+            )
+    return results
+
+
+def _strengths_weaknesses(
+    student_id: str,
+    gmat_section: str,
+    total_questions: int,
+    skills_counts: Dict[str, Dict[str, int]],
+    q_types_counts: Dict[str, Dict[str, int]],
+    difficulty_counts: Dict[str, Dict[str, int]]
+) -> Dict[str, Any]:
     analysis = {
         "student_id": student_id,
         "gmat_section": gmat_section,
         "analysis_complete": True,
-        "total_questions": len(section_records),
+        "total_questions": int(total_questions),
         "skills_analysis": {},
         "question_types_analysis": {},
         "difficulty_analysis": {
@@ -245,171 +319,141 @@ def identify_student_strengths_weaknesses(student_id: str, gmat_section: str) ->
             "hard": {"correct": 0, "total": 0, "accuracy": 0}
         }
     }
-    
-    # Initialize counters for different analysis aspects
-    skills_counts = defaultdict(lambda: {"correct": 0, "total": 0})
-    q_types_counts = defaultdict(lambda: {"correct": 0, "total": 0})
-    
-    # Process each record
-    for record in section_records:
-        is_correct = record["is_correct"] == '1'
-        
-        # Process fundamental skill analysis
-        if gmat_section in ["Q", "V"]:
-            skill = record.get("question_fundamental_skill", "Unknown")
-            if skill:
-                skills_counts[skill]["total"] += 1
-                if is_correct:
-                    skills_counts[skill]["correct"] += 1
-        
-        # Process content domain analysis for DI section
-        if gmat_section == "DI":
-            domain = record.get("content_domain", "Unknown")
-            if domain:
-                skills_counts[domain]["total"] += 1
-                if is_correct:
-                    skills_counts[domain]["correct"] += 1
-        
-        # Process question type analysis
-        q_type = record.get("question_type", "Unknown")
-        if q_type:
-            q_types_counts[q_type]["total"] += 1
-            if is_correct:
-                q_types_counts[q_type]["correct"] += 1
-        
-        # Process difficulty analysis
-        try:
-            difficulty = float(record["question_difficulty"])
-            
-            # Categorize difficulty
-            if difficulty < 3:
-                category = "easy"
-            elif difficulty < 4:
-                category = "medium"
-            else:
-                category = "hard"
-                
-            analysis["difficulty_analysis"][category]["total"] += 1
-            if is_correct:
-                analysis["difficulty_analysis"][category]["correct"] += 1
-                
-        except (ValueError, KeyError):
-            pass
-    
-    # Calculate accuracies for skills/domains
-    for skill, counts in skills_counts.items():
-        accuracy = counts["correct"] / counts["total"] if counts["total"] > 0 else 0
-        analysis["skills_analysis"][skill] = {
-            "correct": counts["correct"],
-            "total": counts["total"],
-            "accuracy": accuracy
-        }
-    
-    # Calculate accuracies for question types
-    for q_type, counts in q_types_counts.items():
-        accuracy = counts["correct"] / counts["total"] if counts["total"] > 0 else 0
-        analysis["question_types_analysis"][q_type] = {
-            "correct": counts["correct"],
-            "total": counts["total"],
-            "accuracy": accuracy
-        }
-    
+
+    # Calculate accuracies for skills/domains and question types
+    for target, counts_by_value in (
+        ("skills_analysis", skills_counts),
+        ("question_types_analysis", q_types_counts),
+    ):
+        for value, counts in counts_by_value.items():
+            analysis[target][value] = {
+                "correct": counts["correct"],
+                "total": counts["total"],
+                "accuracy": counts["correct"] / counts["total"] if counts["total"] > 0 else 0
+            }
+
     # Calculate accuracies for difficulty levels
+    for level, counts in difficulty_counts.items():
+        analysis["difficulty_analysis"][level].update(counts)
     for level in analysis["difficulty_analysis"]:
         counts = analysis["difficulty_analysis"][level]
         counts["accuracy"] = counts["correct"] / counts["total"] if counts["total"] > 0 else 0
-    
+
     # Identify strengths and weaknesses
     if analysis["skills_analysis"]:
         skills = list(analysis["skills_analysis"].items())
-        
+
         # Sort by accuracy
         strengths = sorted(skills, key=lambda x: x[1]["accuracy"], reverse=True)
         weaknesses = sorted(skills, key=lambda x: x[1]["accuracy"])
-        
+
         # Filter to include only skills with at least 2 questions
         strengths = [s for s in strengths if s[1]["total"] >= 2]
         weaknesses = [s for s in weaknesses if s[1]["total"] >= 2]
-        
+
         analysis["top_strengths"] = [{"skill": s[0], **s[1]} for s in strengths[:3]]
         analysis["top_weaknesses"] = [{"skill": w[0], **w[1]} for w in weaknesses[:3]]
-    
+
     return analysis
 
 
-def get_progress_over_time(student_id: str, gmat_section: str) -> Dict[str, Any]:
+def _strengths_weaknesses_by_student(gmat_section: str, frame: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    student_ids = frame["student_id"].to_numpy()
+    correct = frame["is_correct"].to_numpy() == '1'
+
+    # Fundamental skills for Q/V, content domains for DI
+    skill_column = SKILL_COLUMNS.get(gmat_section)
+    skills_counts = _tally(student_ids, frame[skill_column].to_numpy(), correct) if skill_column else {}
+    q_types_counts = _tally(student_ids, frame["question_type"].to_numpy(), correct)
+
+    # Categorize difficulty (non-numeric difficulties are skipped)
+    levels, has_difficulty = difficulty_levels(frame)
+    difficulty_counts = _tally(student_ids[has_difficulty], levels[has_difficulty], correct[has_difficulty])
+
+    return {
+        student_id: _strengths_weaknesses(
+            student_id, gmat_section, total_questions,
+            skills_counts.get(student_id, {}),
+            q_types_counts.get(student_id, {}),
+            difficulty_counts.get(student_id, {}),
+        )
+        for student_id, total_questions in frame["student_id"].value_counts(sort=False).items()
+    }
+
+
+def identify_student_strengths_weaknesses(student_id: str, gmat_section: str) -> Dict[str, Any]:
     """
-    Track a student's progress over time for a specific GMAT section.
-    
+    Identify a student's strengths and weaknesses based on their performance.
+
     Args:
         student_id: The ID of the student to analyze
         gmat_section: The section to analyze ('Q', 'DI', or 'V')
-        
+
     Returns:
-        Dictionary containing the progress analysis
+        Dictionary containing the analysis results
     """
-    section_records = get_student_section_performance_records(student_id, gmat_section)
-    
-    if not section_records:
-        return {
-            "student_id": student_id,
-            "gmat_section": gmat_section,
-            "analysis_complete": False,
-            "message": "No records found for this student and section"
-        }
-    
-    # Group records by test_instance_id and test_date
-    test_instances = defaultdict(lambda: {"records": [], "date": None})
-    
-    for record in section_records:
-        test_id = record["test_instance_id"]
-        test_instances[test_id]["records"].append(record)
-        test_instances[test_id]["date"] = record["test_date"]
-    
-    # Calculate statistics for each test instance
-    progress_data = []
-    
-    for test_id, data in test_instances.items():
-        records = data["records"]
-        test_date = data["date"]
-        
-        total_questions = len(records)
-        correct_count = sum(1 for r in records if r["is_correct"] == '1')
-        accuracy = correct_count / total_questions if total_questions > 0 else 0
-        
-        # Calculate average time per question
-        try:
-            avg_time = sum(float(r["question_time_minutes"]) for r in records) / total_questions
-        except (ValueError, ZeroDivisionError):
-            avg_time = 0
-            
-        # Calculate difficulty metrics
-        try:
-            avg_difficulty = sum(float(r["question_difficulty"]) for r in records) / total_questions
-        except (ValueError, ZeroDivisionError):
-            avg_difficulty = 0
-        
+    summaries = get_student_performance_summaries(student_id, gmat_section)
+    if summaries is None:
+        section_frame = get_gmat_performance_dataframe(student_id=student_id, gmat_section=gmat_section)
+        if not section_frame.empty:
+            return _strengths_weaknesses_by_student(gmat_section, section_frame)[student_id]
+    elif summaries:
+        return _strengths_weaknesses(
+            student_id, gmat_section,
+            sum(summary["total_questions"] for summary in summaries),
+            _summary_tally(summaries, "skills"),
+            _summary_tally(summaries, "question_types"),
+            _summary_tally(summaries, "difficulty"),
+        )
+
+    return {
+        "student_id": student_id,
+        "gmat_section": gmat_section,
+        "analysis_complete": False,
+        "message": "No records found for this student and section"
+    }
+
+
+def identify_cohort_strengths_weaknesses(gmat_section: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Run identify_student_strengths_weaknesses for every student with records in a section.
+
+    Args:
+        gmat_section: The section to analyze ('Q', 'DI', or 'V')
+
+    Returns:
+        Dictionary mapping student_id to the same dictionary identify_student_strengths_weaknesses returns
+    """
+    return _strengths_weaknesses_by_student(gmat_section, get_gmat_performance_dataframe(gmat_section=gmat_section))
+
+
+def _progress_over_time(student_id: str, gmat_section: str, aggregates: pd.DataFrame) -> Dict[str, Any]:
+    # Calculate statistics for each test instance (the date is the one of its last record)
+    progress_data: List[Dict[str, Any]] = []
+    for row in aggregates.itertuples(index=False):
+        total_questions = int(row.total_questions)
+        correct_count = int(row.correct_count)
         progress_data.append({
-            "test_instance_id": test_id,
-            "test_date": test_date,
+            "test_instance_id": row.test_instance_id,
+            "test_date": row.last_date,
             "total_questions": total_questions,
             "correct_count": correct_count,
-            "accuracy": accuracy,
-            "avg_question_time_minutes": avg_time,
-            "avg_difficulty": avg_difficulty
+            "accuracy": correct_count / total_questions if total_questions > 0 else 0,
+            "avg_question_time_minutes": _average(row.time_sum, row.time_valid, total_questions),
+            "avg_difficulty": _average(row.difficulty_sum, row.difficulty_valid, total_questions)
         })
-    
+
     # Sort by test date
     progress_data.sort(key=lambda x: x["test_date"])
-    
+
     # Calculate trend metrics
     if len(progress_data) >= 2:
         first_test = progress_data[0]
         latest_test = progress_data[-1]
-        
+
         accuracy_change = latest_test["accuracy"] - first_test["accuracy"]
         time_change = latest_test["avg_question_time_minutes"] - first_test["avg_question_time_minutes"]
-        
+
         trend_analysis = {
             "accuracy_trend": "improving" if accuracy_change > 0 else "declining" if accuracy_change < 0 else "stable",
             "accuracy_change": accuracy_change,
@@ -423,11 +467,52 @@ def get_progress_over_time(student_id: str, gmat_section: str) -> Dict[str, Any]
             "message": "Need at least 2 tests to calculate trends",
             "num_tests_analyzed": len(progress_data)
         }
-    
+
     return {
         "student_id": student_id,
         "gmat_section": gmat_section,
         "analysis_complete": True,
         "progress_data": progress_data,
         "trend_analysis": trend_analysis
-    } 
\ No newline at end of file
+    }
+
+
+def get_progress_over_time(student_id: str, gmat_section: str) -> Dict[str, Any]:
+    """
+    Track a student's progress over time for a specific GMAT section.
+
+    Args:
+        student_id: The ID of the student to analyze
+        gmat_section: The section to analyze ('Q', 'DI', or 'V')
+
+    Returns:
+        Dictionary containing the progress analysis
+    """
+    aggregates = _student_aggregates(student_id, gmat_section)
+
+    if aggregates.empty:
+        return {
+            "student_id": student_id,
+            "gmat_section": gmat_section,
+            "analysis_complete": False,
+            "message": "No records found for this student and section"
+        }
+
+    return _progress_over_time(student_id, gmat_section, aggregates)
+
+
+def get_cohort_progress_over_time(gmat_section: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Run get_progress_over_time for every student with records in a section.
+
+    Args:
+        gmat_section: The section to analyze ('Q', 'DI', or 'V')
+
+    Returns:
+        Dictionary mapping student_id to the same dictionary get_progress_over_time returns
+    """
+    aggregates = test_instance_aggregates(get_gmat_performance_dataframe(gmat_section=gmat_section))
+    return {
+        student_id: _progress_over_time(student_id, gmat_section, student_aggregates)
+        for student_id, student_aggregates in aggregates.groupby("student_id", sort=False)
+    }
@@ -2,13 +2,34 @@
 CSV Data Service for GMAT Diagnosis App
 
 This module provides functions to manage GMAT diagnosis data and student subjective reports
-stored in CSV files.
+stored in CSV files (default), a SQLite database or a Parquet dataset, via the backends in
+services/storage.
 """
 
-import csv
 import os
 import datetime
-from typing import List, Dict, Any, Optional
+import threading
+from typing import List, Dict, Any, Iterator, Optional, Set, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from gmat_diagnosis_app.services.storage import (
+    StorageBackend,
+    CSVStorageBackend,
+    SQLiteStorageBackend,
+    ParquetStorageBackend,
+    PerformanceSummaryStore,
+    migrate_storage,
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    GMAT_PERFORMANCE_HEADERS,
+    STUDENT_SUBJECTIVE_REPORTS_HEADERS,
+    GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK,
+    STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK,
+    record_digest,
+    serialize_record,
+)
 
 # --- Revised Path Definition ---
 # Get the directory where this script (csv_data_service.py) is located
@@ -19,48 +40,263 @@ APP_DIR = os.path.dirname(SCRIPT_DIR)
 # Define file paths based on the APP_DIR
 GMAT_PERFORMANCE_DATA_FILE = os.path.join(APP_DIR, "gmat_performance_data.csv")
 STUDENT_SUBJECTIVE_REPORTS_FILE = os.path.join(APP_DIR, "student_subjective_reports.csv")
+GMAT_SQLITE_DB_FILE = os.environ.get("GMAT_SQLITE_DB_FILE", os.path.join(APP_DIR, "gmat_data.sqlite3"))
+GMAT_PARQUET_DIR = os.environ.get("GMAT_PARQUET_DIR", os.path.join(APP_DIR, "gmat_parquet"))
+GMAT_SUMMARY_DB_FILE = os.environ.get("GMAT_SUMMARY_DB_FILE", os.path.join(APP_DIR, "gmat_summary.sqlite3"))
 # --- End of Revised Path Definition ---
 
 # Define constants
 APP_SUBDIRECTORY = "gmat_diagnosis_app" # Define the app subdirectory
 
-# Define CSV headers
-GMAT_PERFORMANCE_HEADERS = [
-    "student_id",
-    "test_instance_id",
-    "gmat_section",
-    "test_date",
-    "question_id",
-    "question_position",
-    "question_time_minutes",
-    "is_correct",
-    "question_difficulty",
-    "question_type",
-    "question_fundamental_skill",
-    "content_domain",
-    "total_section_time_minutes",
-    "max_allowed_section_time_minutes",
-    "total_questions_in_section",
-    "record_timestamp"
-]
-
-STUDENT_SUBJECTIVE_REPORTS_HEADERS = [
-    "student_id",
-    "test_instance_id",
-    "gmat_section",
-    "subjective_time_pressure",
-    "report_collection_timestamp"
-]
-
-# Headers for duplicate check, excluding fields that change with each write (e.g., timestamp)
-GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK = [
-    h for h in GMAT_PERFORMANCE_HEADERS if h != "record_timestamp"
-]
-
-# Headers for subjective report duplicate check, excluding timestamp field
-STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK = [
-    h for h in STUDENT_SUBJECTIVE_REPORTS_HEADERS if h != "report_collection_timestamp"
-]
+# Storage backend selection: "csv" (default, original files), "sqlite" (indexed lookups)
+# or "parquet" (typed columnar files, requires pyarrow)
+STORAGE_BACKEND_ENV = "GMAT_STORAGE_BACKEND"
+
+# CSV backend write path: appends are queued and written in batches by a background
+# thread ("0" writes synchronously); fsync policy is "always", "batch" or "never"
+CSV_WRITE_BEHIND_ENV = "GMAT_CSV_WRITE_BEHIND"
+CSV_FSYNC_POLICY_ENV = "GMAT_CSV_FSYNC"
+
+# GMAT_PERFORMANCE_HEADERS, STUDENT_SUBJECTIVE_REPORTS_HEADERS and the
+# *_HEADERS_FOR_DUPLICATE_CHECK lists are defined in services/storage/schema.py
+# and re-exported here for existing imports.
+
+
+_storage_backend: Optional[StorageBackend] = None
+_storage_backend_lock = threading.Lock()
+_summary_store: Optional[PerformanceSummaryStore] = None
+
+
+def create_storage_backend(kind: Optional[str] = None) -> StorageBackend:
+    """
+    Create a storage backend by name.
+
+    Args:
+        kind: 'csv', 'sqlite' or 'parquet'. Defaults to the GMAT_STORAGE_BACKEND environment variable, then 'csv'.
+
+    Returns:
+        A new StorageBackend instance using this module's file paths.
+    """
+    kind = (kind or os.environ.get(STORAGE_BACKEND_ENV) or "csv").strip().lower()
+    if kind == "csv":
+        return CSVStorageBackend(
+            GMAT_PERFORMANCE_DATA_FILE,
+            STUDENT_SUBJECTIVE_REPORTS_FILE,
+            write_behind=os.environ.get(CSV_WRITE_BEHIND_ENV, "0").strip() == "1",
+            fsync_policy=os.environ.get(CSV_FSYNC_POLICY_ENV, "batch").strip().lower(),
+        )
+    if kind == "sqlite":
+        return SQLiteStorageBackend(GMAT_SQLITE_DB_FILE)
+    if kind == "parquet":
+        return ParquetStorageBackend(GMAT_PARQUET_DIR)
+    raise ValueError(f"Unknown storage backend: {kind!r} (expected 'csv', 'sqlite' or 'parquet')")
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Get the process-wide storage backend, creating it on first use.
+    """
+    global _storage_backend
+    if _storage_backend is None:
+        with _storage_backend_lock:
+            if _storage_backend is None:
+                _storage_backend = create_storage_backend()
+    return _storage_backend
+
+
+def set_storage_backend(backend: StorageBackend) -> None:
+    """
+    Replace the process-wide storage backend.
+    """
+    global _storage_backend
+    with _storage_backend_lock:
+        replaced = _storage_backend is not None and _storage_backend is not backend
+        if replaced:
+            _storage_backend.flush()
+        _storage_backend = backend
+    if replaced:
+        # The summaries describe the old backend's records; rebuild them on next use
+        _clear_performance_summary()
+
+
+def migrate_csv_to_sqlite(db_path: Optional[str] = None, overwrite: bool = False) -> Dict[str, Any]:
+    """
+    One-shot migration of the CSV files into a SQLite database.
+    Set GMAT_STORAGE_BACKEND=sqlite afterwards to serve reads from it.
+    
+    Args:
+        db_path: Target database file (defaults to GMAT_SQLITE_DB_FILE)
+        overwrite: Replace records already present in the database
+        
+    Returns:
+        Dictionary containing migration statistics per table
+    """
+    # Make sure rows queued by the active backend are on disk before copying
+    get_storage_backend().flush()
+    source = CSVStorageBackend(GMAT_PERFORMANCE_DATA_FILE, STUDENT_SUBJECTIVE_REPORTS_FILE)
+    target = SQLiteStorageBackend(db_path or GMAT_SQLITE_DB_FILE)
+    try:
+        results = migrate_storage(source, target, overwrite=overwrite)
+    except Exception as e:
+        print(f"Error migrating CSV data to SQLite: {e}")
+        return {"success": False, "message": str(e), "tables": {}}
+    print(f"Migrated CSV data to {target.db_path}: {results['tables']}")
+    return results
+
+
+def migrate_csv_to_parquet(root_dir: Optional[str] = None, overwrite: bool = False) -> Dict[str, Any]:
+    """
+    One-shot migration of the CSV files into a partitioned Parquet dataset.
+    Set GMAT_STORAGE_BACKEND=parquet afterwards to serve reads from it.
+    
+    Args:
+        root_dir: Target directory (defaults to GMAT_PARQUET_DIR)
+        overwrite: Replace records already present in the dataset
+        
+    Returns:
+        Dictionary containing migration statistics per table
+    """
+    get_storage_backend().flush()
+    source = CSVStorageBackend(GMAT_PERFORMANCE_DATA_FILE, STUDENT_SUBJECTIVE_REPORTS_FILE)
+    try:
+        target = ParquetStorageBackend(root_dir or GMAT_PARQUET_DIR)
+        results = migrate_storage(source, target, overwrite=overwrite)
+    except Exception as e:
+        print(f"Error migrating CSV data to Parquet: {e}")
+        return {"success": False, "message": str(e), "tables": {}}
+    print(f"Migrated CSV data to {target.root_dir}: {results['tables']}")
+    return results
+
+
+def compact_storage() -> Dict[str, Any]:
+    """
+    Merges pending updates/deletes of the CSV backend into the CSV files.
+    Updates and deletes are appended to a change log and compacted automatically
+    once the log grows; call this e.g. before copying the CSV files elsewhere.
+    
+    Returns:
+        Dictionary containing the number of merged change-log entries per table
+    """
+    backend = _initialize_storage()
+    if not isinstance(backend, CSVStorageBackend):
+        return {"success": True, "tables": {}}
+    try:
+        merged = backend.compact()
+    except Exception as e:
+        print(f"Error compacting CSV storage: {e}")
+        return {"success": False, "message": str(e), "tables": {}}
+    return {"success": True, "tables": merged}
+
+
+def get_summary_store() -> PerformanceSummaryStore:
+    """
+    Get the process-wide performance summary store, creating it on first use.
+    """
+    global _summary_store
+    if _summary_store is None:
+        with _storage_backend_lock:
+            if _summary_store is None:
+                _summary_store = PerformanceSummaryStore(GMAT_SUMMARY_DB_FILE)
+    return _summary_store
+
+
+def _ready_summary_store(backend: StorageBackend,
+                         expected_signature: Optional[str] = None) -> Tuple[PerformanceSummaryStore, bool]:
+    """
+    Returns the summary store and whether it had to be rebuilt from ``backend``
+    (in which case it already reflects every stored record).
+
+    The store is rebuilt when it is empty or when the data signature it was last
+    brought up to date with differs from ``expected_signature`` (default: the
+    backend's current signature), i.e. the data was changed outside the app.
+    """
+    store = get_summary_store()
+    current_signature = backend.data_signature(PERFORMANCE_TABLE)
+    if expected_signature is None:
+        expected_signature = current_signature
+    if store.is_built() and (expected_signature is None or store.source_signature() == expected_signature):
+        return store, False
+    store.rebuild(backend.query_frame(PERFORMANCE_TABLE), current_signature)
+    return store, True
+
+
+def _clear_performance_summary() -> None:
+    try:
+        get_summary_store().clear()
+    except Exception as e:
+        print(f"Error clearing performance summary: {e}")
+
+
+def _update_performance_summary(
+    backend: StorageBackend,
+    signature_before: Optional[str],
+    added_frame: Optional[pd.DataFrame] = None,
+    changed_test_instance_ids: Optional[List[str]] = None,
+    updates: Optional[Dict[str, Any]] = None
+) -> None:
+    """
+    Applies a write to the performance summary store. ``signature_before`` is the
+    backend's data signature taken just before the write; if the store does not
+    match it, the data also changed elsewhere and the store is rebuilt instead.
+    A failed update clears the store, so it is rebuilt from the stored records on
+    next use instead of serving stale summaries.
+    """
+    try:
+        store, rebuilt = _ready_summary_store(backend, signature_before)
+        if rebuilt:
+            return
+        if added_frame is not None:
+            store.add_records(added_frame)
+        if changed_test_instance_ids:
+            # A rename to the same ID lists it twice; its rows must be summarized once
+            changed_test_instance_ids = list(dict.fromkeys(changed_test_instance_ids))
+            frames = [
+                backend.query_frame(PERFORMANCE_TABLE, test_instance_id=test_instance_id)
+                for test_instance_id in changed_test_instance_ids
+            ]
+            store.replace_test_instances(changed_test_instance_ids, pd.concat(frames, ignore_index=True), updates)
+        store.set_source_signature(backend.data_signature(PERFORMANCE_TABLE))
+    except Exception as e:
+        print(f"Error updating performance summary: {e}")
+        _clear_performance_summary()
+
+
+def get_student_performance_summaries(student_id: str, gmat_section: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Get the materialized per-test-instance summaries of a student.
+    
+    Args:
+        student_id: The ID of the student to retrieve summaries for
+        gmat_section: Optional section filter ('Q', 'DI', or 'V')
+        
+    Returns:
+        List of summary dictionaries (see storage/summary_store.py) in order of first
+        appearance, or None if the summary store could not be read.
+    """
+    try:
+        store, _ = _ready_summary_store(_initialize_storage())
+        return store.student_summaries(student_id, gmat_section)
+    except Exception as e:
+        print(f"Error reading performance summary: {e}")
+        return None
+
+
+def rebuild_performance_summary() -> Dict[str, Any]:
+    """
+    Rebuilds the performance summary store from every stored performance record,
+    e.g. after the data files were edited outside the app.
+    
+    Returns:
+        Dictionary containing the number of summarized test instances
+    """
+    try:
+        backend = _initialize_storage()
+        signature = backend.data_signature(PERFORMANCE_TABLE)
+        summaries = get_summary_store().rebuild(backend.query_frame(PERFORMANCE_TABLE), signature)
+    except Exception as e:
+        print(f"Error rebuilding performance summary: {e}")
+        return {"success": False, "message": str(e)}
+    return {"success": True, "test_instances": summaries}
 
 
 def initialize_csv_files() -> None:
@@ -68,25 +304,16 @@ def initialize_csv_files() -> None:
     Initialize CSV files if they do not exist.
     Creates the files and writes headers.
     """
-    # Initialize gmat_performance_data.csv
-    if not os.path.exists(GMAT_PERFORMANCE_DATA_FILE):
-        try:
-            with open(GMAT_PERFORMANCE_DATA_FILE, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
-                writer.writeheader()
-                print(f"Created {GMAT_PERFORMANCE_DATA_FILE} successfully.")
-        except Exception as e:
-            print(f"Error creating {GMAT_PERFORMANCE_DATA_FILE}: {e}")
-    
-    # Initialize student_subjective_reports.csv
-    if not os.path.exists(STUDENT_SUBJECTIVE_REPORTS_FILE):
-        try:
-            with open(STUDENT_SUBJECTIVE_REPORTS_FILE, 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-                writer.writeheader()
-                print(f"Created {STUDENT_SUBJECTIVE_REPORTS_FILE} successfully.")
-        except Exception as e:
-            print(f"Error creating {STUDENT_SUBJECTIVE_REPORTS_FILE}: {e}")
+    CSVStorageBackend(GMAT_PERFORMANCE_DATA_FILE, STUDENT_SUBJECTIVE_REPORTS_FILE).initialize()
+
+
+def _initialize_storage() -> StorageBackend:
+    """
+    Initialize the active storage backend and return it.
+    """
+    backend = get_storage_backend()
+    backend.initialize()
+    return backend
 
 
 def validate_gmat_performance_record(record: Dict[str, Any]) -> bool:
@@ -157,146 +384,282 @@ def validate_gmat_performance_record(record: Dict[str, Any]) -> bool:
     return True
 
 
-def _is_duplicate_record(
-    new_records_sample: List[Dict[str, Any]],
-    existing_csv_file_path: str,
-    headers_for_comparison: List[str]
-) -> bool:
+def validate_gmat_performance_frame(frame: pd.DataFrame) -> pd.Series:
     """
-    Check if the sample of new records (first 5 rows) already exists in the CSV file.
-    Comparison is based on a specified list of headers.
+    Vectorized validate_gmat_performance_record for a chunk of imported rows.
+    Applies the same rules to the serialized (string) values of a CSV import,
+    e.g. is_correct '0'/'1' and question_position '3'.
+    
+    Args:
+        frame: DataFrame with the GMAT performance columns as strings
+        
+    Returns:
+        Series (same index) with the error message of each invalid row and '' for valid rows;
+        a missing required column marks every row invalid.
     """
-    if not os.path.exists(existing_csv_file_path):
-        return False # File doesn't exist, so no duplicates
+    required_fields = [
+        "student_id", "test_instance_id", "gmat_section", "test_date",
+        "question_id", "question_position", "question_time_minutes",
+        "is_correct", "question_difficulty", "question_type",
+        "total_section_time_minutes", "max_allowed_section_time_minutes",
+        "total_questions_in_section"
+    ]
+    for field in required_fields:
+        if field not in frame.columns:
+            return pd.Series(f"Missing required field: {field}", index=frame.index)
+
+    def number(column: str) -> pd.Series:
+        return pd.to_numeric(frame[column].astype(str).str.strip(), errors="coerce")
 
-    if not new_records_sample:
-        return False # No new records to check
+    position = frame["question_position"].astype(str)
+    # Checks in the order of validate_gmat_performance_record; a row reports its first failure
+    checks = [
+        (~frame["is_correct"].astype(str).isin(["0", "1"]),
+         "Invalid value for is_correct. Must be 0 or 1."),
+        (~(position.str.fullmatch(r"\d+") & (number("question_position") > 0)),
+         "Invalid question_position. Must be a positive integer."),
+        (~(number("question_time_minutes") >= 0),
+         "Invalid question_time_minutes. Must be a non-negative number."),
+        (~(number("total_section_time_minutes") >= 0),
+         "Invalid total_section_time_minutes. Must be a non-negative number."),
+        (~(number("max_allowed_section_time_minutes") > 0),
+         "Invalid max_allowed_section_time_minutes. Must be a positive number."),
+        (~frame["gmat_section"].isin(["Q", "DI", "V"]),
+         "Invalid gmat_section. Must be 'Q', 'DI', or 'V'."),
+        (pd.to_datetime(frame["test_date"], format="%Y-%m-%d", errors="coerce").isna(),
+         "Invalid test_date format. Must be in YYYY-MM-DD format."),
+    ]
+    errors = np.select([mask.to_numpy() for mask, _ in checks], [message for _, message in checks], default="")
+    return pd.Series(errors, index=frame.index, dtype=object)
+
+
+def _filter_duplicate_records(
+    backend: StorageBackend,
+    table: str,
+    new_records: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Removes records that are already stored or that repeat earlier in the batch.
+
+    Records are compared by their digest over the duplicate-check headers (see
+    storage/schema.py), looked up in the backend's persisted digest index, so the
+    cost depends on the batch size rather than the number of stored records.
+
+    Returns:
+        The records to write, in their original order.
+    """
+    if not new_records:
+        return []
 
+    digests = [record_digest(record, table) for record in new_records]
     try:
-        with open(existing_csv_file_path, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            existing_records = list(reader)
-            if not existing_records:
-                return False # Existing file is empty
+        existing: Set[int] = backend.find_existing_digests(table, digests, new_records)
+    except Exception as e:
+        print(f"Error reading or comparing stored records for duplicates: {e}")
+        existing = set() # Treat errors as non-duplicate to allow write if unsure
 
-            num_new_sample = len(new_records_sample)
-            
-            # Prepare the new sample for comparison by selecting and ordering relevant fields
-            new_sample_to_compare = []
-            for new_rec in new_records_sample:
-                try:
-                    new_sample_to_compare.append(
-                        tuple(str(new_rec.get(h, '')) for h in headers_for_comparison)
-                    )
-                except Exception as e:
-                    # Handle potential errors if a header is missing or value conversion fails, though validation should prevent this
-                    print(f"Warning: Error preparing new record for comparison: {new_rec}, error: {e}")
-                    # Depending on strictness, could return True to prevent partial write, or False to allow
-                    return False # Or True if strictness is required
-
-
-            # Iterate through existing records to find a match for the new sample
-            for i in range(len(existing_records) - num_new_sample + 1):
-                current_existing_chunk_to_compare = []
-                is_match = True
-                for j in range(num_new_sample):
-                    existing_rec_for_chunk = existing_records[i+j]
-                    try:
-                        current_existing_chunk_to_compare.append(
-                             tuple(str(existing_rec_for_chunk.get(h, '')) for h in headers_for_comparison)
-                        )
-                    except Exception as e:
-                        print(f"Warning: Error preparing existing record for comparison: {existing_rec_for_chunk}, error: {e}")
-                        is_match = False # Chunk cannot be reliably compared
-                        break
-                
-                if not is_match: # if preparing this chunk failed
-                    continue
-
-                if new_sample_to_compare == current_existing_chunk_to_compare:
-                    return True # Found a duplicate chunk
-                    
-        return False # No duplicate chunk found
-    except FileNotFoundError:
-        return False # Should be caught by os.path.exists, but as a safeguard
+    unique_records = []
+    seen = set(existing)
+    for record, digest in zip(new_records, digests):
+        if digest in seen:
+            continue
+        seen.add(digest)
+        unique_records.append(record)
+    return unique_records
+
+
+def build_gmat_performance_frame(
+    input_df: pd.DataFrame,
+    student_id: str,
+    test_date: str,
+    sections: List[str],
+    max_allowed_section_time: float = 45.0
+) -> pd.DataFrame:
+    """
+    Column-wise conversion of the combined diagnosis input (one row per question with
+    'Subject', 'question_position', 'question_time', 'is_correct', ...) into GMAT
+    performance rows, in their stored string form.
+    
+    Each section becomes the test instance '{student_id}_{section}_{YYYYMMDD}_upload';
+    missing question positions fall back to the row label + 1, missing or non-numeric
+    times to 0.0, and is_correct is 1 for True / 'correct' (any case), else 0.
+    Section totals (question count, summed time) are joined with a merge.
+    
+    Args:
+        input_df: Combined input DataFrame of all sections
+        student_id: Student the records belong to
+        test_date: Test date (YYYY-MM-DD)
+        sections: Sections to keep (rows of other subjects, e.g. 'Total', are skipped)
+        max_allowed_section_time: Value of max_allowed_section_time_minutes
+        
+    Returns:
+        DataFrame with every GMAT performance column except record_timestamp
+    """
+    columns = GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK
+    if "Subject" not in input_df.columns:
+        return pd.DataFrame(columns=columns)
+    frame = input_df[input_df["Subject"].isin(sections)]
+    if frame.empty:
+        return pd.DataFrame(columns=columns)
+
+    date_compact = test_date.replace('-', '')
+    section = frame["Subject"].astype(str)
+    fallback_positions = pd.Series(frame.index + 1, index=frame.index)
+
+    if "question_position" in frame.columns:
+        positions = frame["question_position"]
+        position_labels = positions.astype(str)
+        position_numbers = positions.astype(object).where(positions.notna(), fallback_positions)
+        position_numbers = pd.to_numeric(position_numbers).astype("int64")
+    else:
+        position_labels = fallback_positions.astype(str)
+        position_numbers = fallback_positions
+
+    if "question_time" in frame.columns:
+        times = pd.to_numeric(frame["question_time"], errors="coerce").astype(float)
+    else:
+        times = pd.Series(np.nan, index=frame.index)
+
+    if "is_correct" in frame.columns:
+        correct = frame["is_correct"].infer_objects()
+        if pd.api.types.is_bool_dtype(correct):
+            correct = correct.astype(int)
+        else:
+            kinds = correct.map(type)
+            is_true = (kinds == bool) & (correct == True)
+            is_correct_text = (kinds == str) & (correct.astype(str).str.lower() == 'correct')
+            correct = (is_true | is_correct_text).astype(int)
+    else:
+        correct = pd.Series(0, index=frame.index)
+
+    if "question_difficulty" in frame.columns:
+        difficulty = pd.to_numeric(frame["question_difficulty"]).astype(float).astype(str)
+    else:
+        difficulty = "0.0"
+
+    def text(column: str):
+        return frame[column].astype(str) if column in frame.columns else ""
+
+    records = pd.DataFrame({
+        "student_id": str(student_id),
+        "test_instance_id": str(student_id) + "_" + section + f"_{date_compact}_upload",
+        "gmat_section": section,
+        "test_date": test_date,
+        "question_id": section + "_" + position_labels + f"_{date_compact}",
+        "question_position": position_numbers.astype(str),
+        "question_time_minutes": times.fillna(0.0).astype(str),
+        "is_correct": correct.astype(str),
+        "question_difficulty": difficulty,
+        "question_type": text("question_type"),
+        "question_fundamental_skill": text("question_fundamental_skill"),
+        "content_domain": text("content_domain"),
+    }, index=frame.index)
+
+    # Per-section totals; without a time column every section reports 0 questions / 0.0 minutes
+    if "question_time" in frame.columns:
+        # Series.sum per section (not the grouped Kahan sum) so the stored totals
+        # stay bit-identical to the values written so far
+        section_stats = (
+            times.groupby(section, sort=False)
+            .agg(total_questions_in_section="size", total_section_time_minutes=lambda t: t.sum())
+            .rename_axis("gmat_section")
+            .reset_index()
+        )
+        records = records.merge(section_stats, on="gmat_section", how="left")
+    else:
+        records = records.reset_index(drop=True)
+        records["total_questions_in_section"] = 0
+        records["total_section_time_minutes"] = 0.0
+    records["total_section_time_minutes"] = records["total_section_time_minutes"].astype(float).astype(str)
+    records["total_questions_in_section"] = records["total_questions_in_section"].astype(str)
+    records["max_allowed_section_time_minutes"] = str(float(max_allowed_section_time))
+    return records[columns]
+
+
+def _add_gmat_performance_dataframe(frame: pd.DataFrame) -> bool:
+    """
+    DataFrame path of add_gmat_performance_record: rows in their stored string form
+    (see build_gmat_performance_frame) are validated column-wise and written in bulk.
+    """
+    try:
+        errors = validate_gmat_performance_frame(frame)
+        invalid = errors != ''
+        for position in np.flatnonzero(invalid.to_numpy()):
+            print(f"Invalid record found, skipping ({errors.iloc[position]}): {frame.iloc[position].to_dict()}")
+        valid_frame = frame[~invalid]
+
+        result = add_gmat_performance_frame(valid_frame)
+        if result["duplicates"]:
+            print(f"Duplicate data detected. Skipping {result['duplicates']} of {len(valid_frame)} records.")
+        if result["written"] == 0 and result["duplicates"] == 0:
+            print("No valid GMAT performance records were written (all were invalid).")
+        return True
     except Exception as e:
-        print(f"Error reading or comparing CSV for duplicates: {e}")
-        return False # Treat errors as non-duplicate to allow write if unsure
+        print(f"Error adding GMAT performance records: {e}")
+        return False
 
 
-def add_gmat_performance_record(record_data: List[Dict[str, Any]]) -> bool:
+def add_gmat_performance_record(record_data: Union[List[Dict[str, Any]], pd.DataFrame]) -> bool:
     """
     Add GMAT performance records to the CSV file.
-    Skips adding if the first 5 records are identical to an existing sequence in the file.
+    Skips records that are identical to a stored record or to an earlier record in the batch.
     
     Args:
         record_data: List of dictionaries, each containing data for a single question performance
                     All records should share the same student_id, test_instance_id, etc.
+                    A DataFrame of stored-form rows (see build_gmat_performance_frame) is
+                    validated and written in bulk.
                     
     Returns:
         bool: True if records were added successfully or if duplicate was detected (operation considered complete), False otherwise
     """
+    if isinstance(record_data, pd.DataFrame):
+        if record_data.empty:
+            print("Error: Empty record data provided to add_gmat_performance_record")
+            return False
+        return _add_gmat_performance_dataframe(record_data)
     if not record_data:
         print("Error: Empty record data provided to add_gmat_performance_record")
         return False
     
-    # Initialize CSV file if it doesn't exist (ensures headers are present for DictReader)
-    initialize_csv_files()
+    # Initialize storage if it doesn't exist (ensures CSV headers are present for DictReader)
+    backend = _initialize_storage()
 
-    # Take a sample of the first 5 records (or fewer if less than 5) for duplicate check
-    sample_size = min(5, len(record_data))
-    new_records_sample = record_data[:sample_size]
-
-    # Check for duplicates
-    if _is_duplicate_record(new_records_sample, GMAT_PERFORMANCE_DATA_FILE, GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK):
-        print(f"Duplicate data detected based on the first {sample_size} records. Skipping write for {len(record_data)} records.")
+    # Check every record of the batch for duplicates
+    new_records = _filter_duplicate_records(backend, PERFORMANCE_TABLE, record_data)
+    skipped_duplicates = len(record_data) - len(new_records)
+    if not new_records:
+        print(f"Duplicate data detected. Skipping write for {len(record_data)} records.")
         # Consider this a "successful" operation in the sense that we've handled the input appropriately
-        return True 
+        return True
+    if skipped_duplicates:
+        print(f"Duplicate data detected. Skipping {skipped_duplicates} of {len(record_data)} records.")
     
     try:
         current_timestamp = datetime.datetime.now().isoformat()
         
-        # Open in append mode. If _is_duplicate_record was false, we proceed to write.
-        with open(GMAT_PERFORMANCE_DATA_FILE, 'a', newline='') as csvfile:
-            # Check if file is empty to write headers. This is a bit tricky with 'a' mode.
-            # initialize_csv_files should handle header writing for new files.
-            # For existing files, we assume headers are there if the file is not empty.
-            # A more robust check might involve peeking at the file or checking size.
-            # However, DictWriter will write headers if the file is empty,
-            # but will raise an error if headers are present and fieldnames don't match.
-            # Given initialize_csv_files creates headers, this should be mostly fine.
-            
-            writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
+        valid_records = []
+        for record in new_records:
+            # Validate the record (individual record validation)
+            if not validate_gmat_performance_record(record):
+                print(f"Invalid record found, skipping: {record}")
+                continue
             
-            # If the file was newly created by initialize_csv_files OR if it was empty before opening in 'a' mode,
-            # we might need to write headers if DictWriter doesn't do it on its own in 'a' mode for an empty file.
-            # Let's check file size. If 0, write header. (os.path.getsize might be better)
-            csvfile.seek(0, os.SEEK_END) # Go to end of file
-            file_is_empty = csvfile.tell() == 0 # Check if pointer is at position 0
-            if file_is_empty:
-                writer.writeheader()
-            
-            valid_records_written = 0
-            for record in record_data:
-                # Validate the record (individual record validation)
-                if not validate_gmat_performance_record(record):
-                    print(f"Invalid record found, skipping: {record}")
-                    continue
-                
-                # Add timestamp to the record
-                record["record_timestamp"] = current_timestamp
-                
-                # Write the record to the CSV file
-                writer.writerow(record)
-                valid_records_written += 1
-        
-        if valid_records_written > 0:
-            # print(f"Successfully added {valid_records_written} GMAT performance records.") # This line will be commented out/removed
-            pass # Keep a pass statement if removing the print makes the if block empty, or remove the if block if appropriate
-        elif not record_data: # Should be caught earlier
-             pass # No records were provided
+            # Add timestamp to the record
+            record["record_timestamp"] = current_timestamp
+            valid_records.append(record)
+        
+        # Write all valid records in one append
+        signature_before = backend.data_signature(PERFORMANCE_TABLE)
+        valid_records_written = backend.append_records(PERFORMANCE_TABLE, valid_records)
+        if valid_records_written:
+            _update_performance_summary(backend, signature_before, added_frame=pd.DataFrame(
+                [serialize_record(record, GMAT_PERFORMANCE_HEADERS) for record in valid_records],
+                columns=GMAT_PERFORMANCE_HEADERS,
+            ))
+        
         # If valid_records_written is 0 but record_data was not empty, it means all were invalid
-        elif record_data and valid_records_written == 0:
+        if record_data and valid_records_written == 0:
             print("No valid GMAT performance records were written (all were invalid).")
 
 
@@ -307,6 +670,35 @@ def add_gmat_performance_record(record_data: List[Dict[str, Any]]) -> bool:
         return False
 
 
+def add_gmat_performance_frame(frame: pd.DataFrame) -> Dict[str, int]:
+    """
+    Bulk-add already validated GMAT performance rows (e.g. one chunk of an import).
+    Duplicates are filtered against the digest index and the rows are written in
+    one append and flushed, so queued rows do not pile up during a long import.
+    
+    Args:
+        frame: Validated rows with the GMAT performance columns
+        
+    Returns:
+        Dictionary with the number of rows written and skipped as duplicates
+    """
+    if frame.empty:
+        return {"written": 0, "duplicates": 0}
+    backend = _initialize_storage()
+    columns = list(frame.columns)
+    records = [dict(zip(columns, row)) for row in frame.itertuples(index=False, name=None)]
+    new_records = _filter_duplicate_records(backend, PERFORMANCE_TABLE, records)
+    if new_records:
+        current_timestamp = datetime.datetime.now().isoformat()
+        for record in new_records:
+            record["record_timestamp"] = current_timestamp
+        signature_before = backend.data_signature(PERFORMANCE_TABLE)
+        backend.append_records(PERFORMANCE_TABLE, new_records)
+        backend.flush(PERFORMANCE_TABLE)
+        _update_performance_summary(backend, signature_before, added_frame=pd.DataFrame(new_records, columns=columns))
+    return {"written": len(new_records), "duplicates": len(records) - len(new_records)}
+
+
 def validate_subjective_report_record(report: Dict[str, Any]) -> bool:
     """
     Validate a subjective report record.
@@ -369,14 +761,11 @@ def add_subjective_report_record(report_data: Dict[str, Any]) -> bool:
         print("Error: Empty report data provided")
         return False
     
-    # Initialize CSV file if it doesn't exist
-    initialize_csv_files()
-    
-    # Convert single report to list for duplicate check function
-    report_list = [report_data]
+    # Initialize storage if it doesn't exist
+    backend = _initialize_storage()
     
     # Check for duplicates
-    if _is_duplicate_record(report_list, STUDENT_SUBJECTIVE_REPORTS_FILE, STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK):
+    if not _filter_duplicate_records(backend, SUBJECTIVE_TABLE, [report_data]):
         print(f"Duplicate subjective report detected. Skipping write for student_id: {report_data.get('student_id', 'unknown')}, test_instance_id: {report_data.get('test_instance_id', 'unknown')}")
         # Consider this a "successful" operation in the sense that we've handled the input appropriately
         return True
@@ -387,21 +776,8 @@ def add_subjective_report_record(report_data: Dict[str, Any]) -> bool:
             print(f"Invalid report data, not adding to CSV: {report_data}")
             return False
         
-        # Ensure the file exists with headers
-        file_exists = os.path.exists(STUDENT_SUBJECTIVE_REPORTS_FILE)
-        
-        # Open in append mode
-        with open(STUDENT_SUBJECTIVE_REPORTS_FILE, 'a', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-            
-            # Check if file is empty or newly created to write headers
-            csvfile.seek(0, os.SEEK_END)
-            file_is_empty = csvfile.tell() == 0
-            if file_is_empty:
-                writer.writeheader()
-            
-            # Write the record to the CSV file
-            writer.writerow(report_data)
+        # Write the record to storage
+        backend.append_records(SUBJECTIVE_TABLE, [report_data])
         
         # print(f"Successfully added subjective report record for student {report_data['student_id']}") # This line will be commented out
         return True
@@ -417,12 +793,8 @@ def get_all_gmat_performance_records() -> List[Dict[str, Any]]:
     Returns:
         List of dictionaries containing all GMAT performance records.
     """
-    initialize_csv_files()
-    
     try:
-        with open(GMAT_PERFORMANCE_DATA_FILE, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            return list(reader)
+        return list(_initialize_storage().iter_records(PERFORMANCE_TABLE))
     except Exception as e:
         print(f"Error reading GMAT performance records: {e}")
         return []
@@ -435,17 +807,81 @@ def get_all_subjective_report_records() -> List[Dict[str, Any]]:
     Returns:
         List of dictionaries containing all subjective report records.
     """
-    initialize_csv_files()
-    
     try:
-        with open(STUDENT_SUBJECTIVE_REPORTS_FILE, 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            return list(reader)
+        return list(_initialize_storage().iter_records(SUBJECTIVE_TABLE))
     except Exception as e:
         print(f"Error reading subjective report records: {e}")
         return []
 
 
+def iter_all_gmat_performance_records() -> Iterator[Dict[str, str]]:
+    """
+    Iterate over all GMAT performance records without building a list, e.g. to
+    stream them into an export file. Read errors are raised to the caller.
+    
+    Returns:
+        Iterator of GMAT performance record dictionaries, in storage order.
+    """
+    yield from _initialize_storage().iter_records(PERFORMANCE_TABLE)
+
+
+def iter_all_subjective_report_records() -> Iterator[Dict[str, str]]:
+    """
+    Iterate over all subjective report records without building a list.
+    Read errors are raised to the caller.
+    
+    Returns:
+        Iterator of subjective report record dictionaries, in storage order.
+    """
+    yield from _initialize_storage().iter_records(SUBJECTIVE_TABLE)
+
+
+def _query_records(table: str, **filters: str) -> List[Dict[str, Any]]:
+    """
+    Query the active storage backend, returning an empty list on errors.
+    """
+    try:
+        return _initialize_storage().query_records(table, **filters)
+    except Exception as e:
+        print(f"Error querying {table} records: {e}")
+        return []
+
+
+def get_gmat_performance_dataframe(**filters: str) -> pd.DataFrame:
+    """
+    Get GMAT performance records as a DataFrame of strings (same values as the
+    record dicts), e.g. ``get_gmat_performance_dataframe(gmat_section='Q')``.
+    
+    Args:
+        **filters: Column equality filters; none returns every record
+        
+    Returns:
+        DataFrame with one column per GMAT_PERFORMANCE_HEADERS entry (empty on errors).
+    """
+    try:
+        return _initialize_storage().query_frame(PERFORMANCE_TABLE, **filters)
+    except Exception as e:
+        print(f"Error querying {PERFORMANCE_TABLE} records: {e}")
+        return pd.DataFrame(columns=GMAT_PERFORMANCE_HEADERS)
+
+
+def get_subjective_reports_dataframe(**filters: str) -> pd.DataFrame:
+    """
+    Get subjective report records as a DataFrame of strings.
+    
+    Args:
+        **filters: Column equality filters; none returns every record
+        
+    Returns:
+        DataFrame with one column per STUDENT_SUBJECTIVE_REPORTS_HEADERS entry (empty on errors).
+    """
+    try:
+        return _initialize_storage().query_frame(SUBJECTIVE_TABLE, **filters)
+    except Exception as e:
+        print(f"Error querying {SUBJECTIVE_TABLE} records: {e}")
+        return pd.DataFrame(columns=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
+
+
 def get_student_gmat_performance_records(student_id: str) -> List[Dict[str, Any]]:
     """
     Get GMAT performance records for a specific student.
@@ -456,8 +892,7 @@ def get_student_gmat_performance_records(student_id: str) -> List[Dict[str, Any]
     Returns:
         List of dictionaries containing GMAT performance records for the specified student.
     """
-    all_records = get_all_gmat_performance_records()
-    return [record for record in all_records if record["student_id"] == student_id]
+    return _query_records(PERFORMANCE_TABLE, student_id=student_id)
 
 
 def get_student_subjective_reports(student_id: str) -> List[Dict[str, Any]]:
@@ -470,8 +905,7 @@ def get_student_subjective_reports(student_id: str) -> List[Dict[str, Any]]:
     Returns:
         List of dictionaries containing subjective report records for the specified student.
     """
-    all_reports = get_all_subjective_report_records()
-    return [report for report in all_reports if report["student_id"] == student_id]
+    return _query_records(SUBJECTIVE_TABLE, student_id=student_id)
 
 
 def get_test_instance_gmat_performance_records(test_instance_id: str) -> List[Dict[str, Any]]:
@@ -484,8 +918,7 @@ def get_test_instance_gmat_performance_records(test_instance_id: str) -> List[Di
     Returns:
         List of dictionaries containing GMAT performance records for the specified test instance.
     """
-    all_records = get_all_gmat_performance_records()
-    return [record for record in all_records if record["test_instance_id"] == test_instance_id]
+    return _query_records(PERFORMANCE_TABLE, test_instance_id=test_instance_id)
 
 
 def get_test_instance_subjective_report(test_instance_id: str) -> Optional[Dict[str, Any]]:
@@ -498,11 +931,8 @@ def get_test_instance_subjective_report(test_instance_id: str) -> Optional[Dict[
     Returns:
         Dictionary containing the subjective report record, or None if not found.
     """
-    all_reports = get_all_subjective_report_records()
-    for report in all_reports:
-        if report["test_instance_id"] == test_instance_id:
-            return report
-    return None
+    reports = _query_records(SUBJECTIVE_TABLE, test_instance_id=test_instance_id)
+    return reports[0] if reports else None
 
 
 def get_student_section_performance_records(student_id: str, gmat_section: str) -> List[Dict[str, Any]]:
@@ -516,8 +946,7 @@ def get_student_section_performance_records(student_id: str, gmat_section: str)
     Returns:
         List of dictionaries containing GMAT performance records for the specified student and section.
     """
-    student_records = get_student_gmat_performance_records(student_id)
-    return [record for record in student_records if record["gmat_section"] == gmat_section]
+    return _query_records(PERFORMANCE_TABLE, student_id=student_id, gmat_section=gmat_section)
 
 
 def update_gmat_performance_records(test_instance_id: str, updates: Dict[str, Any]) -> bool:
@@ -531,35 +960,26 @@ def update_gmat_performance_records(test_instance_id: str, updates: Dict[str, An
     Returns:
         bool: True if records were updated successfully, False otherwise
     """
-    all_records = get_all_gmat_performance_records()
-    updated_records = []
-    records_updated = False
-    
-    for record in all_records:
-        if record["test_instance_id"] == test_instance_id:
-            # Apply updates to the record
-            for key, value in updates.items():
-                if key in GMAT_PERFORMANCE_HEADERS:
-                    record[key] = value
-            records_updated = True
-        updated_records.append(record)
+    try:
+        backend = _initialize_storage()
+        signature_before = backend.data_signature(PERFORMANCE_TABLE)
+        records_updated = backend.update_records(PERFORMANCE_TABLE, test_instance_id, updates)
+    except Exception as e:
+        print(f"Error updating GMAT performance records: {e}")
+        return False
     
     if not records_updated:
         print(f"No records found for test_instance_id: {test_instance_id}")
         return False
     
-    try:
-        # Write all records back to the CSV file
-        with open(GMAT_PERFORMANCE_DATA_FILE, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
-            writer.writeheader()
-            writer.writerows(updated_records)
-        
-        print(f"Successfully updated records for test_instance_id: {test_instance_id}")
-        return True
-    except Exception as e:
-        print(f"Error updating GMAT performance records: {e}")
-        return False
+    # Re-summarize the test instance (and the one it was moved to, if its ID changed)
+    changed_ids = [test_instance_id]
+    if "test_instance_id" in updates:
+        changed_ids.append(str(updates["test_instance_id"]))
+    _update_performance_summary(backend, signature_before, changed_test_instance_ids=changed_ids, updates=updates)
+    
+    print(f"Successfully updated records for test_instance_id: {test_instance_id}")
+    return True
 
 
 def update_subjective_report_record(test_instance_id: str, updates: Dict[str, Any]) -> bool:
@@ -573,35 +993,18 @@ def update_subjective_report_record(test_instance_id: str, updates: Dict[str, An
     Returns:
         bool: True if the record was updated successfully, False otherwise
     """
-    all_reports = get_all_subjective_report_records()
-    updated_reports = []
-    report_updated = False
-    
-    for report in all_reports:
-        if report["test_instance_id"] == test_instance_id:
-            # Apply updates to the report
-            for key, value in updates.items():
-                if key in STUDENT_SUBJECTIVE_REPORTS_HEADERS:
-                    report[key] = value
-            report_updated = True
-        updated_reports.append(report)
+    try:
+        report_updated = _initialize_storage().update_records(SUBJECTIVE_TABLE, test_instance_id, updates)
+    except Exception as e:
+        print(f"Error updating subjective report record: {e}")
+        return False
     
     if not report_updated:
         print(f"No subjective report found for test_instance_id: {test_instance_id}")
         return False
     
-    try:
-        # Write all reports back to the CSV file
-        with open(STUDENT_SUBJECTIVE_REPORTS_FILE, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-            writer.writeheader()
-            writer.writerows(updated_reports)
-        
-        print(f"Successfully updated subjective report for test_instance_id: {test_instance_id}")
-        return True
-    except Exception as e:
-        print(f"Error updating subjective report record: {e}")
-        return False
+    print(f"Successfully updated subjective report for test_instance_id: {test_instance_id}")
+    return True
 
 
 def delete_gmat_performance_records(test_instance_id: str) -> bool:
@@ -614,32 +1017,22 @@ def delete_gmat_performance_records(test_instance_id: str) -> bool:
     Returns:
         bool: True if records were deleted successfully, False otherwise
     """
-    all_records = get_all_gmat_performance_records()
-    filtered_records = []
-    records_deleted = False
-    
-    for record in all_records:
-        if record["test_instance_id"] != test_instance_id:
-            filtered_records.append(record)
-        else:
-            records_deleted = True
+    try:
+        backend = _initialize_storage()
+        signature_before = backend.data_signature(PERFORMANCE_TABLE)
+        records_deleted = backend.delete_records(PERFORMANCE_TABLE, test_instance_id)
+    except Exception as e:
+        print(f"Error deleting GMAT performance records: {e}")
+        return False
     
     if not records_deleted:
         print(f"No records found for test_instance_id: {test_instance_id}")
         return False
     
-    try:
-        # Write filtered records back to the CSV file
-        with open(GMAT_PERFORMANCE_DATA_FILE, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=GMAT_PERFORMANCE_HEADERS)
-            writer.writeheader()
-            writer.writerows(filtered_records)
-        
-        print(f"Successfully deleted records for test_instance_id: {test_instance_id}")
-        return True
-    except Exception as e:
-        print(f"Error deleting GMAT performance records: {e}")
-        return False
+    _update_performance_summary(backend, signature_before, changed_test_instance_ids=[test_instance_id])
+    
+    print(f"Successfully deleted records for test_instance_id: {test_instance_id}")
+    return True
 
 
 def delete_subjective_report_record(test_instance_id: str) -> bool:
@@ -652,29 +1045,15 @@ def delete_subjective_report_record(test_instance_id: str) -> bool:
     Returns:
         bool: True if the record was deleted successfully, False otherwise
     """
-    all_reports = get_all_subjective_report_records()
-    filtered_reports = []
-    report_deleted = False
-    
-    for report in all_reports:
-        if report["test_instance_id"] != test_instance_id:
-            filtered_reports.append(report)
-        else:
-            report_deleted = True
+    try:
+        report_deleted = _initialize_storage().delete_records(SUBJECTIVE_TABLE, test_instance_id)
+    except Exception as e:
+        print(f"Error deleting subjective report record: {e}")
+        return False
     
     if not report_deleted:
         print(f"No subjective report found for test_instance_id: {test_instance_id}")
         return False
     
-    try:
-        # Write filtered reports back to the CSV file
-        with open(STUDENT_SUBJECTIVE_REPORTS_FILE, 'w', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=STUDENT_SUBJECTIVE_REPORTS_HEADERS)
-            writer.writeheader()
-            writer.writerows(filtered_reports)
-        
-        print(f"Successfully deleted subjective report for test_instance_id: {test_instance_id}")
-        return True
-    except Exception as e:
-        print(f"Error deleting subjective report record: {e}")
-        return False 
\ No newline at end of file
+    print(f"Successfully deleted subjective report for test_instance_id: {test_instance_id}")
+    return True
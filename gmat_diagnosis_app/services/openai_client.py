@@ -0,0 +1,295 @@
+"""
+Shared OpenAI client factory
+
+Provides one process-wide OpenAI client backed by a pooled httpx connection,
+per-call timeouts, bounded retries, a circuit breaker that fails fast while the
+upstream is unavailable, and call metrics (retries, failures, latency).
+"""
+
+import collections
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+import httpx
+import openai
+from openai import OpenAI
+from tenacity import (
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    stop_after_delay,
+    wait_random_exponential,
+)
+
+logger = logging.getLogger(__name__)
+
+# --- Connection pool / timeout settings ---
+MAX_CONNECTIONS = int(os.environ.get("OPENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get("OPENAI_MAX_KEEPALIVE_CONNECTIONS", "10"))
+KEEPALIVE_EXPIRY_SECONDS = 30.0
+CONNECT_TIMEOUT_SECONDS = 5.0
+DEFAULT_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_TIMEOUT_SECONDS", "60"))
+# Reasoning models (o4-mini via responses.create) need a longer read timeout
+REASONING_TIMEOUT_SECONDS = float(os.environ.get("OPENAI_REASONING_TIMEOUT_SECONDS", "120"))
+
+# --- Retry settings (retries are done here, the SDK's own retries are disabled) ---
+MAX_ATTEMPTS = 3
+RETRY_WAIT_MIN_SECONDS = 1
+RETRY_WAIT_MAX_SECONDS = 8
+RETRY_TOTAL_BUDGET_SECONDS = 30
+
+# --- Circuit breaker settings ---
+BREAKER_FAILURE_THRESHOLD = 5       # consecutive upstream failures before opening
+BREAKER_RECOVERY_SECONDS = 30.0     # time the breaker stays open before a trial call
+
+# Errors that indicate the upstream is unhealthy (retried and counted by the breaker)
+TRANSIENT_ERRORS = (
+    openai.APIConnectionError,  # includes APITimeoutError
+    openai.InternalServerError,
+    openai.RateLimitError,
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling the API while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """
+    Thread-safe circuit breaker (closed -> open -> half-open -> closed).
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    rejects calls for ``recovery_seconds``. Then a single trial call is let
+    through: success closes the breaker, failure opens it again.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 recovery_seconds: float = BREAKER_RECOVERY_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_seconds:
+                return self.HALF_OPEN
+            return self._state
+
+    def allow_request(self) -> bool:
+        """Returns True if a call may proceed right now."""
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.recovery_seconds:
+                    return False
+                self._state = self.HALF_OPEN
+                self._trial_in_flight = False
+            # Half-open: let exactly one trial call through
+            if self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._state = self.CLOSED
+            self._consecutive_failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._trial_in_flight = False
+            if self._state == self.HALF_OPEN or self._consecutive_failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    logger.warning(
+                        f"OpenAI circuit breaker opened after {self._consecutive_failures} consecutive failures."
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class OpenAICallMetrics:
+    """Thread-safe counters and latency samples for OpenAI calls."""
+
+    def __init__(self, latency_window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = collections.deque(maxlen=latency_window)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.calls = 0
+            self.successes = 0
+            self.failures = 0
+            self.retries = 0
+            self.short_circuited = 0
+            self.by_operation = collections.defaultdict(lambda: {"calls": 0, "failures": 0, "retries": 0})
+            self._latencies.clear()
+
+    def record_call(self, operation: str, latency_seconds: float, success: bool, retries: int) -> None:
+        with self._lock:
+            self.calls += 1
+            self.retries += retries
+            op = self.by_operation[operation]
+            op["calls"] += 1
+            op["retries"] += retries
+            if success:
+                self.successes += 1
+            else:
+                self.failures += 1
+                op["failures"] += 1
+            self._latencies.append(latency_seconds)
+
+    def record_short_circuit(self) -> None:
+        with self._lock:
+            self.short_circuited += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = sorted(self._latencies)
+
+            def percentile(p):
+                if not latencies:
+                    return 0.0
+                return latencies[min(len(latencies) - 1, int(round(p * (len(latencies) - 1))))]
+
+            return {
+                "calls": self.calls,
+                "successes": self.successes,
+                "failures": self.failures,
+                "retries": self.retries,
+                "short_circuited": self.short_circuited,
+                "latency_avg_seconds": sum(latencies) / len(latencies) if latencies else 0.0,
+                "latency_p50_seconds": percentile(0.50),
+                "latency_p95_seconds": percentile(0.95),
+                "latency_max_seconds": latencies[-1] if latencies else 0.0,
+                "by_operation": {name: dict(values) for name, values in self.by_operation.items()},
+            }
+
+
+_shared_client: Optional[OpenAI] = None
+_shared_client_key: Optional[str] = None
+_client_lock = threading.Lock()
+
+circuit_breaker = CircuitBreaker()
+call_metrics = OpenAICallMetrics()
+
+
+def _build_http_client() -> httpx.Client:
+    """Creates the pooled httpx client shared by every OpenAI request in this process."""
+    return openai.DefaultHttpxClient(
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY_SECONDS,
+        ),
+        timeout=httpx.Timeout(DEFAULT_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+    )
+
+
+def get_shared_openai_client(api_key: Optional[str] = None) -> Optional[OpenAI]:
+    """
+    Returns the process-wide OpenAI client, creating it on first use.
+
+    Args:
+        api_key: API key to use. Defaults to the OPENAI_API_KEY environment variable.
+                 A different key replaces the shared client.
+
+    Returns:
+        OpenAI client, or None if no API key is available.
+    """
+    global _shared_client, _shared_client_key
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        return None
+
+    with _client_lock:
+        if _shared_client is None or _shared_client_key != api_key:
+            if _shared_client is not None:
+                _shared_client.close()
+            _shared_client = OpenAI(
+                api_key=api_key,
+                http_client=_build_http_client(),
+                timeout=DEFAULT_TIMEOUT_SECONDS,
+                max_retries=0,  # Retries are handled (and counted) by guarded_openai_call
+            )
+            _shared_client_key = api_key
+            logger.info("Created shared OpenAI client with pooled HTTP connections.")
+        return _shared_client
+
+
+def _is_retryable(exc: BaseException) -> bool:
+    return isinstance(exc, TRANSIENT_ERRORS)
+
+
+def guarded_openai_call(operation: str, func: Callable[..., Any], *args,
+                        max_attempts: int = MAX_ATTEMPTS, **kwargs) -> Any:
+    """
+    Calls ``func(*args, **kwargs)`` behind the circuit breaker with bounded retries.
+
+    Only transient upstream errors are retried (short exponential backoff, capped
+    by RETRY_TOTAL_BUDGET_SECONDS) and counted as breaker failures. Other errors
+    (authentication, bad request, ...) are raised immediately.
+
+    Args:
+        operation: Name used in the metrics (e.g. "chat.completions").
+        func: The SDK method to call, e.g. ``client.with_options(timeout=30).chat.completions.create``.
+        max_attempts: Maximum number of attempts including the first one.
+
+    Raises:
+        CircuitOpenError: If the breaker is open; the API is not called.
+    """
+    if not circuit_breaker.allow_request():
+        call_metrics.record_short_circuit()
+        raise CircuitOpenError(
+            f"OpenAI circuit breaker is open; skipping '{operation}' call for up to {BREAKER_RECOVERY_SECONDS:.0f}s."
+        )
+
+    attempts = 0
+    started = time.perf_counter()
+    retryer = Retrying(
+        retry=retry_if_exception(_is_retryable),
+        wait=wait_random_exponential(min=RETRY_WAIT_MIN_SECONDS, max=RETRY_WAIT_MAX_SECONDS),
+        stop=stop_after_attempt(max_attempts) | stop_after_delay(RETRY_TOTAL_BUDGET_SECONDS),
+        reraise=True,
+    )
+    try:
+        for attempt in retryer:
+            with attempt:
+                attempts += 1
+                if attempts > 1:
+                    logger.warning(f"Retrying OpenAI '{operation}' call (attempt {attempts}/{max_attempts}).")
+                result = func(*args, **kwargs)
+    except Exception as e:
+        call_metrics.record_call(operation, time.perf_counter() - started, False, attempts - 1)
+        if _is_retryable(e):
+            circuit_breaker.record_failure()
+        else:
+            # The upstream answered; a client-side error says nothing about its health
+            circuit_breaker.record_success()
+        raise
+
+    call_metrics.record_call(operation, time.perf_counter() - started, True, attempts - 1)
+    circuit_breaker.record_success()
+    return result
+
+
+def get_openai_metrics() -> Dict[str, Any]:
+    """Returns a snapshot of OpenAI call metrics and the circuit breaker state."""
+    metrics = call_metrics.snapshot()
+    metrics["circuit_state"] = circuit_breaker.state
+    return metrics
@@ -6,10 +6,15 @@ OpenAI服務模組
 import logging
 import streamlit as st
 import openai
-from openai import OpenAI
-from tenacity import retry, stop_after_attempt, wait_random_exponential
 import os
 from ..utils.rate_limiter import get_client_ip, check_rate_limit # Import rate limiting functions
+from .openai_client import (
+    get_shared_openai_client,
+    guarded_openai_call,
+    CircuitOpenError,
+    DEFAULT_TIMEOUT_SECONDS,
+    REASONING_TIMEOUT_SECONDS,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -20,27 +25,37 @@ client = None
 api_key_env = os.environ.get("OPENAI_API_KEY")
 master_key_env = os.environ.get("MASTER_KEY")
 
-# Decorator for retrying API calls
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+# Circuit breaker message shown whenever calls are short-circuited
+CIRCUIT_OPEN_MESSAGE = "OpenAI 服務目前無法連線，已暫停 AI 請求，請稍後再試。"
+
 def chat_completion_request_with_retry(**kwargs):
-    """Makes a request to the OpenAI API with retries on failure."""
+    """
+    Makes a chat completion request with bounded retries on transient errors.
+    Calls go through the shared client and circuit breaker (see openai_client.py),
+    so an unavailable upstream fails fast instead of blocking the session.
+    """
     if not client:
         st.error("OpenAI 客戶端未初始化，無法處理請求。請檢查驗證狀態。")
-        raise Exception("OpenAI client not initialized.") # Raise exception to stop retry
+        raise Exception("OpenAI client not initialized.")
     
-    # Rate Limiting Check
+    # Rate Limiting Check (once per request, not once per retry)
     ip_address = get_client_ip()
     if not check_rate_limit(ip_address):
         st.error(f"抱歉，您今天的 API 使用次數已達上限 ({check_rate_limit.__globals__['DAILY_LIMIT']}次)。請明天再試。")
-        raise Exception("Rate limit exceeded") # This will stop the retry mechanism too
+        raise Exception("Rate limit exceeded")
 
     try:
-        response = client.chat.completions.create(**kwargs)
-        return response
+        return guarded_openai_call(
+            "chat.completions",
+            client.with_options(timeout=DEFAULT_TIMEOUT_SECONDS).chat.completions.create,
+            **kwargs
+        )
+    except CircuitOpenError:
+        st.error(CIRCUIT_OPEN_MESSAGE)
+        raise
     except Exception as e:
         logger.error(f"OpenAI API request failed: {repr(e)}")
-        st.warning(f"與 OpenAI 連線時發生暫時性錯誤，正在重試... ({repr(e)})")
-        raise e # Reraise exception to trigger tenacity retry
+        raise
 
 def validate_master_key(input_key):
     """驗證提供的master key是否與環境變量中的相符"""
@@ -63,7 +78,7 @@ def initialize_openai_client_with_master_key(master_key):
     
     # 如果master key驗證成功，使用環境變量中的API key
     if api_key_env:
-        client = OpenAI(api_key=api_key_env)
+        client = get_shared_openai_client(api_key_env)
         logger.info("OpenAI client initialized successfully with environment API key.")
         return True
     else:
@@ -150,8 +165,8 @@ def summarize_report_with_openai(report_markdown, api_key):
             logging.warning("環境變量中未設置OPENAI_API_KEY。跳過摘要處理。")
             return report_markdown
         else:
-            # 臨時初始化客戶端用於此次請求
-            temp_client = OpenAI(api_key=api_key_env)
+            # 使用共享的客戶端（連線池）處理此次請求
+            temp_client = get_shared_openai_client(api_key_env)
     else:
         # 使用已初始化的客戶端
         temp_client = client
@@ -179,7 +194,9 @@ bsection Title). Reformat content into clear Markdown tables where appropriate.
 ions. Only reformat and polish the existing text. Output strictly in Markdown format, without code blocks.
 """
 
-        response = temp_client.chat.completions.create(
+        response = guarded_openai_call(
+            "summarize_report",
+            temp_client.with_options(timeout=DEFAULT_TIMEOUT_SECONDS).chat.completions.create,
             model="gpt-4.1-nano", 
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -195,6 +212,10 @@ ions. Only reformat and polish the existing text. Output strictly in Markdown fo
              st.warning("AI 整理報告時返回了空內容，將使用原始報告。", icon="⚠️")
              return report_markdown
 
+    except CircuitOpenError:
+        st.warning(f"{CIRCUIT_OPEN_MESSAGE}暫時使用原始報告文字。", icon="🌐")
+        logging.warning("OpenAI circuit open; skipped summarization.")
+        return report_markdown
     except openai.AuthenticationError:
         st.warning("OpenAI API 驗證失敗，無法整理報告文字。請檢查系統管理員設定的API金鑰。", icon="🔑")
         logging.error("OpenAI AuthenticationError.")
@@ -243,8 +264,8 @@ def generate_ai_consolidated_report(report_dict, api_key):
             logging.warning("環境變量中未設置OPENAI_API_KEY。跳過匯總報告生成。")
             return None
         else:
-            # 臨時初始化客戶端用於此次請求
-            temp_client = openai.OpenAI(api_key=api_key_env)
+            # 使用共享的客戶端（連線池）處理此次請求
+            temp_client = get_shared_openai_client(api_key_env)
     else:
         # 使用已初始化的客戶端
         temp_client = client
@@ -289,7 +310,9 @@ Your task is to identify and extract ONLY the sections related to '練習建議'
     try:
         logging.info("Calling OpenAI responses.create with model o4-mini for consolidated report.")
         # WARNING: client.responses.create might be outdated. Consider migrating to chat.completions.create.
-        response = temp_client.responses.create(
+        response = guarded_openai_call(
+            "consolidated_report",
+            temp_client.with_options(timeout=REASONING_TIMEOUT_SECONDS).responses.create,
             model="o4-mini",
             input=f"""
 System: {system_prompt}
@@ -331,6 +354,10 @@ User: 從以下 GMAT 診斷報告中提取練習建議和後續行動部分，
             st.warning(f"AI 未能成功生成匯總報告（狀態：{response.status}）。", icon="⚠️")
             return None
 
+    except CircuitOpenError:
+        st.warning(CIRCUIT_OPEN_MESSAGE, icon="🌐")
+        logging.warning("OpenAI circuit open; skipped consolidated report.")
+        return None
     except openai.AuthenticationError:
         st.warning("OpenAI API 驗證失敗，無法生成匯總報告。請檢查系統管理員設定的API金鑰。", icon="🔑")
         logging.error("OpenAI AuthenticationError (consolidated report).")
@@ -518,8 +545,8 @@ def get_openai_response(current_chat_history, report_context, dataframe_context,
             logging.error("環境變量中未設置OPENAI_API_KEY。無法使用聊天功能。")
             return "錯誤：系統未配置OpenAI API金鑰。請聯絡系統管理員。", None
         else:
-            # 臨時初始化客戶端用於此次請求
-            temp_client = openai.OpenAI(api_key=api_key_env)
+            # 使用共享的客戶端（連線池）處理此次請求
+            temp_client = get_shared_openai_client(api_key_env)
     else:
         # 使用已初始化的客戶端
         temp_client = client
@@ -612,7 +639,9 @@ Maintain a conversational and supportive tone.
             logging.info("Sending request with simplified system prompt.")
 
         # WARNING: client.responses.create might be outdated. Consider migrating to chat.completions.create.
-        response = temp_client.responses.create(
+        response = guarded_openai_call(
+            "chat",
+            temp_client.with_options(timeout=REASONING_TIMEOUT_SECONDS).responses.create,
             model="o4-mini", 
             input=messages_for_api, 
             previous_response_id=previous_response_id,
@@ -648,6 +677,10 @@ Maintain a conversational and supportive tone.
             logging.error(f"OpenAI response status not completed or output empty. Status: {response.status}")
             return f"AI 未能成功回應 (狀態: {response.status})，請稍後再試。", None
 
+    except CircuitOpenError:
+        logging.warning("OpenAI circuit open; skipped chat request.")
+        return CIRCUIT_OPEN_MESSAGE, None
+
     except openai.AuthenticationError:
         error_msg = "OpenAI API驗證失敗，請檢查系統管理員設定的API金鑰。"
         logging.error(error_msg)
@@ -713,8 +746,8 @@ def trim_diagnostic_tags_with_openai(original_tags_str: str, user_description: s
             logging.warning("環境變量中未設置OPENAI_API_KEY。無法執行標籤修剪。")
             return "錯誤：系統未配置OpenAI API金鑰。請聯絡系統管理員。"
         else:
-            # 臨時初始化客戶端用於此次請求
-            temp_client = openai.OpenAI(api_key=api_key_env)
+            # 使用共享的客戶端（連線池）處理此次請求
+            temp_client = get_shared_openai_client(api_key_env)
     else:
         # 使用已初始化的客戶端
         temp_client = client
@@ -751,7 +784,9 @@ def trim_diagnostic_tags_with_openai(original_tags_str: str, user_description: s
 
     try:
         logging.info("Calling OpenAI ChatCompletion for tag trimming with model gpt-4.1-mini.")
-        response = temp_client.chat.completions.create(
+        response = guarded_openai_call(
+            "trim_tags",
+            temp_client.with_options(timeout=DEFAULT_TIMEOUT_SECONDS).chat.completions.create,
             model="gpt-4.1-mini", 
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -770,6 +805,9 @@ def trim_diagnostic_tags_with_openai(original_tags_str: str, user_description: s
             logging.warning("OpenAI returned empty response for tag trimming.")
             return "AI 未能提供修剪建議（返回空內容）。"
 
+    except CircuitOpenError:
+        logging.warning("OpenAI circuit open; skipped tag trimming.")
+        return f"錯誤：{CIRCUIT_OPEN_MESSAGE}"
     except openai.AuthenticationError:
         logging.error("OpenAI AuthenticationError during tag trimming.")
         return "錯誤：OpenAI API 驗證失敗。請檢查系統管理員設定的API金鑰。"
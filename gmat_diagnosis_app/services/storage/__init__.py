@@ -0,0 +1,56 @@
+"""
+Storage backends for the CSV data service.
+
+The data service talks to a StorageBackend; the CSV backend keeps the original
+file format, the SQLite backend adds indexed lookups and the Parquet backend
+stores typed, partitioned columns for large histories. The summary store keeps
+per-test-instance aggregates for the per-student analyses.
+"""
+
+from gmat_diagnosis_app.services.storage.schema import (
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    TABLE_HEADERS,
+    GMAT_PERFORMANCE_HEADERS,
+    STUDENT_SUBJECTIVE_REPORTS_HEADERS,
+    GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK,
+    STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK,
+    DUPLICATE_CHECK_HEADERS,
+    record_digest,
+    serialize_record,
+)
+from gmat_diagnosis_app.services.storage.base import StorageBackend, migrate_storage
+from gmat_diagnosis_app.services.storage.csv_cache import CSVTableCache
+from gmat_diagnosis_app.services.storage.digest_index import DigestSidecarIndex
+from gmat_diagnosis_app.services.storage.change_log import ChangeLog
+from gmat_diagnosis_app.services.storage.file_lock import FileLock
+from gmat_diagnosis_app.services.storage.write_buffer import WriteBehindBuffer
+from gmat_diagnosis_app.services.storage.csv_backend import CSVStorageBackend
+from gmat_diagnosis_app.services.storage.sqlite_backend import SQLiteStorageBackend
+from gmat_diagnosis_app.services.storage.parquet_backend import ParquetStorageBackend
+from gmat_diagnosis_app.services.storage.summary_store import PerformanceSummaryStore, summarize_records
+
+__all__ = [
+    'PERFORMANCE_TABLE',
+    'SUBJECTIVE_TABLE',
+    'TABLE_HEADERS',
+    'GMAT_PERFORMANCE_HEADERS',
+    'STUDENT_SUBJECTIVE_REPORTS_HEADERS',
+    'GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK',
+    'STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK',
+    'DUPLICATE_CHECK_HEADERS',
+    'record_digest',
+    'serialize_record',
+    'StorageBackend',
+    'migrate_storage',
+    'CSVTableCache',
+    'DigestSidecarIndex',
+    'ChangeLog',
+    'FileLock',
+    'WriteBehindBuffer',
+    'CSVStorageBackend',
+    'SQLiteStorageBackend',
+    'ParquetStorageBackend',
+    'PerformanceSummaryStore',
+    'summarize_records',
+]
@@ -0,0 +1,118 @@
+"""
+Vectorized aggregations over performance records.
+
+Shared by the analysis functions (services/csv_data_analysis.py) and the
+materialized summary store, so both compute per-test-instance statistics and
+tallies the same way. Frames hold the stored string values.
+"""
+
+from collections import defaultdict
+from typing import Dict, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Column tallied as the "skill" of a question per section: fundamental skills
+# for Q/V, content domains for DI
+SKILL_COLUMNS = {"Q": "question_fundamental_skill", "V": "question_fundamental_skill", "DI": "content_domain"}
+
+
+def group_codes(*keys: np.ndarray):
+    """
+    Factorize combined key columns.
+
+    Returns:
+        (group code per row, number of groups, tuple of key values per group), groups
+        numbered in order of first appearance
+    """
+    combined = np.zeros(len(keys[0]), dtype=np.int64)
+    uniques = []
+    for key in keys:
+        codes, key_uniques = pd.factorize(key)
+        combined = combined * max(len(key_uniques), 1) + codes
+        uniques.append(key_uniques)
+    codes, group_keys = pd.factorize(combined)
+    key_values = []
+    remainder = np.asarray(group_keys, dtype=np.int64)
+    for key_uniques in reversed(uniques):
+        size = max(len(key_uniques), 1)
+        key_values.append(np.asarray(key_uniques, dtype=object)[remainder % size])
+        remainder = remainder // size
+    return codes, len(group_keys), tuple(reversed(key_values))
+
+
+def test_instance_aggregates(frame: pd.DataFrame,
+                             keys: Sequence[str] = ("student_id", "test_instance_id")) -> pd.DataFrame:
+    """
+    Aggregate question rows per ``keys`` (default (student_id, test_instance_id)),
+    in order of first appearance.
+
+    Time / difficulty averages are only defined when every value of the test
+    instance is numeric (``time_valid`` / ``difficulty_valid`` equal ``total_questions``),
+    matching the per-test ``float()`` conversion of the record-based implementation.
+    Sums are accumulated in row order with np.bincount.
+    """
+    groups, group_count, key_values = group_codes(*(frame[key].to_numpy() for key in keys))
+    test_dates = frame["test_date"].to_numpy()
+    correct = frame["is_correct"].to_numpy() == '1'
+    times = pd.to_numeric(frame["question_time_minutes"], errors="coerce").to_numpy(dtype=float)
+    difficulties = pd.to_numeric(frame["question_difficulty"], errors="coerce").to_numpy(dtype=float)
+
+    # Position of the first / last row of each group
+    first_rows = np.full(group_count, len(groups), dtype=np.int64)
+    np.minimum.at(first_rows, groups, np.arange(len(groups)))
+    last_rows = np.full(group_count, -1, dtype=np.int64)
+    np.maximum.at(last_rows, groups, np.arange(len(groups)))
+
+    def count(mask: np.ndarray) -> np.ndarray:
+        return np.bincount(groups, weights=mask, minlength=group_count).astype(np.int64)
+
+    def total(values: np.ndarray) -> np.ndarray:
+        return np.bincount(groups, weights=np.nan_to_num(values), minlength=group_count)
+
+    columns = dict(zip(keys, key_values))
+    columns.update({
+        "first_date": test_dates[first_rows],
+        "last_date": test_dates[last_rows],
+        "total_questions": np.bincount(groups, minlength=group_count),
+        "correct_count": count(correct),
+        "time_sum": total(times),
+        "time_valid": count(~np.isnan(times)),
+        "difficulty_sum": total(difficulties),
+        "difficulty_valid": count(~np.isnan(difficulties)),
+    })
+    return pd.DataFrame(columns)
+
+
+def tally(keys: Tuple[np.ndarray, ...], values: np.ndarray,
+          correct: np.ndarray) -> Dict[tuple, Dict[str, Dict[str, int]]]:
+    """
+    Count correct / total answers per (key..., value), skipping empty values.
+
+    Returns:
+        {key tuple: {value: {"correct": int, "total": int}}}, values in order of first appearance
+    """
+    mask = values != ''
+    result = defaultdict(dict)
+    if not mask.any():
+        return result
+    correct = correct[mask]
+    groups, group_count, group_keys = group_codes(*(key[mask] for key in keys), values[mask])
+    totals = np.bincount(groups, minlength=group_count)
+    correct_counts = np.bincount(groups, weights=correct, minlength=group_count)
+    for *key, value, correct_count, total in zip(*group_keys, correct_counts, totals):
+        result[tuple(key)][value] = {"correct": int(correct_count), "total": int(total)}
+    return result
+
+
+def difficulty_levels(frame: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Categorize question difficulty as easy (< 3), medium (< 4) or hard.
+
+    Returns:
+        (level per row, mask of rows with a numeric difficulty)
+    """
+    difficulty = pd.to_numeric(frame["question_difficulty"], errors="coerce").to_numpy()
+    has_difficulty = ~np.isnan(difficulty)
+    levels = np.select([difficulty < 3, difficulty < 4], ["easy", "medium"], default="hard")
+    return levels, has_difficulty
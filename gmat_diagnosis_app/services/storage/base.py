@@ -0,0 +1,173 @@
+"""
+Storage backend interface for the CSV data service.
+
+A backend stores the two tables defined in ``schema.py`` (performance records
+and subjective reports). Updates and deletes are always keyed by
+``test_instance_id``, mirroring the public csv_data_service API.
+"""
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from gmat_diagnosis_app.services.storage.schema import TABLE_HEADERS, record_digest
+
+# Number of rows copied per append call during migrations
+MIGRATION_BATCH_SIZE = 5000
+
+
+class StorageBackend:
+    """Base class for performance / subjective report stores."""
+
+    name = "base"
+
+    def initialize(self) -> None:
+        """Creates the underlying files/tables if they do not exist."""
+        raise NotImplementedError
+
+    def append_records(self, table: str, records: List[Dict[str, Any]]) -> int:
+        """
+        Appends records to ``table``.
+
+        Returns:
+            Number of records written.
+        """
+        raise NotImplementedError
+
+    def iter_records(self, table: str) -> Iterator[Dict[str, str]]:
+        """Yields every record of ``table`` in insertion order."""
+        raise NotImplementedError
+
+    def query_records(self, table: str, **filters: str) -> List[Dict[str, str]]:
+        """
+        Returns the records of ``table`` whose columns equal the given values,
+        in insertion order, e.g. ``query_records(PERFORMANCE_TABLE, student_id='s1')``.
+        """
+        raise NotImplementedError
+
+    def query_frame(self, table: str, **filters: str):
+        """
+        Same as ``query_records`` (no filters: every record) but returns a pandas
+        DataFrame of strings with one column per header.
+        """
+        import pandas as pd
+        headers = self._check_table(table)
+        return pd.DataFrame(self.query_records(table, **filters), columns=headers)
+
+    def update_records(self, table: str, test_instance_id: str, updates: Dict[str, Any]) -> int:
+        """
+        Applies ``updates`` (unknown columns are ignored) to every record of
+        ``test_instance_id``.
+
+        Returns:
+            Number of records matched.
+        """
+        raise NotImplementedError
+
+    def delete_records(self, table: str, test_instance_id: str) -> int:
+        """
+        Deletes every record of ``test_instance_id``.
+
+        Returns:
+            Number of records deleted.
+        """
+        raise NotImplementedError
+
+    def flush(self, table: Optional[str] = None) -> None:
+        """Writes records still buffered in memory (no-op for unbuffered backends)."""
+
+    def data_signature(self, table: str) -> Optional[str]:
+        """
+        Returns a string that changes whenever the stored data of ``table``
+        changes, including edits made outside the app (e.g. file mtimes and
+        sizes), or None if the backend cannot tell.
+        """
+        return None
+
+    def count_records(self, table: str) -> int:
+        """Returns the number of records in ``table``."""
+        return sum(1 for _ in self.iter_records(table))
+
+    def clear_records(self, table: str) -> None:
+        """Removes every record of ``table`` (the table itself is kept)."""
+        raise NotImplementedError
+
+    def find_existing_digests(self, table: str, digests: Iterable[int],
+                              records: Optional[List[Dict[str, Any]]] = None) -> Set[int]:
+        """
+        Returns the subset of ``digests`` (see ``schema.record_digest``) that
+        belong to records already stored in ``table``.
+
+        ``records`` are the records the digests were computed from, if known;
+        backends may use them to narrow the lookup. The default scans every
+        record; backends override it with a persisted index.
+        """
+        self._check_table(table)
+        wanted = set(digests)
+        if not wanted:
+            return set()
+        found = set()
+        for record in self.iter_records(table):
+            digest = record_digest(record, table)
+            if digest in wanted:
+                found.add(digest)
+                if len(found) == len(wanted):
+                    break
+        return found
+
+    @staticmethod
+    def _check_table(table: str) -> List[str]:
+        if table not in TABLE_HEADERS:
+            raise ValueError(f"Unknown table: {table}")
+        return TABLE_HEADERS[table]
+
+    @staticmethod
+    def _matches(record: Dict[str, str], filters: Dict[str, str]) -> bool:
+        return all(record.get(column) == value for column, value in filters.items())
+
+
+def _batched(records: Iterable[Dict[str, str]], batch_size: int) -> Iterator[List[Dict[str, str]]]:
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def migrate_storage(source: StorageBackend, target: StorageBackend,
+                    overwrite: bool = False) -> Dict[str, Any]:
+    """
+    Copies every table from ``source`` to ``target`` in batches.
+
+    Args:
+        source: Backend to read from (e.g. the CSV backend).
+        target: Backend to write to (e.g. the SQLite backend).
+        overwrite: If True, existing target records are removed first. If False,
+                   tables that already contain records are skipped.
+
+    Returns:
+        Dictionary with the number of records copied / skipped per table.
+    """
+    source.initialize()
+    target.initialize()
+    results = {"success": True, "tables": {}}
+
+    for table in TABLE_HEADERS:
+        existing = target.count_records(table)
+        if existing and not overwrite:
+            results["tables"][table] = {
+                "records_copied": 0,
+                "skipped": True,
+                "message": f"Target already contains {existing} records; use overwrite=True to replace them",
+            }
+            continue
+        if existing:
+            target.clear_records(table)
+
+        copied = 0
+        for batch in _batched(source.iter_records(table), MIGRATION_BATCH_SIZE):
+            copied += target.append_records(table, batch)
+        results["tables"][table] = {"records_copied": copied, "skipped": False}
+
+    return results
@@ -0,0 +1,123 @@
+"""
+Append-only change log for a CSV table.
+
+Updates and deletes are not written into the CSV file itself; they are
+appended to ``<file>.changes.jsonl`` as one JSON line each:
+
+- ``{"op": "update", "test_instance_id": ..., "updates": {...}, "base_rows": N}``
+- ``{"op": "delete", "test_instance_id": ..., "base_rows": N}`` (tombstone)
+
+``base_rows`` is the number of data rows in the CSV file when the change was
+made; a change only applies to rows before that position, so rows appended
+later for the same test instance are not affected (same behaviour as the old
+rewrite-in-place). Readers apply the log on top of the CSV rows in order.
+
+The first line records the inode of the CSV file the log belongs to.
+Compaction writes the merged rows to a new file and atomically renames it
+over the CSV file, which gives it a new inode; a log left behind by an
+interrupted compaction therefore no longer matches and is ignored.
+
+The number of entries is counted once and then kept up to date by ``append``
+and ``clear``; it is only recounted when the log or the CSV file was changed
+by someone else (another process or an external edit).
+"""
+
+import json
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class ChangeLog:
+    """Update/tombstone entries for one CSV file."""
+
+    def __init__(self, data_path: str):
+        self.data_path = data_path
+        self.path = data_path + ".changes.jsonl"
+        # ((log signature, CSV inode), number of entries) as of the last count
+        self._counted: Optional[Tuple[Tuple, int]] = None
+
+    def _data_inode(self) -> Optional[int]:
+        try:
+            return os.stat(self.data_path).st_ino
+        except FileNotFoundError:
+            return None
+
+    def signature(self) -> Optional[Tuple[int, int]]:
+        """Returns (mtime_ns, size) of the log, or None if there is no log."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _count_key(self) -> Tuple:
+        return (self.signature(), self._data_inode())
+
+    def read_entries(self) -> List[Dict[str, Any]]:
+        """Returns the entries that apply to the current CSV file, in order."""
+        try:
+            with open(self.path, "r", encoding="utf-8") as log_file:
+                lines = log_file.read().split("\n")
+        except FileNotFoundError:
+            return []
+        if not lines or not lines[0]:
+            return []
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return []
+        if header.get("csv_inode") != self._data_inode():
+            return [] # Left over from before a compaction / rewrite
+        entries = []
+        # The last element is '' for a complete log, or a line still being written
+        for line in lines[1:-1]:
+            if line:
+                entries.append(json.loads(line))
+        return entries
+
+    def append(self, entry: Dict[str, Any], fsync: bool = False) -> None:
+        """Appends one entry, starting a new log if the current one is stale."""
+        count = self._known_count()
+        data_inode = self._data_inode()
+        header = None
+        try:
+            with open(self.path, "r", encoding="utf-8") as log_file:
+                header = json.loads(log_file.readline() or "null")
+        except (FileNotFoundError, ValueError):
+            header = None
+        if not header or header.get("csv_inode") != data_inode:
+            self._start(data_inode)
+            count = 0
+        with open(self.path, "a", encoding="utf-8") as log_file:
+            log_file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            if fsync:
+                log_file.flush()
+                os.fsync(log_file.fileno())
+        self._counted = None if count is None else (self._count_key(), count + 1)
+
+    def clear(self) -> None:
+        """Removes the log (after a compaction or when the table is cleared)."""
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._counted = (self._count_key(), 0)
+
+    def _start(self, data_inode: Optional[int]) -> None:
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as log_file:
+            log_file.write(json.dumps({"csv_inode": data_inode}) + "\n")
+        os.replace(tmp_path, self.path)
+
+    def _known_count(self) -> Optional[int]:
+        """Returns the counted number of entries if the log is unchanged since, else None."""
+        if self._counted is not None and self._counted[0] == self._count_key():
+            return self._counted[1]
+        return None
+
+    def __len__(self) -> int:
+        count = self._known_count()
+        if count is None:
+            count = len(self.read_entries())
+            self._counted = (self._count_key(), count)
+        return count
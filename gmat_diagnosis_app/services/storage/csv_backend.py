@@ -0,0 +1,327 @@
+"""
+CSV storage backend (the original file format of the data service).
+
+Reads are served from an in-memory indexed cache of each file (see
+csv_cache.py) that is invalidated when the file changes. Updates and deletes
+are appended to a per-table change log (see change_log.py) instead of
+rewriting the file; compaction merges the log back into the file and replaces
+the file atomically. Duplicate checks use a digest sidecar file per table (see
+digest_index.py). Kept as the default backend for compatibility with existing
+deployments and exports.
+
+Every write to a table's files happens under a cross-process advisory lock
+(see file_lock.py). Appends can be queued in a write-behind buffer (see
+write_buffer.py) and written in batches by a background thread.
+"""
+
+import csv
+import os
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from gmat_diagnosis_app.services.storage.base import StorageBackend
+from gmat_diagnosis_app.services.storage.change_log import ChangeLog
+from gmat_diagnosis_app.services.storage.csv_cache import CSVTableCache
+from gmat_diagnosis_app.services.storage.digest_index import DigestSidecarIndex
+from gmat_diagnosis_app.services.storage.file_lock import FileLock
+from gmat_diagnosis_app.services.storage.schema import (
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    record_digest,
+    serialize_record,
+)
+from gmat_diagnosis_app.services.storage.write_buffer import WriteBehindBuffer
+
+# Change-log entries per table before the log is merged into the CSV file
+DEFAULT_COMPACTION_THRESHOLD = 200
+
+# fsync policies:
+#   "always": fsync the CSV file and change log after every write
+#   "batch":  fsync the CSV file once per flushed batch and before compaction renames
+#   "never":  leave flushing to the operating system
+FSYNC_POLICIES = ("always", "batch", "never")
+DEFAULT_FSYNC_POLICY = "batch"
+
+
+class CSVStorageBackend(StorageBackend):
+    """Stores each table in its own CSV file."""
+
+    name = "csv"
+
+    def __init__(self, performance_file: str, subjective_file: str,
+                 compaction_threshold: int = DEFAULT_COMPACTION_THRESHOLD,
+                 write_behind: bool = False,
+                 batch_size: int = 500,
+                 flush_interval: float = 1.0,
+                 fsync_policy: str = DEFAULT_FSYNC_POLICY):
+        """
+        Args:
+            performance_file: CSV file of the performance records.
+            subjective_file: CSV file of the subjective reports.
+            compaction_threshold: Number of change-log entries after which a table
+                                  is compacted automatically (0 disables it).
+            write_behind: Queue appends and write them from a background thread.
+            batch_size: Queued rows that trigger an immediate flush (write_behind only).
+            flush_interval: Max seconds an appended row stays queued (write_behind only).
+            fsync_policy: One of FSYNC_POLICIES.
+        """
+        if fsync_policy not in FSYNC_POLICIES:
+            raise ValueError(f"Unknown fsync policy: {fsync_policy!r} (expected one of {FSYNC_POLICIES})")
+        self.compaction_threshold = compaction_threshold
+        self.fsync_policy = fsync_policy
+        self.files = {
+            PERFORMANCE_TABLE: performance_file,
+            SUBJECTIVE_TABLE: subjective_file,
+        }
+        self.locks = {table: FileLock(path) for table, path in self.files.items()}
+        self.change_logs = {table: ChangeLog(path) for table, path in self.files.items()}
+        self.caches = {
+            table: CSVTableCache(
+                path, self._check_table(table),
+                change_log=self.change_logs[table], file_lock=self.locks[table],
+            )
+            for table, path in self.files.items()
+        }
+        self.digest_indexes = {
+            table: DigestSidecarIndex(path, self._digest_source(table))
+            for table, path in self.files.items()
+        }
+        self.write_buffer = (
+            WriteBehindBuffer(self._write_rows, batch_size=batch_size, flush_interval=flush_interval)
+            if write_behind else None
+        )
+        # Digests of rows still queued in the write-behind buffer; shared by
+        # request threads and the flush thread, so only touched under the lock
+        self._queued_digests: Dict[str, Set[int]] = {table: set() for table in self.files}
+        self._queued_digests_lock = threading.Lock()
+
+    def _digest_source(self, table: str):
+        def source():
+            for record in self.caches[table].records():
+                yield record_digest(record, table), record["test_instance_id"]
+        return source
+
+    def path_for(self, table: str) -> str:
+        self._check_table(table)
+        return self.files[table]
+
+    def initialize(self) -> None:
+        """
+        Initialize CSV files if they do not exist.
+        Creates the files and writes headers.
+        """
+        for table, path in self.files.items():
+            if os.path.exists(path):
+                continue
+            try:
+                with self.locks[table].exclusive():
+                    # Another process may have created it while we waited for the lock
+                    if os.path.exists(path):
+                        continue
+                    self._write_all(table, [])
+                print(f"Created {path} successfully.")
+            except Exception as e:
+                print(f"Error creating {path}: {e}")
+
+    def append_records(self, table: str, records: List[Dict[str, Any]]) -> int:
+        headers = self._check_table(table)
+        rows = [serialize_record(record, headers) for record in records]
+        if not rows:
+            return 0
+        if self.write_buffer is None:
+            self._write_rows(table, rows)
+        else:
+            digests = {record_digest(row, table) for row in rows}
+            with self._queued_digests_lock:
+                new_digests = digests - self._queued_digests[table]
+                self._queued_digests[table].update(new_digests)
+            try:
+                self.write_buffer.add(table, rows)
+            except Exception:
+                # The rows were not queued (e.g. an earlier background flush failed)
+                with self._queued_digests_lock:
+                    self._queued_digests[table].difference_update(new_digests)
+                raise
+        return len(rows)
+
+    def flush(self, table: Optional[str] = None) -> None:
+        if self.write_buffer is not None:
+            self.write_buffer.flush(table)
+
+    def close(self) -> None:
+        """Flushes queued rows and stops the write-behind thread."""
+        if self.write_buffer is not None:
+            self.write_buffer.close()
+
+    def _write_rows(self, table: str, rows: List[Dict[str, str]]) -> None:
+        headers = self._check_table(table)
+        cache = self.caches[table]
+        with self.locks[table].exclusive():
+            signature_before = cache.file_signature()
+            with open(self.files[table], 'a', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=headers)
+                # Write headers if the file is empty (e.g. created externally with no content)
+                csvfile.seek(0, os.SEEK_END)
+                if csvfile.tell() == 0:
+                    writer.writeheader()
+                writer.writerows(rows)
+                if self.fsync_policy != "never":
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+            cache.note_append(rows, signature_before)
+            self.digest_indexes[table].add(
+                [(record_digest(row, table), row["test_instance_id"]) for row in rows]
+            )
+        if self.write_buffer is not None:
+            written = {record_digest(row, table) for row in rows}
+            # Keep digests of identical rows that are still queued
+            still_queued = {record_digest(row, table) for row in self.write_buffer.pending(table)}
+            with self._queued_digests_lock:
+                queued = self._queued_digests[table]
+                queued.difference_update(written)
+                queued.update(still_queued)
+
+    def iter_records(self, table: str) -> Iterator[Dict[str, str]]:
+        self._check_table(table)
+        self.flush(table)
+        yield from self.caches[table].records()
+
+    def query_records(self, table: str, **filters: str) -> List[Dict[str, str]]:
+        self._check_table(table)
+        self.flush(table)
+        return self.caches[table].query(**filters)
+
+    def query_frame(self, table: str, **filters: str):
+        self._check_table(table)
+        self.flush(table)
+        return self.caches[table].query_frame(**filters)
+
+    def data_signature(self, table: str) -> Optional[str]:
+        self._check_table(table)
+        signature = self.caches[table].file_signature()
+        return None if signature is None else repr(signature)
+
+    def count_records(self, table: str) -> int:
+        self._check_table(table)
+        self.flush(table)
+        return self.caches[table].count()
+
+    def find_existing_digests(self, table: str, digests: Iterable[int],
+                              records: Optional[List[Dict[str, Any]]] = None) -> Set[int]:
+        self._check_table(table)
+        digests = set(digests)
+        with self.locks[table].shared():
+            found = self.digest_indexes[table].find_existing(digests)
+        with self._queued_digests_lock:
+            return found | (digests & self._queued_digests[table])
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns hit/load counters of the per-table caches."""
+        return {table: dict(cache.stats) for table, cache in self.caches.items()}
+
+    def update_records(self, table: str, test_instance_id: str, updates: Dict[str, Any]) -> int:
+        headers = self._check_table(table)
+        self.flush(table)
+        cache = self.caches[table]
+        valid_updates = {
+            key: "" if value is None else str(value)
+            for key, value in updates.items() if key in headers
+        }
+        with self.locks[table].exclusive():
+            matched = len(cache.positions(test_instance_id=test_instance_id))
+            if not matched or not valid_updates:
+                return matched
+            self._log_change(table, {
+                "op": "update",
+                "test_instance_id": test_instance_id,
+                "updates": valid_updates,
+                "base_rows": cache.physical_rows(),
+            })
+            # Re-index the digests of the changed rows (and of the target test instance if renamed)
+            affected = {test_instance_id, valid_updates.get("test_instance_id", test_instance_id)}
+            digest_index = self.digest_indexes[table]
+            entries = []
+            for affected_id in affected:
+                digest_index.remove_test_instance(affected_id)
+                entries.extend(
+                    (record_digest(record, table), affected_id)
+                    for record in cache.query(test_instance_id=affected_id)
+                )
+            if entries:
+                digest_index.add(entries)
+        # Outside the table lock: compact() flushes the write-behind buffer, whose
+        # flush thread takes the table lock while holding the buffer's flush lock
+        self._maybe_compact(table)
+        return matched
+
+    def delete_records(self, table: str, test_instance_id: str) -> int:
+        self._check_table(table)
+        self.flush(table)
+        cache = self.caches[table]
+        with self.locks[table].exclusive():
+            deleted = len(cache.positions(test_instance_id=test_instance_id))
+            if deleted:
+                self._log_change(table, {
+                    "op": "delete",
+                    "test_instance_id": test_instance_id,
+                    "base_rows": cache.physical_rows(),
+                })
+                self.digest_indexes[table].remove_test_instance(test_instance_id)
+        if deleted:
+            # Outside the table lock, see update_records
+            self._maybe_compact(table)
+        return deleted
+
+    def clear_records(self, table: str) -> None:
+        self._check_table(table)
+        self.flush(table)
+        self._write_all(table, [])
+
+    def compact(self, table: Optional[str] = None) -> Dict[str, int]:
+        """
+        Merges the change log of ``table`` (default: every table) into its CSV file.
+        Must not be called with the table lock held (it flushes the write-behind buffer).
+
+        Returns:
+            Number of change-log entries merged per table.
+        """
+        tables = [table] if table else list(self.files)
+        merged = {}
+        for name in tables:
+            self._check_table(name)
+            self.flush(name)
+            with self.locks[name].exclusive():
+                entries = len(self.change_logs[name])
+                if entries:
+                    self._write_all(name, self.caches[name].records())
+            merged[name] = entries
+        return merged
+
+    def _log_change(self, table: str, entry: Dict[str, Any]) -> None:
+        cache = self.caches[table]
+        signature_before = cache.file_signature()
+        self.change_logs[table].append(entry, fsync=self.fsync_policy == "always")
+        cache.note_change(entry, signature_before)
+
+    def _maybe_compact(self, table: str) -> None:
+        if self.compaction_threshold and len(self.change_logs[table]) >= self.compaction_threshold:
+            self.compact(table)
+
+    def _write_all(self, table: str, records: List[Dict[str, Any]]) -> None:
+        """Replaces the file with ``records`` via a temporary file and an atomic rename."""
+        headers = self._check_table(table)
+        path = self.files[table]
+        tmp_path = path + ".tmp"
+        with self.locks[table].exclusive():
+            with open(tmp_path, 'w', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=headers)
+                writer.writeheader()
+                writer.writerows(records)
+                if self.fsync_policy != "never":
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+            os.replace(tmp_path, path)
+            # The new file has a new inode, so the old log no longer applies; remove it
+            self.change_logs[table].clear()
+            self.caches[table].invalidate()
+            self.digest_indexes[table].rebuild()
@@ -0,0 +1,309 @@
+"""
+In-memory indexed cache of a CSV table.
+
+The file is parsed once into a pandas DataFrame of strings (the same values
+csv.DictReader returns) with hash indexes on the lookup columns. The cache is
+invalidated when the file's mtime or size changes, so edits made by other
+processes are picked up on the next read. Rows appended by this process are
+added to the cache directly instead of re-parsing the file. If the table has a
+change log (see change_log.py), its updates and tombstones are applied on top
+of the parsed rows.
+
+A change only touches the rows of its test instance: updated values are
+written into those rows (copy-on-write keeps frames handed out earlier
+unchanged) and deleted rows are only dropped from the indexes. The rows
+themselves are removed on the next read of the whole table.
+"""
+
+import os
+import threading
+from contextlib import nullcontext
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from gmat_diagnosis_app.services.storage.change_log import ChangeLog
+from gmat_diagnosis_app.services.storage.file_lock import FileLock
+
+# Columns that get a hash index (value -> row positions)
+DEFAULT_INDEX_COLUMNS = ("student_id", "test_instance_id")
+
+_EMPTY_POSITIONS = np.array([], dtype=np.intp)
+
+# Appended rows kept as dicts until the next read merges them; beyond this (e.g.
+# during a bulk import) the cache is dropped instead, so it does not grow with
+# every chunk written
+MAX_PENDING_ROWS = 10000
+
+
+class CSVTableCache:
+    """Caches one CSV file as a string DataFrame plus per-column hash indexes."""
+
+    def __init__(self, path: str, headers: Sequence[str],
+                 index_columns: Sequence[str] = DEFAULT_INDEX_COLUMNS,
+                 change_log: Optional[ChangeLog] = None,
+                 file_lock: Optional[FileLock] = None):
+        self.path = path
+        self.headers = list(headers)
+        self.index_columns = [column for column in index_columns if column in self.headers]
+        self.change_log = change_log
+        # Held (shared) while parsing so a concurrent writer's rows are never read half-written
+        self.file_lock = file_lock
+        self._frame: Optional[pd.DataFrame] = None
+        # Position of each cached row in the CSV file (rows removed by tombstones leave gaps)
+        self._row_ids = np.array([], dtype=np.int64)
+        # Sorted positions of rows deleted by a change but still in _frame
+        self._deleted = _EMPTY_POSITIONS
+        self._physical_rows = 0
+        self._indexes: Dict[str, Dict[str, np.ndarray]] = {}
+        self._pending: List[Dict[str, str]] = []
+        self._signature: Optional[Tuple] = None
+        self._lock = threading.RLock()
+        self.stats = {"hits": 0, "loads": 0, "appends": 0, "changes": 0, "invalidations": 0}
+
+    # --- Freshness -------------------------------------------------------
+
+    def file_signature(self) -> Optional[Tuple]:
+        """
+        Returns (mtime_ns, size, change log signature) of the file, or None if
+        it does not exist.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        log_signature = self.change_log.signature() if self.change_log else None
+        return (st.st_mtime_ns, st.st_size, log_signature)
+
+    def invalidate(self) -> None:
+        """Drops the cached data; the next read re-parses the file."""
+        with self._lock:
+            self._frame = None
+            self._deleted = _EMPTY_POSITIONS
+            self._indexes = {}
+            self._pending = []
+            self._signature = None
+            self.stats["invalidations"] += 1
+
+    def note_append(self, rows: List[Dict[str, str]], signature_before: Optional[Tuple[int, int]]) -> None:
+        """
+        Records rows this process just appended to the file.
+
+        If the cache was up to date before the append, the rows are added to it
+        and the new file signature is adopted; otherwise the cache is dropped.
+        """
+        with self._lock:
+            if (self._frame is None or self._signature != signature_before
+                    or len(self._pending) + len(rows) > MAX_PENDING_ROWS):
+                self.invalidate()
+                return
+            self._pending.extend(rows)
+            self._physical_rows += len(rows)
+            self._signature = self.file_signature()
+            self.stats["appends"] += 1
+
+    def note_change(self, entry: Dict[str, Any], signature_before: Optional[Tuple]) -> None:
+        """
+        Records a change-log entry this process just appended. Applied to the
+        cached rows if the cache was up to date, otherwise the cache is dropped.
+        """
+        with self._lock:
+            if self._frame is None or self._signature != signature_before:
+                self.invalidate()
+                return
+            self._merge_pending()
+            self._apply_change(entry)
+            self._signature = self.file_signature()
+            self.stats["changes"] += 1
+
+    # --- Loading ---------------------------------------------------------
+
+    def _load(self) -> None:
+        signature = self.file_signature()
+        if signature is None or signature[1] == 0:
+            frame = pd.DataFrame(columns=self.headers, dtype=object)
+        else:
+            frame = pd.read_csv(
+                self.path, dtype=str, keep_default_na=False, na_filter=False,
+                skip_blank_lines=True,
+            )
+        self._frame = frame.reset_index(drop=True)
+        self._physical_rows = len(self._frame)
+        self._row_ids = np.arange(self._physical_rows, dtype=np.int64)
+        self._deleted = _EMPTY_POSITIONS
+        self._build_indexes()
+        if self.change_log is not None:
+            for entry in self.change_log.read_entries():
+                self._apply_change(entry)
+        self._pending = []
+        self._signature = signature
+        self.stats["loads"] += 1
+
+    def _build_indexes(self) -> None:
+        self._indexes = {
+            column: self._frame.groupby(column, sort=False).indices
+            for column in self.index_columns if column in self._frame.columns
+        }
+
+    def _apply_change(self, entry: Dict[str, Any]) -> None:
+        """
+        Applies one change-log entry to the rows that existed when it was written.
+        Only those rows and their index entries are touched.
+        """
+        positions = self._positions(self._frame, self._indexes, self._deleted,
+                                    {"test_instance_id": entry["test_instance_id"]})
+        positions = positions[self._row_ids[positions] < entry["base_rows"]]
+        if len(positions) == 0:
+            return
+        if entry["op"] == "delete":
+            for column in self._indexes:
+                self._unindex(column, positions)
+            self._deleted = np.union1d(self._deleted, positions)
+        elif entry["op"] == "update":
+            updates = {column: value for column, value in entry["updates"].items() if column in self._frame.columns}
+            for column in updates:
+                if column in self._indexes:
+                    self._unindex(column, positions)
+            # The shallow copy shares the data; once the old frame is dropped,
+            # copy-on-write only copies it if a reader still holds that frame
+            self._frame = self._frame.copy(deep=False)
+            for column, value in updates.items():
+                self._frame.iloc[positions, self._frame.columns.get_loc(column)] = value
+            for column, value in updates.items():
+                if column in self._indexes:
+                    self._index(column, value, positions)
+
+    def _unindex(self, column: str, positions: np.ndarray) -> None:
+        """Removes ``positions`` from the index of ``column`` (readers keep the old dict)."""
+        index = dict(self._indexes[column])
+        values = self._frame[column].to_numpy()[positions]
+        for value in pd.unique(values):
+            remaining = np.setdiff1d(index[value], positions[values == value], assume_unique=True)
+            if len(remaining):
+                index[value] = remaining
+            else:
+                del index[value]
+        self._indexes = {**self._indexes, column: index}
+
+    def _index(self, column: str, value: str, positions: np.ndarray) -> None:
+        """Adds ``positions``, which now hold ``value``, to the index of ``column``."""
+        index = dict(self._indexes[column])
+        existing = index.get(value)
+        index[value] = positions if existing is None else np.union1d(existing, positions)
+        self._indexes = {**self._indexes, column: index}
+
+    def _drop_deleted(self) -> None:
+        """Removes the rows deleted by changes from the frame (before reading all of it)."""
+        if len(self._deleted) == 0:
+            return
+        keep = np.ones(len(self._frame), dtype=bool)
+        keep[self._deleted] = False
+        self._frame = self._frame[keep].reset_index(drop=True)
+        self._row_ids = self._row_ids[keep]
+        self._deleted = _EMPTY_POSITIONS
+        self._build_indexes()
+
+    def _merge_pending(self) -> None:
+        if not self._pending:
+            return
+        start = len(self._frame)
+        new_rows = pd.DataFrame(self._pending, columns=self._frame.columns).fillna("")
+        self._frame = pd.concat([self._frame, new_rows], ignore_index=True)
+        self._row_ids = np.concatenate([
+            self._row_ids,
+            np.arange(self._physical_rows - len(new_rows), self._physical_rows, dtype=np.int64),
+        ])
+        for column, index in self._indexes.items():
+            for value, positions in new_rows.groupby(column, sort=False).indices.items():
+                new_positions = positions + start
+                existing = index.get(value)
+                index[value] = new_positions if existing is None else np.concatenate([existing, new_positions])
+        self._pending = []
+
+    def _is_fresh(self) -> bool:
+        return self._frame is not None and self._signature == self.file_signature()
+
+    def _current(self, whole: bool = False) -> Tuple[pd.DataFrame, Dict[str, Dict[str, np.ndarray]], np.ndarray]:
+        """
+        Returns (frame, indexes, positions of deleted rows). With ``whole`` the
+        deleted rows are removed from the frame first.
+        """
+        with self._lock:
+            if self._is_fresh():
+                self.stats["hits"] += 1
+                return self._snapshot(whole)
+        # Writers hold the file lock while updating the cache, so take it before the cache lock
+        with self.file_lock.shared() if self.file_lock is not None else nullcontext():
+            with self._lock:
+                if self._is_fresh():
+                    self.stats["hits"] += 1
+                else:
+                    self._load()
+                return self._snapshot(whole)
+
+    def _snapshot(self, whole: bool):
+        self._merge_pending()
+        if whole:
+            self._drop_deleted()
+        return self._frame, self._indexes, self._deleted
+
+    # --- Reads -----------------------------------------------------------
+
+    def frame(self) -> pd.DataFrame:
+        """Returns the cached DataFrame (all values are strings). Treat it as read-only."""
+        return self._current(whole=True)[0]
+
+    def count(self) -> int:
+        """Returns the number of rows (without materializing pending deletions)."""
+        frame, _, deleted = self._current()
+        return len(frame) - len(deleted)
+
+    def physical_rows(self) -> int:
+        """Returns the number of data rows in the CSV file (including changed/deleted ones)."""
+        self._current()
+        with self._lock:
+            return self._physical_rows
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Returns every row as a dict, in file order."""
+        return self.frame().to_dict("records")
+
+    def positions(self, **filters: str) -> np.ndarray:
+        """Returns the row positions matching all equality ``filters``, in file order."""
+        return self._positions(*self._current(), filters)
+
+    def query(self, **filters: str) -> List[Dict[str, Any]]:
+        """Returns the rows matching all equality ``filters`` as dicts, in file order."""
+        frame, indexes, deleted = self._current()
+        positions = self._positions(frame, indexes, deleted, filters)
+        if len(positions) == 0:
+            return []
+        return frame.iloc[positions].to_dict("records")
+
+    def query_frame(self, **filters: str) -> pd.DataFrame:
+        """Returns the rows matching all equality ``filters`` as a new DataFrame, in file order."""
+        if not filters:
+            return self._current(whole=True)[0].copy()
+        frame, indexes, deleted = self._current()
+        positions = self._positions(frame, indexes, deleted, filters)
+        return frame.iloc[positions].reset_index(drop=True)
+
+    @staticmethod
+    def _positions(frame: pd.DataFrame, indexes: Dict[str, Dict[str, np.ndarray]],
+                   deleted: np.ndarray, filters: Dict[str, str]) -> np.ndarray:
+        indexed = [column for column in filters if column in indexes]
+        if indexed:
+            # Start from the most selective indexed column (deleted rows are not indexed)
+            candidates = [indexes[column].get(str(filters[column]), _EMPTY_POSITIONS) for column in indexed]
+            positions = min(candidates, key=len)
+        else:
+            positions = np.setdiff1d(np.arange(len(frame)), deleted, assume_unique=True)
+        for column, value in filters.items():
+            if len(positions) == 0:
+                break
+            if column not in frame.columns:
+                return _EMPTY_POSITIONS
+            mask = frame[column].to_numpy()[positions] == str(value)
+            positions = positions[mask]
+        return np.sort(positions)
@@ -0,0 +1,161 @@
+"""
+Persisted digest index used for duplicate detection in the CSV backend.
+
+The index lives in an append-only sidecar file next to the CSV file
+(``<file>.digests``). Each line is one of:
+
+- ``+<digest>\\t<test_instance_id>``: a stored record
+- ``-<test_instance_id>``: every record of the test instance was removed
+- ``=<size>``: the size in bytes of the CSV file the lines above describe
+
+The index is loaded into memory once and then followed incrementally, so
+duplicate checks are set lookups independent of the CSV file size. If the
+last ``=`` marker does not match the CSV file (e.g. the CSV was edited by
+hand), the index is rebuilt from the CSV once.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+
+class DigestSidecarIndex:
+    """Set of record digests for one CSV file, persisted in a sidecar file."""
+
+    def __init__(self, data_path: str, rebuild_source: Callable[[], Iterable[Tuple[int, str]]]):
+        """
+        Args:
+            data_path: The CSV file the index describes.
+            rebuild_source: Returns (digest, test_instance_id) for every stored
+                            record; used when the sidecar is missing or stale.
+        """
+        self.data_path = data_path
+        self.path = data_path + ".digests"
+        self.rebuild_source = rebuild_source
+        self._digests: Set[int] = set()
+        self._by_test_instance: Dict[str, List[int]] = defaultdict(list)
+        self._covered_size: Optional[int] = None
+        self._offset = 0
+        self._inode = None
+        self._lock = threading.RLock()
+        self.stats = {"lookups": 0, "rebuilds": 0}
+
+    # --- Reads -----------------------------------------------------------
+
+    def find_existing(self, digests: Iterable[int]) -> Set[int]:
+        """Returns the subset of ``digests`` already stored."""
+        with self._lock:
+            self._sync()
+            self.stats["lookups"] += 1
+            return {digest for digest in digests if digest in self._digests}
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._sync(ignore_size=True)
+            return len(self._digests)
+
+    # --- Writes (call right after the matching CSV write) -----------------
+
+    def add(self, entries: List[Tuple[int, str]]) -> None:
+        """Records digests of rows just appended to the CSV file."""
+        lines = [f"+{digest:x}\t{test_instance_id}\n" for digest, test_instance_id in entries]
+        with self._lock:
+            self._sync(ignore_size=True)
+            self._append_lines(lines)
+            for digest, test_instance_id in entries:
+                self._apply_add(digest, test_instance_id)
+
+    def remove_test_instance(self, test_instance_id: str) -> None:
+        """Forgets every digest of ``test_instance_id``."""
+        with self._lock:
+            self._sync(ignore_size=True)
+            self._append_lines([f"-{test_instance_id}\n"])
+            self._apply_remove(test_instance_id)
+
+    def rebuild(self) -> None:
+        """Rewrites the sidecar from the CSV contents (atomic replace)."""
+        with self._lock:
+            self._digests = set()
+            self._by_test_instance = defaultdict(list)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w", encoding="utf-8", newline="\n") as sidecar:
+                for digest, test_instance_id in self.rebuild_source():
+                    self._apply_add(digest, test_instance_id)
+                    sidecar.write(f"+{digest:x}\t{test_instance_id}\n")
+                sidecar.write(f"={self._data_size()}\n")
+            os.replace(tmp_path, self.path)
+            st = os.stat(self.path)
+            self._inode = st.st_ino
+            self._offset = st.st_size
+            self._covered_size = self._data_size()
+            self.stats["rebuilds"] += 1
+
+    # --- Internals -------------------------------------------------------
+
+    def _data_size(self) -> int:
+        try:
+            return os.path.getsize(self.data_path)
+        except FileNotFoundError:
+            return 0
+
+    def _append_lines(self, lines: List[str]) -> None:
+        lines = lines + [f"={self._data_size()}\n"]
+        with open(self.path, "a", encoding="utf-8", newline="\n") as sidecar:
+            sidecar.writelines(lines)
+        self._offset = os.path.getsize(self.path)
+        self._covered_size = self._data_size()
+
+    def _apply_add(self, digest: int, test_instance_id: str) -> None:
+        if digest not in self._digests:
+            self._digests.add(digest)
+            self._by_test_instance[test_instance_id].append(digest)
+
+    def _apply_remove(self, test_instance_id: str) -> None:
+        for digest in self._by_test_instance.pop(test_instance_id, []):
+            self._digests.discard(digest)
+
+    def _sync(self, ignore_size: bool = False) -> None:
+        """
+        Brings the in-memory set up to date with the sidecar file (reading only
+        lines appended since the last sync) and rebuilds it if it does not
+        describe the current CSV file.
+        """
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.rebuild()
+            return
+
+        if st.st_ino != self._inode or st.st_size < self._offset:
+            # Sidecar replaced (e.g. rebuilt by another process): reload from scratch
+            self._digests = set()
+            self._by_test_instance = defaultdict(list)
+            self._offset = 0
+            self._inode = st.st_ino
+            self._covered_size = None
+
+        if st.st_size > self._offset:
+            # Offsets are byte counts, so read bytes and decode complete lines only
+            with open(self.path, "rb") as sidecar:
+                sidecar.seek(self._offset)
+                chunk = sidecar.read()
+            # Only consume complete lines; a concurrent writer may be mid-line
+            end = chunk.rfind(b"\n") + 1
+            for line in chunk[:end].decode("utf-8").splitlines():
+                if not line:
+                    continue
+                kind, payload = line[0], line[1:]
+                if kind == "+":
+                    digest_hex, _, test_instance_id = payload.partition("\t")
+                    digest = int(digest_hex, 16)
+                    self._apply_add(digest, test_instance_id)
+                elif kind == "-":
+                    self._apply_remove(payload)
+                elif kind == "=":
+                    self._covered_size = int(payload)
+            self._offset += end
+
+        if not ignore_size and self._covered_size != self._data_size():
+            self.rebuild()
+
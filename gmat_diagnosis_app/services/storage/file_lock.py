@@ -0,0 +1,76 @@
+"""
+Advisory file lock shared by every process that writes a CSV table.
+
+Uses ``fcntl.flock`` on a ``<file>.lock`` file, so writers in other Streamlit
+workers or scripts serialize their appends, change-log entries and
+compactions. The lock is re-entrant within a thread. On platforms without
+``fcntl`` (Windows) only threads of the same process are serialized.
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+try:
+    import fcntl
+except ImportError: # pragma: no cover - Windows
+    fcntl = None
+
+
+class FileLock:
+    """Re-entrant shared/exclusive advisory lock on ``<path>.lock``."""
+
+    def __init__(self, data_path: str):
+        self.path = data_path + ".lock"
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """Held while writing; blocks other writers and readers."""
+        with self._held(exclusive=True):
+            yield
+
+    @contextmanager
+    def shared(self) -> Iterator[None]:
+        """Held while parsing the file; only blocks writers of other processes."""
+        with self._held(exclusive=False):
+            yield
+
+    @contextmanager
+    def _held(self, exclusive: bool) -> Iterator[None]:
+        with self._thread_lock:
+            if self._depth == 0:
+                self._acquire(exclusive)
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._release()
+
+    def _acquire(self, exclusive: bool) -> None:
+        if fcntl is None:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        except Exception:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def _release(self) -> None:
+        if self._fd is None:
+            return
+        try:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        finally:
+            os.close(self._fd)
+            self._fd = None
@@ -0,0 +1,501 @@
+"""
+Parquet storage backend (columnar, for large historical datasets).
+
+Each table is a hive-partitioned Parquet dataset under ``<root>/<table>/``:
+performance records by ``gmat_section`` and test month
+(``gmat_section=Q/test_month=2024-05/``), subjective reports by
+``gmat_section``. Columns are typed (bool is_correct, float times, int
+positions, dictionary-encoded question type / skill / domain), and files are
+sorted by student_id so row-group statistics let student lookups skip data.
+
+The StorageBackend API still exchanges strings like the CSV backend: typed
+values are rendered back as '1' / '0' for booleans, ``str()`` for numbers and
+'' for missing values. Integral values of float columns therefore read back
+as e.g. '45.0' even if they were written as 45. ``read_frame`` returns the
+typed columns directly for analysis code.
+
+Requires the optional ``pyarrow`` package.
+"""
+
+import hashlib
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from gmat_diagnosis_app.services.storage.base import StorageBackend
+from gmat_diagnosis_app.services.storage.file_lock import FileLock
+from gmat_diagnosis_app.services.storage.schema import (
+    DUPLICATE_CHECK_HEADERS,
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    TABLE_HEADERS,
+    record_digest,
+    serialize_record,
+)
+
+# Column kinds; columns not listed are plain strings
+COLUMN_KINDS = {
+    "question_position": "int",
+    "question_time_minutes": "float",
+    "is_correct": "bool",
+    "question_difficulty": "float",
+    "question_type": "category",
+    "question_fundamental_skill": "category",
+    "content_domain": "category",
+    "total_section_time_minutes": "float",
+    "max_allowed_section_time_minutes": "float",
+    "total_questions_in_section": "int",
+    "subjective_time_pressure": "bool",
+}
+
+PARTITION_COLUMNS = {
+    PERFORMANCE_TABLE: ["gmat_section", "test_month"],
+    SUBJECTIVE_TABLE: ["gmat_section"],
+}
+
+# Hidden columns: insertion order (append time + row within the append) and record digest
+APPEND_NS_COLUMN = "_append_ns"
+ROW_COLUMN = "_row"
+DIGEST_COLUMN = "_digest"
+
+ROW_GROUP_SIZE = 64 * 1024
+# Files per partition directory before the partition is compacted automatically
+COMPACT_FILES_PER_PARTITION = 32
+
+_MONTH_PATTERN = re.compile(r"^\d{4}-\d{2}")
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow  # Optional dependency, only needed for this backend
+        import pyarrow.compute  # noqa: F401
+        import pyarrow.dataset  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            "ParquetStorageBackend requires the 'pyarrow' package (pip install pyarrow)."
+        ) from e
+    return pyarrow
+
+
+def _parse(kind: str, value: str) -> Any:
+    """Converts a stored string to the typed value of a column kind ('' -> None for non-strings)."""
+    if kind in ("string", "category"):
+        return value
+    if value == "":
+        return None
+    if kind == "bool":
+        if value in ("1", "True", "true"):
+            return True
+        if value in ("0", "False", "false"):
+            return False
+        raise ValueError(f"Expected 0/1, got {value!r}")
+    if kind == "int":
+        number = float(value)
+        if not number.is_integer():
+            raise ValueError(f"Expected an integer, got {value!r}")
+        return int(number)
+    return float(value)
+
+
+def _render(kind: str, value: Any) -> str:
+    """Converts a typed value back to the stored string form."""
+    if value is None:
+        return ""
+    if kind == "bool":
+        return "1" if value else "0"
+    return str(value)
+
+
+def _test_month(test_date: str) -> str:
+    return test_date[:7] if _MONTH_PATTERN.match(test_date or "") else "unknown"
+
+
+class ParquetStorageBackend(StorageBackend):
+    """Stores each table as a partitioned Parquet dataset."""
+
+    name = "parquet"
+
+    def __init__(self, root_dir: str):
+        self.pa = _require_pyarrow()
+        self.root_dir = root_dir
+        self.locks = {table: FileLock(self._table_dir(table)) for table in TABLE_HEADERS}
+
+    # --- Layout ----------------------------------------------------------
+
+    def _table_dir(self, table: str) -> str:
+        return os.path.join(self.root_dir, table)
+
+    def _column_kind(self, column: str) -> str:
+        return COLUMN_KINDS.get(column, "string")
+
+    def _arrow_type(self, kind: str):
+        pa = self.pa
+        return {
+            "string": pa.string(),
+            "category": pa.dictionary(pa.int32(), pa.string()),
+            "bool": pa.bool_(),
+            "int": pa.int32(),
+            "float": pa.float64(),
+        }[kind]
+
+    def _file_schema(self, table: str):
+        """Schema of the data files (partition columns live in the directory names)."""
+        pa = self.pa
+        partition_columns = PARTITION_COLUMNS[table]
+        fields = [
+            pa.field(column, self._arrow_type(self._column_kind(column)))
+            for column in self._check_table(table) if column not in partition_columns
+        ]
+        fields += [
+            pa.field(APPEND_NS_COLUMN, pa.int64()),
+            pa.field(ROW_COLUMN, pa.int32()),
+            pa.field(DIGEST_COLUMN, pa.int64()),
+        ]
+        return pa.schema(fields)
+
+    def _partitioning(self, table: str):
+        pa = self.pa
+        return self.pa.dataset.partitioning(
+            pa.schema([(column, pa.string()) for column in PARTITION_COLUMNS[table]]), flavor="hive"
+        )
+
+    def _dataset(self, table: str):
+        """Returns the table's dataset, or None if it has no data files yet."""
+        table_dir = self._table_dir(table)
+        if not os.path.isdir(table_dir):
+            return None
+        schema = self._file_schema(table)
+        for column in PARTITION_COLUMNS[table]:
+            schema = schema.append(self.pa.field(column, self.pa.string()))
+        dataset = self.pa.dataset.dataset(
+            table_dir, format="parquet", schema=schema, partitioning=self._partitioning(table),
+        )
+        return dataset if dataset.files else None
+
+    def initialize(self) -> None:
+        for table in TABLE_HEADERS:
+            os.makedirs(self._table_dir(table), exist_ok=True)
+
+    # --- Writes ----------------------------------------------------------
+
+    def append_records(self, table: str, records: List[Dict[str, Any]]) -> int:
+        headers = self._check_table(table)
+        rows = [serialize_record(record, headers) for record in records]
+        if not rows:
+            return 0
+        append_ns = time.time_ns()
+        order = [(append_ns, position) for position in range(len(rows))]
+        with self.locks[table].exclusive():
+            touched = self._write_rows(table, rows, order)
+            for partition_dir in touched:
+                if len(self._data_files(partition_dir)) > COMPACT_FILES_PER_PARTITION:
+                    self._compact_partition(table, partition_dir)
+        return len(rows)
+
+    def _write_rows(self, table: str, rows: List[Dict[str, str]],
+                    order: List[Tuple[int, int]], digests: Optional[List[int]] = None) -> List[str]:
+        """
+        Writes rows into their partitions; returns the partition directories written.
+
+        ``digests`` defaults to ``record_digest`` of the rows, which is only right
+        for rows in their original string form (not rendered from typed values).
+        """
+        if digests is None:
+            digests = [record_digest(row, table) for row in rows]
+        groups: Dict[Tuple[str, ...], List[int]] = defaultdict(list)
+        for position, row in enumerate(rows):
+            groups[self._partition_key(table, row)].append(position)
+
+        touched = []
+        for key, positions in groups.items():
+            partition_dir = os.path.join(
+                self._table_dir(table),
+                *(f"{column}={value}" for column, value in zip(PARTITION_COLUMNS[table], key)),
+            )
+            os.makedirs(partition_dir, exist_ok=True)
+            arrow_table = self._to_arrow(
+                table, [rows[i] for i in positions], [order[i] for i in positions],
+                [digests[i] for i in positions],
+            )
+            self._write_file(partition_dir, arrow_table)
+            touched.append(partition_dir)
+        return touched
+
+    @staticmethod
+    def _partition_key(table: str, row: Dict[str, str]) -> Tuple[str, ...]:
+        values = dict(row, test_month=_test_month(row.get("test_date", "")))
+        return tuple(values[column] for column in PARTITION_COLUMNS[table])
+
+    def _to_arrow(self, table: str, rows: List[Dict[str, str]], order: List[Tuple[int, int]],
+                  digests: List[int]):
+        pa = self.pa
+        schema = self._file_schema(table)
+        columns = []
+        for field in schema:
+            if field.name == APPEND_NS_COLUMN:
+                values = [append_ns for append_ns, _ in order]
+            elif field.name == ROW_COLUMN:
+                values = [row for _, row in order]
+            elif field.name == DIGEST_COLUMN:
+                values = digests
+            else:
+                kind = self._column_kind(field.name)
+                try:
+                    values = [_parse(kind, row[field.name]) for row in rows]
+                except ValueError as e:
+                    raise ValueError(f"Invalid value for {field.name}: {e}") from e
+            columns.append(pa.array(values, type=field.type))
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def _write_file(self, partition_dir: str, arrow_table) -> None:
+        """Writes one data file sorted by student_id (atomic rename of a hidden temp file)."""
+        if "student_id" in arrow_table.column_names:
+            arrow_table = arrow_table.sort_by([("student_id", "ascending")])
+        name = f"part-{time.time_ns()}-{uuid.uuid4().hex[:8]}.parquet"
+        # Dataset discovery ignores files starting with '.'
+        tmp_path = os.path.join(partition_dir, f".{name}.tmp")
+        self.pa.parquet.write_table(arrow_table, tmp_path, row_group_size=ROW_GROUP_SIZE)
+        os.replace(tmp_path, os.path.join(partition_dir, name))
+
+    @staticmethod
+    def _data_files(partition_dir: str) -> List[str]:
+        return sorted(
+            os.path.join(partition_dir, name) for name in os.listdir(partition_dir)
+            if name.endswith(".parquet") and not name.startswith(".")
+        )
+
+    def _compact_partition(self, table: str, partition_dir: str) -> None:
+        files = self._data_files(partition_dir)
+        if len(files) <= 1:
+            return
+        schema = self._file_schema(table)
+        merged = self.pa.concat_tables(
+            [self.pa.parquet.read_table(path, schema=schema) for path in files]
+        )
+        self._write_file(partition_dir, merged)
+        for path in files:
+            os.remove(path)
+
+    def compact(self, table: Optional[str] = None) -> Dict[str, int]:
+        """
+        Merges the data files of each partition of ``table`` (default: every table).
+
+        Returns:
+            Number of files merged per table.
+        """
+        merged = {}
+        for name in ([table] if table else list(TABLE_HEADERS)):
+            self._check_table(name)
+            count = 0
+            with self.locks[name].exclusive():
+                for partition_dir in self._partition_dirs(name):
+                    files = self._data_files(partition_dir)
+                    if len(files) > 1:
+                        self._compact_partition(name, partition_dir)
+                        count += len(files)
+            merged[name] = count
+        return merged
+
+    def _partition_dirs(self, table: str) -> List[str]:
+        table_dir = self._table_dir(table)
+        if not os.path.isdir(table_dir):
+            return []
+        depth = len(PARTITION_COLUMNS[table])
+        partition_dirs = []
+        for current, _, _ in os.walk(table_dir):
+            relative = os.path.relpath(current, table_dir)
+            if relative != "." and len(relative.split(os.sep)) == depth:
+                partition_dirs.append(current)
+        return sorted(partition_dirs)
+
+    def data_signature(self, table: str) -> Optional[str]:
+        # Every write adds or replaces whole files, so their names, sizes and
+        # mtimes change with the data
+        self._check_table(table)
+        table_dir = self._table_dir(table)
+        files = []
+        for partition_dir in self._partition_dirs(table):
+            for path in self._data_files(partition_dir):
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((os.path.relpath(path, table_dir), st.st_mtime_ns, st.st_size))
+        return hashlib.sha1(repr(files).encode("utf-8")).hexdigest()
+
+    def _take_rows(self, table: str, test_instance_id: str) -> Tuple[List[Dict[str, str]], List[Tuple[int, int]], List[int], List[Tuple[str, Any]]]:
+        """
+        Finds the rows of ``test_instance_id``.
+
+        Returns:
+            (rows, their order keys, their stored digests,
+             [(file path, remaining arrow table)] for each file holding them)
+        """
+        pc = self.pa.compute
+        dataset = self._dataset(table)
+        if dataset is None:
+            return [], [], [], []
+        schema = self._file_schema(table)
+        rows, order, digests, rewrites = [], [], [], []
+        for fragment in dataset.get_fragments(filter=pc.field("test_instance_id") == test_instance_id):
+            arrow_table = self.pa.parquet.read_table(fragment.path, schema=schema)
+            mask = pc.equal(arrow_table["test_instance_id"], test_instance_id)
+            matched = arrow_table.filter(mask)
+            if matched.num_rows == 0:
+                continue
+            partition_values = self.pa.dataset.get_partition_keys(fragment.partition_expression)
+            rendered = self._render_table(table, matched, partition_values)
+            rows.extend(rendered)
+            order.extend(zip(matched[APPEND_NS_COLUMN].to_pylist(), matched[ROW_COLUMN].to_pylist()))
+            digests.extend(matched[DIGEST_COLUMN].to_pylist())
+            rewrites.append((fragment.path, arrow_table.filter(pc.invert(mask))))
+        return rows, order, digests, rewrites
+
+    def _rewrite_files(self, rewrites: List[Tuple[str, Any]]) -> None:
+        for path, remaining in rewrites:
+            if remaining.num_rows:
+                self._write_file(os.path.dirname(path), remaining)
+            os.remove(path)
+
+    def update_records(self, table: str, test_instance_id: str, updates: Dict[str, Any]) -> int:
+        headers = self._check_table(table)
+        valid_updates = {
+            key: "" if value is None else str(value)
+            for key, value in updates.items() if key in headers
+        }
+        with self.locks[table].exclusive():
+            rows, order, digests, rewrites = self._take_rows(table, test_instance_id)
+            if not rows or not valid_updates:
+                return len(rows)
+            for row in rows:
+                row.update(valid_updates)
+            # Rendered rows are not in their original string form ('2' reads back
+            # as '2.0'), so keep the stored digests unless a duplicate-check field
+            # changed; re-importing the original record is then still a duplicate
+            if any(key in DUPLICATE_CHECK_HEADERS[table] for key in valid_updates):
+                digests = None
+            # Write the updated rows before dropping the old ones, so a crash
+            # in between leaves duplicates rather than losing records
+            self._write_rows(table, rows, order, digests)
+            self._rewrite_files(rewrites)
+        return len(rows)
+
+    def delete_records(self, table: str, test_instance_id: str) -> int:
+        self._check_table(table)
+        with self.locks[table].exclusive():
+            rows, _, _, rewrites = self._take_rows(table, test_instance_id)
+            self._rewrite_files(rewrites)
+        return len(rows)
+
+    def clear_records(self, table: str) -> None:
+        self._check_table(table)
+        with self.locks[table].exclusive():
+            shutil.rmtree(self._table_dir(table), ignore_errors=True)
+            os.makedirs(self._table_dir(table), exist_ok=True)
+
+    # --- Reads -----------------------------------------------------------
+
+    def _filter_expression(self, table: str, filters: Dict[str, Any]):
+        """
+        Builds a dataset filter from string equality filters.
+
+        Returns:
+            (expression or None, False if a value can never match its column type)
+        """
+        headers = self._check_table(table)
+        pc = self.pa.compute
+        expression = None
+        for column, value in filters.items():
+            if column not in headers:
+                raise ValueError(f"Unknown columns for {table}: {column}")
+            kind = "string" if column in PARTITION_COLUMNS[table] else self._column_kind(column)
+            try:
+                typed = _parse(kind, str(value))
+            except ValueError:
+                return None, False
+            condition = pc.field(column).is_null() if typed is None else pc.field(column) == typed
+            expression = condition if expression is None else expression & condition
+        return expression, True
+
+    def _read_table(self, table: str, filters: Dict[str, Any], columns: Optional[List[str]] = None):
+        dataset = self._dataset(table)
+        if dataset is None:
+            return None
+        expression, satisfiable = self._filter_expression(table, filters)
+        if not satisfiable:
+            return None
+        arrow_table = dataset.to_table(columns=columns, filter=expression)
+        return arrow_table.sort_by([(APPEND_NS_COLUMN, "ascending"), (ROW_COLUMN, "ascending")])
+
+    def _render_table(self, table: str, arrow_table, partition_values: Optional[Dict[str, str]] = None) -> List[Dict[str, str]]:
+        headers = self._check_table(table)
+        columns = {}
+        for header in headers:
+            if header in arrow_table.column_names:
+                column = arrow_table[header]
+                if self.pa.types.is_dictionary(column.type):
+                    column = column.cast(self.pa.string())
+                kind = self._column_kind(header)
+                columns[header] = [_render(kind, value) for value in column.to_pylist()]
+            else:
+                columns[header] = [str((partition_values or {}).get(header, ""))] * arrow_table.num_rows
+        return [dict(zip(headers, values)) for values in zip(*(columns[header] for header in headers))]
+
+    def iter_records(self, table: str) -> Iterator[Dict[str, str]]:
+        arrow_table = self._read_table(table, {})
+        if arrow_table is not None:
+            yield from self._render_table(table, arrow_table)
+
+    def query_records(self, table: str, **filters: str) -> List[Dict[str, str]]:
+        arrow_table = self._read_table(table, filters)
+        if arrow_table is None:
+            return []
+        return self._render_table(table, arrow_table)
+
+    def read_frame(self, table: str, columns: Optional[List[str]] = None, **filters: str):
+        """
+        Returns matching records as a typed pandas DataFrame (bool / float / category
+        columns), in insertion order. Filters are pushed down to the Parquet scan.
+        """
+        headers = self._check_table(table)
+        wanted = list(columns or headers)
+        arrow_table = self._read_table(
+            table, filters, columns=wanted + [APPEND_NS_COLUMN, ROW_COLUMN]
+        )
+        if arrow_table is None:
+            import pandas as pd
+            return pd.DataFrame(columns=wanted)
+        return arrow_table.select(wanted).to_pandas()
+
+    def count_records(self, table: str) -> int:
+        self._check_table(table)
+        dataset = self._dataset(table)
+        return 0 if dataset is None else dataset.count_rows()
+
+    def find_existing_digests(self, table: str, digests: Iterable[int],
+                              records: Optional[List[Dict[str, Any]]] = None) -> Set[int]:
+        self._check_table(table)
+        wanted = list(set(digests))
+        dataset = self._dataset(table)
+        if dataset is None or not wanted:
+            return set()
+        pc = self.pa.compute
+        expression = pc.field(DIGEST_COLUMN).isin(self.pa.array(wanted, type=self.pa.int64()))
+        if records:
+            # A duplicate has the same test_instance_id and partition values, so
+            # only the partitions of the new records are scanned
+            headers = self._check_table(table)
+            rows = [serialize_record(record, headers) for record in records]
+            keys = {self._partition_key(table, row) for row in rows}
+            for position, column in enumerate(PARTITION_COLUMNS[table]):
+                values = sorted({key[position] for key in keys})
+                expression &= pc.field(column).isin(self.pa.array(values, type=self.pa.string()))
+            test_instance_ids = sorted({row["test_instance_id"] for row in rows})
+            expression &= pc.field("test_instance_id").isin(self.pa.array(test_instance_ids, type=self.pa.string()))
+        found = dataset.to_table(columns=[DIGEST_COLUMN], filter=expression)
+        return set(found[DIGEST_COLUMN].to_pylist())
@@ -0,0 +1,97 @@
+"""
+Table schemas shared by every storage backend.
+
+Values are stored and returned as strings, exactly as the original CSV files
+hold them (e.g. is_correct is '1' / '0'), so callers behave identically
+whichever backend is active.
+"""
+
+import hashlib
+from typing import Any, Dict, List
+
+PERFORMANCE_TABLE = "gmat_performance"
+SUBJECTIVE_TABLE = "student_subjective_reports"
+
+# Define CSV headers
+GMAT_PERFORMANCE_HEADERS = [
+    "student_id",
+    "test_instance_id",
+    "gmat_section",
+    "test_date",
+    "question_id",
+    "question_position",
+    "question_time_minutes",
+    "is_correct",
+    "question_difficulty",
+    "question_type",
+    "question_fundamental_skill",
+    "content_domain",
+    "total_section_time_minutes",
+    "max_allowed_section_time_minutes",
+    "total_questions_in_section",
+    "record_timestamp"
+]
+
+STUDENT_SUBJECTIVE_REPORTS_HEADERS = [
+    "student_id",
+    "test_instance_id",
+    "gmat_section",
+    "subjective_time_pressure",
+    "report_collection_timestamp"
+]
+
+TABLE_HEADERS = {
+    PERFORMANCE_TABLE: GMAT_PERFORMANCE_HEADERS,
+    SUBJECTIVE_TABLE: STUDENT_SUBJECTIVE_REPORTS_HEADERS,
+}
+
+# Headers for duplicate check, excluding fields that change with each write (e.g., timestamp)
+GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK = [
+    h for h in GMAT_PERFORMANCE_HEADERS if h != "record_timestamp"
+]
+
+# Headers for subjective report duplicate check, excluding timestamp field
+STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK = [
+    h for h in STUDENT_SUBJECTIVE_REPORTS_HEADERS if h != "report_collection_timestamp"
+]
+
+DUPLICATE_CHECK_HEADERS = {
+    PERFORMANCE_TABLE: GMAT_PERFORMANCE_HEADERS_FOR_DUPLICATE_CHECK,
+    SUBJECTIVE_TABLE: STUDENT_SUBJECTIVE_REPORTS_HEADERS_FOR_DUPLICATE_CHECK,
+}
+
+
+def serialize_record(record: Dict[str, Any], headers: List[str]) -> Dict[str, str]:
+    """
+    Converts a record to its stored string form, following csv.DictWriter rules:
+    missing fields and None become '', other values go through str().
+
+    Raises:
+        ValueError: If the record contains fields that are not in ``headers``
+                    (same behaviour as csv.DictWriter).
+    """
+    extra_fields = [key for key in record if key not in headers]
+    if extra_fields:
+        raise ValueError(f"dict contains fields not in fieldnames: {', '.join(repr(f) for f in extra_fields)}")
+    serialized = {}
+    for header in headers:
+        value = record.get(header)
+        serialized[header] = "" if value is None else str(value)
+    return serialized
+
+
+def record_digest(record: Dict[str, Any], table: str) -> int:
+    """
+    Returns a 64-bit signed digest of the record's duplicate-check fields.
+
+    Values are compared in their stored string form, so a new record
+    (e.g. is_correct=1, content_domain=None) has the same digest as the stored
+    row ('1', ''). test_instance_id is part of the digest, so the digests of
+    one test instance can be dropped without touching any other instance.
+    """
+    canonical = "\x1f".join(
+        "" if record.get(header) is None else str(record.get(header))
+        for header in DUPLICATE_CHECK_HEADERS[table]
+    )
+    digest = hashlib.blake2b(canonical.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
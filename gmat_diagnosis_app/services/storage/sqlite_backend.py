@@ -0,0 +1,221 @@
+"""
+SQLite storage backend.
+
+Both tables live in one SQLite file with indexes on student_id,
+test_instance_id and (student_id, gmat_section), so the per-student and
+per-test lookups of the data service are index seeks instead of full scans.
+Columns are TEXT and hold the same strings the CSV files hold. Record digests
+used for duplicate checks are kept in the ``record_digests`` table, updated in
+the same transaction as the records.
+"""
+
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+
+from gmat_diagnosis_app.services.storage.base import StorageBackend
+from gmat_diagnosis_app.services.storage.schema import (
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    TABLE_HEADERS,
+    record_digest,
+    serialize_record,
+)
+
+# Index name -> (table, columns)
+TABLE_INDEXES = {
+    "idx_performance_student": (PERFORMANCE_TABLE, ["student_id"]),
+    "idx_performance_test_instance": (PERFORMANCE_TABLE, ["test_instance_id"]),
+    "idx_performance_student_section": (PERFORMANCE_TABLE, ["student_id", "gmat_section"]),
+    "idx_subjective_student": (SUBJECTIVE_TABLE, ["student_id"]),
+    "idx_subjective_test_instance": (SUBJECTIVE_TABLE, ["test_instance_id"]),
+}
+
+DIGEST_TABLE = "record_digests"
+
+# Max number of digests bound per lookup query (SQLite variable limit)
+DIGEST_LOOKUP_CHUNK = 500
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """
+    Stores both tables in a single SQLite database file.
+
+    One connection is kept per thread (Streamlit serves sessions from several
+    threads). WAL mode lets readers run while another process writes.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, db_path: str, timeout: float = 10.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def initialize(self) -> None:
+        if self._initialized:
+            return
+        conn = self._connection()
+        with conn:
+            for table, headers in TABLE_HEADERS.items():
+                columns = ", ".join(f'"{header}" TEXT NOT NULL DEFAULT \'\'' for header in headers)
+                conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" ({columns})')
+            for index_name, (table, columns) in TABLE_INDEXES.items():
+                column_list = ", ".join(f'"{column}"' for column in columns)
+                conn.execute(f'CREATE INDEX IF NOT EXISTS "{index_name}" ON "{table}" ({column_list})')
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{DIGEST_TABLE}" ('
+                'table_name TEXT NOT NULL, digest INTEGER NOT NULL, test_instance_id TEXT NOT NULL, '
+                'PRIMARY KEY (table_name, digest))'
+            )
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_record_digests_test_instance" '
+                f'ON "{DIGEST_TABLE}" (table_name, test_instance_id)'
+            )
+            # Backfill digests for databases created before the digest table existed
+            for table in TABLE_HEADERS:
+                has_digests = conn.execute(
+                    f'SELECT 1 FROM "{DIGEST_TABLE}" WHERE table_name = ? LIMIT 1', (table,)
+                ).fetchone()
+                has_records = conn.execute(f'SELECT 1 FROM "{table}" LIMIT 1').fetchone()
+                if has_records and not has_digests:
+                    cursor = conn.execute(f'SELECT * FROM "{table}"')
+                    self._insert_digests(conn, table, (dict(row) for row in cursor))
+        self._initialized = True
+
+    @staticmethod
+    def _insert_digests(conn: sqlite3.Connection, table: str, rows: Iterable[Dict[str, str]]) -> None:
+        conn.executemany(
+            f'INSERT OR IGNORE INTO "{DIGEST_TABLE}" (table_name, digest, test_instance_id) VALUES (?, ?, ?)',
+            [(table, record_digest(row, table), row["test_instance_id"]) for row in rows],
+        )
+
+    def find_existing_digests(self, table: str, digests: Iterable[int],
+                              records: Optional[List[Dict[str, Any]]] = None) -> Set[int]:
+        self._check_table(table)
+        self.initialize()
+        wanted = list(set(digests))
+        found = set()
+        conn = self._connection()
+        for start in range(0, len(wanted), DIGEST_LOOKUP_CHUNK):
+            chunk = wanted[start:start + DIGEST_LOOKUP_CHUNK]
+            placeholders = ", ".join("?" for _ in chunk)
+            cursor = conn.execute(
+                f'SELECT digest FROM "{DIGEST_TABLE}" WHERE table_name = ? AND digest IN ({placeholders})',
+                (table, *chunk),
+            )
+            found.update(row[0] for row in cursor)
+        return found
+
+    def append_records(self, table: str, records: List[Dict[str, Any]]) -> int:
+        headers = self._check_table(table)
+        rows = [serialize_record(record, headers) for record in records]
+        if not rows:
+            return 0
+        self.initialize()
+        column_list = ", ".join(f'"{header}"' for header in headers)
+        placeholders = ", ".join("?" for _ in headers)
+        conn = self._connection()
+        with conn:
+            conn.executemany(
+                f'INSERT INTO "{table}" ({column_list}) VALUES ({placeholders})',
+                [tuple(row[header] for header in headers) for row in rows],
+            )
+            self._insert_digests(conn, table, rows)
+        return len(rows)
+
+    def iter_records(self, table: str) -> Iterator[Dict[str, str]]:
+        self._check_table(table)
+        self.initialize()
+        cursor = self._connection().execute(f'SELECT * FROM "{table}" ORDER BY rowid')
+        for row in cursor:
+            yield dict(row)
+
+    def query_records(self, table: str, **filters: str) -> List[Dict[str, str]]:
+        headers = self._check_table(table)
+        unknown = [column for column in filters if column not in headers]
+        if unknown:
+            raise ValueError(f"Unknown columns for {table}: {', '.join(unknown)}")
+        self.initialize()
+        where = " AND ".join(f'"{column}" = ?' for column in filters) or "1"
+        cursor = self._connection().execute(
+            f'SELECT * FROM "{table}" WHERE {where} ORDER BY rowid',
+            tuple(str(value) for value in filters.values()),
+        )
+        return [dict(row) for row in cursor]
+
+    def update_records(self, table: str, test_instance_id: str, updates: Dict[str, Any]) -> int:
+        headers = self._check_table(table)
+        self.initialize()
+        valid_updates = {key: value for key, value in updates.items() if key in headers}
+        conn = self._connection()
+        with conn:
+            if not valid_updates:
+                row = conn.execute(
+                    f'SELECT COUNT(*) FROM "{table}" WHERE test_instance_id = ?', (test_instance_id,)
+                ).fetchone()
+                return int(row[0])
+            assignments = ", ".join(f'"{key}" = ?' for key in valid_updates)
+            values = ["" if value is None else str(value) for value in valid_updates.values()]
+            cursor = conn.execute(
+                f'UPDATE "{table}" SET {assignments} WHERE test_instance_id = ?',
+                (*values, test_instance_id),
+            )
+            matched = cursor.rowcount
+            if matched:
+                # Updated rows (possibly under a new test_instance_id) get fresh digests
+                new_test_instance_id = dict(zip(valid_updates, values)).get("test_instance_id", test_instance_id)
+                conn.execute(
+                    f'DELETE FROM "{DIGEST_TABLE}" WHERE table_name = ? AND test_instance_id IN (?, ?)',
+                    (table, test_instance_id, new_test_instance_id),
+                )
+                updated = conn.execute(
+                    f'SELECT * FROM "{table}" WHERE test_instance_id IN (?, ?)',
+                    (test_instance_id, new_test_instance_id),
+                )
+                self._insert_digests(conn, table, (dict(row) for row in updated))
+        return matched
+
+    def delete_records(self, table: str, test_instance_id: str) -> int:
+        self._check_table(table)
+        self.initialize()
+        conn = self._connection()
+        with conn:
+            cursor = conn.execute(f'DELETE FROM "{table}" WHERE test_instance_id = ?', (test_instance_id,))
+            conn.execute(
+                f'DELETE FROM "{DIGEST_TABLE}" WHERE table_name = ? AND test_instance_id = ?',
+                (table, test_instance_id),
+            )
+        return cursor.rowcount
+
+    def data_signature(self, table: str) -> Optional[str]:
+        # Row count and highest rowid: catches inserts and deletes made with other
+        # tools, but not in-place UPDATEs
+        self._check_table(table)
+        self.initialize()
+        count, max_rowid = self._connection().execute(f'SELECT COUNT(*), MAX(rowid) FROM "{table}"').fetchone()
+        return f"{count}:{max_rowid}"
+
+    def count_records(self, table: str) -> int:
+        self._check_table(table)
+        self.initialize()
+        return int(self._connection().execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0])
+
+    def clear_records(self, table: str) -> None:
+        self._check_table(table)
+        self.initialize()
+        conn = self._connection()
+        with conn:
+            conn.execute(f'DELETE FROM "{table}"')
+            conn.execute(f'DELETE FROM "{DIGEST_TABLE}" WHERE table_name = ?', (table,))
@@ -0,0 +1,314 @@
+"""
+Materialized per-test-instance summaries of the performance table.
+
+One row per (student_id, gmat_section, test_instance_id) holds the question
+count, correct count, time / difficulty sums and the correct/total tallies per
+skill, question type and difficulty level of that test instance. The data
+service keeps the rows up to date on every add, update and delete, so the
+dashboards and consolidated reports read a student's few summary rows instead
+of re-aggregating all of their question records.
+
+The summaries live in their own SQLite file, independent of the storage
+backend. A store that has never been filled (or was cleared) is rebuilt from
+the backend on first use. The store also keeps the backend's data signature
+(see ``StorageBackend.data_signature``) of the records it summarizes, so the
+data service rebuilds it when the data files were edited outside the app.
+"""
+
+import json
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+import pandas as pd
+
+from gmat_diagnosis_app.services.storage.aggregates import (
+    SKILL_COLUMNS,
+    difficulty_levels,
+    tally,
+    test_instance_aggregates,
+)
+
+SUMMARY_TABLE = "test_instance_summary"
+META_TABLE = "summary_meta"
+
+SUMMARY_KEYS = ["student_id", "gmat_section", "test_instance_id"]
+SUMMARY_COUNTS = [
+    "first_date", "last_date", "total_questions", "correct_count",
+    "time_sum", "time_valid", "difficulty_sum", "difficulty_valid",
+]
+# Tallies are stored as JSON {value: [correct, total]}, in order of first appearance
+SUMMARY_TALLIES = ["skills", "question_types", "difficulty"]
+SUMMARY_COLUMNS = SUMMARY_KEYS + SUMMARY_COUNTS + SUMMARY_TALLIES
+
+
+def summarize_records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    Summarize question rows per (student_id, gmat_section, test_instance_id).
+
+    Args:
+        frame: Performance records as a DataFrame of stored string values
+
+    Returns:
+        One summary dict per test instance (SUMMARY_COLUMNS, tallies as dicts), in order of first appearance
+    """
+    if frame.empty:
+        return []
+    aggregates = test_instance_aggregates(frame, SUMMARY_KEYS)
+    keys = tuple(frame[key].to_numpy() for key in SUMMARY_KEYS)
+    correct = frame["is_correct"].to_numpy() == '1'
+
+    # The skill column depends on the section, so tally each section's rows separately
+    skills: Dict[tuple, Dict[str, Dict[str, int]]] = {}
+    sections = keys[1]
+    for section, column in SKILL_COLUMNS.items():
+        in_section = sections == section
+        if in_section.any():
+            skills.update(tally(tuple(key[in_section] for key in keys),
+                                frame[column].to_numpy()[in_section], correct[in_section]))
+    question_types = tally(keys, frame["question_type"].to_numpy(), correct)
+    levels, has_difficulty = difficulty_levels(frame)
+    difficulty = tally(tuple(key[has_difficulty] for key in keys), levels[has_difficulty], correct[has_difficulty])
+
+    summaries = []
+    for row in aggregates.itertuples(index=False):
+        key = tuple(getattr(row, column) for column in SUMMARY_KEYS)
+        summary = {column: getattr(row, column) for column in SUMMARY_KEYS + SUMMARY_COUNTS}
+        for column in ("total_questions", "correct_count", "time_valid", "difficulty_valid"):
+            summary[column] = int(summary[column])
+        for column in ("time_sum", "difficulty_sum"):
+            summary[column] = float(summary[column])
+        for column, counts in (("skills", skills), ("question_types", question_types), ("difficulty", difficulty)):
+            summary[column] = {value: [c["correct"], c["total"]] for value, c in counts.get(key, {}).items()}
+        summaries.append(summary)
+    return summaries
+
+
+def _merge_tally(target: Dict[str, List[int]], source: Dict[str, List[int]]) -> None:
+    for value, (correct_count, total) in source.items():
+        counts = target.setdefault(value, [0, 0])
+        counts[0] += correct_count
+        counts[1] += total
+
+
+class PerformanceSummaryStore:
+    """
+    SQLite table of per-test-instance summaries.
+
+    One connection is kept per thread, as in the SQLite storage backend.
+    """
+
+    def __init__(self, db_path: str, timeout: float = 10.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._initialized = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def initialize(self) -> None:
+        if self._initialized:
+            return
+        conn = self._connection()
+        with conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{SUMMARY_TABLE}" ('
+                'student_id TEXT NOT NULL, gmat_section TEXT NOT NULL, test_instance_id TEXT NOT NULL, '
+                'seq INTEGER NOT NULL, first_date TEXT NOT NULL, last_date TEXT NOT NULL, '
+                'total_questions INTEGER NOT NULL, correct_count INTEGER NOT NULL, '
+                'time_sum REAL NOT NULL, time_valid INTEGER NOT NULL, '
+                'difficulty_sum REAL NOT NULL, difficulty_valid INTEGER NOT NULL, '
+                'skills TEXT NOT NULL, question_types TEXT NOT NULL, difficulty TEXT NOT NULL, '
+                'PRIMARY KEY (student_id, gmat_section, test_instance_id))'
+            )
+            conn.execute(
+                f'CREATE INDEX IF NOT EXISTS "idx_summary_test_instance" ON "{SUMMARY_TABLE}" (test_instance_id)'
+            )
+            conn.execute(f'CREATE TABLE IF NOT EXISTS "{META_TABLE}" (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        self._initialized = True
+
+    def is_built(self) -> bool:
+        """True once the store has been filled from the storage backend."""
+        self.initialize()
+        row = self._connection().execute(f'SELECT value FROM "{META_TABLE}" WHERE key = ?', ("built",)).fetchone()
+        return row is not None and row[0] == "1"
+
+    def source_signature(self) -> Optional[str]:
+        """The data signature of the records the summaries were last brought up to date with."""
+        self.initialize()
+        row = self._connection().execute(f'SELECT value FROM "{META_TABLE}" WHERE key = ?', ("source",)).fetchone()
+        return None if row is None else row[0]
+
+    def set_source_signature(self, signature: Optional[str]) -> None:
+        """Records the data signature the summaries are up to date with (None: unknown)."""
+        self.initialize()
+        conn = self._connection()
+        with conn:
+            self._write_signature(conn, signature)
+
+    @staticmethod
+    def _write_signature(conn: sqlite3.Connection, signature: Optional[str]) -> None:
+        if signature is None:
+            conn.execute(f'DELETE FROM "{META_TABLE}" WHERE key = ?', ("source",))
+        else:
+            conn.execute(f'INSERT OR REPLACE INTO "{META_TABLE}" (key, value) VALUES (?, ?)', ("source", signature))
+
+    def rebuild(self, frame: pd.DataFrame, signature: Optional[str] = None) -> int:
+        """
+        Replace every summary with the summaries of ``frame`` (all performance records).
+
+        Args:
+            frame: Every performance record
+            signature: Data signature of the backend ``frame`` was read from, if known
+
+        Returns:
+            Number of summary rows written
+        """
+        self.initialize()
+        summaries = summarize_records(frame)
+        conn = self._connection()
+        with conn:
+            conn.execute(f'DELETE FROM "{SUMMARY_TABLE}"')
+            self._insert(conn, summaries, start_seq=0)
+            conn.execute(f'INSERT OR REPLACE INTO "{META_TABLE}" (key, value) VALUES (?, ?)', ("built", "1"))
+            self._write_signature(conn, signature)
+        return len(summaries)
+
+    def add_records(self, frame: pd.DataFrame) -> None:
+        """Fold newly appended question rows into the summaries of their test instances."""
+        self.initialize()
+        summaries = summarize_records(frame)
+        if not summaries:
+            return
+        conn = self._connection()
+        with conn:
+            # Take the write lock up front so concurrent merges do not lose counts
+            conn.execute("BEGIN IMMEDIATE")
+            new_summaries = []
+            for summary in summaries:
+                existing = conn.execute(
+                    f'SELECT * FROM "{SUMMARY_TABLE}" WHERE student_id = ? AND gmat_section = ? AND test_instance_id = ?',
+                    tuple(summary[key] for key in SUMMARY_KEYS),
+                ).fetchone()
+                if existing is None:
+                    new_summaries.append(summary)
+                    continue
+                merged = self._decode(existing)
+                merged["last_date"] = summary["last_date"]
+                for column in ("total_questions", "correct_count", "time_sum", "time_valid",
+                               "difficulty_sum", "difficulty_valid"):
+                    merged[column] += summary[column]
+                for column in SUMMARY_TALLIES:
+                    _merge_tally(merged[column], summary[column])
+                conn.execute(
+                    f'UPDATE "{SUMMARY_TABLE}" SET last_date = ?, total_questions = ?, correct_count = ?, '
+                    'time_sum = ?, time_valid = ?, difficulty_sum = ?, difficulty_valid = ?, '
+                    'skills = ?, question_types = ?, difficulty = ? '
+                    'WHERE student_id = ? AND gmat_section = ? AND test_instance_id = ?',
+                    (merged["last_date"], merged["total_questions"], merged["correct_count"],
+                     merged["time_sum"], merged["time_valid"], merged["difficulty_sum"], merged["difficulty_valid"],
+                     *(json.dumps(merged[column], ensure_ascii=False) for column in SUMMARY_TALLIES),
+                     *(summary[key] for key in SUMMARY_KEYS)),
+                )
+            self._insert(conn, new_summaries, start_seq=self._next_seq(conn))
+
+    def replace_test_instances(self, test_instance_ids: Iterable[str], frame: pd.DataFrame,
+                               updates: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Re-summarize test instances after an update or delete.
+
+        Args:
+            test_instance_ids: Test instances whose summaries are replaced; the first one is the updated/deleted one
+            frame: All stored question rows of those test instances (empty after a delete)
+            updates: Field updates applied to the first test instance, used to carry
+                     the report position of its summaries over to their new key
+        """
+        self.initialize()
+        test_instance_ids = list(dict.fromkeys(test_instance_ids))
+        summaries = summarize_records(frame)
+        conn = self._connection()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            # Keep the position of the summaries, so report order does not change
+            previous_seq: Dict[tuple, int] = {}
+            for test_instance_id in test_instance_ids:
+                cursor = conn.execute(
+                    f'SELECT student_id, gmat_section, test_instance_id, seq FROM "{SUMMARY_TABLE}" '
+                    'WHERE test_instance_id = ?', (test_instance_id,)
+                )
+                for row in cursor:
+                    key = tuple(row[:3])
+                    if updates and test_instance_id == test_instance_ids[0]:
+                        key = tuple(
+                            ('' if updates[column] is None else str(updates[column])) if column in updates else value
+                            for column, value in zip(SUMMARY_KEYS, key)
+                        )
+                    previous_seq[key] = min(previous_seq.get(key, row[3]), row[3])
+                conn.execute(f'DELETE FROM "{SUMMARY_TABLE}" WHERE test_instance_id = ?', (test_instance_id,))
+            next_seq = self._next_seq(conn)
+            for summary in summaries:
+                seq = previous_seq.get(tuple(summary[key] for key in SUMMARY_KEYS))
+                if seq is None:
+                    seq, next_seq = next_seq, next_seq + 1
+                self._insert(conn, [summary], start_seq=seq)
+
+    def clear(self) -> None:
+        """Removes every summary; the store is rebuilt on next use."""
+        self.initialize()
+        conn = self._connection()
+        with conn:
+            conn.execute(f'DELETE FROM "{SUMMARY_TABLE}"')
+            conn.execute(f'DELETE FROM "{META_TABLE}" WHERE key IN (?, ?)', ("built", "source"))
+
+    def student_summaries(self, student_id: str, gmat_section: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Summaries of one student (optionally one section), in order of first appearance.
+        Uses the primary key, so the cost depends only on the student's number of tests.
+        """
+        self.initialize()
+        query = f'SELECT * FROM "{SUMMARY_TABLE}" WHERE student_id = ?'
+        params: List[str] = [student_id]
+        if gmat_section is not None:
+            query += ' AND gmat_section = ?'
+            params.append(gmat_section)
+        cursor = self._connection().execute(query + ' ORDER BY seq', params)
+        return [self._decode(row) for row in cursor]
+
+    def all_summaries(self) -> List[Dict[str, Any]]:
+        self.initialize()
+        cursor = self._connection().execute(f'SELECT * FROM "{SUMMARY_TABLE}" ORDER BY seq')
+        return [self._decode(row) for row in cursor]
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+        summary = {column: row[column] for column in SUMMARY_KEYS + SUMMARY_COUNTS}
+        for column in SUMMARY_TALLIES:
+            summary[column] = json.loads(row[column])
+        return summary
+
+    @staticmethod
+    def _next_seq(conn: sqlite3.Connection) -> int:
+        return conn.execute(f'SELECT COALESCE(MAX(seq) + 1, 0) FROM "{SUMMARY_TABLE}"').fetchone()[0]
+
+    @staticmethod
+    def _insert(conn: sqlite3.Connection, summaries: List[Dict[str, Any]], start_seq: int) -> None:
+        conn.executemany(
+            f'INSERT INTO "{SUMMARY_TABLE}" (student_id, gmat_section, test_instance_id, seq, '
+            'first_date, last_date, total_questions, correct_count, time_sum, time_valid, '
+            'difficulty_sum, difficulty_valid, skills, question_types, difficulty) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (*(summary[key] for key in SUMMARY_KEYS), start_seq + offset,
+                 *(summary[column] for column in SUMMARY_COUNTS),
+                 *(json.dumps(summary[column], ensure_ascii=False) for column in SUMMARY_TALLIES))
+                for offset, summary in enumerate(summaries)
+            ],
+        )
@@ -0,0 +1,113 @@
+"""
+In-process write-behind buffer for CSV appends.
+
+``append_records`` only queues the rows; a background thread writes them in
+batches (when ``batch_size`` rows are queued or after ``flush_interval``
+seconds), so analysis requests do not wait for disk I/O. Anything still
+queued is written at interpreter exit. A failed background flush keeps its
+rows queued and is raised to the next caller of ``add`` or ``flush``, so a
+write error is never reported only from the flush thread; the flush thread
+retries them after ``flush_interval``.
+"""
+
+import atexit
+import threading
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+
+
+class WriteBehindBuffer:
+    """Per-table queue of serialized rows, flushed by a daemon thread."""
+
+    def __init__(self, write_rows: Callable[[str, List[Dict[str, str]]], None],
+                 batch_size: int = 500, flush_interval: float = 1.0):
+        """
+        Args:
+            write_rows: Writes one batch of rows to a table (called with the
+                        buffer unlocked, from the flush thread or a reader).
+            batch_size: Number of queued rows that triggers an immediate flush.
+            flush_interval: Max seconds a row stays queued.
+        """
+        self.write_rows = write_rows
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: Dict[str, List[Dict[str, str]]] = defaultdict(list)
+        self._condition = threading.Condition()
+        # Serializes flushes so batches reach the file in queue order
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+        # Error of the last failed background flush, raised to the next caller
+        self._flush_error: Optional[Exception] = None
+        self.stats = {"queued": 0, "flushes": 0, "errors": 0}
+
+    def add(self, table: str, rows: List[Dict[str, str]]) -> None:
+        self._raise_flush_error()
+        with self._condition:
+            self._pending[table].extend(rows)
+            self.stats["queued"] += len(rows)
+            self._ensure_thread()
+            if sum(len(queued) for queued in self._pending.values()) >= self.batch_size:
+                self._condition.notify()
+
+    def pending(self, table: str) -> List[Dict[str, str]]:
+        """Returns a copy of the rows still queued for ``table``."""
+        with self._condition:
+            return list(self._pending.get(table, []))
+
+    def flush(self, table: Optional[str] = None) -> None:
+        """Writes the queued rows of ``table`` (default: every table) now."""
+        with self._flush_lock:
+            with self._condition:
+                tables = [table] if table else list(self._pending)
+                batches = {name: self._pending.pop(name, []) for name in tables}
+            for name, rows in batches.items():
+                if not rows:
+                    continue
+                try:
+                    self.write_rows(name, rows)
+                    self.stats["flushes"] += 1
+                    self._flush_error = None
+                except Exception:
+                    # Put the rows back so the next flush retries them
+                    with self._condition:
+                        self._pending[name][:0] = rows
+                    self.stats["errors"] += 1
+                    raise
+
+    def _raise_flush_error(self) -> None:
+        error, self._flush_error = self._flush_error, None
+        if error is not None:
+            raise RuntimeError(f"Buffered CSV writes failed and are still queued: {error}") from error
+
+    def close(self) -> None:
+        """Stops the flush thread after writing everything still queued."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval + 5)
+        self.flush()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="csv-write-behind", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def _run(self) -> None:
+        failed = False
+        while True:
+            with self._condition:
+                # After a failure the rows are queued again; wait before retrying them
+                if not self._stopped and (failed or sum(len(queued) for queued in self._pending.values()) < self.batch_size):
+                    self._condition.wait(self.flush_interval)
+                if self._stopped:
+                    return
+            try:
+                self.flush()
+                failed = False
+            except Exception as e:
+                self._flush_error = e
+                failed = True
+                print(f"Error flushing buffered CSV writes: {e}")
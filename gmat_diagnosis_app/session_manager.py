@@ -110,7 +110,7 @@ def ensure_chat_history_persistence():
 def set_analysis_results(processed_df, report_dict, final_thetas, theta_plots, consolidated_report):
     st.session_state.processed_df = processed_df
     if processed_df is not None:
-        st.session_state.original_processed_df = processed_df.copy() # Save a copy for reset
+        st.session_state.original_processed_df = processed_df.copy(deep=False) # Lazy copy for reset (copy-on-write)
     else:
         st.session_state.original_processed_df = None
     st.session_state.report_dict = report_dict
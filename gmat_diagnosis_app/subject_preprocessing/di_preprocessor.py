@@ -4,122 +4,127 @@ import pandas as pd
 import numpy as np
 import logging
 
-def _identify_msr_groups(df_di_subset):
+def _identify_msr_groups(df_di_subset, group_keys=()):
     """
     Identifies MSR groups based on 'MSR Set ID' or question contiguity.
-    Adds 'msr_group_id' to the DataFrame.
+
+    Args:
+        df_di_subset (pd.DataFrame): DI questions. Requires 'question_type' and
+                                     'question_position' when grouping by contiguity.
+        group_keys (tuple): Columns identifying one exam; contiguous groups never cross them.
+
+    Returns:
+        pd.Series: 'msr_group_id' of each row (object dtype, NaN outside MSR groups),
+                   index and row order matching df_di_subset. With group_keys, set-ID
+                   groups are 'MSR-<exam number>-<set id>' so ids never repeat across exams.
     """
-    if 'MSR Set ID' in df_di_subset.columns and df_di_subset['MSR Set ID'].notna().any():
-        df_di_subset['msr_group_id'] = 'MSR-' + df_di_subset['MSR Set ID'].astype(str)
-    else:
-        logging.debug("'MSR Set ID' column missing or empty for DI. Attempting to group by contiguity.")
-        df_di_subset = df_di_subset.sort_values(by='question_position')
-        is_msr = (df_di_subset['question_type'] == 'Multi-source reasoning')
-        
-        group_markers = (~is_msr).cumsum()
-        
-        df_di_subset['msr_group_id'] = pd.Series(index=df_di_subset.index, dtype='object')
-        
-        df_di_subset.loc[is_msr, 'msr_group_id'] = 'MSRG-' + group_markers[is_msr].astype(str)
-        
-        df_di_subset.loc[~is_msr, 'msr_group_id'] = np.nan
-    return df_di_subset
-
-def preprocess_di_data(df):
-    """Applies preprocessing specific to DI data, primarily MSR grouping and time calculations."""
-    df_processed = df.copy()
-    di_mask = (df_processed['Subject'] == 'DI')
-    if not di_mask.any():
-        # Ensure MSR specific columns exist even if no DI data, similar to verbal_preprocessor
-        for col in ['msr_group_id', 'msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time', 'is_first_msr_q']:
-            if col not in df_processed.columns:
-                df_processed[col] = pd.Series(dtype='object' if col == 'msr_group_id' else 'float64')
-        return df_processed
-
-    df_di_subset = df_processed[di_mask].copy() 
-    df_di_subset['question_time'] = pd.to_numeric(df_di_subset['question_time'], errors='coerce') # Ensure numeric for sum
-    df_di_subset = _identify_msr_groups(df_di_subset)
-
-    # Calculate MSR group total time, number of questions, and reading time
-    if 'msr_group_id' in df_di_subset.columns and df_di_subset['msr_group_id'].notna().any():
-        msr_rows_mask = df_di_subset['msr_group_id'].notna() & (df_di_subset['question_type'] == 'Multi-source reasoning')
-        if msr_rows_mask.any():
-            df_msr_part = df_di_subset[msr_rows_mask].copy()
-            df_msr_part['question_position'] = pd.to_numeric(df_msr_part['question_position'], errors='coerce') # Ensure numeric for idxmin
-            
-            # Group Total Time
-            group_total_time_map = df_msr_part.groupby('msr_group_id')['question_time'].sum().to_dict()
-            df_msr_part['msr_group_total_time'] = df_msr_part['msr_group_id'].map(group_total_time_map)
-            
-            # Group Num Questions
-            group_num_questions_map = df_msr_part.groupby('msr_group_id').size().to_dict()
-            df_msr_part['msr_group_num_questions'] = df_msr_part['msr_group_id'].map(group_num_questions_map)
-
-            # MSR Reading Time
-            df_msr_part['msr_reading_time'] = 0.0 # Initialize
-            first_q_indices_msr = []
-            group_data_for_reading_time_msr = {}
-
-            for name, group in df_msr_part.groupby('msr_group_id', dropna=False):
-                if group['question_position'].notna().any() and len(group) >= 2: # Only if group has at least 2 questions
-                    first_q_idx_msr = group['question_position'].idxmin()
-                    first_q_indices_msr.append(first_q_idx_msr)
-                    first_q_time_msr = group.loc[first_q_idx_msr, 'question_time']
-                    other_qs_time_msr = group.loc[group.index != first_q_idx_msr, 'question_time']
-                    
-                    calculated_msr_reading_time = first_q_time_msr
-                    if not other_qs_time_msr.empty:
-                        avg_other_qs_time_msr = other_qs_time_msr.mean()
-                        calculated_msr_reading_time = first_q_time_msr - avg_other_qs_time_msr
-                    
-                    df_msr_part.loc[first_q_idx_msr, 'msr_reading_time'] = calculated_msr_reading_time
-            
-            df_msr_part['msr_reading_time'] = pd.to_numeric(df_msr_part['msr_reading_time'], errors='coerce')
-            df_msr_part['msr_reading_time'] = df_msr_part['msr_reading_time'].replace({pd.NA: 0, None: 0, np.nan: 0}).infer_objects(copy=False)
-
-            # Add is_first_msr_q flag
-            df_msr_part['is_first_msr_q'] = False
-            if first_q_indices_msr: # Check if list is not empty
-                # Ensure indices are valid for df_msr_part before trying to loc
-                valid_first_q_indices = [idx for idx in first_q_indices_msr if idx in df_msr_part.index]
-                if valid_first_q_indices:
-                    df_msr_part.loc[valid_first_q_indices, 'is_first_msr_q'] = True
-
-            # Update the DI subset with new columns
-            df_di_subset.update(df_msr_part)
-
-    df_processed.update(df_di_subset)
-
-    # Ensure standard MSR columns exist in the main df and initialize them correctly.
-    msr_numeric_cols = ['msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time']
-    msr_bool_cols = ['is_first_msr_q']
-    msr_object_cols = ['msr_group_id']
-
-    for col in msr_numeric_cols:
-        if col not in df_processed.columns:
-            df_processed[col] = 0.0  # Initialize with 0.0 for all rows
-        else:
-            # Ensure correct dtype and fill NaNs if column already existed
-            df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce')
-            df_processed[col] = df_processed[col].replace({pd.NA: 0.0, None: 0.0, np.nan: 0.0}).infer_objects(copy=False)
-            
-    for col in msr_bool_cols:
-        if col not in df_processed.columns:
-            df_processed[col] = False  # Initialize with False for all rows
+    keys = list(group_keys)
+    # Exams that report 'MSR Set ID' use it; the others are grouped by contiguity
+    uses_set_id = np.zeros(len(df_di_subset), dtype=bool)
+    if 'MSR Set ID' in df_di_subset.columns:
+        has_set_id = df_di_subset['MSR Set ID'].notna()
+        if keys:
+            uses_set_id = has_set_id.groupby([df_di_subset[key] for key in keys], sort=False, dropna=False).transform('any').to_numpy(dtype=bool)
         else:
-            # Ensure correct dtype and fill NaNs
-            try:
-                df_processed[col] = df_processed[col].astype(bool) # Attempt direct cast
-            except ValueError: # Handle potential mixed types or uncastable values
-                df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce').notna() # Example: 0/1 to False/True
-            df_processed[col] = df_processed[col].replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False)
-
-    for col in msr_object_cols: # e.g., msr_group_id
-        if col not in df_processed.columns:
-            df_processed[col] = pd.NA # Or np.nan, or a placeholder string like "N/A"
-        else:
-            # If it exists, just ensure it's not all NaNs if a placeholder is preferred for full NaNs.
-            # df_processed[col] = df_processed[col].fillna(pd.NA) # Default fillna for object is usually fine
-            pass # Allow existing NaNs or values
-            
-    return df_processed 
\ No newline at end of file
+            uses_set_id[:] = has_set_id.any()
+    if uses_set_id.all():
+        return _set_id_group_ids(df_di_subset, keys)
+
+    logging.debug("'MSR Set ID' column missing or empty for DI. Attempting to group by contiguity.")
+    sort_order = (df_di_subset[keys + ['question_position']].reset_index(drop=True)
+                  .sort_values(by=keys + ['question_position'], kind='mergesort').index.to_numpy())
+    df_sorted = df_di_subset.iloc[sort_order]
+    is_msr = (df_sorted['question_type'] == 'Multi-source reasoning').to_numpy()
+
+    # A group is a run of MSR questions in position order; a new exam also ends a run
+    ends_run = ~is_msr
+    for key in keys:
+        starts_exam = df_sorted[key].ne(df_sorted[key].shift()).to_numpy()
+        ends_run[1:] |= starts_exam[1:]
+    group_markers = np.cumsum(ends_run)
+
+    msr_group_ids = np.full(len(df_di_subset), np.nan, dtype=object)
+    msr_group_ids[sort_order[is_msr]] = ['MSRG-' + str(marker) for marker in group_markers[is_msr]]
+    if uses_set_id.any():
+        msr_group_ids[uses_set_id] = _set_id_group_ids(df_di_subset, keys).to_numpy()[uses_set_id]
+    return pd.Series(msr_group_ids, index=df_di_subset.index, dtype='object')
+
+def _set_id_group_ids(df_di_subset, keys):
+    """'MSR-' + 'MSR Set ID', prefixed with the exam number when several exams share the frame."""
+    set_ids = df_di_subset['MSR Set ID'].astype(str)
+    if not keys:
+        return 'MSR-' + set_ids
+    exam_numbers = df_di_subset.groupby(keys, sort=False, dropna=False).ngroup().astype(str)
+    return 'MSR-' + exam_numbers + '-' + set_ids
+
+def preprocess_di_data(df, group_keys=()):
+    """
+    Applies preprocessing specific to DI data, primarily MSR grouping and time calculations.
+
+    Args:
+        df (pd.DataFrame): Question rows with 'Subject'; DI rows need 'question_type',
+            'question_time' and 'question_position'.
+        group_keys (tuple): Columns identifying one exam, e.g. ('student_id', 'test_instance_id'),
+            so a cohort's DI data can be preprocessed in one call.
+
+    Returns:
+        pd.DataFrame: df with msr_group_id (object), msr_group_total_time (float),
+        msr_group_num_questions (int), msr_reading_time (float) and is_first_msr_q (bool).
+        Rows outside MSR groups get NaN / 0 / False.
+    """
+    df_processed = df.copy(deep=False)
+    keys = list(group_keys)
+    num_rows = len(df_processed)
+    msr_group_id = np.full(num_rows, np.nan, dtype=object)
+    msr_group_total_time = np.zeros(num_rows)
+    msr_group_num_questions = np.zeros(num_rows, dtype=int)
+    msr_reading_time = np.zeros(num_rows)
+    is_first_msr_q = np.zeros(num_rows, dtype=bool)
+
+    di_rows = np.flatnonzero((df_processed['Subject'] == 'DI').to_numpy())
+    if di_rows.size:
+        df_di_subset = df_processed.iloc[di_rows]
+        di_group_ids = _identify_msr_groups(df_di_subset, group_keys).to_numpy()
+        msr_group_id[di_rows] = di_group_ids
+
+        # Calculate MSR group total time, number of questions, and reading time
+        is_msr_q = pd.notna(di_group_ids) & (df_di_subset['question_type'] == 'Multi-source reasoning').to_numpy()
+        msr_rows = np.flatnonzero(is_msr_q)
+        if msr_rows.size:
+            df_msr_part = df_di_subset.iloc[msr_rows][keys].reset_index(drop=True)
+            df_msr_part['msr_group_id'] = di_group_ids[msr_rows]
+            df_msr_part['question_time'] = pd.to_numeric(df_di_subset['question_time'].iloc[msr_rows], errors='coerce').to_numpy(dtype=float)
+            df_msr_part['question_position'] = pd.to_numeric(df_di_subset['question_position'].iloc[msr_rows], errors='coerce').to_numpy(dtype=float)
+            group_cols = keys + ['msr_group_id']
+            grouped_times = df_msr_part.groupby(group_cols, sort=False, dropna=False)['question_time']
+
+            # Group Total Time / Num Questions
+            group_total_time = grouped_times.transform('sum')
+            group_num_questions = grouped_times.transform('size')
+
+            # First question: smallest position (first one on ties), only in groups of at least 2 questions
+            has_position = df_msr_part['question_position'].notna()
+            first_q_rows = (df_msr_part[has_position].groupby(group_cols, sort=False, dropna=False)['question_position']
+                            .idxmin().to_numpy())
+            first_q_rows = first_q_rows[group_num_questions.to_numpy()[first_q_rows] >= 2]
+            is_first_q = np.zeros(msr_rows.size, dtype=bool)
+            is_first_q[first_q_rows] = True
+
+            # MSR Reading Time = first question time - average time of the other questions
+            avg_other_qs_time = (df_msr_part['question_time'].where(~is_first_q)
+                                 .groupby([df_msr_part[col] for col in group_cols], sort=False, dropna=False).transform('mean'))
+            reading_time = (df_msr_part['question_time'] - avg_other_qs_time).where(is_first_q, 0.0).fillna(0.0)
+
+            msr_q_rows = di_rows[msr_rows]
+            msr_group_total_time[msr_q_rows] = group_total_time.to_numpy()
+            msr_group_num_questions[msr_q_rows] = group_num_questions.to_numpy()
+            msr_reading_time[msr_q_rows] = reading_time.to_numpy()
+            is_first_msr_q[msr_q_rows] = is_first_q
+
+    # Explicit assignment keeps the column dtypes the same whatever the input
+    df_processed['msr_group_id'] = pd.Series(msr_group_id, index=df_processed.index, dtype='object')
+    df_processed['msr_group_total_time'] = msr_group_total_time
+    df_processed['msr_group_num_questions'] = msr_group_num_questions
+    df_processed['msr_reading_time'] = msr_reading_time
+    df_processed['is_first_msr_q'] = is_first_msr_q
+    return df_processed
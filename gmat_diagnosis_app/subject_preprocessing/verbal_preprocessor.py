@@ -10,66 +10,76 @@ try:
 except ImportError:
     RC_GROUP_SIMILARITY_THRESHOLD = 80 # Default fallback
 
-# --- Helper Function for Time-Based Splitting ---
-def _is_likely_new_group_start(df_block_subset, relative_check_idx):
+# --- RC Block Layout ---
+# Size of the next group of a consecutive RC block, by the number of questions
+# still ungrouped. More than 12 take 4; 7 are split 3+4 or 4+3 by the time
+# heuristic; 1, 2 or 5 remaining questions stay ungrouped.
+RC_NEXT_GROUP_SIZE = {3: 3, 4: 4, 6: 3, 8: 4, 9: 3, 10: 3, 11: 3, 12: 4}
+
+def _rc_block_layout(block_length, split_seven):
     """
-    Checks if the question at relative_check_idx within the block subset
-    has a time significantly longer than the average of other questions (excluding the first).
+    Splits a consecutive RC block into groups of 3 or 4 questions.
 
     Args:
-        df_block_subset (pd.DataFrame): DataFrame containing ONLY the questions
-                                         in the current consecutive block being evaluated.
-                                         Index should be the original DataFrame index.
-        relative_check_idx (int): The 0-based index WITHIN the df_block_subset
-                                  to check (e.g., 3 for the 4th question).
+        block_length (int): Number of questions in the block.
+        split_seven (bool): Whether 7 remaining questions are split 3+4 (else 4+3).
 
     Returns:
-        bool: True if the time at relative_check_idx suggests a new group start.
+        tuple: (np.ndarray with the group number within the block of each
+               question, -1 for ungrouped questions; block position where 7
+               questions remain, or None if the walk never gets there)
     """
-    if df_block_subset.empty or len(df_block_subset) <= relative_check_idx or len(df_block_subset) < 3:
-        # Not enough data to compare or invalid index
-        return False # Default to not splitting if ambiguous
-
-    try:
-        # Ensure question_time is numeric
-        q_times = pd.to_numeric(df_block_subset['question_time'], errors='coerce')
-
-        # Check if the specific question to check has a valid time
-        time_at_check_point = q_times.iloc[relative_check_idx]
-        if pd.isna(time_at_check_point):
-             return False # Cannot determine if time is NaN
-
-        # Calculate average time excluding the first question of the block
-        # Need at least 2 other questions to calculate a meaningful average
-        other_q_times = q_times.iloc[1:] # Exclude the first question
-        if len(other_q_times.dropna()) < 1:
-             return False # Cannot determine without avg
-
-        avg_time_excl_first = other_q_times.mean() # NaNs are automatically skipped by mean()
-
-        if pd.isna(avg_time_excl_first) or avg_time_excl_first <= 0:
-             return False # Cannot determine if avg is invalid
-
-        threshold = 2 * avg_time_excl_first
-        is_longer = time_at_check_point > threshold
+    layout = np.full(block_length, -1)
+    position, group_number, seven_start = 0, 0, None
+    while True:
+        remaining_length = block_length - position
+        if remaining_length == 7:
+            seven_start = position
+            group_size = 3 if split_seven else 4
+        elif remaining_length > 12:
+            group_size = 4
+        else:
+            group_size = RC_NEXT_GROUP_SIZE.get(remaining_length)
+        if group_size is None:
+            break
+        layout[position:position + group_size] = group_number
+        position += group_size
+        group_number += 1
+    return layout, seven_start
+
+def _is_likely_new_group_start(q_times):
+    """
+    Time heuristic for 7-question remainders, evaluated for many of them at once.
 
-        return is_longer
+    The 4th question starts a new group when its time is more than twice the
+    average time of the questions after the first (NaNs skipped).
 
-    except Exception as e:
-        logging.error(f"Error during time check for index {df_block_subset.index[relative_check_idx]}: {e}", exc_info=True)
-        return False # Default to False on error
+    Args:
+        q_times (np.ndarray): Numeric times of shape (n, 7), one row per remainder.
 
-# --- Main RC Grouping Function (Rewritten) ---
-def _identify_rc_groups(df_v_subset):
+    Returns:
+        np.ndarray: Boolean per remainder; False whenever the times are missing.
+    """
+    other_q_times = q_times[:, 1:] # Exclude the first question
+    num_valid = np.count_nonzero(~np.isnan(other_q_times), axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        avg_time_excl_first = np.nansum(other_q_times, axis=1) / num_valid
+    time_at_check_point = q_times[:, 3]
+    return (num_valid > 0) & (avg_time_excl_first > 0) & (time_at_check_point > 2 * avg_time_excl_first)
+
+# --- Main RC Grouping Function ---
+def _identify_rc_groups(df_v_subset, group_keys=()):
     """
     Identifies groups of consecutive Reading Comprehension (RC) questions based on
-    block length and time heuristics (only for 7-question blocks).
+    block length and time heuristics (only for 7-question remainders).
     RC groups must be 3 or 4 questions long.
 
     Args:
         df_v_subset (pd.DataFrame): DataFrame containing Verbal questions.
                                      Requires 'question_type' and 'question_time'.
                                      Index should be preserved from the original DataFrame.
+        group_keys (tuple): Columns identifying one exam, e.g. ('student_id', 'test_instance_id')
+                            for a frame holding several students; blocks never cross them.
 
     Returns:
         pd.Series: Contains the group ID (integer starting from 0) for RC questions,
@@ -77,7 +87,6 @@ def _identify_rc_groups(df_v_subset):
                    Index matches df_v_subset.
     """
     rc_group_ids = pd.Series(np.nan, index=df_v_subset.index, dtype='Int64') # Use nullable Int64
-    global_group_counter = 0
 
     if 'question_type' not in df_v_subset.columns:
         logging.error("Missing 'question_type' column.")
@@ -86,77 +95,48 @@ def _identify_rc_groups(df_v_subset):
         logging.error("Missing 'question_time' column.")
         return rc_group_ids
 
-    # Ensure question_time is numeric
-    df_v_subset['question_time_numeric'] = pd.to_numeric(df_v_subset['question_time'], errors='coerce')
-
-
-    # 1. Identify consecutive RC blocks
-    is_rc = df_v_subset['question_type'] == 'Reading Comprehension'
-    # Create groups based on consecutive RC questions
-    rc_blocks = is_rc.ne(is_rc.shift()).cumsum()[is_rc]
-
-    if rc_blocks.empty:
-        df_v_subset.drop(columns=['question_time_numeric'], inplace=True, errors='ignore') # Clean up temp column
+    # 1. Identify consecutive RC blocks (rows in frame order)
+    is_rc = (df_v_subset['question_type'] == 'Reading Comprehension').to_numpy()
+    rc_rows = np.flatnonzero(is_rc)
+    if rc_rows.size == 0:
         return rc_group_ids
 
-    # 2. Process each block
-    for block_id, block_indices in rc_blocks.groupby(rc_blocks).groups.items():
-        block_length = len(block_indices)
-        block_start_idx = block_indices[0]
-        block_end_idx = block_indices[-1]
-
-        # Get subset for time analysis if needed (only for length 7)
-        block_subset_df = df_v_subset.loc[block_indices]
-
-        current_idx_position = 0 # Position within the current block indices list
-        while current_idx_position < block_length:
-            remaining_length = block_length - current_idx_position
-            group_size_to_assign = 0
-
-            if remaining_length <= 2:
-                break # Stop processing this block
-
-            elif remaining_length == 3: group_size_to_assign = 3
-            elif remaining_length == 4: group_size_to_assign = 4
-            elif remaining_length == 5:
-                break
-            elif remaining_length == 6: group_size_to_assign = 3 # First part of 3+3
-            elif remaining_length == 7:
-                # Time heuristic needed for 3+4 vs 4+3
-                # Check the 4th question in the remaining 7 (relative index 3)
-                is_new_group = _is_likely_new_group_start(block_subset_df.iloc[current_idx_position : current_idx_position + 7], 3)
-                if is_new_group:
-                    group_size_to_assign = 3 # Split is 3 + 4
-                else:
-                    group_size_to_assign = 4 # Split is 4 + 3
-            elif remaining_length == 8: group_size_to_assign = 4 # First part of 4+4
-            elif remaining_length == 9: group_size_to_assign = 3 # First part of 3+3+3
-            elif remaining_length == 10: group_size_to_assign = 3 # First part of 3+3+4
-            elif remaining_length == 11: group_size_to_assign = 3 # First part of 3+4+4
-            elif remaining_length == 12: group_size_to_assign = 4 # First part of 4+4+4
-            else: # remaining_length > 12
-                group_size_to_assign = 4
-
-            # Assign Group ID
-            if group_size_to_assign > 0:
-                start_assign_block_pos = current_idx_position
-                end_assign_block_pos = current_idx_position + group_size_to_assign -1
-                # Get original indices from the block_indices Series
-                original_indices_to_assign = block_indices[start_assign_block_pos : end_assign_block_pos + 1]
-
-                rc_group_ids.loc[original_indices_to_assign] = global_group_counter
-
-                current_idx_position += group_size_to_assign
-                global_group_counter += 1
-            else:
-                 # Should not happen unless remaining_length <= 2 initially or 5
-                 logging.error("Internal error: group_size_to_assign became 0 unexpectedly.")
-                 break # Safety break
-
-    # Clean up temporary column
-    df_v_subset.drop(columns=['question_time_numeric'], inplace=True, errors='ignore')
-
-    return rc_group_ids
+    starts_block = np.ones(len(df_v_subset), dtype=bool)
+    starts_block[1:] = ~is_rc[:-1]
+    for key in group_keys:
+        starts_block |= df_v_subset[key].ne(df_v_subset[key].shift()).to_numpy()
+    starts_block = starts_block[rc_rows]
+    block_of_q = np.cumsum(starts_block) - 1
+    block_first_q = np.flatnonzero(starts_block)
+    block_lengths = np.diff(np.append(block_first_q, rc_rows.size))
+    position_in_block = np.arange(rc_rows.size) - block_first_q[block_of_q]
+
+    # 2. Time heuristic for the blocks that end with a 7-question remainder
+    seven_starts = {length: _rc_block_layout(length, False)[1] for length in np.unique(block_lengths)}
+    block_seven_start = np.array([seven_starts[length] if seven_starts[length] is not None else -1 for length in block_lengths])
+    split_seven = np.zeros(block_lengths.size, dtype=bool)
+    blocks_with_seven = np.flatnonzero(block_seven_start >= 0)
+    if blocks_with_seven.size:
+        q_times = pd.to_numeric(df_v_subset['question_time'], errors='coerce').to_numpy(dtype=float)[rc_rows]
+        window_q = (block_first_q[blocks_with_seven] + block_seven_start[blocks_with_seven])[:, None] + np.arange(7)
+        split_seven[blocks_with_seven] = _is_likely_new_group_start(q_times[window_q])
+
+    # 3. Group number within the block, one layout per distinct (length, split)
+    group_in_block = np.full(rc_rows.size, -1)
+    q_block_length = block_lengths[block_of_q]
+    q_split_seven = split_seven[block_of_q]
+    for length, split in set(zip(block_lengths.tolist(), split_seven.tolist())):
+        layout, _ = _rc_block_layout(length, split)
+        in_layout = (q_block_length == length) & (q_split_seven == split)
+        group_in_block[in_layout] = layout[position_in_block[in_layout]]
+
+    # 4. Global group IDs numbered in order of appearance
+    is_grouped = group_in_block >= 0
+    previous_group = np.append(-1, group_in_block[:-1])
+    starts_group = is_grouped & ((position_in_block == 0) | (group_in_block != previous_group))
+    group_ids = np.full(len(df_v_subset), np.nan)
+    group_ids[rc_rows[is_grouped]] = (np.cumsum(starts_group) - 1)[is_grouped]
+    return pd.Series(group_ids, index=df_v_subset.index).astype('Int64')
 
 def _calculate_rc_times(df_v_grouped):
     """Calculate reading time and total group time for RC passages."""
@@ -172,54 +152,47 @@ def _calculate_rc_times(df_v_grouped):
     df_v_grouped['question_position'] = pd.to_numeric(df_v_grouped['question_position'], errors='coerce')
     df_v_grouped['question_time'] = pd.to_numeric(df_v_grouped['question_time'], errors='coerce')
 
-    # --- Calculate Reading Time ---
-    df_v_grouped['rc_reading_time'] = 0.0 # Initialize
-    # Group by the potentially nullable Int64 rc_group_id
-    # Need to handle groups where rc_group_id is NaN - these should not be processed
-    valid_groups = df_v_grouped.dropna(subset=['rc_group_id']).groupby('rc_group_id')
-
-    group_data_for_reading_time = {}
-    first_q_indices_map = {} # Store first q index per group
-
-    for name, group in valid_groups:
-        if group['question_position'].notna().any():
-            first_q_idx = group['question_position'].idxmin()
-            first_q_time = group.loc[first_q_idx, 'question_time']
-            other_qs_time = group.loc[group.index != first_q_idx, 'question_time']
-
-            calculated_rc_reading_time = first_q_time
-            if not other_qs_time.dropna().empty:
-                avg_other_qs_time = other_qs_time.mean() # mean() handles NaNs
-                if pd.notna(avg_other_qs_time):
-                    calculated_rc_reading_time = first_q_time - avg_other_qs_time
-
-            # Assign reading time only to the first question
-            if pd.notna(calculated_rc_reading_time):
-                 df_v_grouped.loc[first_q_idx, 'rc_reading_time'] = calculated_rc_reading_time
-            else:
-                 df_v_grouped.loc[first_q_idx, 'rc_reading_time'] = 0.0 # Default if calc failed
+    # Work on row numbers so a non-unique index cannot mix up questions
+    group_ids = df_v_grouped['rc_group_id'].reset_index(drop=True)
+    q_times = df_v_grouped['question_time'].reset_index(drop=True)
+    q_positions = df_v_grouped['question_position'].reset_index(drop=True)
 
+    # --- Calculate Reading Time ---
+    # The first question of a group is the one with the smallest position (first one on ties);
+    # groups without any position get no reading time
+    has_position = group_ids.notna() & q_positions.notna()
+    first_q_rows = q_positions[has_position].groupby(group_ids[has_position], sort=False).idxmin()
+    is_first_q = np.zeros(len(df_v_grouped), dtype=bool)
+    is_first_q[first_q_rows.to_numpy()] = True
+
+    # Reading time = first question time - average time of the other questions (NaNs skipped),
+    # or the whole first question time when no other question has a time
+    avg_other_qs_time = q_times.where(~is_first_q).groupby(group_ids, sort=False).transform('mean')
+    rc_reading_time = (q_times - avg_other_qs_time.fillna(0)).where(is_first_q, 0.0)
+    df_v_grouped['rc_reading_time'] = rc_reading_time.fillna(0).to_numpy() # Default if calc failed
 
     # --- Calculate Total Time and Num Questions per Group ---
-    df_v_grouped['rc_group_total_time'] = 0.0 # Initialize
-    df_v_grouped['rc_group_num_questions'] = 0 # Initialize
-
-    group_stats = valid_groups['question_time'].agg(['sum', 'size'])
-    group_stats.columns = ['rc_group_total_time', 'rc_group_num_questions']
-
-    # Map the results back to the DataFrame using the group_id
-    # Need to handle if rc_group_id is not in group_stats.index (shouldn't happen with valid_groups)
-    df_v_grouped['rc_group_total_time'] = df_v_grouped['rc_group_id'].map(group_stats['rc_group_total_time']).fillna(0)
-    df_v_grouped['rc_group_num_questions'] = df_v_grouped['rc_group_id'].map(group_stats['rc_group_num_questions']).fillna(0).astype(int)
+    grouped_times = q_times.groupby(group_ids, sort=False)
+    df_v_grouped['rc_group_total_time'] = grouped_times.transform('sum').fillna(0).to_numpy()
+    df_v_grouped['rc_group_num_questions'] = grouped_times.transform('size').fillna(0).astype(int).to_numpy()
 
+    return df_v_grouped
 
-    # Final cleanup / default values
-    df_v_grouped['rc_reading_time'] = df_v_grouped['rc_reading_time'].fillna(0)
+def preprocess_verbal_data(df, group_keys=()):
+    """
+    Applies preprocessing specific to Verbal data: RC grouping and time calcs.
 
-    return df_v_grouped
+    Args:
+        df (pd.DataFrame): Question rows with 'Subject'; Verbal rows need
+            'question_type', 'question_time' and 'question_position'.
+        group_keys (tuple): Columns identifying one exam, e.g. ('student_id', 'test_instance_id'),
+            so a cohort's Verbal data can be preprocessed in one call. RC group IDs stay
+            unique across exams.
 
-def preprocess_verbal_data(df):
-    """Applies preprocessing specific to Verbal data: RC grouping and time calcs."""
+    Returns:
+        pd.DataFrame: Copy of df with rc_group_id, rc_reading_time,
+        rc_group_total_time and rc_group_num_questions.
+    """
     df_processed = df.copy()
     verbal_mask = (df_processed['Subject'] == 'V')
     if not verbal_mask.any():
@@ -234,13 +207,19 @@ def preprocess_verbal_data(df):
     df_v_subset = df_processed.loc[verbal_mask].copy()
 
     # Calls the NEW _identify_rc_groups on the SUBSET
-    rc_groups_series = _identify_rc_groups(df_v_subset) # Returns a Series
+    rc_groups_series = _identify_rc_groups(df_v_subset, group_keys) # Returns a Series
     df_v_subset['rc_group_id'] = rc_groups_series # Assign Series to the subset column
 
     # Calculate RC times using the NEW group IDs (operates on df_v_subset in place)
     rc_groups_found_in_subset = df_v_subset['rc_group_id'].notna().any() # Check if any groups were successfully assigned
     if rc_groups_found_in_subset:
         df_v_subset = _calculate_rc_times(df_v_subset) # Modifies df_v_subset
+        if group_keys:
+            # Exams without any RC group keep missing RC times, as in a call for that exam alone
+            exam_has_groups = df_v_subset['rc_group_id'].notna().groupby(
+                [df_v_subset[key] for key in group_keys], sort=False, dropna=False
+            ).transform('any')
+            df_v_subset.loc[~exam_has_groups, ['rc_reading_time', 'rc_group_total_time', 'rc_group_num_questions']] = np.nan
     else:
         # Ensure columns exist with defaults if skipped
         if 'rc_reading_time' not in df_v_subset.columns: df_v_subset['rc_reading_time'] = 0.0
@@ -184,7 +184,7 @@ def combine_input_data(input_dfs, SUBJECTS):
                     # st.write(f"  - 索引是否唯一: {df.index.is_unique}") # Removed
                     
                     # 先重設索引，確保沒有重複索引
-                    temp_df = df.copy()
+                    temp_df = df
 
                     # Check for and remove duplicate columns
                     if temp_df.columns.has_duplicates:
@@ -211,7 +211,7 @@ def combine_input_data(input_dfs, SUBJECTS):
                 st.error(f"合併方法1失敗: {e1}") # Kept error
                 try:
                     # 方法2：逐個合併
-                    df_combined_input = df_list[0].copy() if df_list else None
+                    df_combined_input = df_list[0] if df_list else None
                     if len(df_list) > 1:
                         for i in range(1, len(df_list)):
                             df_combined_input = pd.concat([df_combined_input, df_list[i]], ignore_index=True)
@@ -12,6 +12,8 @@ from gmat_diagnosis_app.utils.excel_utils import to_excel
 from gmat_diagnosis_app.constants.config import SUBJECTS, EXCEL_COLUMN_MAP
 from gmat_diagnosis_app.ui.chat_interface import display_chat_interface
 from gmat_diagnosis_app.services.openai_service import trim_diagnostic_tags_with_openai
+import hashlib
+from collections import OrderedDict
 import logging
 import traceback # Added for more detailed error logging in download
 
@@ -35,6 +37,99 @@ COLUMN_DISPLAY_CONFIG = {
     "is_manually_invalid": None, # Hide the intermediate manual flag
 }
 
+# Session key of the workbook cache used by the Excel download buttons
+EXCEL_DOWNLOAD_CACHE_KEY = '_excel_download_cache'
+# Number of workbooks kept per session (subject tabs + edited-labels download)
+EXCEL_DOWNLOAD_CACHE_SIZE = 8
+
+def _frame_digest(df):
+    """Content hash of a DataFrame (values, index, column names and dtypes)."""
+    # astype(str): list cells (e.g. diagnostic_params_list) are not hashable as-is
+    hashed = pd.util.hash_pandas_object(df.astype(str), index=True).to_numpy()
+    digest = hashlib.blake2b(hashed.tobytes(), digest_size=16)
+    digest.update(repr((list(df.columns), [str(dtype) for dtype in df.dtypes])).encode('utf-8'))
+    return digest.hexdigest()
+
+def _excel_download_cache():
+    """Returns this session's workbook cache, emptied whenever processed_df or original_processed_df is replaced."""
+    sources = (st.session_state.get('processed_df'), st.session_state.get('original_processed_df'))
+    cache = st.session_state.get(EXCEL_DOWNLOAD_CACHE_KEY)
+    if cache is None or any(cached is not source for cached, source in zip(cache['sources'], sources)):
+        cache = {'sources': sources, 'workbooks': OrderedDict()}
+        st.session_state[EXCEL_DOWNLOAD_CACHE_KEY] = cache
+    return cache['workbooks']
+
+def _lazy_excel_bytes(df, excel_map, prepare=None, source_key=None):
+    """
+    Returns a callable for st.download_button's data: the workbook is built (with
+    prepare(df, excel_map) then to_excel) only when the download is requested, and
+    memoized per column map and source_key, or the content of df if no source_key
+    is given. Pass source_key only for frames taken unchanged from the session's
+    processed_df (e.g. a subject's rows), since the cache is reset whenever that
+    DataFrame is replaced.
+    """
+    workbooks = _excel_download_cache()
+    frame_key = ('source', source_key) if source_key is not None else _frame_digest(df)
+    key = (frame_key, tuple(excel_map.items()), getattr(prepare, '__name__', None))
+
+    def build():
+        # Runs on a separate thread when the button is clicked; only touches the captured cache
+        excel_bytes = workbooks.get(key)
+        if excel_bytes is None:
+            try:
+                df_for_excel = prepare(df, excel_map) if prepare else df
+                excel_bytes = to_excel(df_for_excel, excel_map)
+            except Exception:
+                logging.error(f"準備Excel下載時出錯: {traceback.format_exc()}")
+                raise
+            workbooks[key] = excel_bytes
+            while len(workbooks) > EXCEL_DOWNLOAD_CACHE_SIZE:
+                workbooks.popitem(last=False)
+        return excel_bytes
+
+    return build
+
+def _prepare_subject_excel_frame(df_subject, excel_map):
+    """Prepares a subject's results for to_excel (invalid flags, column selection, types)."""
+    # Prepare a copy specifically for Excel export using excel_map
+    df_for_excel = df_subject.copy(deep=False) # copy-on-write：修改時才實際複製
+
+    # 重要：確保 df_for_excel 中的 is_invalid 也以 is_manually_invalid 為準
+    if 'is_manually_invalid' in df_for_excel.columns:
+        if 'is_invalid' in df_for_excel.columns:
+            df_for_excel['is_invalid'] = False
+            df_for_excel.loc[df_for_excel['is_manually_invalid'] == True, 'is_invalid'] = True
+        else:
+            df_for_excel['is_invalid'] = df_for_excel['is_manually_invalid']
+
+    # 確保 is_invalid 列是布爾型，以便後續處理
+    if 'is_invalid' in df_for_excel.columns:
+        df_for_excel['is_invalid'] = df_for_excel['is_invalid'].astype(bool)
+
+    # 根據 excel_map 篩選列（在 is_invalid 更新之後）
+    df_for_excel = df_for_excel[[k for k in excel_map.keys() if k in df_for_excel.columns]]
+
+    # 確保按題號排序
+    if 'question_position' in df_for_excel.columns:
+        df_for_excel = df_for_excel.sort_values(by='question_position').reset_index(drop=True)
+
+    if 'is_invalid' not in df_for_excel.columns:
+        df_for_excel['is_invalid'] = False
+
+    if 'question_difficulty' in df_for_excel.columns:
+        df_for_excel['question_difficulty'] = pd.to_numeric(df_for_excel['question_difficulty'], errors='coerce')
+    if 'question_time' in df_for_excel.columns:
+        df_for_excel['question_time'] = pd.to_numeric(df_for_excel['question_time'], errors='coerce')
+
+    if 'is_correct' in df_for_excel.columns:
+        df_for_excel['is_correct'] = df_for_excel['is_correct'].astype(str)
+    if 'is_sfe' in df_for_excel.columns:
+        df_for_excel['is_sfe'] = df_for_excel['is_sfe'].astype(str)
+
+    if 'is_invalid' in df_for_excel.columns:
+        df_for_excel['is_invalid'] = df_for_excel['is_invalid'].astype(str)
+    return df_for_excel
+
 def display_subject_results(subject, tab_container, report_md, df_subject, col_config, excel_map):
     """Displays the diagnosis report, styled DataFrame, and download button for a subject."""
     tab_container.subheader(f"{subject} 科診斷報告")
@@ -63,8 +158,8 @@ def display_subject_results(subject, tab_container, report_md, df_subject, col_c
         subject_col_config = col_config.copy()
         subject_excel_map = excel_map.copy()
         
-        # 複製數據框以避免修改原始數據
-        df_display = df_subject.copy()
+        # 淺複製即可：copy-on-write 下修改不會影響原始數據
+        df_display = df_subject.copy(deep=False)
         
         # 確保按題號排序
         if 'question_position' in df_display.columns:
@@ -96,7 +191,7 @@ def display_subject_results(subject, tab_container, report_md, df_subject, col_c
 
         # 準備數據框顯示
         cols_available = [k for k in subject_col_config.keys() if k in df_display.columns]
-        df_to_display = df_display[cols_available].copy()
+        df_to_display = df_display[cols_available]
         columns_for_st_display_order = [k for k in cols_available if subject_col_config.get(k) is not None]
 
         # 確保必要的列存在
@@ -162,58 +257,12 @@ def display_subject_results(subject, tab_container, report_md, df_subject, col_c
         tab_container.info(f"未找到 {subject} 科的診斷報告。")
 
     # 4. Download Button (一樣為所有科目顯示下載按鈕)
+    # The workbook is only built when the button is clicked, and reused until the data changes
     try:
-        # Prepare a copy specifically for Excel export using excel_map
-        df_for_excel = df_subject.copy() # 先完整複製一份 df_subject
-
-        # 重要：確保 df_for_excel 中的 is_invalid 也以 is_manually_invalid 為準
-        if 'is_manually_invalid' in df_for_excel.columns:
-            if 'is_invalid' in df_for_excel.columns:
-                df_for_excel['is_invalid'] = False
-                df_for_excel.loc[df_for_excel['is_manually_invalid'] == True, 'is_invalid'] = True
-            else:
-                df_for_excel['is_invalid'] = df_for_excel['is_manually_invalid']
-        
-        # 確保 is_invalid 列是布爾型，以便後續處理
-        if 'is_invalid' in df_for_excel.columns:
-            df_for_excel['is_invalid'] = df_for_excel['is_invalid'].astype(bool)
-            
-        # 根據 excel_map 篩選列（在 is_invalid 更新之後）
-        df_for_excel = df_for_excel[[k for k in excel_map.keys() if k in df_for_excel.columns]].copy()
-        
-        # 確保按題號排序
-        if 'question_position' in df_for_excel.columns:
-            df_for_excel = df_for_excel.sort_values(by='question_position').reset_index(drop=True)
-
-        if 'is_invalid' not in df_for_excel.columns:
-            df_for_excel['is_invalid'] = False
-            
-        if 'question_difficulty' in df_for_excel.columns:
-            df_for_excel['question_difficulty'] = pd.to_numeric(df_for_excel['question_difficulty'], errors='coerce')
-        if 'question_time' in df_for_excel.columns:
-            df_for_excel['question_time'] = pd.to_numeric(df_for_excel['question_time'], errors='coerce')
-            
-        if 'is_correct' in df_for_excel.columns:
-            df_for_excel['is_correct'] = df_for_excel['is_correct'].astype(str)
-        if 'is_sfe' in df_for_excel.columns:
-            df_for_excel['is_sfe'] = df_for_excel['is_sfe'].astype(str)
-            
-        if 'is_invalid' in df_for_excel.columns:
-            df_for_excel['is_invalid'] = df_for_excel['is_invalid'].astype(str)
-
-        try:
-            value_counts = df_for_excel['is_invalid'].value_counts().to_dict()
-        except Exception as e:
-            pass
-            
-        invalid_count = (df_for_excel['is_invalid'] == 'True').sum() if 'is_invalid' in df_for_excel.columns else 0
-                
-        excel_bytes = to_excel(df_for_excel, excel_map)
-        
         today_str = pd.Timestamp.now().strftime('%Y%m%d')
         tab_container.download_button(
             f"下載 {subject} 科詳細數據 (Excel)",
-            data=excel_bytes,
+            data=_lazy_excel_bytes(df_subject, excel_map, _prepare_subject_excel_frame, source_key=subject),
             file_name=f"{today_str}_GMAT_{subject}_detailed_data.xlsx",
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
@@ -466,7 +515,7 @@ def generate_new_diagnostic_report(df: pd.DataFrame) -> str:
     required_cols_di = ["Subject", "question_position", "content_domain", "question_type", "diagnostic_params_list"]
 
     for subject in ["Q", "V", "DI"]:
-        subject_df = df[df["Subject"] == subject].copy()
+        subject_df = df[df["Subject"] == subject]
         if subject_df.empty:
             continue
 
@@ -639,7 +688,7 @@ def display_results():
                 tabs[edit_tab_index].info("沒有可供編輯的診斷數據。請先成功執行一次分析。")
             else:
                 if "reset_editable_df_requested" in st.session_state and st.session_state.reset_editable_df_requested:
-                    st.session_state.editable_diagnostic_df = st.session_state.original_processed_df.copy(deep=True)
+                    st.session_state.editable_diagnostic_df = st.session_state.original_processed_df.copy(deep=False)
                     st.session_state._editable_df_source = st.session_state.original_processed_df
                     tabs[edit_tab_index].success("已重設為原始標籤。")
                     if 'generated_ai_prompts_for_edit_tab' in st.session_state:
@@ -647,7 +696,7 @@ def display_results():
                     st.session_state.reset_editable_df_requested = False
                 
                 if 'editable_diagnostic_df' not in st.session_state or st.session_state.original_processed_df is not st.session_state.get('_editable_df_source'):
-                    st.session_state.editable_diagnostic_df = st.session_state.original_processed_df.copy()
+                    st.session_state.editable_diagnostic_df = st.session_state.original_processed_df.copy(deep=False)
                     st.session_state._editable_df_source = st.session_state.original_processed_df
 
                 user_requested_internal_names = [
@@ -657,7 +706,7 @@ def display_results():
                 ]
                 
                 cols_to_display = [col for col in user_requested_internal_names if col in st.session_state.editable_diagnostic_df.columns]
-                df_for_editor = st.session_state.editable_diagnostic_df[cols_to_display].copy()
+                df_for_editor = st.session_state.editable_diagnostic_df[cols_to_display]
 
                 if 'diagnostic_params_list' in df_for_editor.columns:
                     def format_tags_for_text_editor(tags_list):
@@ -753,7 +802,7 @@ def display_results():
                         logging.info(f"[save_editor_content] Received editor content of type: {type(edited_content)}")
                         
                         if edited_content is not None:
-                            updated_full_df = st.session_state.editable_diagnostic_df.copy()
+                            updated_full_df = st.session_state.editable_diagnostic_df.copy(deep=False)
                             
                             # 處理編輯的內容（在session_state中可能是字典格式）
                             if isinstance(edited_content, dict):
@@ -929,7 +978,7 @@ def display_results():
                             tabs[edit_tab_index].warning("您有未套用的變更。請先點擊「✓ 套用變更並更新質化分析輸出」按鈕儲存變更，然後再下載試算表。", icon="⚠️")
                         elif st.session_state.get('changes_saved', False):
                             try:
-                                df_to_export = st.session_state.editable_diagnostic_df.copy() # Start with internal names
+                                df_to_export = st.session_state.editable_diagnostic_df.copy(deep=False) # Start with internal names
                                 logging.info(f"[Download Edited] Initial columns: {df_to_export.columns.tolist()}")
 
                                 # --- Merge Logic (Operates on internal names) ---
@@ -951,7 +1000,7 @@ def display_results():
                                                     logging.warning(f"[Download Edited] Type mismatch for 'question_position': {df_to_export['question_position'].dtype} vs {source_df['question_position'].dtype}. Attempting coercion.")
                                                     try:
                                                         df_to_export['question_position'] = pd.to_numeric(df_to_export['question_position'], errors='coerce').astype('Int64')
-                                                        source_df_temp = source_df.copy()
+                                                        source_df_temp = source_df.copy(deep=False)
                                                         source_df_temp['question_position'] = pd.to_numeric(source_df_temp['question_position'], errors='coerce').astype('Int64')
                                                         source_df_for_merge = source_df_temp
                                                         logging.info("[Download Edited] Coerced 'question_position' to Int64 for merge.")
@@ -979,7 +1028,7 @@ def display_results():
                                     for internal_name in EXCEL_COLUMN_MAP.keys() # Use defined export order/keys
                                     if internal_name in df_to_export.columns # Check if column exists after merge
                                 ]
-                                df_to_export_final = df_to_export[final_internal_columns_to_export].copy() # Select final columns with internal names
+                                df_to_export_final = df_to_export[final_internal_columns_to_export] # Select final columns with internal names
 
                                 # Create the map only for the selected columns
                                 excel_column_map_for_export_final = {
@@ -1001,8 +1050,8 @@ def display_results():
                                           df_to_export_final[bool_col] = df_to_export_final[bool_col].astype(str)
                                 # NOTE: Numeric formatting (e.g., difficulty, time) is handled within to_excel based on the map
 
-                                # --- Call to_excel with internal names and the map ---
-                                excel_bytes = to_excel(df_to_export_final, excel_column_map_for_export_final)
+                                # --- to_excel with internal names and the map, run when the download is requested (memoized per content) ---
+                                excel_bytes = _lazy_excel_bytes(df_to_export_final, excel_column_map_for_export_final)
 
                                 # Trigger download
                                 today_str = pd.Timestamp.now().strftime('%Y%m%d')
@@ -7,80 +7,143 @@ import io
 import pandas as pd
 import numpy as np
 import streamlit as st
-from thefuzz import process as fuzz_process # Renamed to avoid conflict
-from thefuzz import fuzz
+from gmat_diagnosis_app.utils.header_resolver import resolve_header_mapping
 
 def normalize_and_rename_headers(df, subject_key, required_cols_map, tab_container_for_warnings):
     # Ensure all column names are strings before processing
     df.columns = df.columns.astype(str)
-    
-    warnings = []
-    actual_columns = df.columns.tolist()
-    # Create a copy of expected columns to modify for BOM check
-    expected_original_cols = list(required_cols_map.get(subject_key, [])) # Make a copy
-    
+
+    expected_original_cols = list(required_cols_map.get(subject_key, []))
     if not expected_original_cols:
-        return df, warnings
-
-    rename_map = {}
-    # This set will store the *original user-provided column names* that have been successfully mapped
-    # to an expected_col. This helps avoid reusing a user's column for multiple expected_cols.
-    mapped_user_columns = set()
-
-
-    for i, expected_col in enumerate(expected_original_cols):
-        # Handle BOM specifically for 'Question' if it's an expected column.
-        # This check is a bit of a special case for 'Question'.
-        bom_question_col_name = '\\ufeffQuestion'
-        if expected_col == 'Question' and bom_question_col_name in actual_columns:
-            # If BOM version exists in actual columns, prioritize it for the 'Question' expected_col.
-            # We effectively treat bom_question_col_name as the target for this expected_col.
-            # And if a user column named 'Question' (no BOM) also exists, it will be available for other fuzzy matches.
-            if bom_question_col_name not in mapped_user_columns:
-                rename_map[bom_question_col_name] = 'Question' # Always rename to canonical 'Question'
-                mapped_user_columns.add(bom_question_col_name)
-                continue # Successfully mapped 'Question', move to next expected_col
-
-        # Create a lowercase to original case map for *available* actual columns
-        # Available columns are those not yet mapped to an expected column.
-        available_actual_cols = [col for col in actual_columns if col not in mapped_user_columns]
-        available_actual_cols_lower_map = {col.lower().strip(): col for col in available_actual_cols}
-        
-        expected_col_lower = expected_col.lower().strip()
-        matched_actual_col = None
-
-        # 1. Exact match among available columns
-        if expected_col in available_actual_cols:
-            matched_actual_col = expected_col
-        
-        # 2. Case-insensitive match among available columns
-        elif expected_col_lower in available_actual_cols_lower_map:
-            matched_actual_col = available_actual_cols_lower_map[expected_col_lower]
-            if matched_actual_col != expected_col:
-                 warnings.append(f"欄位自動匹配：輸入欄位 '{matched_actual_col}' 已通過忽略大小寫匹配至標準欄位 '{expected_col}'。")
-        
-        # 3. Fuzzy match if no direct or case-insensitive match among available columns
-        else:
-            if available_actual_cols: # Ensure there are columns to search
-                best_match_tuple = fuzz_process.extractOne(expected_col, available_actual_cols, scorer=fuzz.WRatio) # Using WRatio
-                if best_match_tuple and best_match_tuple[1] >= 85: # Confidence threshold 85%
-                    # Check if this best_match_tuple[0] (an actual user column) has already been used for another expected_col
-                    # This check is implicitly handled by `available_actual_cols` being up-to-date.
-                    matched_actual_col = best_match_tuple[0]
-                    warnings.append(f"欄位模糊匹配：輸入欄位 '{matched_actual_col}' 已通過模糊匹配（相似度 {best_match_tuple[1]}%）至標準欄位 '{expected_col}'。")
-
-        if matched_actual_col:
-            # If the matched_actual_col is different from the canonical expected_col, add to rename_map.
-            # If they are the same, no rename is needed but we still mark it as mapped.
-            if matched_actual_col != expected_col:
-                 rename_map[matched_actual_col] = expected_col
-            mapped_user_columns.add(matched_actual_col) # Add the user's column name that got mapped
+        return df, []
+
+    # Memoized per header set; fuzzy matching only runs for header variants never seen before
+    rename_map, warnings = resolve_header_mapping(subject_key, expected_original_cols, df.columns.tolist())
 
     if rename_map:
         df.rename(columns=rename_map, inplace=True)
 
     return df, warnings
 
+# Number of distinct inputs kept by the parse / validation caches
+INPUT_CACHE_MAX_ENTRIES = 32
+
+@st.cache_data(max_entries=INPUT_CACHE_MAX_ENTRIES, show_spinner=False)
+def _prepare_input_frame(content, subject, required_original_cols, _suggest_invalid_questions):
+    """
+    Parses the raw upload / pasted text, normalizes the headers, drops empty rows and
+    columns and pre-fills 'is_manually_invalid' from the invalid-question suggestion.
+
+    Cached on the input content: Streamlit reruns the page on every widget interaction,
+    and unchanged inputs then skip the whole pipeline. The messages meant for the tab are
+    returned instead of displayed, so they can be replayed on every rerun.
+
+    Returns:
+        (DataFrame or None, list of (tab method, message, kwargs), errors when the DataFrame is None)
+    """
+    messages = []
+    # Read data, attempt flexible separator detection
+    source = io.BytesIO(content) if isinstance(content, bytes) else io.StringIO(content)
+    temp_df = pd.read_csv(source, sep=None, engine='python', skip_blank_lines=True)
+
+    if temp_df.empty: # Check if df is empty immediately after read
+        messages.append(("warning", "讀取的資料為空或格式不正確。", {}))
+        return None, messages, ["Empty or invalid data format after read."]
+
+    # ---> 新增：標準化欄位標頭 <---
+    if temp_df is not None and not temp_df.empty:
+        temp_df, header_warnings = normalize_and_rename_headers(temp_df.copy(), subject, required_original_cols, None) # Pass a copy
+        for warning_msg in header_warnings:
+            messages.append(("warning", warning_msg, {"icon": "⚠️"}))
+    # ---> 結束新增 <---
+
+    # --- Initial Cleaning & Prep ---
+    initial_rows, initial_cols = temp_df.shape
+    # Drop *_b columns silently
+    cols_to_drop = [col for col in temp_df.columns if str(col).endswith('_b')]
+    if cols_to_drop:
+        temp_df.drop(columns=cols_to_drop, inplace=True, errors='ignore')
+
+    # Drop fully empty rows/columns
+    temp_df.dropna(how='all', axis=0, inplace=True)
+    temp_df.dropna(how='all', axis=1, inplace=True)
+    temp_df.reset_index(drop=True, inplace=True)
+    cleaned_rows, cleaned_cols = temp_df.shape
+    if initial_rows > cleaned_rows or initial_cols > cleaned_cols:
+         messages.append(("caption", f"已自動移除 {initial_rows - cleaned_rows} 個空行和 {initial_cols - cleaned_cols} 個空列。", {}))
+
+    if temp_df.empty:
+         messages.append(("warning", "讀取的資料在清理空行/空列後為空。", {}))
+         return None, messages, []
+
+    # Add manual invalid column *before* editor
+    temp_df['is_manually_invalid'] = False # Default to False
+
+    # --- Preprocessing for Invalid Suggestion (for default checkbox state) ---
+    try:
+        # Create a temporary structure for suggestion function
+        temp_suggest_df = temp_df.copy()
+        temp_suggest_df['Subject'] = subject
+        # Basic time pressure guess for suggestion (actual pressure calculated later)
+        time_col_name = 'Response Time (Minutes)'
+        pressure_guess = False
+        if time_col_name in temp_suggest_df.columns:
+            times = pd.to_numeric(temp_suggest_df[time_col_name], errors='coerce').dropna()
+            if len(times) > 1:
+                 # Use a simple threshold diff for the *guess*
+                 diff_threshold = 3.0 # Default threshold
+                 if subject == 'Q': diff_threshold = 3.0
+                 elif subject == 'DI': diff_threshold = 3.0
+                 elif subject == 'V': diff_threshold = 3.0
+                 pressure_guess = (times.max() - times.min()) > diff_threshold
+
+        temp_pressure_map = {subject: pressure_guess}
+
+        # Rename required columns for suggestion function
+        temp_rename_map = {}
+        if time_col_name in temp_suggest_df.columns: temp_rename_map[time_col_name] = 'question_time'
+        question_col = '\ufeffQuestion' if '\ufeffQuestion' in temp_suggest_df.columns else 'Question'
+        if question_col in temp_suggest_df.columns: temp_rename_map[question_col] = 'question_position'
+        if 'Performance' in temp_suggest_df.columns: temp_rename_map['Performance'] = 'is_correct' # Need correct format for suggest
+
+        # Apply temporary renames if needed
+        if temp_rename_map:
+            temp_suggest_df.rename(columns=temp_rename_map, inplace=True)
+            # Convert 'is_correct' column format if it exists after renaming
+            if 'is_correct' in temp_suggest_df.columns:
+               temp_suggest_df['is_correct'] = temp_suggest_df['is_correct'].apply(lambda x: True if str(x).strip().lower() == 'correct' else False)
+
+
+        # Call suggestion function IF necessary columns are present
+        suggest_cols_present = all(c in temp_suggest_df.columns for c in ['question_time', 'question_position', 'is_correct'])
+        if suggest_cols_present:
+            processed_suggest_df = _suggest_invalid_questions(temp_suggest_df, temp_pressure_map)
+            # Update the manual invalid flag based on suggestion
+            if 'is_auto_suggested_invalid' in processed_suggest_df.columns:
+                # 使用替代方法處理NaN值，避免FutureWarning
+                temp_df['is_manually_invalid'] = processed_suggest_df['is_auto_suggested_invalid'].reindex(temp_df.index).replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False)
+        else:
+             messages.append(("caption", "無法自動建議無效題目，缺少必要欄位(時間, 題號, 正確性)。請手動勾選。", {}))
+
+
+    except Exception as suggest_err:
+        messages.append(("warning", f"自動檢測無效題目時出錯，請手動檢查: {suggest_err}", {"icon": "⚠️"}))
+
+    return temp_df, messages, []
+
+
+@st.cache_data(max_entries=INPUT_CACHE_MAX_ENTRIES, show_spinner=False)
+def _validate_edited_frame(edited_df, subject, _validate_dataframe):
+    """
+    Validates (and auto-corrects) the edited DataFrame, cached on its content.
+
+    Returns:
+        (corrected copy of the DataFrame, validation errors, warnings)
+    """
+    df_to_validate = edited_df.copy()
+    validation_errors, warnings = _validate_dataframe(df_to_validate, subject) # _validate_dataframe modifies df_to_validate in place for corrections
+    return df_to_validate, validation_errors, warnings
+
 def process_subject_tab(subject, tab_container, base_rename_map, max_file_size_bytes, suggest_invalid_questions, validate_dataframe, required_original_cols):
     """Handles data input, cleaning, validation, and standardization for a subject tab."""
     subject_key = subject.lower()
@@ -135,99 +198,19 @@ def process_subject_tab(subject, tab_container, base_rename_map, max_file_size_b
             tab_container.error(f"檔案大小 ({uploaded_file.size / (1024*1024):.2f} MB) 超過 {max_file_size_bytes // (1024*1024)}MB 限制。")
             return None, 'File Upload', [] # Return error state
         else:
-            source = uploaded_file
+            source = uploaded_file.getvalue()
             data_source_type = 'File Upload'
     elif pasted_data:
-        source = io.StringIO(pasted_data) # Use io.StringIO
+        source = pasted_data
         data_source_type = 'Pasted Data'
 
     if source is not None:
         try:
-            # Read data, attempt flexible separator detection
-            temp_df = pd.read_csv(source, sep=None, engine='python', skip_blank_lines=True)
-
-            if temp_df.empty: # Check if df is empty immediately after read
-                tab_container.warning("讀取的資料為空或格式不正確。")
-                return None, data_source_type, ["Empty or invalid data format after read."]
-
-            # ---> 新增：標準化欄位標頭 <---
-            if temp_df is not None and not temp_df.empty:
-                temp_df, header_warnings = normalize_and_rename_headers(temp_df.copy(), subject, required_original_cols, tab_container) # Pass a copy
-                for warning_msg in header_warnings:
-                    tab_container.warning(warning_msg, icon="⚠️")
-            # ---> 結束新增 <---
-
-            # --- Initial Cleaning & Prep ---
-            initial_rows, initial_cols = temp_df.shape
-            # Drop *_b columns silently
-            cols_to_drop = [col for col in temp_df.columns if str(col).endswith('_b')]
-            if cols_to_drop:
-                temp_df.drop(columns=cols_to_drop, inplace=True, errors='ignore')
-
-            # Drop fully empty rows/columns
-            temp_df.dropna(how='all', axis=0, inplace=True)
-            temp_df.dropna(how='all', axis=1, inplace=True)
-            temp_df.reset_index(drop=True, inplace=True)
-            cleaned_rows, cleaned_cols = temp_df.shape
-            if initial_rows > cleaned_rows or initial_cols > cleaned_cols:
-                 tab_container.caption(f"已自動移除 {initial_rows - cleaned_rows} 個空行和 {initial_cols - cleaned_cols} 個空列。")
-
-            if temp_df.empty:
-                 tab_container.warning("讀取的資料在清理空行/空列後為空。")
-                 return None, data_source_type, []
-
-            # Add manual invalid column *before* editor
-            temp_df['is_manually_invalid'] = False # Default to False
-
-            # --- Preprocessing for Invalid Suggestion (for default checkbox state) ---
-            try:
-                # Create a temporary structure for suggestion function
-                temp_suggest_df = temp_df.copy()
-                temp_suggest_df['Subject'] = subject
-                # Basic time pressure guess for suggestion (actual pressure calculated later)
-                time_col_name = 'Response Time (Minutes)'
-                pressure_guess = False
-                if time_col_name in temp_suggest_df.columns:
-                    times = pd.to_numeric(temp_suggest_df[time_col_name], errors='coerce').dropna()
-                    if len(times) > 1:
-                         # Use a simple threshold diff for the *guess*
-                         diff_threshold = 3.0 # Default threshold
-                         if subject == 'Q': diff_threshold = 3.0
-                         elif subject == 'DI': diff_threshold = 3.0
-                         elif subject == 'V': diff_threshold = 3.0
-                         pressure_guess = (times.max() - times.min()) > diff_threshold
-
-                temp_pressure_map = {subject: pressure_guess}
-
-                # Rename required columns for suggestion function
-                temp_rename_map = {}
-                if time_col_name in temp_suggest_df.columns: temp_rename_map[time_col_name] = 'question_time'
-                question_col = '\ufeffQuestion' if '\ufeffQuestion' in temp_suggest_df.columns else 'Question'
-                if question_col in temp_suggest_df.columns: temp_rename_map[question_col] = 'question_position'
-                if 'Performance' in temp_suggest_df.columns: temp_rename_map['Performance'] = 'is_correct' # Need correct format for suggest
-
-                # Apply temporary renames if needed
-                if temp_rename_map:
-                    temp_suggest_df.rename(columns=temp_rename_map, inplace=True)
-                    # Convert 'is_correct' column format if it exists after renaming
-                    if 'is_correct' in temp_suggest_df.columns:
-                       temp_suggest_df['is_correct'] = temp_suggest_df['is_correct'].apply(lambda x: True if str(x).strip().lower() == 'correct' else False)
-
-
-                # Call suggestion function IF necessary columns are present
-                suggest_cols_present = all(c in temp_suggest_df.columns for c in ['question_time', 'question_position', 'is_correct'])
-                if suggest_cols_present:
-                    processed_suggest_df = suggest_invalid_questions(temp_suggest_df, temp_pressure_map)
-                    # Update the manual invalid flag based on suggestion
-                    if 'is_auto_suggested_invalid' in processed_suggest_df.columns:
-                        # 使用替代方法處理NaN值，避免FutureWarning
-                        temp_df['is_manually_invalid'] = processed_suggest_df['is_auto_suggested_invalid'].reindex(temp_df.index).replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False)
-                else:
-                     tab_container.caption("無法自動建議無效題目，缺少必要欄位(時間, 題號, 正確性)。請手動勾選。")
-
-
-            except Exception as suggest_err:
-                tab_container.warning(f"自動檢測無效題目時出錯，請手動檢查: {suggest_err}", icon="⚠️")
+            temp_df, messages, prepare_errors = _prepare_input_frame(source, subject, required_original_cols, suggest_invalid_questions)
+            for method, message, kwargs in messages:
+                getattr(tab_container, method)(message, **kwargs)
+            if temp_df is None:
+                return None, data_source_type, prepare_errors
 
             # --- Editable Preview ---
             tab_container.write("預覽與編輯資料 (修改後請確保欄位符合要求)：")
@@ -253,9 +236,8 @@ def process_subject_tab(subject, tab_container, base_rename_map, max_file_size_b
             )
 
             # --- Post-Edit Validation ---
-            # Create a fresh copy for validation to avoid modifying editor's state directly if validation fails mid-way
-            df_to_validate = edited_df.copy()
-            validation_errors, warnings = validate_dataframe(df_to_validate, subject) # validate_dataframe now modifies df_to_validate in place for corrections
+            # Validated on a fresh copy to avoid modifying editor's state directly if validation fails mid-way
+            df_to_validate, validation_errors, warnings = _validate_edited_frame(edited_df, subject, validate_dataframe)
 
             if validation_errors:
                 tab_container.error(f"{subject} 科目: 發現以下輸入錯誤，請修正：")
@@ -0,0 +1,264 @@
+"""
+Memoized header-mapping resolver for uploaded CSV files.
+
+``resolve_header_mapping`` decides how the incoming column names of a subject
+are renamed to the expected column names:
+
+1. Exact match, 2. case-insensitive match, 3. fuzzy match (thefuzz WRatio >= 85).
+
+Score-report exports repeat the same header sets constantly, so the result is
+memoized per (subject, expected columns, incoming columns). Accepted fuzzy
+matches are also recorded in a persistent alias table (a JSON file in the
+app's cache directory), so a header variant seen once maps instantly in later
+sessions and in other header sets; thefuzz is only imported and run when
+neither the memo nor the alias table has an answer.
+"""
+
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from gmat_diagnosis_app.services.storage.file_lock import FileLock
+
+# Environment variable overriding the location of the learned alias table
+HEADER_ALIAS_FILE_ENV = "GMAT_HEADER_ALIAS_FILE"
+
+DEFAULT_ALIAS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".cache", "header_aliases.json"
+)
+
+FUZZY_MATCH_THRESHOLD = 85
+MAX_CACHED_HEADER_SETS = 256
+# Learned aliases kept per expected column; the least recently learned are dropped first
+MAX_ALIASES_PER_COLUMN = 32
+
+# The 'Question' column as written by exports that keep the UTF-8 BOM
+BOM_QUESTION_COL = '\\ufeffQuestion'
+
+
+class HeaderResolver:
+    """
+    Resolves (and memoizes) header rename maps, learning fuzzy matches as aliases.
+
+    Args:
+        alias_path: JSON file holding the learned aliases, or None to keep them in memory only
+        max_cached: number of distinct header sets kept in the memo
+    """
+
+    def __init__(self, alias_path: Optional[str] = None, max_cached: int = MAX_CACHED_HEADER_SETS):
+        self.alias_path = alias_path
+        self.max_cached = max_cached
+        self._lock = threading.Lock()
+        self._memo = OrderedDict()
+        # Learned alias table of accepted fuzzy matches:
+        # {expected column: {incoming header: WRatio score}}, least recently learned first
+        self._aliases = None
+        self._stats = {"hits": 0, "misses": 0, "alias_hits": 0, "fuzzy_lookups": 0}
+
+    def resolve(self, subject_key: str, expected_cols: Sequence[str],
+                actual_columns: Sequence[str]) -> Tuple[Dict[str, str], List[str]]:
+        """
+        Returns:
+            (rename map {incoming column: expected column}, list of warning messages)
+        """
+        key = (subject_key, tuple(expected_cols), tuple(actual_columns))
+        with self._lock:
+            cached = self._memo.get(key)
+            if cached is not None:
+                self._memo.move_to_end(key)
+                self._stats["hits"] += 1
+                return dict(cached[0]), list(cached[1])
+            self._stats["misses"] += 1
+
+        rename_map, warnings = self._compute(key[1], key[2])
+
+        with self._lock:
+            self._memo[key] = (dict(rename_map), tuple(warnings))
+            while len(self._memo) > self.max_cached:
+                self._memo.popitem(last=False)
+        return rename_map, warnings
+
+    def _compute(self, expected_cols, actual_columns):
+        warnings = []
+        rename_map = {}
+        # Incoming column names already mapped to an expected column, so one
+        # incoming column is never used for several expected columns
+        mapped_user_columns = set()
+
+        for expected_col in expected_cols:
+            # The BOM version of 'Question' takes priority over any other candidate
+            if expected_col == 'Question' and BOM_QUESTION_COL in actual_columns:
+                if BOM_QUESTION_COL not in mapped_user_columns:
+                    rename_map[BOM_QUESTION_COL] = 'Question'
+                    mapped_user_columns.add(BOM_QUESTION_COL)
+                    continue
+
+            available_actual_cols = [col for col in actual_columns if col not in mapped_user_columns]
+            available_actual_cols_lower_map = {col.lower().strip(): col for col in available_actual_cols}
+            expected_col_lower = expected_col.lower().strip()
+            matched_actual_col = None
+
+            # 1. Exact match among available columns
+            if expected_col in available_actual_cols:
+                matched_actual_col = expected_col
+
+            # 2. Case-insensitive match among available columns
+            elif expected_col_lower in available_actual_cols_lower_map:
+                matched_actual_col = available_actual_cols_lower_map[expected_col_lower]
+                if matched_actual_col != expected_col:
+                    warnings.append(f"欄位自動匹配：輸入欄位 '{matched_actual_col}' 已通過忽略大小寫匹配至標準欄位 '{expected_col}'。")
+
+            # 3. Fuzzy match, answered from the learned similarity scores when possible
+            elif available_actual_cols:
+                best_match_tuple = self._best_match(expected_col, available_actual_cols)
+                if best_match_tuple and best_match_tuple[1] >= FUZZY_MATCH_THRESHOLD:
+                    matched_actual_col = best_match_tuple[0]
+                    warnings.append(f"欄位模糊匹配：輸入欄位 '{matched_actual_col}' 已通過模糊匹配（相似度 {best_match_tuple[1]}%）至標準欄位 '{expected_col}'。")
+
+            if matched_actual_col:
+                if matched_actual_col != expected_col:
+                    rename_map[matched_actual_col] = expected_col
+                mapped_user_columns.add(matched_actual_col)
+
+        return rename_map, warnings
+
+    def _best_match(self, expected_col, available_actual_cols):
+        """
+        Returns (incoming column, score) like thefuzz extractOne(expected_col,
+        available_actual_cols, scorer=WRatio).
+
+        A header previously accepted as a fuzzy match for ``expected_col`` is
+        reused without scoring; if several learned aliases are present, the one
+        with the highest unique score wins and a tie falls back to extractOne.
+        """
+        with self._lock:
+            if self._aliases is None:
+                self._aliases = self._load_aliases()
+            known = self._aliases.get(expected_col, {})
+            candidates = [(col, known[col]) for col in available_actual_cols if col in known]
+        if candidates:
+            best_score = max(score for _, score in candidates)
+            best = [col for col, score in candidates if score == best_score]
+            if len(best) == 1:
+                with self._lock:
+                    self._stats["alias_hits"] += 1
+                return best[0], best_score
+
+        # Imported lazily: most uploads resolve without ever needing thefuzz
+        from thefuzz import process as fuzz_process
+        from thefuzz import fuzz
+
+        with self._lock:
+            self._stats["fuzzy_lookups"] += 1
+        best_match_tuple = fuzz_process.extractOne(expected_col, available_actual_cols, scorer=fuzz.WRatio)
+        if best_match_tuple and best_match_tuple[1] >= FUZZY_MATCH_THRESHOLD:
+            self._learn_alias(expected_col, best_match_tuple[0], best_match_tuple[1])
+        return best_match_tuple
+
+    def _load_aliases(self):
+        if not self.alias_path or not os.path.exists(self.alias_path):
+            return {}
+        try:
+            with open(self.alias_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Error loading header alias table: {e}")
+            return {}
+        if not isinstance(data, dict):
+            return {}
+        # Drop anything that is not an accepted match (e.g. tables of older versions)
+        return {
+            expected_col: {
+                col: score for col, score in scores.items()
+                if isinstance(score, (int, float)) and score >= FUZZY_MATCH_THRESHOLD
+            }
+            for expected_col, scores in data.items() if isinstance(scores, dict)
+        }
+
+    def _learn_alias(self, expected_col, actual_col, score):
+        with self._lock:
+            expected_scores = self._aliases.setdefault(expected_col, {})
+            expected_scores.pop(actual_col, None)
+            expected_scores[actual_col] = score
+            self._save_aliases(learned={expected_col: {actual_col: score}})
+
+    @staticmethod
+    def _cap(expected_scores):
+        while len(expected_scores) > MAX_ALIASES_PER_COLUMN:
+            del expected_scores[next(iter(expected_scores))]
+
+    def _save_aliases(self, learned=None):
+        """
+        Writes the alias table. With ``learned`` ({expected column: {incoming header: score}}),
+        the table on disk is re-read under the file lock and the new aliases are merged
+        into it, so aliases learned by other processes are kept; without it the table
+        in memory replaces the file.
+        """
+        for expected_scores in self._aliases.values():
+            self._cap(expected_scores)
+        if not self.alias_path:
+            return
+        try:
+            directory = os.path.dirname(self.alias_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with FileLock(self.alias_path).exclusive():
+                if learned is not None:
+                    merged = self._load_aliases()
+                    for expected_col, scores in learned.items():
+                        expected_scores = merged.setdefault(expected_col, {})
+                        for col, score in scores.items():
+                            expected_scores.pop(col, None)
+                            expected_scores[col] = score
+                        self._cap(expected_scores)
+                    self._aliases = merged
+                # Write to a temporary file first so a crash never leaves a truncated table
+                tmp_path = f"{self.alias_path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(self._aliases, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_path, self.alias_path)
+        except OSError as e:
+            print(f"Error saving header alias table: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        """Returns memo hit / miss counts, alias hits, fuzzy lookups and table sizes."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["cached_header_sets"] = len(self._memo)
+            stats["learned_aliases"] = sum(len(scores) for scores in (self._aliases or {}).values())
+        return stats
+
+    def clear(self, forget_aliases: bool = False):
+        """Empties the memo (and the learned alias table if ``forget_aliases``) and resets the stats."""
+        with self._lock:
+            self._memo.clear()
+            self._stats = dict.fromkeys(self._stats, 0)
+            if forget_aliases:
+                self._aliases = {}
+                self._save_aliases()
+
+
+_resolver = HeaderResolver(os.environ.get(HEADER_ALIAS_FILE_ENV, DEFAULT_ALIAS_FILE))
+
+
+def get_header_resolver() -> HeaderResolver:
+    """Returns the process-wide resolver used by normalize_and_rename_headers."""
+    return _resolver
+
+
+def resolve_header_mapping(subject_key: str, expected_cols: Sequence[str],
+                           actual_columns: Sequence[str]) -> Tuple[Dict[str, str], List[str]]:
+    """
+    Resolve the rename map for one uploaded header set with the process-wide resolver.
+
+    Returns:
+        (rename map {incoming column: expected column}, list of warning messages)
+    """
+    return _resolver.resolve(subject_key, expected_cols, actual_columns)
+
+
+def get_header_resolver_stats() -> Dict[str, int]:
+    """Returns the hit statistics of the process-wide resolver."""
+    return _resolver.stats()
@@ -0,0 +1,371 @@
+"""
+Pluggable storage backends for the API rate limiter.
+
+Every backend implements the same two primitives:
+
+- ``hit_daily``: the daily call counter used by ``check_rate_limit``
+  (count resets when the calendar day changes).
+- ``take_token``: token-bucket semantics for burst limiting
+  (``capacity`` tokens, refilled continuously at ``refill_per_second``).
+
+Backends:
+
+- ``InMemoryRateLimitBackend``: process-local dict protected by a lock.
+- ``SQLiteRateLimitBackend``: a SQLite file shared by every process on one host.
+  Updates run inside ``BEGIN IMMEDIATE`` transactions with atomic upserts.
+- ``RedisRateLimitBackend``: any Redis-protocol server, shared by every replica.
+  Accepts an injected client so it can run against a local stand-in.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Environment variables used by create_rate_limit_backend()
+RATE_LIMIT_BACKEND_ENV = "RATE_LIMIT_BACKEND"            # memory | sqlite | redis
+RATE_LIMIT_SQLITE_PATH_ENV = "RATE_LIMIT_SQLITE_PATH"
+RATE_LIMIT_REDIS_URL_ENV = "RATE_LIMIT_REDIS_URL"
+
+DEFAULT_SQLITE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rate_limits.sqlite3"
+)
+DEFAULT_REDIS_URL = "redis://localhost:6379/0"
+REDIS_KEY_PREFIX = "gmat_rate_limit"
+
+
+class RateLimitBackend:
+    """Base class for rate-limit stores."""
+
+    def hit_daily(self, key: str, day: str, limit: int) -> bool:
+        """
+        Register one call for ``key`` on ``day`` if the daily limit allows it.
+
+        Args:
+            key: Identifier being limited (usually the client IP).
+            day: ISO date string of the current day; a new value resets the count.
+            limit: Maximum number of calls per day.
+
+        Returns:
+            True if the call is allowed (and counted), False if the limit is reached.
+        """
+        raise NotImplementedError
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> bool:
+        """
+        Try to take ``cost`` tokens from the bucket of ``key``.
+
+        A new bucket starts full. Tokens refill continuously at
+        ``refill_per_second`` up to ``capacity``.
+
+        Returns:
+            True if enough tokens were available (and were taken), False otherwise.
+        """
+        raise NotImplementedError
+
+    def get_daily_count(self, key: str, day: str) -> int:
+        """Return the number of calls counted for ``key`` on ``day``."""
+        raise NotImplementedError
+
+    def reset(self, key: Optional[str] = None) -> None:
+        """Clear stored state for ``key``, or for every key if ``key`` is None."""
+        raise NotImplementedError
+
+
+def _refill_bucket(tokens: float, updated_at: float, now: float, capacity: float, refill_per_second: float) -> float:
+    """Return the token count after refilling from ``updated_at`` to ``now``."""
+    elapsed = max(0.0, now - updated_at)
+    return min(float(capacity), tokens + elapsed * refill_per_second)
+
+
+class InMemoryRateLimitBackend(RateLimitBackend):
+    """
+    Process-local backend. Counts are not shared between workers or replicas.
+
+    ``store`` keeps the historical ``{ip: {"count": int, "last_reset_date": day}}``
+    layout so existing callers inspecting ``RATE_LIMIT_DATA`` keep working.
+    """
+
+    def __init__(self, store: Optional[Dict[str, Dict[str, Any]]] = None):
+        self.store = store if store is not None else {}
+        self.buckets: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def hit_daily(self, key: str, day: str, limit: int) -> bool:
+        with self._lock:
+            entry = self.store.get(key)
+            if entry is None or entry["last_reset_date"] != day:
+                entry = {"count": 0, "last_reset_date": day}
+                self.store[key] = entry
+            if entry["count"] >= limit:
+                return False
+            entry["count"] += 1
+            return True
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> bool:
+        now = time.time()
+        with self._lock:
+            bucket = self.buckets.get(key)
+            tokens = float(capacity) if bucket is None else _refill_bucket(
+                bucket["tokens"], bucket["updated_at"], now, capacity, refill_per_second
+            )
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self.buckets[key] = {"tokens": tokens, "updated_at": now}
+            return allowed
+
+    def get_daily_count(self, key: str, day: str) -> int:
+        with self._lock:
+            entry = self.store.get(key)
+            if entry is None or entry["last_reset_date"] != day:
+                return 0
+            return entry["count"]
+
+    def reset(self, key: Optional[str] = None) -> None:
+        with self._lock:
+            if key is None:
+                self.store.clear()
+                self.buckets.clear()
+            else:
+                self.store.pop(key, None)
+                self.buckets.pop(key, None)
+
+
+class SQLiteRateLimitBackend(RateLimitBackend):
+    """
+    Host-wide backend stored in a SQLite file.
+
+    Each operation opens its own connection (safe across Streamlit threads) and
+    runs in a ``BEGIN IMMEDIATE`` transaction, so concurrent processes serialise
+    on the database write lock instead of overwriting each other's counts.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_SQLITE_PATH, timeout: float = 5.0):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        # isolation_level=None: transactions are managed explicitly with BEGIN IMMEDIATE
+        conn = sqlite3.connect(self.db_path, timeout=self.timeout, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _init_schema(self) -> None:
+        conn = self._connect()
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_daily ("
+                "key TEXT PRIMARY KEY, day TEXT NOT NULL, count INTEGER NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS rate_limit_buckets ("
+                "key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+        finally:
+            conn.close()
+
+    def hit_daily(self, key: str, day: str, limit: int) -> bool:
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            # Create the row, or reset it when the stored day is stale
+            conn.execute(
+                "INSERT INTO rate_limit_daily (key, day, count) VALUES (?, ?, 0) "
+                "ON CONFLICT(key) DO UPDATE SET day = excluded.day, count = 0 "
+                "WHERE rate_limit_daily.day != excluded.day",
+                (key, day),
+            )
+            cursor = conn.execute(
+                "UPDATE rate_limit_daily SET count = count + 1 WHERE key = ? AND count < ?",
+                (key, limit),
+            )
+            allowed = cursor.rowcount == 1
+            conn.execute("COMMIT")
+            return allowed
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?", (key,)
+            ).fetchone()
+            tokens = float(capacity) if row is None else _refill_bucket(
+                row[0], row[1], now, capacity, refill_per_second
+            )
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            conn.execute(
+                "INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+            return allowed
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get_daily_count(self, key: str, day: str) -> int:
+        conn = self._connect()
+        try:
+            row = conn.execute(
+                "SELECT count FROM rate_limit_daily WHERE key = ? AND day = ?", (key, day)
+            ).fetchone()
+            return int(row[0]) if row else 0
+        finally:
+            conn.close()
+
+    def reset(self, key: Optional[str] = None) -> None:
+        conn = self._connect()
+        try:
+            for table in ("rate_limit_daily", "rate_limit_buckets"):
+                if key is None:
+                    conn.execute(f"DELETE FROM {table}")
+                else:
+                    conn.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+        finally:
+            conn.close()
+
+
+# Token bucket update executed atomically on the Redis server.
+# KEYS[1] = bucket hash; ARGV = capacity, refill_per_second, cost, now, ttl_seconds
+# Both scripts run atomically on the server. The bucket reads the server clock
+# (TIME), so replicas with skewed clocks share one refill rate.
+_REDIS_TOKEN_BUCKET_SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local server_time = redis.call('TIME')
+local now = tonumber(server_time[1]) + tonumber(server_time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1])
+local updated_at = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+end
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], tonumber(ARGV[4]))
+return allowed
+"""
+
+# The expiry is set in the same script as the first increment, so a crash
+# cannot leave a daily counter without one.
+_REDIS_DAILY_COUNTER_SCRIPT = """
+local count = redis.call('INCR', KEYS[1])
+if count == 1 then
+    redis.call('EXPIRE', KEYS[1], tonumber(ARGV[2]))
+end
+if count > tonumber(ARGV[1]) then
+    redis.call('DECR', KEYS[1])
+    return 0
+end
+return 1
+"""
+
+
+class RedisRateLimitBackend(RateLimitBackend):
+    """
+    Backend for any Redis-protocol server, shared across hosts and replicas.
+
+    Pass ``client`` to inject a connection (any object exposing the redis-py
+    ``get``/``eval``/``delete``/``scan_iter`` methods,
+    e.g. a local stand-in server client). Otherwise ``redis`` is imported lazily
+    and a client is created from ``url``.
+    """
+
+    DAILY_KEY_TTL_SECONDS = 2 * 24 * 3600
+
+    def __init__(self, client: Any = None, url: str = DEFAULT_REDIS_URL, key_prefix: str = REDIS_KEY_PREFIX):
+        if client is None:
+            try:
+                import redis  # Optional dependency, only needed for this backend
+            except ImportError as e:
+                raise ImportError(
+                    "RedisRateLimitBackend requires the 'redis' package (pip install redis)."
+                ) from e
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.key_prefix = key_prefix
+
+    def _daily_key(self, key: str, day: str) -> str:
+        return f"{self.key_prefix}:daily:{key}:{day}"
+
+    def _bucket_key(self, key: str) -> str:
+        return f"{self.key_prefix}:bucket:{key}"
+
+    def hit_daily(self, key: str, day: str, limit: int) -> bool:
+        # The day is part of the key, so expiry only garbage-collects old days.
+        # Over-limit increments are undone so the stored count stays at the limit.
+        allowed = self.client.eval(
+            _REDIS_DAILY_COUNTER_SCRIPT, 1, self._daily_key(key, day),
+            limit, self.DAILY_KEY_TTL_SECONDS,
+        )
+        return int(allowed) == 1
+
+    def take_token(self, key: str, capacity: float, refill_per_second: float, cost: float = 1.0) -> bool:
+        # Keep idle buckets around only as long as it takes them to refill completely
+        ttl_seconds = int(capacity / refill_per_second) + 60 if refill_per_second > 0 else self.DAILY_KEY_TTL_SECONDS
+        allowed = self.client.eval(
+            _REDIS_TOKEN_BUCKET_SCRIPT, 1, self._bucket_key(key),
+            capacity, refill_per_second, cost, ttl_seconds,
+        )
+        return int(allowed) == 1
+
+    def get_daily_count(self, key: str, day: str) -> int:
+        value = self.client.get(self._daily_key(key, day))
+        return int(value) if value is not None else 0
+
+    def reset(self, key: Optional[str] = None) -> None:
+        if key is None:
+            keys = list(self.client.scan_iter(match=f"{self.key_prefix}:*"))
+        else:
+            keys = list(self.client.scan_iter(match=f"{self.key_prefix}:daily:{key}:*"))
+            keys.append(self._bucket_key(key))
+        if keys:
+            self.client.delete(*keys)
+
+
+def create_rate_limit_backend(kind: Optional[str] = None, **kwargs) -> RateLimitBackend:
+    """
+    Create a backend by name, defaulting to the ``RATE_LIMIT_BACKEND`` env variable.
+
+    Args:
+        kind: 'memory', 'sqlite' or 'redis'. Defaults to the environment, then 'memory'.
+        **kwargs: Passed to the backend constructor.
+    """
+    kind = (kind or os.environ.get(RATE_LIMIT_BACKEND_ENV) or "memory").strip().lower()
+    if kind == "memory":
+        return InMemoryRateLimitBackend(**kwargs)
+    if kind == "sqlite":
+        kwargs.setdefault("db_path", os.environ.get(RATE_LIMIT_SQLITE_PATH_ENV, DEFAULT_SQLITE_PATH))
+        return SQLiteRateLimitBackend(**kwargs)
+    if kind == "redis":
+        kwargs.setdefault("url", os.environ.get(RATE_LIMIT_REDIS_URL_ENV, DEFAULT_REDIS_URL))
+        return RedisRateLimitBackend(**kwargs)
+    raise ValueError(f"Unknown rate limit backend: {kind!r} (expected 'memory', 'sqlite' or 'redis')")
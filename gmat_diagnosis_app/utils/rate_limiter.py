@@ -2,15 +2,58 @@ import streamlit as st
 from streamlit.runtime.scriptrunner import get_script_run_ctx
 # from streamlit.web.server.server import Server # Potential alternative if get_script_run_ctx is too fragile or removed
 import datetime
+import logging
+import os
+import threading
 
-# This dictionary will store IP addresses and their request counts and last reset date.
-# In a production environment with multiple workers/instances, a more robust shared store
-# like Redis or a database would be necessary. For a single-instance Streamlit app,
-# a global dictionary can work for simplicity, but be aware of potential concurrency issues
-# if Streamlit's threading model becomes complex.
+from .rate_limit_backends import (
+    RateLimitBackend,
+    InMemoryRateLimitBackend,
+    create_rate_limit_backend,
+    RATE_LIMIT_BACKEND_ENV,
+)
+
+logger = logging.getLogger(__name__)
+
+# Store used by the in-process backend: {ip: {"count": int, "last_reset_date": "YYYY-MM-DD"}}.
+# Counts here are per process. Multi-worker / multi-replica deployments should set
+# RATE_LIMIT_BACKEND=sqlite (one host) or RATE_LIMIT_BACKEND=redis (several hosts)
+# so that every worker shares the same counts. See utils/rate_limit_backends.py.
 RATE_LIMIT_DATA = {}
 DAILY_LIMIT = 20 # Daily limit per IP
 
+# Optional token-bucket burst limit, applied on top of the daily counter.
+# Disabled unless RATE_LIMIT_BURST_CAPACITY is set (e.g. 5 calls, refilled at 2 per minute).
+BURST_CAPACITY = float(os.environ.get("RATE_LIMIT_BURST_CAPACITY", "0") or 0)
+BURST_REFILL_PER_MINUTE = float(os.environ.get("RATE_LIMIT_BURST_REFILL_PER_MINUTE", "1") or 1)
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_rate_limit_backend() -> RateLimitBackend:
+    """
+    Returns the process-wide rate limit backend, creating it on first use.
+    The backend type comes from the RATE_LIMIT_BACKEND environment variable (default: memory).
+    """
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                if (os.environ.get(RATE_LIMIT_BACKEND_ENV) or "memory").strip().lower() == "memory":
+                    _backend = InMemoryRateLimitBackend(store=RATE_LIMIT_DATA)
+                else:
+                    _backend = create_rate_limit_backend()
+    return _backend
+
+
+def set_rate_limit_backend(backend: RateLimitBackend) -> None:
+    """Replaces the process-wide rate limit backend (e.g. with a shared SQLite/Redis store)."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
 def get_client_ip():
     """
     Tries to get the client's IP address.
@@ -60,7 +103,8 @@ def get_client_ip():
 def check_rate_limit(ip_address: str) -> bool:
     """
     Checks if the given IP address has exceeded the daily API call limit.
-    Resets the count daily.
+    Resets the count daily. Counts are kept in the configured backend
+    (see get_rate_limit_backend), so they can be shared between workers.
 
     Args:
         ip_address: The IP address to check.
@@ -72,26 +116,21 @@ def check_rate_limit(ip_address: str) -> bool:
         st.warning("IP 位址未知，無法執行速率限制。為安全起見，此次請求將被拒絕。")
         return False # Changed to False for safety if IP is unknown
 
-    today = datetime.date.today()
-    
-    if ip_address not in RATE_LIMIT_DATA:
-        RATE_LIMIT_DATA[ip_address] = {"count": 1, "last_reset_date": today}
-        return True
-    
-    ip_data = RATE_LIMIT_DATA[ip_address]
-    
-    if ip_data["last_reset_date"] != today:
-        # Reset for the new day
-        ip_data["count"] = 1
-        ip_data["last_reset_date"] = today
-        return True
-    
-    if ip_data["count"] >= DAILY_LIMIT:
-        # st.error(f"IP: {ip_address} 已達到每日 {DAILY_LIMIT} 次的 API 呼叫上限。") # Message displayed by calling function
-        return False # Limit exceeded
-    
-    ip_data["count"] += 1
-    return True
+    today = datetime.date.today().isoformat()
+    backend = get_rate_limit_backend()
+
+    try:
+        # Burst limit first, so a request rejected for bursting does not use up the daily quota
+        if BURST_CAPACITY > 0 and not backend.take_token(
+            ip_address, BURST_CAPACITY, BURST_REFILL_PER_MINUTE / 60.0
+        ):
+            return False
+
+        return backend.hit_daily(ip_address, today, DAILY_LIMIT)
+    except Exception as e:
+        # Fail closed: if the shared store is unreachable we cannot enforce the limit
+        logger.error(f"Rate limit backend error for {ip_address}: {repr(e)}")
+        return False
 
 # Example usage (for testing this file directly):
 # if __name__ == "__main__":
@@ -117,7 +156,7 @@ def check_rate_limit(ip_address: str) -> bool:
 #     print("\\nSimulating next day for {test_ip_known}...")
 #     if test_ip_known in RATE_LIMIT_DATA:
 #         # Manually "age" the entry to simulate a new day
-#         RATE_LIMIT_DATA[test_ip_known]["last_reset_date"] = datetime.date.today() - datetime.timedelta(days=1)
+#         RATE_LIMIT_DATA[test_ip_known]["last_reset_date"] = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
 #         print(f"Manually set last_reset_date for {test_ip_known} to yesterday.")
 #         allowed = check_rate_limit(test_ip_known)
 #         current_count = RATE_LIMIT_DATA.get(test_ip_known, {}).get('count', 0)
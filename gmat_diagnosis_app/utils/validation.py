@@ -4,19 +4,166 @@
 """
 
 import re
+from functools import lru_cache
+
+import numpy as np
 import pandas as pd
 from gmat_diagnosis_app.constants.validation_rules import (
     VALIDATION_RULES
 )
 from gmat_diagnosis_app.constants.config import REQUIRED_ORIGINAL_COLS
-from thefuzz import process, fuzz # Changed from fuzzywuzzy to thefuzz
 
 def preprocess_skill(skill):
     """Lowercase, strip, collapse spaces for skill matching."""
     return re.sub(r'\s+', ' ', str(skill).strip()).lower()
 
+def _parse_floats(values):
+    """
+    Parses stripped strings like float() would.
+    pd.to_numeric handles the common cases; the values it rejects are retried
+    with float() once per distinct value (e.g. '1_000', 'nan').
+
+    Returns:
+        (float array with NaN for unparsable values, mask of values float() accepts)
+    """
+    numbers = pd.to_numeric(values, errors='coerce').astype(float)
+    parsed = numbers.notna()
+    for value in values[~parsed].unique():
+        try:
+            number = float(value)
+        except (ValueError, TypeError):
+            continue
+        hits = values == value
+        numbers[hits] = number
+        parsed[hits] = True
+    return numbers.to_numpy(dtype=float), parsed.to_numpy()
+
+
+def _fuzzy_best_match(value, choices, scorer_name):
+    """
+    Best fuzzy match of value among choices with the named thefuzz scorer.
+    thefuzz is imported lazily: it is only needed for values outside the allowed lists.
+
+    Returns:
+        (match, score), or (None, 0) when there are no choices
+    """
+    if not choices:
+        return None, 0
+    from thefuzz import process, fuzz
+    return process.extractOne(value, choices, scorer=getattr(fuzz, scorer_name))
+
+
+def _check_type(values, rule_type):
+    """Returns the mask of valid values for a 'type' rule (values are stripped strings)."""
+    numbers, parsed = _parse_floats(values)
+    with np.errstate(invalid='ignore'):
+        if rule_type == 'positive_float':
+            return parsed & ~(numbers <= 0)
+        if rule_type == 'positive_integer':
+            return parsed & np.isfinite(numbers) & (numbers > 0) & (numbers == np.floor(numbers))
+    if rule_type == 'number':
+        return parsed
+    return np.ones(len(values), dtype=bool)
+
+
+@lru_cache(maxsize=4096)
+def _resolve_allowed_value(original_col_name, subject, allowed_values, value_str_stripped):
+    """
+    Checks one (stripped) value against an allowed list, with the column-specific
+    canonical mappings and fuzzy fallbacks.
+
+    Returns:
+        (is_valid, corrected value or None, whether a fuzzy match was used)
+    """
+    allowed_values_list = list(allowed_values)
+    value_str_lower = value_str_stripped.lower()
+
+    # Specific Logic for Q: Question Type ('real contexts'/'pure contexts')
+    if original_col_name == 'Question Type' and subject == 'Q':
+        if value_str_lower == 'real contexts': return True, 'REAL', False
+        if value_str_lower == 'pure contexts': return True, 'PURE', False
+        # Fallback to general check for 'REAL', 'PURE'
+        allowed_map = {str(v).lower(): v for v in allowed_values_list}
+        if value_str_lower in allowed_map:
+            return True, allowed_map[value_str_lower], False
+        # Fuzzy match for Q's Question Type if exact fails
+        match, score = _fuzzy_best_match(value_str_stripped, allowed_values_list, 'ratio')
+        if score >= 85: # Fuzzy match threshold
+            return True, match, True
+        return False, None, False
+
+    # Specific Logic for Fundamental Skills (Preprocessing + Exact Match, then Fuzzy)
+    if original_col_name == 'Fundamental Skills':
+        skill_map = {}
+        for allowed_val in allowed_values_list:
+            processed_allowed = preprocess_skill(allowed_val)
+            # Canonical mapping for Rates/Ratio/Percent(s)
+            skill_map[processed_allowed] = 'Rates/Ratio/Percent' if processed_allowed == 'rates/ratios/percent' else allowed_val
+        processed_input = preprocess_skill(value_str_stripped)
+        if processed_input in skill_map:
+            return True, skill_map[processed_input], False
+        # Fuzzy match the original input against the original allowed values (WRatio copes
+        # with mixed case/punctuation), then map the match to its canonical form
+        match, score = _fuzzy_best_match(value_str_stripped, allowed_values_list, 'WRatio')
+        if score >= 85 and preprocess_skill(match) in skill_map:
+            return True, skill_map[preprocess_skill(match)], True
+        return False, None, False
+
+    # Default Case-Insensitive Check (Handles 'Graphs and Tables' -> 'Graph and Table')
+    # And Fuzzy matching for Content Domain and general Question Types (non-Q)
+    allowed_map = {}
+    for v in allowed_values_list:
+        key = str(v).lower()
+        canonical_value = v
+        if original_col_name == 'Question Type' and subject == 'DI' and key == 'graphs and tables':
+            canonical_value = 'Graph and Table' # Specific canonical mapping
+        allowed_map[key] = canonical_value
+    if value_str_lower in allowed_map:
+        return True, allowed_map[value_str_lower], False
+    # Fuzzy match for 'Content Domain' and other 'Question Type'
+    if original_col_name in ['Content Domain', 'Question Type']:
+        match, score = _fuzzy_best_match(value_str_stripped, allowed_values_list, 'ratio')
+        if score >= 85: # Fuzzy match threshold
+            if original_col_name == 'Question Type' and subject == 'DI' and str(match).lower() == 'graph and table':
+                return True, 'Graph and Table', True
+            return True, match, True
+    return False, None, False
+
+
+def _compile_rules(subject, columns, question_col_in_df):
+    """
+    Turns VALIDATION_RULES into the list of checks for the columns present in the DataFrame.
+
+    Returns:
+        List of (rule position, original column name, DataFrame column name, rules, allowed values or None)
+    """
+    compiled = []
+    for rule_position, (original_col_name, rules) in enumerate(VALIDATION_RULES.items()):
+        # Determine the actual column name to check in the dataframe (handling BOM)
+        current_col_name = original_col_name
+        if original_col_name == 'Question' and question_col_in_df == '\ufeffQuestion':
+            current_col_name = question_col_in_df
+        if current_col_name not in columns:
+            continue # Missing required columns were reported before
+        allowed_values = None
+        if 'type' not in rules and 'allowed' in rules:
+            allowed_values = rules['allowed']
+            # Use subject-specific list if available
+            if 'subject_specific' in rules and subject in rules['subject_specific']:
+                allowed_values = rules['subject_specific'][subject]
+        compiled.append((rule_position, original_col_name, current_col_name, rules, allowed_values))
+    return compiled
+
+
 def validate_dataframe(df, subject):
-    """Validates the DataFrame rows based on predefined rules for the subject."""
+    """
+    Validates the DataFrame rows based on predefined rules for the subject.
+
+    Each rule is applied to a whole column at once (numeric parsing for type
+    rules, set membership for allowed lists); only failing or fuzzy-corrected
+    cells produce messages. Auto-corrections are written back into ``df``.
+    Messages are ordered by row, then by rule, as when validating row by row.
+    """
     errors = []
     warnings = []
     required_original = REQUIRED_ORIGINAL_COLS.get(subject, [])
@@ -34,173 +181,52 @@ def validate_dataframe(df, subject):
         errors.append(f"資料缺少必要欄位: {', '.join(missing_cols)}。請檢查欄位標頭。")
         return errors, warnings # Stop if essential columns are missing
 
-    # 2. Validate cell values row by row
-    for index, row in df.iterrows():
-        for original_col_name, rules in VALIDATION_RULES.items():
-            # Determine the actual column name to check in the dataframe (handling BOM)
-            current_col_name = original_col_name
-            if original_col_name == 'Question' and question_col_in_df == '\ufeffQuestion':
-                current_col_name = question_col_in_df
-
-            if current_col_name not in df.columns:
-                # Skip validation only if the column wasn't required for this subject
-                if original_col_name not in required_original:
-                     continue
-                # If it was required but not found, the previous check caught it.
-
-            # Proceed if column exists
-            if current_col_name in df.columns:
-                value = row[current_col_name]
-
-                # Skip validation for empty/NaN cells
-                if pd.isna(value) or str(value).strip() == '':
-                    continue
-
-                is_valid = True
-                error_detail = rules['error']
-                correct_value = None # To store potential auto-corrected value
-
-                # --- Type Checks ---
-                if 'type' in rules:
-                    value_str = str(value).strip()
-                    if rules['type'] == 'positive_float':
-                        try:
-                            num = float(value_str)
-                            if num <= 0: is_valid = False
-                        except (ValueError, TypeError): is_valid = False
-                    elif rules['type'] == 'positive_integer':
-                        try:
-                            num_float = float(value_str)
-                            if not (num_float > 0 and num_float == int(num_float)):
-                                is_valid = False
-                        except (ValueError, TypeError): is_valid = False
-                    elif rules['type'] == 'number':
-                        try: float(value_str)
-                        except (ValueError, TypeError): is_valid = False
-
-                # --- Allowed List Checks (with auto-correction) ---
-                elif 'allowed' in rules:
-                    allowed_values_list = rules['allowed']
-                    # Use subject-specific list if available
-                    if 'subject_specific' in rules and subject in rules['subject_specific']:
-                        allowed_values_list = rules['subject_specific'][subject]
-
-                    value_str_stripped = str(value).strip()
-                    value_str_lower = value_str_stripped.lower()
-
-                    # Specific Logic for Q: Question Type ('real contexts'/'pure contexts')
-                    if original_col_name == 'Question Type' and subject == 'Q':
-                        if value_str_lower == 'real contexts': correct_value = 'REAL'; is_valid = True
-                        elif value_str_lower == 'pure contexts': correct_value = 'PURE'; is_valid = True
-                        else: # Fallback to general check for 'REAL', 'PURE'
-                            allowed_map = {str(v).lower(): v for v in allowed_values_list}
-                            if value_str_lower in allowed_map:
-                                correct_value = allowed_map[value_str_lower]
-                                is_valid = True
-                            else:
-                                # Fuzzy match for Q's Question Type if exact fails
-                                match, score = process.extractOne(value_str_stripped, allowed_values_list, scorer=fuzz.ratio) if allowed_values_list else (None, 0)
-                                if score >= 85: # Fuzzy match threshold
-                                    correct_value = match
-                                    is_valid = True
-                                    warnings.append(f"第 {index + 1} 行, 欄位 '{current_col_name}': 值 '{value_str_stripped}' 透過模糊比對修正為 '{correct_value}'。")
-                                else:
-                                    is_valid = False
-
-                    # Specific Logic for Fundamental Skills (Preprocessing + Exact Match, then Fuzzy)
-                    elif original_col_name == 'Fundamental Skills':
-                        processed_input = preprocess_skill(value_str_stripped)
-                        is_valid = False # Assume invalid initially
-                        skill_map = {}
-                        # Prepare a list of preprocessed allowed skills for fuzzy matching
-                        preprocessed_allowed_skills_for_fuzzy = []
-
-                        for allowed_val in allowed_values_list:
-                            processed_allowed = preprocess_skill(allowed_val)
-                            # Canonical mapping for Rates/Ratio/Percent(s)
-                            canonical_value = 'Rates/Ratio/Percent' if processed_allowed == 'rates/ratios/percent' else allowed_val
-                            skill_map[processed_allowed] = canonical_value
-                            preprocessed_allowed_skills_for_fuzzy.append(processed_allowed) # Store preprocessed version for fuzzy
-
-                        if processed_input in skill_map:
-                            correct_value = skill_map[processed_input]
-                            is_valid = True
-                        else:
-                            # Fuzzy match against preprocessed allowed skills
-                            # We use the original allowed_values_list to extract the *original* casing if a match is found
-                            # The `process.extractOne` needs the original list to return the correctly cased value.
-                            # We find the best match based on the preprocessed input against preprocessed allowed values.
-                            
-                            # To get the original cased value from a fuzzy match on preprocessed strings:
-                            # 1. Fuzzy match `processed_input` against `preprocessed_allowed_skills_for_fuzzy`.
-                            # 2. If a match is found, get the index of the matched preprocessed skill.
-                            # 3. Use this index to get the original cased skill from `allowed_values_list`.
-                            # OR, simpler: fuzzy match `value_str_stripped` (original input) directly against `allowed_values_list` (original allowed values)
-                            
-                            match, score = process.extractOne(value_str_stripped, allowed_values_list, scorer=fuzz.WRatio) if allowed_values_list else (None, 0)
-                            if score >= 85: # Fuzzy match threshold (using WRatio for better results with mixed case/punctuation)
-                                # Check if the matched value, after preprocessing, is a known skill
-                                preprocessed_match = preprocess_skill(match)
-                                if preprocessed_match in skill_map: # Ensure the fuzzy matched skill is valid after preprocessing
-                                    correct_value = skill_map[preprocessed_match] # Use the canonical form
-                                    is_valid = True
-                                    warnings.append(f"第 {index + 1} 行, 欄位 '{current_col_name}': 值 '{value_str_stripped}' 透過模糊比對修正為 '{correct_value}'。")
-                                else:
-                                    # This case is unlikely if skill_map is comprehensive but good for safety
-                                    is_valid = False
-                            else:
-                                is_valid = False
-                    
-                    # Default Case-Insensitive Check (Handles 'Graphs and Tables' -> 'Graph and Table')
-                    # And Fuzzy matching for Content Domain and general Question Types (non-Q)
-                    else:
-                        allowed_map = {}
-                        # Special handling for 'Graphs and Tables' -> 'Graph and Table' for DI Question Type
-                        # This canonical mapping should ideally be in validation_rules.py or handled more generically
-                        for v in allowed_values_list:
-                            key = str(v).lower()
-                            canonical_value = v
-                            if original_col_name == 'Question Type' and subject == 'DI' and key == 'graphs and tables':
-                                canonical_value = 'Graph and Table' # Specific canonical mapping
-                            allowed_map[key] = canonical_value
-                        
-                        if value_str_lower in allowed_map:
-                            correct_value = allowed_map[value_str_lower]
-                            is_valid = True
-                        else:
-                            # Fuzzy match for 'Content Domain' and other 'Question Type'
-                            if original_col_name in ['Content Domain', 'Question Type']:
-                                match, score = process.extractOne(value_str_stripped, allowed_values_list, scorer=fuzz.ratio) if allowed_values_list else (None, 0)
-                                if score >= 85: # Fuzzy match threshold
-                                    # If it was 'Graphs and Tables' and matched to 'Graph and Table', ensure canonical
-                                    if original_col_name == 'Question Type' and subject == 'DI' and str(match).lower() == 'graph and table':
-                                        correct_value = 'Graph and Table'
-                                    else:
-                                        correct_value = match
-                                    is_valid = True
-                                    warnings.append(f"第 {index + 1} 行, 欄位 '{current_col_name}': 值 '{value_str_stripped}' 透過模糊比對修正為 '{correct_value}'。")
-                                else:
-                                    is_valid = False
-                            else:
-                                is_valid = False # Not one of the fuzzy matched fields, and no exact match
-
-                    # --- Auto-Correction Application ---
-                    if is_valid and correct_value is not None and value_str_stripped != correct_value:
-                        try:
-                            # Use .loc for safe assignment BACK into the original DataFrame
-                            df.loc[index, current_col_name] = correct_value
-                            # st.toast(f"Row {index+1}, Col '{current_col_name}': Auto-corrected '{value_str_stripped}' to '{correct_value}'") # Optional user feedback
-                        except Exception as e:
-                            errors.append(f"第 {index + 1} 行, 欄位 '{current_col_name}': 自動修正時出錯 ({e})。")
-                            is_valid = False # Mark invalid if correction fails
-
-                    elif not is_valid:
-                        # Improve error message for list failures
-                        allowed_str = ", ".join(f"'{v}'" for v in allowed_values_list)
-                        error_detail += f" 允許的值: {allowed_str} (大小寫/格式可能不符)。"
-
-                # --- Record Error ---
-                if not is_valid:
-                    errors.append(f"第 {index + 1} 行, 欄位 '{current_col_name}': 值 '{value}' 無效。{error_detail}")
-
-    return errors, warnings 
\ No newline at end of file
+    # 2. Validate each column; messages are (row position, rule position, text)
+    error_entries = []
+    warning_entries = []
+    for rule_position, original_col_name, current_col_name, rules, allowed_values in _compile_rules(subject, df.columns, question_col_in_df):
+        column = df[current_col_name]
+        raw_values = column.to_numpy(dtype=object)
+        stripped = column.astype(str).str.strip()
+        # Skip validation for empty/NaN cells
+        checked = (column.notna() & ~stripped.str.fullmatch(r'\s*')).to_numpy()
+        if not checked.any():
+            continue
+        positions = np.flatnonzero(checked)
+        values = stripped.iloc[positions].reset_index(drop=True)
+        error_detail = rules['error']
+
+        if 'type' in rules:
+            invalid_positions = positions[~_check_type(values, rules['type'])]
+        elif allowed_values is not None:
+            allowed_key = tuple(allowed_values)
+            resolved = {value: _resolve_allowed_value(original_col_name, subject, allowed_key, value) for value in values.unique()}
+            is_valid = values.map(lambda value: resolved[value][0]).to_numpy(dtype=bool)
+            invalid_positions = positions[~is_valid]
+
+            # --- Auto-Correction Application ---
+            corrections = values.map(lambda value: resolved[value][1])
+            needs_correction = is_valid & corrections.notna().to_numpy() & (corrections != values).to_numpy()
+            if needs_correction.any():
+                corrected_positions = positions[needs_correction]
+                corrected_values = corrections.to_numpy(dtype=object)[needs_correction]
+                df.loc[df.index[corrected_positions], current_col_name] = corrected_values
+                for position, original, corrected in zip(corrected_positions, values.to_numpy(dtype=object)[needs_correction], corrected_values):
+                    if resolved[original][2]:
+                        warning_entries.append((position, rule_position, f"第 {df.index[position] + 1} 行, 欄位 '{current_col_name}': 值 '{original}' 透過模糊比對修正為 '{corrected}'。"))
+
+            # Improve error message for list failures
+            allowed_str = ", ".join(f"'{v}'" for v in allowed_values)
+            error_detail += f" 允許的值: {allowed_str} (大小寫/格式可能不符)。"
+        else:
+            continue
+
+        # --- Record Errors (failing cells only) ---
+        for position in invalid_positions:
+            error_entries.append((position, rule_position, f"第 {df.index[position] + 1} 行, 欄位 '{current_col_name}': 值 '{raw_values[position]}' 無效。{error_detail}"))
+
+    error_entries.sort(key=lambda entry: entry[:2])
+    warning_entries.sort(key=lambda entry: entry[:2])
+    errors.extend(message for _, _, message in error_entries)
+    warnings.extend(message for _, _, message in warning_entries)
+    return errors, warnings
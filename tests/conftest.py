@@ -0,0 +1,11 @@
+"""
+Shared pytest setup: makes the gmat_diagnosis_app package importable from the
+repository root (the app is run from a checkout, not installed).
+"""
+
+import os
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
@@ -0,0 +1,211 @@
+"""
+Concurrency of the CSV backend: appends from several threads and processes
+(directly, with every fsync policy, and through the write-behind buffer), the
+cross-process file lock, and appends queued in the write-behind buffer racing
+with updates and deletes that trigger automatic compaction.
+"""
+
+import atexit
+import csv
+import multiprocessing
+import threading
+
+import pytest
+
+from gmat_diagnosis_app.services.storage import (
+    CSVStorageBackend,
+    FileLock,
+    GMAT_PERFORMANCE_HEADERS,
+    PERFORMANCE_TABLE,
+)
+
+JOIN_TIMEOUT = 20
+
+
+def performance_record(test_instance_id, position, student_id='s1'):
+    return {
+        'student_id': student_id,
+        'test_instance_id': test_instance_id,
+        'gmat_section': 'Quantitative',
+        'question_id': f"{test_instance_id}-q{position}",
+        'question_position': position,
+        'question_time_minutes': 2.0,
+        'is_correct': 1,
+    }
+
+
+def make_backend(tmp_path, **options):
+    backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'), **options)
+    backend.initialize()
+    return backend
+
+
+def run_threads(backend, targets):
+    """Runs ``targets`` in threads, then closes ``backend``."""
+    errors = []
+
+    def guarded(target):
+        try:
+            target()
+        except Exception as e: # Reported by the test instead of the thread
+            errors.append(e)
+
+    # Daemon threads, so a deadlock fails the test instead of hanging the run
+    threads = [threading.Thread(target=guarded, args=(target,), daemon=True) for target in targets]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(JOIN_TIMEOUT)
+    if any(thread.is_alive() for thread in threads):
+        # close() would wait for the stuck flush, also at interpreter exit
+        atexit.unregister(backend.write_buffer.close)
+        raise AssertionError("threads still running (deadlock?)")
+    backend.close()
+    assert not errors, errors
+
+
+def test_edits_with_compaction_do_not_deadlock_with_write_behind(tmp_path):
+    backend = make_backend(tmp_path, write_behind=True, batch_size=1, flush_interval=0.001,
+                           compaction_threshold=2)
+    rounds = 60
+
+    def append():
+        for number in range(rounds):
+            backend.append_records(PERFORMANCE_TABLE, [performance_record(f"t{number}", 1),
+                                                       performance_record(f"t{number}", 2)])
+
+    def edit():
+        for number in range(rounds):
+            backend.update_records(PERFORMANCE_TABLE, f"t{number}", {'is_correct': 0})
+            if number % 3 == 0:
+                backend.delete_records(PERFORMANCE_TABLE, f"t{number}")
+
+    run_threads(backend, [append, edit])
+
+    records = backend.query_records(PERFORMANCE_TABLE)
+    assert len(records) == len({(r['test_instance_id'], r['question_position']) for r in records})
+    assert {r['test_instance_id'] for r in records} <= {f"t{number}" for number in range(rounds)}
+
+
+def test_compaction_waits_for_a_flush_blocked_on_the_table_lock(tmp_path):
+    # Forces the interleaving: the editing thread holds the table lock while the
+    # flush thread holds the buffer's flush lock and waits for the table lock
+    backend = make_backend(tmp_path, write_behind=True, batch_size=1, flush_interval=60,
+                           compaction_threshold=1)
+    backend.append_records(PERFORMANCE_TABLE, [performance_record('t1', 1)])
+    backend.flush()
+
+    flushing = threading.Event()
+    write_rows = backend.write_buffer.write_rows
+
+    def signalling_write_rows(table, rows):
+        flushing.set()
+        write_rows(table, rows)
+
+    backend.write_buffer.write_rows = signalling_write_rows
+    log_change = backend._log_change
+
+    def log_change_then_queue_an_append(table, entry):
+        log_change(table, entry)
+        # Still under the table lock: queue a row and wait until the flush thread picked it up
+        backend.append_records(PERFORMANCE_TABLE, [performance_record('t2', 1)])
+        assert flushing.wait(JOIN_TIMEOUT)
+
+    backend._log_change = log_change_then_queue_an_append
+    run_threads(backend, [lambda: backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})])
+
+    assert [(r['test_instance_id'], r['is_correct']) for r in backend.query_records(PERFORMANCE_TABLE)] == [('t1', '0'), ('t2', '1')]
+    assert len(backend.change_logs[PERFORMANCE_TABLE]) == 0
+
+
+def read_csv_rows(path):
+    with open(path, newline='') as csv_file:
+        reader = csv.DictReader(csv_file)
+        rows = list(reader)
+    assert reader.fieldnames == GMAT_PERFORMANCE_HEADERS
+    # A torn write shows up as a short row (None values) or an extra field (None key)
+    assert all(None not in row and None not in row.values() for row in rows)
+    return rows
+
+
+def append_instances(performance_file, subjective_file, writer, instances, options):
+    backend = CSVStorageBackend(performance_file, subjective_file, **options)
+    backend.initialize()
+    for number in range(instances):
+        backend.append_records(PERFORMANCE_TABLE, [performance_record(f"{writer}-t{number}", position)
+                                                   for position in range(1, 4)])
+    backend.close()
+
+
+@pytest.mark.parametrize("options", [
+    {},
+    {'fsync_policy': 'always'},
+    {'write_behind': True, 'batch_size': 2, 'flush_interval': 0.001, 'fsync_policy': 'never'},
+])
+def test_concurrent_appends_from_threads_leave_a_well_formed_csv(tmp_path, options):
+    backend = make_backend(tmp_path, **options)
+    writers, instances = 4, 25
+
+    def append(writer):
+        for number in range(instances):
+            backend.append_records(PERFORMANCE_TABLE, [performance_record(f"w{writer}-t{number}", position)
+                                                       for position in range(1, 4)])
+
+    run_threads(backend, [lambda writer=writer: append(writer) for writer in range(writers)])
+
+    rows = read_csv_rows(backend.path_for(PERFORMANCE_TABLE))
+    assert len(rows) == writers * instances * 3
+    assert len({row['question_id'] for row in rows}) == len(rows)
+    assert backend.count_records(PERFORMANCE_TABLE) == len(rows)
+
+
+@pytest.mark.parametrize("options", [{}, {'write_behind': True, 'batch_size': 5, 'flush_interval': 0.01}])
+def test_concurrent_appends_from_processes_leave_a_well_formed_csv(tmp_path, options):
+    performance_file, subjective_file = str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv')
+    writers, instances = 4, 25
+    context = multiprocessing.get_context('spawn')
+    processes = [
+        context.Process(target=append_instances,
+                        args=(performance_file, subjective_file, f"p{writer}", instances, options))
+        for writer in range(writers)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join(JOIN_TIMEOUT * 3)
+    assert [process.exitcode for process in processes] == [0] * writers
+
+    rows = read_csv_rows(performance_file)
+    assert len(rows) == writers * instances * 3
+    assert len({row['question_id'] for row in rows}) == len(rows)
+    # Rows of one append call stay together
+    for start in range(0, len(rows), 3):
+        assert len({row['test_instance_id'] for row in rows[start:start + 3]}) == 1
+
+
+def test_exclusive_lock_blocks_another_process(tmp_path):
+    data_path = str(tmp_path / 'performance.csv')
+    context = multiprocessing.get_context('spawn')
+    acquired = context.Event()
+    with FileLock(data_path).exclusive():
+        process = context.Process(target=hold_lock_and_signal, args=(data_path, acquired))
+        process.start()
+        assert not acquired.wait(0.5)
+    assert acquired.wait(JOIN_TIMEOUT)
+    process.join(JOIN_TIMEOUT)
+    assert process.exitcode == 0
+
+
+def hold_lock_and_signal(data_path, acquired):
+    with FileLock(data_path).exclusive():
+        acquired.set()
+
+
+def test_lock_is_reentrant_within_a_thread(tmp_path):
+    lock = FileLock(str(tmp_path / 'performance.csv'))
+    with lock.exclusive():
+        with lock.shared():
+            with lock.exclusive():
+                pass
+        assert lock._fd is not None
+    assert lock._fd is None
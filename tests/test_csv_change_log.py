@@ -0,0 +1,217 @@
+"""
+Updates and deletes of the CSV backend go to a change log (update entries and
+tombstones) that readers apply on top of the CSV rows; compaction merges the
+log back into the file with an atomic rename. These tests check what readers
+see (in the same and in another backend instance) against a plain list of
+records edited the same way.
+"""
+
+import os
+import shutil
+
+import numpy as np
+import pytest
+
+from gmat_diagnosis_app.services.storage import (
+    ChangeLog,
+    CSVStorageBackend,
+    GMAT_PERFORMANCE_HEADERS,
+    PERFORMANCE_TABLE,
+    record_digest,
+    serialize_record,
+)
+
+
+def performance_record(test_instance_id, position, student_id='s1', is_correct=1):
+    return serialize_record({
+        'student_id': student_id,
+        'test_instance_id': test_instance_id,
+        'gmat_section': 'Quantitative',
+        'question_position': position,
+        'question_time_minutes': 1.5,
+        'is_correct': is_correct,
+    }, GMAT_PERFORMANCE_HEADERS)
+
+
+def make_backend(tmp_path, **options):
+    backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'), **options)
+    backend.initialize()
+    return backend
+
+
+def other_instance(backend):
+    """A second backend on the same files, like another Streamlit worker."""
+    return CSVStorageBackend(backend.path_for(PERFORMANCE_TABLE), backend.files['student_subjective_reports'])
+
+
+def instance_ids(records):
+    return [record['test_instance_id'] for record in records]
+
+
+@pytest.fixture
+def backend(tmp_path):
+    backend = make_backend(tmp_path, compaction_threshold=0)
+    backend.append_records(PERFORMANCE_TABLE, [performance_record('t1', 1), performance_record('t1', 2),
+                                               performance_record('t2', 1, student_id='s2')])
+    return backend
+
+
+def test_update_then_read(backend):
+    assert backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0, 'unknown': 'x'}) == 2
+
+    assert [r['is_correct'] for r in backend.query_records(PERFORMANCE_TABLE, test_instance_id='t1')] == ['0', '0']
+    assert backend.query_records(PERFORMANCE_TABLE, test_instance_id='t2')[0]['is_correct'] == '1'
+    assert len(backend.change_logs[PERFORMANCE_TABLE]) == 1
+    # The CSV file itself is not rewritten
+    with open(backend.path_for(PERFORMANCE_TABLE)) as csv_file:
+        assert ',0,' not in csv_file.read()
+
+
+def test_delete_then_read(backend):
+    assert backend.delete_records(PERFORMANCE_TABLE, 't1') == 2
+
+    assert instance_ids(backend.query_records(PERFORMANCE_TABLE)) == ['t2']
+    assert backend.query_records(PERFORMANCE_TABLE, test_instance_id='t1') == []
+    assert backend.query_records(PERFORMANCE_TABLE, student_id='s1') == []
+    assert backend.count_records(PERFORMANCE_TABLE) == 1
+    assert backend.delete_records(PERFORMANCE_TABLE, 't1') == 0
+
+
+def test_rename_test_instance(backend):
+    assert backend.update_records(PERFORMANCE_TABLE, 't1', {'test_instance_id': 't9'}) == 2
+
+    assert backend.query_records(PERFORMANCE_TABLE, test_instance_id='t1') == []
+    assert [r['question_position'] for r in backend.query_records(PERFORMANCE_TABLE, test_instance_id='t9')] == ['1', '2']
+    assert instance_ids(backend.query_records(PERFORMANCE_TABLE, student_id='s1')) == ['t9', 't9']
+    # Duplicate checks follow the rename
+    renamed = performance_record('t9', 1)
+    original = performance_record('t1', 1)
+    digests = {record_digest(renamed, PERFORMANCE_TABLE), record_digest(original, PERFORMANCE_TABLE)}
+    assert backend.find_existing_digests(PERFORMANCE_TABLE, digests) == {record_digest(renamed, PERFORMANCE_TABLE)}
+
+
+def test_changes_do_not_affect_rows_appended_later(backend):
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    backend.delete_records(PERFORMANCE_TABLE, 't2')
+    backend.append_records(PERFORMANCE_TABLE, [performance_record('t1', 3), performance_record('t2', 2)])
+
+    for reader in (backend, other_instance(backend)):
+        records = reader.query_records(PERFORMANCE_TABLE)
+        assert [(r['test_instance_id'], r['question_position'], r['is_correct']) for r in records] == [
+            ('t1', '1', '0'), ('t1', '2', '0'), ('t1', '3', '1'), ('t2', '2', '1'),
+        ]
+
+
+def test_reader_in_another_instance_sees_the_edits(backend):
+    reader = other_instance(backend)
+    assert len(reader.query_records(PERFORMANCE_TABLE)) == 3
+
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    assert [r['is_correct'] for r in reader.query_records(PERFORMANCE_TABLE, test_instance_id='t1')] == ['0', '0']
+
+    backend.delete_records(PERFORMANCE_TABLE, 't2')
+    assert instance_ids(reader.query_records(PERFORMANCE_TABLE)) == ['t1', 't1']
+
+    backend.compact()
+    assert instance_ids(reader.query_records(PERFORMANCE_TABLE)) == ['t1', 't1']
+
+    # And the other way round, with the change count of the writer's log kept up to date
+    reader.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 1})
+    assert len(backend.change_logs[PERFORMANCE_TABLE]) == 1
+    assert [r['is_correct'] for r in backend.query_records(PERFORMANCE_TABLE)] == ['1', '1']
+
+
+def test_compaction_keeps_the_records_and_replaces_the_file(backend):
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    backend.delete_records(PERFORMANCE_TABLE, 't2')
+    before = backend.query_records(PERFORMANCE_TABLE)
+    path = backend.path_for(PERFORMANCE_TABLE)
+    inode_before = os.stat(path).st_ino
+
+    assert backend.compact(PERFORMANCE_TABLE) == {PERFORMANCE_TABLE: 2}
+
+    assert os.stat(path).st_ino != inode_before
+    assert not os.path.exists(backend.change_logs[PERFORMANCE_TABLE].path)
+    assert len(backend.change_logs[PERFORMANCE_TABLE]) == 0
+    assert backend.query_records(PERFORMANCE_TABLE) == before
+    assert other_instance(backend).query_records(PERFORMANCE_TABLE) == before
+    assert backend.compact(PERFORMANCE_TABLE) == {PERFORMANCE_TABLE: 0}
+
+
+def test_compacts_automatically_at_the_threshold(tmp_path):
+    backend = make_backend(tmp_path, compaction_threshold=3)
+    backend.append_records(PERFORMANCE_TABLE, [performance_record(f"t{n}", 1) for n in range(5)])
+    for number in range(3):
+        backend.update_records(PERFORMANCE_TABLE, f"t{number}", {'is_correct': 0})
+        assert len(backend.change_logs[PERFORMANCE_TABLE]) == (number + 1) % 3
+
+    assert [r['is_correct'] for r in backend.query_records(PERFORMANCE_TABLE)] == ['0', '0', '0', '1', '1']
+
+
+def test_log_left_by_an_interrupted_compaction_is_ignored(backend):
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    log_path = backend.change_logs[PERFORMANCE_TABLE].path
+    shutil.copy(log_path, log_path + '.saved')
+    backend.compact()
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 1})
+    backend.compact()
+    # The renamed file was written, but the old log was not removed
+    shutil.copy(log_path + '.saved', log_path)
+
+    assert ChangeLog(backend.path_for(PERFORMANCE_TABLE)).read_entries() == []
+    assert [r['is_correct'] for r in other_instance(backend).query_records(PERFORMANCE_TABLE, test_instance_id='t1')] == ['1', '1']
+
+    # The next change starts a new log instead of appending to the stale one
+    backend.delete_records(PERFORMANCE_TABLE, 't2')
+    assert len(ChangeLog(backend.path_for(PERFORMANCE_TABLE)).read_entries()) == 1
+    assert instance_ids(other_instance(backend).query_records(PERFORMANCE_TABLE)) == ['t1', 't1']
+
+
+def test_frames_handed_out_earlier_stay_unchanged(backend):
+    frame = backend.caches[PERFORMANCE_TABLE].frame()
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    backend.delete_records(PERFORMANCE_TABLE, 't2')
+
+    assert frame['is_correct'].tolist() == ['1', '1', '1']
+    assert frame['test_instance_id'].tolist() == ['t1', 't1', 't2']
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits_match_a_plain_list(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    backend = make_backend(tmp_path, compaction_threshold=int(rng.choice([0, 4])))
+    expected = []
+    for step in range(120):
+        test_instance_id = f"t{rng.integers(0, 8)}"
+        action = rng.choice(['append', 'update', 'rename', 'delete', 'compact'], p=[0.35, 0.25, 0.1, 0.2, 0.1])
+        if action == 'append':
+            records = [performance_record(test_instance_id, step, student_id=f"s{rng.integers(0, 3)}")
+                       for _ in range(int(rng.integers(1, 4)))]
+            backend.append_records(PERFORMANCE_TABLE, records)
+            expected.extend(records)
+        elif action in ('update', 'rename'):
+            updates = ({'test_instance_id': f"t{rng.integers(0, 8)}"} if action == 'rename'
+                       else {'is_correct': str(rng.integers(0, 2)), 'student_id': f"s{rng.integers(0, 3)}"})
+            matched = [r for r in expected if r['test_instance_id'] == test_instance_id]
+            assert backend.update_records(PERFORMANCE_TABLE, test_instance_id, updates) == len(matched)
+            for record in matched:
+                record.update(updates)
+        elif action == 'delete':
+            deleted = sum(r['test_instance_id'] == test_instance_id for r in expected)
+            assert backend.delete_records(PERFORMANCE_TABLE, test_instance_id) == deleted
+            expected = [r for r in expected if r['test_instance_id'] != test_instance_id]
+        else:
+            backend.compact()
+
+        assert backend.query_records(PERFORMANCE_TABLE, test_instance_id=test_instance_id) == [
+            r for r in expected if r['test_instance_id'] == test_instance_id]
+        assert backend.query_records(PERFORMANCE_TABLE, student_id='s1', gmat_section='Quantitative') == [
+            r for r in expected if r['student_id'] == 's1']
+        assert backend.count_records(PERFORMANCE_TABLE) == len(expected)
+        if step % 10 == 0:
+            assert backend.query_records(PERFORMANCE_TABLE) == expected
+            assert other_instance(backend).query_records(PERFORMANCE_TABLE) == expected
+
+    assert backend.query_records(PERFORMANCE_TABLE) == expected
+    backend.compact()
+    assert other_instance(backend).query_records(PERFORMANCE_TABLE) == expected
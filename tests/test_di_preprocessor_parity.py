@@ -0,0 +1,226 @@
+"""
+Parity of the vectorized MSR grouping / MSR time calculation of di_preprocessor
+with the per-group loop it replaced. The previous implementation is kept below
+as a frozen reference (reference_* functions). Single-exam frames must match it;
+cohort frames (group_keys) must match one call per exam, with group ids that
+never repeat across exams.
+"""
+
+import logging
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gmat_diagnosis_app.subject_preprocessing.di_preprocessor import preprocess_di_data
+
+MSR_COLUMNS = ['msr_group_id', 'msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time', 'is_first_msr_q']
+GROUP_KEYS = ('student_id', 'test_instance_id')
+
+
+def reference_identify_msr_groups(df_di_subset):
+    """
+    Identifies MSR groups based on 'MSR Set ID' or question contiguity.
+    Adds 'msr_group_id' to the DataFrame.
+    """
+    if 'MSR Set ID' in df_di_subset.columns and df_di_subset['MSR Set ID'].notna().any():
+        df_di_subset['msr_group_id'] = 'MSR-' + df_di_subset['MSR Set ID'].astype(str)
+    else:
+        logging.debug("'MSR Set ID' column missing or empty for DI. Attempting to group by contiguity.")
+        df_di_subset = df_di_subset.sort_values(by='question_position')
+        is_msr = (df_di_subset['question_type'] == 'Multi-source reasoning')
+
+        group_markers = (~is_msr).cumsum()
+
+        df_di_subset['msr_group_id'] = pd.Series(index=df_di_subset.index, dtype='object')
+
+        df_di_subset.loc[is_msr, 'msr_group_id'] = 'MSRG-' + group_markers[is_msr].astype(str)
+
+        df_di_subset.loc[~is_msr, 'msr_group_id'] = np.nan
+    return df_di_subset
+
+def reference_preprocess_di_data(df):
+    """Frozen copy of the per-group implementation (before the vectorized rewrite)."""
+    df_processed = df.copy()
+    di_mask = (df_processed['Subject'] == 'DI')
+    if not di_mask.any():
+        # Ensure MSR specific columns exist even if no DI data, similar to verbal_preprocessor
+        for col in ['msr_group_id', 'msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time', 'is_first_msr_q']:
+            if col not in df_processed.columns:
+                df_processed[col] = pd.Series(dtype='object' if col == 'msr_group_id' else 'float64')
+        return df_processed
+
+    df_di_subset = df_processed[di_mask].copy()
+    df_di_subset['question_time'] = pd.to_numeric(df_di_subset['question_time'], errors='coerce') # Ensure numeric for sum
+    df_di_subset = reference_identify_msr_groups(df_di_subset)
+
+    # Calculate MSR group total time, number of questions, and reading time
+    if 'msr_group_id' in df_di_subset.columns and df_di_subset['msr_group_id'].notna().any():
+        msr_rows_mask = df_di_subset['msr_group_id'].notna() & (df_di_subset['question_type'] == 'Multi-source reasoning')
+        if msr_rows_mask.any():
+            df_msr_part = df_di_subset[msr_rows_mask].copy()
+            df_msr_part['question_position'] = pd.to_numeric(df_msr_part['question_position'], errors='coerce') # Ensure numeric for idxmin
+
+            # Group Total Time
+            group_total_time_map = df_msr_part.groupby('msr_group_id')['question_time'].sum().to_dict()
+            df_msr_part['msr_group_total_time'] = df_msr_part['msr_group_id'].map(group_total_time_map)
+
+            # Group Num Questions
+            group_num_questions_map = df_msr_part.groupby('msr_group_id').size().to_dict()
+            df_msr_part['msr_group_num_questions'] = df_msr_part['msr_group_id'].map(group_num_questions_map)
+
+            # MSR Reading Time
+            df_msr_part['msr_reading_time'] = 0.0 # Initialize
+            first_q_indices_msr = []
+            group_data_for_reading_time_msr = {}
+
+            for name, group in df_msr_part.groupby('msr_group_id', dropna=False):
+                if group['question_position'].notna().any() and len(group) >= 2: # Only if group has at least 2 questions
+                    first_q_idx_msr = group['question_position'].idxmin()
+                    first_q_indices_msr.append(first_q_idx_msr)
+                    first_q_time_msr = group.loc[first_q_idx_msr, 'question_time']
+                    other_qs_time_msr = group.loc[group.index != first_q_idx_msr, 'question_time']
+
+                    calculated_msr_reading_time = first_q_time_msr
+                    if not other_qs_time_msr.empty:
+                        avg_other_qs_time_msr = other_qs_time_msr.mean()
+                        calculated_msr_reading_time = first_q_time_msr - avg_other_qs_time_msr
+
+                    df_msr_part.loc[first_q_idx_msr, 'msr_reading_time'] = calculated_msr_reading_time
+
+            df_msr_part['msr_reading_time'] = pd.to_numeric(df_msr_part['msr_reading_time'], errors='coerce')
+            df_msr_part['msr_reading_time'] = df_msr_part['msr_reading_time'].replace({pd.NA: 0, None: 0, np.nan: 0}).infer_objects(copy=False)
+
+            # Add is_first_msr_q flag
+            df_msr_part['is_first_msr_q'] = False
+            if first_q_indices_msr: # Check if list is not empty
+                # Ensure indices are valid for df_msr_part before trying to loc
+                valid_first_q_indices = [idx for idx in first_q_indices_msr if idx in df_msr_part.index]
+                if valid_first_q_indices:
+                    df_msr_part.loc[valid_first_q_indices, 'is_first_msr_q'] = True
+
+            # Update the DI subset with new columns
+            df_di_subset.update(df_msr_part)
+
+    df_processed.update(df_di_subset)
+
+    # Ensure standard MSR columns exist in the main df and initialize them correctly.
+    msr_numeric_cols = ['msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time']
+    msr_bool_cols = ['is_first_msr_q']
+    msr_object_cols = ['msr_group_id']
+
+    for col in msr_numeric_cols:
+        if col not in df_processed.columns:
+            df_processed[col] = 0.0  # Initialize with 0.0 for all rows
+        else:
+            # Ensure correct dtype and fill NaNs if column already existed
+            df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce')
+            df_processed[col] = df_processed[col].replace({pd.NA: 0.0, None: 0.0, np.nan: 0.0}).infer_objects(copy=False)
+
+    for col in msr_bool_cols:
+        if col not in df_processed.columns:
+            df_processed[col] = False  # Initialize with False for all rows
+        else:
+            # Ensure correct dtype and fill NaNs
+            try:
+                df_processed[col] = df_processed[col].astype(bool) # Attempt direct cast
+            except ValueError: # Handle potential mixed types or uncastable values
+                df_processed[col] = pd.to_numeric(df_processed[col], errors='coerce').notna() # Example: 0/1 to False/True
+            df_processed[col] = df_processed[col].replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False)
+
+    for col in msr_object_cols: # e.g., msr_group_id
+        if col not in df_processed.columns:
+            df_processed[col] = pd.NA # Or np.nan, or a placeholder string like "N/A"
+        else:
+            # If it exists, just ensure it's not all NaNs if a placeholder is preferred for full NaNs.
+            # df_processed[col] = df_processed[col].fillna(pd.NA) # Default fillna for object is usually fine
+            pass # Allow existing NaNs or values
+
+    return df_processed
+
+
+def with_msr_columns(df):
+    """The reference only fills MSR columns that already exist (DataFrame.update)."""
+    df = df.copy()
+    df['msr_group_id'] = pd.Series(np.nan, index=df.index, dtype='object')
+    for column in ['msr_group_total_time', 'msr_group_num_questions', 'msr_reading_time']:
+        df[column] = np.nan
+    df['is_first_msr_q'] = False
+    return df
+
+
+def random_exam(rng, student_id, with_set_id):
+    rows = []
+    msr_share = float(rng.uniform(0.2, 0.8))
+    num_questions = int(rng.integers(1, 25))
+    positions = rng.permutation(num_questions) + 1
+    for number in range(num_questions):
+        question_type = 'Multi-source reasoning' if rng.random() < msr_share else str(rng.choice(['Data Sufficiency', 'Graph and Table']))
+        row = {
+            'student_id': student_id,
+            'test_instance_id': 't1',
+            'Subject': 'DI' if rng.random() < 0.9 else 'Q',
+            'question_type': question_type,
+            'question_time': round(float(rng.uniform(0.2, 5)), 2) if rng.random() < 0.9 else np.nan,
+            'question_position': float(positions[number]) if rng.random() < 0.93 else np.nan,
+        }
+        if with_set_id:
+            row['MSR Set ID'] = int(rng.integers(0, 3)) if question_type == 'Multi-source reasoning' and rng.random() < 0.9 else np.nan
+        rows.append(row)
+    df = pd.DataFrame(rows)
+    if rng.random() < 0.3:
+        df.index = df.index * 2 + 50
+    return df
+
+
+def same_groups(left, right):
+    """True if both id Series split the rows into the same groups (ids themselves may differ)."""
+    if not left.isna().equals(right.isna()):
+        return False
+    pairs = pd.DataFrame({'left': left, 'right': right}).dropna().drop_duplicates()
+    return pairs['left'].is_unique and pairs['right'].is_unique
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_single_exam_matches_reference(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(30):
+        df = random_exam(rng, 's1', with_set_id=rng.random() < 0.3)
+        expected = reference_preprocess_di_data(with_msr_columns(df))[MSR_COLUMNS]
+        expected['is_first_msr_q'] = expected['is_first_msr_q'].astype(bool)
+        # The reference stores question counts as floats; reading times differ by float rounding only
+        pd.testing.assert_frame_equal(preprocess_di_data(df)[MSR_COLUMNS], expected, check_dtype=False)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_cohort_matches_one_call_per_exam(seed):
+    rng = np.random.default_rng(100 + seed)
+    for _ in range(10):
+        with_set_id = rng.random() < 0.3
+        exams = [random_exam(rng, f"s{number}", with_set_id).reset_index(drop=True)
+                 for number in range(int(rng.integers(1, 6)))]
+        cohort = preprocess_di_data(pd.concat(exams, ignore_index=True), group_keys=GROUP_KEYS)
+
+        for exam in exams:
+            expected = preprocess_di_data(exam)
+            result = cohort[cohort['student_id'] == exam['student_id'].iloc[0]].reset_index(drop=True)
+            pd.testing.assert_frame_equal(result[MSR_COLUMNS[1:]], expected[MSR_COLUMNS[1:]])
+            assert same_groups(result['msr_group_id'], expected['msr_group_id'])
+
+        # Downstream code groups by msr_group_id alone, so no id may span two exams
+        exams_per_group = cohort.dropna(subset=['msr_group_id']).groupby('msr_group_id')['student_id'].nunique()
+        assert (exams_per_group == 1).all()
+
+
+def test_cohort_set_ids_are_unique_per_exam():
+    exam = pd.DataFrame({
+        'student_id': 's1', 'test_instance_id': 't1', 'Subject': 'DI',
+        'question_type': 'Multi-source reasoning', 'question_time': [3.0, 1.5, 1.5],
+        'question_position': [1, 2, 3], 'MSR Set ID': 7,
+    })
+    cohort = preprocess_di_data(pd.concat([exam, exam.assign(student_id='s2')], ignore_index=True),
+                                group_keys=GROUP_KEYS)
+
+    assert cohort['msr_group_id'].nunique() == 2
+    assert cohort['msr_group_num_questions'].tolist() == [3] * 6
+    assert preprocess_di_data(exam)['msr_group_id'].tolist() == ['MSR-7'] * 3
@@ -0,0 +1,189 @@
+"""
+Round trips through the Parquet backend: records written as typed, partitioned
+columns must read back as the strings the CSV backend returns, and updates /
+deletes must rewrite only the partitions holding the test instance.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from gmat_diagnosis_app.services.storage import (  # noqa: E402
+    CSVStorageBackend,
+    ParquetStorageBackend,
+    PERFORMANCE_TABLE,
+    SUBJECTIVE_TABLE,
+    record_digest,
+)
+
+SECTIONS = ['Quantitative', 'Verbal', 'Data Insights']
+DATES = ['2024-05-01', '2024-05-20', '2024-06-15', '']
+
+
+def performance_records(rng, count=200):
+    """Records in the form the importers produce (ints, 0/1 flags, floats, None for missing)."""
+    records = []
+    for number in range(count):
+        student = f"s{rng.integers(0, 5)}"
+        test = int(rng.integers(0, 3))
+        records.append({
+            'student_id': student,
+            'test_instance_id': f"{student}-t{test}",
+            'gmat_section': str(rng.choice(SECTIONS)),
+            'test_date': DATES[test],
+            'question_id': f"q{number}",
+            'question_position': int(rng.integers(1, 22)),
+            'question_time_minutes': round(float(rng.uniform(0.5, 4)), 2),
+            'is_correct': int(rng.integers(0, 2)),
+            'question_difficulty': None if rng.random() < 0.1 else round(float(rng.normal()), 3),
+            'question_type': str(rng.choice(['REAL', 'Critical Reasoning', 'Multi-source reasoning'])),
+            'question_fundamental_skill': str(rng.choice(['Rates/Ratio/Percent', '推理', ''])),
+            'content_domain': None if rng.random() < 0.2 else 'Algebra',
+            'total_section_time_minutes': 45.0,
+            'total_questions_in_section': 21,
+            'record_timestamp': f"2024-07-01T00:00:{number % 60:02d}",
+        })
+    return records
+
+
+@pytest.fixture
+def backends(tmp_path):
+    rng = np.random.default_rng(0)
+    records = performance_records(rng)
+    subjective = [{'student_id': 's1', 'test_instance_id': 's1-t0', 'gmat_section': 'Verbal',
+                   'subjective_time_pressure': 1, 'report_collection_timestamp': '2024-07-01'}]
+    csv_backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'))
+    parquet_backend = ParquetStorageBackend(str(tmp_path / 'parquet'))
+    for backend in (csv_backend, parquet_backend):
+        backend.initialize()
+        for start in range(0, len(records), 50):
+            backend.append_records(PERFORMANCE_TABLE, records[start:start + 50])
+        backend.append_records(SUBJECTIVE_TABLE, subjective)
+    return csv_backend, parquet_backend
+
+
+def snapshot(backend):
+    records = backend.query_records(PERFORMANCE_TABLE)
+    students = sorted({r['student_id'] for r in records})
+    return {
+        'all': records,
+        'count': backend.count_records(PERFORMANCE_TABLE),
+        'student': {s: backend.query_records(PERFORMANCE_TABLE, student_id=s) for s in students + ['missing']},
+        'test_instance': {t: backend.query_records(PERFORMANCE_TABLE, test_instance_id=t)
+                          for t in sorted({r['test_instance_id'] for r in records})},
+        'student_section': {(s, section): backend.query_records(PERFORMANCE_TABLE, student_id=s, gmat_section=section)
+                            for s in students for section in SECTIONS},
+        'subjective': backend.query_records(SUBJECTIVE_TABLE),
+    }
+
+
+def partition_files(backend, table=PERFORMANCE_TABLE):
+    """Partition directory (relative) -> names of its data files."""
+    table_dir = backend._table_dir(table)
+    return {
+        os.path.relpath(partition_dir, table_dir): [os.path.basename(path) for path in backend._data_files(partition_dir)]
+        for partition_dir in backend._partition_dirs(table)
+    }
+
+
+def test_round_trip_returns_the_csv_strings(backends):
+    csv_backend, parquet_backend = backends
+    expected = snapshot(csv_backend)
+
+    assert expected['count'] == 200
+    assert snapshot(parquet_backend) == expected
+    assert list(parquet_backend.iter_records(PERFORMANCE_TABLE)) == expected['all']
+
+
+def test_typed_column_filters_match_the_csv_backend(backends):
+    csv_backend, parquet_backend = backends
+    for filters in ({'is_correct': '1'}, {'is_correct': '0', 'student_id': 's2'}, {'question_position': '5'},
+                    {'question_type': 'REAL'}, {'content_domain': ''}, {'question_position': 'abc'},
+                    {'test_date': '2024-06-15'}):
+        assert parquet_backend.query_records(PERFORMANCE_TABLE, **filters) == \
+            csv_backend.query_records(PERFORMANCE_TABLE, **filters), filters
+
+
+def test_files_are_partitioned_by_section_and_test_month(backends):
+    _, parquet_backend = backends
+    partitions = partition_files(parquet_backend)
+
+    assert set(partitions) <= {os.path.join(f"gmat_section={section}", f"test_month={month}")
+                               for section in SECTIONS for month in ('2024-05', '2024-06', 'unknown')}
+    assert all(name.endswith('.parquet') for names in partitions.values() for name in names)
+
+
+def test_read_frame_returns_typed_columns(backends):
+    _, parquet_backend = backends
+    frame = parquet_backend.read_frame(PERFORMANCE_TABLE, columns=['is_correct', 'question_time_minutes', 'question_type'],
+                                       student_id='s1')
+
+    assert str(frame['is_correct'].dtype) == 'bool'
+    assert str(frame['question_time_minutes'].dtype) == 'float64'
+    assert str(frame['question_type'].dtype) == 'category'
+    assert len(frame) == len(parquet_backend.query_records(PERFORMANCE_TABLE, student_id='s1'))
+
+
+def test_integral_floats_read_back_with_a_decimal(tmp_path):
+    # Documented difference from the CSV backend
+    backend = ParquetStorageBackend(str(tmp_path / 'parquet'))
+    backend.initialize()
+    backend.append_records(PERFORMANCE_TABLE, [{'student_id': 's1', 'test_instance_id': 't1',
+                                                'gmat_section': 'Verbal', 'total_section_time_minutes': 45}])
+
+    assert backend.query_records(PERFORMANCE_TABLE)[0]['total_section_time_minutes'] == '45.0'
+
+
+def test_update_and_delete_rewrite_only_the_partitions_of_the_test_instance(backends):
+    csv_backend, parquet_backend = backends
+    parquet_backend.compact()
+    target = 's1-t0'
+    target_partitions = {
+        os.path.join(f"gmat_section={r['gmat_section']}", f"test_month={r['test_date'][:7]}")
+        for r in parquet_backend.query_records(PERFORMANCE_TABLE, test_instance_id=target)
+    }
+    before = partition_files(parquet_backend)
+
+    for backend in backends:
+        assert backend.update_records(PERFORMANCE_TABLE, target, {'is_correct': 0, 'content_domain': None}) > 0
+    after_update = partition_files(parquet_backend)
+    assert {p for p in before if before[p] != after_update.get(p)} == target_partitions
+    assert snapshot(parquet_backend) == snapshot(csv_backend)
+
+    for backend in backends:
+        assert backend.delete_records(PERFORMANCE_TABLE, target) > 0
+    after_delete = partition_files(parquet_backend)
+    assert {p for p in after_update if after_update[p] != after_delete.get(p)} == target_partitions
+    assert parquet_backend.query_records(PERFORMANCE_TABLE, test_instance_id=target) == []
+    assert snapshot(parquet_backend) == snapshot(csv_backend)
+
+
+def test_update_of_a_partition_column_moves_the_rows(backends):
+    csv_backend, parquet_backend = backends
+    for backend in backends:
+        backend.update_records(PERFORMANCE_TABLE, 's2-t1', {'test_date': '2025-01-03', 'test_instance_id': 's2-t9'})
+
+    moved = parquet_backend.query_records(PERFORMANCE_TABLE, test_instance_id='s2-t9')
+    assert moved and all(r['test_date'] == '2025-01-03' for r in moved)
+    assert {p for p in partition_files(parquet_backend) if p.endswith('test_month=2025-01')} == {
+        os.path.join(f"gmat_section={r['gmat_section']}", 'test_month=2025-01') for r in moved}
+    assert parquet_backend.query_records(PERFORMANCE_TABLE, test_instance_id='s2-t1') == []
+    assert snapshot(parquet_backend) == snapshot(csv_backend)
+
+
+def test_reimported_records_are_duplicates(backends):
+    _, parquet_backend = backends
+    records = performance_records(np.random.default_rng(0))
+    digests = {record_digest(record, PERFORMANCE_TABLE) for record in records}
+
+    assert parquet_backend.find_existing_digests(PERFORMANCE_TABLE, digests) == digests
+    # With the new records given, only their partitions are scanned
+    first = {record_digest(record, PERFORMANCE_TABLE) for record in records[:10]}
+    assert parquet_backend.find_existing_digests(PERFORMANCE_TABLE, first, records=records[:10]) == first
+    # A changed record is new
+    changed = dict(records[0], question_time_minutes=9.99)
+    assert parquet_backend.find_existing_digests(PERFORMANCE_TABLE, {record_digest(changed, PERFORMANCE_TABLE)},
+                                                 records=[changed]) == set()
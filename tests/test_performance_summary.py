@@ -0,0 +1,158 @@
+"""
+The performance summary store is maintained incrementally by the data
+service's add / update / delete functions. After every write its summaries must
+equal the ones rebuilt from scratch from the stored question rows.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gmat_diagnosis_app.services import csv_data_service
+from gmat_diagnosis_app.services.storage import (
+    CSVStorageBackend,
+    PERFORMANCE_TABLE,
+    PerformanceSummaryStore,
+    SQLiteStorageBackend,
+    summarize_records,
+)
+
+SECTIONS = ['Q', 'V', 'DI']
+QUESTION_TYPES = {'Q': ['REAL', 'PURE'], 'V': ['Critical Reasoning', 'Reading Comprehension'],
+                  'DI': ['Data Sufficiency', 'Multi-source reasoning']}
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == 'csv':
+        backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'))
+    else:
+        backend = SQLiteStorageBackend(str(tmp_path / 'gmat.db'))
+    monkeypatch.setattr(csv_data_service, 'GMAT_SUMMARY_DB_FILE', str(tmp_path / 'summary.sqlite3'))
+    monkeypatch.setattr(csv_data_service, '_summary_store', None)
+    monkeypatch.setattr(csv_data_service, '_storage_backend', backend)
+    return backend
+
+
+@pytest.fixture
+def rebuilds(monkeypatch):
+    """Counts full rebuilds, which would hide a wrong incremental update."""
+    calls = []
+    rebuild = PerformanceSummaryStore.rebuild
+
+    def counting_rebuild(self, *args, **kwargs):
+        calls.append(args)
+        return rebuild(self, *args, **kwargs)
+
+    monkeypatch.setattr(PerformanceSummaryStore, 'rebuild', counting_rebuild)
+    return calls
+
+
+def instance_records(rng, student_id, test_instance_id, section, count):
+    test_date = f"2024-0{rng.integers(1, 10)}-1{rng.integers(0, 10)}"
+    return [{
+        'student_id': student_id,
+        'test_instance_id': test_instance_id,
+        'gmat_section': section,
+        'test_date': test_date,
+        'question_id': f"{test_instance_id}-{section}-q{rng.integers(0, 10**9)}",
+        'question_position': position,
+        'question_time_minutes': round(float(rng.uniform(0.3, 5)), 2),
+        'is_correct': int(rng.integers(0, 2)),
+        'question_difficulty': '' if rng.random() < 0.1 else round(float(rng.uniform(1, 5)), 2),
+        'question_type': str(rng.choice(QUESTION_TYPES[section])),
+        'question_fundamental_skill': str(rng.choice(['Rates', 'Algebra', ''])),
+        'content_domain': str(rng.choice(['Math Related', 'Non-Math Related', ''])),
+        'total_section_time_minutes': 45,
+        'max_allowed_section_time_minutes': 45,
+        'total_questions_in_section': count,
+    } for position in range(1, count + 1)]
+
+
+def rounded(summaries):
+    """Sums are accumulated in a different order incrementally, so compare them to 1e-9."""
+    return [dict(summary, time_sum=round(summary['time_sum'], 9), difficulty_sum=round(summary['difficulty_sum'], 9))
+            for summary in summaries]
+
+
+def assert_matches_rebuild(backend):
+    store = csv_data_service.get_summary_store()
+    expected = summarize_records(backend.query_frame(PERFORMANCE_TABLE))
+    assert rounded(store.all_summaries()) == rounded(expected)
+    for student_id in {summary['student_id'] for summary in expected}:
+        assert rounded(csv_data_service.get_student_performance_summaries(student_id)) == \
+            rounded([summary for summary in expected if summary['student_id'] == student_id])
+
+
+def test_add_update_rename_and_delete_match_a_rebuild(backend, rebuilds):
+    rng = np.random.default_rng(0)
+    add = csv_data_service.add_gmat_performance_record
+
+    assert add(instance_records(rng, 's1', 't1', 'Q', 5))
+    assert add(instance_records(rng, 's1', 't1', 'V', 4))
+    assert add(instance_records(rng, 's2', 't2', 'DI', 6))
+    assert_matches_rebuild(backend)
+
+    # More questions of an existing summary (merged into it), through the bulk path
+    extra = pd.DataFrame(instance_records(rng, 's1', 't1', 'Q', 3)).astype(str)
+    assert csv_data_service.add_gmat_performance_frame(extra)['written'] == 3
+    assert_matches_rebuild(backend)
+
+    assert csv_data_service.update_gmat_performance_records('t1', {'is_correct': 1, 'question_difficulty': 4.5})
+    assert_matches_rebuild(backend)
+
+    # Rename to a new test instance, then into an existing one
+    assert csv_data_service.update_gmat_performance_records('t2', {'test_instance_id': 't3'})
+    assert_matches_rebuild(backend)
+    assert add(instance_records(rng, 's1', 't4', 'Q', 2))
+    assert csv_data_service.update_gmat_performance_records('t4', {'test_instance_id': 't1'})
+    assert_matches_rebuild(backend)
+    assert csv_data_service.update_gmat_performance_records('t1', {'test_instance_id': 't1', 'is_correct': 0})
+    assert_matches_rebuild(backend)
+
+    assert csv_data_service.delete_gmat_performance_records('t3')
+    assert_matches_rebuild(backend)
+    assert [summary['test_instance_id'] for summary in csv_data_service.get_summary_store().all_summaries()] == ['t1', 't1']
+    # Only the initial build of the empty store
+    assert len(rebuilds) == 1
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_random_writes_match_a_rebuild(backend, rebuilds, seed):
+    rng = np.random.default_rng(seed)
+    for step in range(25):
+        test_instance_id = f"t{rng.integers(0, 5)}"
+        student_id = f"s{int(test_instance_id[1:]) % 3}"
+        action = rng.choice(['add', 'add_frame', 'update', 'rename', 'section', 'delete'],
+                            p=[0.3, 0.15, 0.2, 0.15, 0.05, 0.15])
+        if action in ('add', 'add_frame'):
+            records = instance_records(rng, student_id, test_instance_id, str(rng.choice(SECTIONS)),
+                                            int(rng.integers(1, 6)))
+            if action == 'add':
+                csv_data_service.add_gmat_performance_record(records)
+            else:
+                csv_data_service.add_gmat_performance_frame(pd.DataFrame(records).astype(str))
+        elif action == 'update':
+            csv_data_service.update_gmat_performance_records(
+                test_instance_id, {'is_correct': int(rng.integers(0, 2)), 'question_type': 'REAL'})
+        elif action == 'rename':
+            csv_data_service.update_gmat_performance_records(
+                test_instance_id, {'test_instance_id': f"t{rng.integers(0, 5)}"})
+        elif action == 'section':
+            csv_data_service.update_gmat_performance_records(test_instance_id, {'gmat_section': 'Q'})
+        else:
+            csv_data_service.delete_gmat_performance_records(test_instance_id)
+        assert_matches_rebuild(backend)
+    assert len(rebuilds) == 1
+
+
+def test_rows_appended_outside_the_service_trigger_a_rebuild(backend):
+    rng = np.random.default_rng(1)
+    csv_data_service.add_gmat_performance_record(instance_records(rng, 's1', 't1', 'Q', 3))
+    assert len(csv_data_service.get_student_performance_summaries('s1')) == 1
+
+    # E.g. another tool appending to the data files
+    backend.append_records(PERFORMANCE_TABLE, instance_records(rng, 's1', 't9', 'V', 2))
+
+    assert [s['test_instance_id'] for s in csv_data_service.get_student_performance_summaries('s1')] == ['t1', 't9']
+    assert_matches_rebuild(backend)
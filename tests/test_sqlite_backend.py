@@ -0,0 +1,169 @@
+"""
+The SQLite backend must return exactly what the CSV backend returns for the
+same rows (the data service does not know which one is active), and
+migrate_storage must carry every table over unchanged.
+"""
+
+import numpy as np
+import pytest
+
+from gmat_diagnosis_app.services.storage import (
+    CSVStorageBackend,
+    PERFORMANCE_TABLE,
+    SQLiteStorageBackend,
+    SUBJECTIVE_TABLE,
+    migrate_storage,
+    record_digest,
+)
+
+SECTIONS = ['Quantitative', 'Verbal', 'Data Insights']
+
+
+def performance_records(rng, count=300):
+    records = []
+    for number in range(count):
+        student = f"s{rng.integers(0, 6)}"
+        records.append({
+            'student_id': student,
+            'test_instance_id': f"{student}-t{rng.integers(0, 4)}",
+            'gmat_section': str(rng.choice(SECTIONS)),
+            'test_date': str(rng.choice(['2024-05-01', '2024-06-15', ''])),
+            'question_id': f"q{number}",
+            'question_position': int(rng.integers(1, 22)),
+            'question_time_minutes': round(float(rng.uniform(0.5, 4)), 2),
+            'is_correct': int(rng.integers(0, 2)),
+            'question_difficulty': None if rng.random() < 0.1 else round(float(rng.normal()), 3),
+            'question_type': str(rng.choice(['REAL', 'Critical Reasoning', 'Multi-source reasoning'])),
+            'question_fundamental_skill': 'Rates/Ratio/Percent, 含逗號',
+            'content_domain': '' if rng.random() < 0.2 else 'Algebra',
+            'record_timestamp': f"2024-07-01T00:00:{number % 60:02d}",
+        })
+    return records
+
+
+def subjective_records(rng, count=20):
+    return [{
+        'student_id': f"s{rng.integers(0, 6)}",
+        'test_instance_id': f"t{number}",
+        'gmat_section': str(rng.choice(SECTIONS)),
+        'subjective_time_pressure': int(rng.integers(0, 2)),
+        'report_collection_timestamp': '2024-07-01T00:00:00',
+    } for number in range(count)]
+
+
+@pytest.fixture
+def backends(tmp_path):
+    rng = np.random.default_rng(0)
+    performance, subjective = performance_records(rng), subjective_records(rng)
+    csv_backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'))
+    sqlite_backend = SQLiteStorageBackend(str(tmp_path / 'gmat.db'))
+    for backend in (csv_backend, sqlite_backend):
+        backend.initialize()
+        # Several appends, like repeated imports
+        for start in range(0, len(performance), 70):
+            backend.append_records(PERFORMANCE_TABLE, performance[start:start + 70])
+        backend.append_records(SUBJECTIVE_TABLE, subjective)
+    return csv_backend, sqlite_backend
+
+
+def lookups(backend):
+    records = backend.query_records(PERFORMANCE_TABLE)
+    students = sorted({r['student_id'] for r in records}) + ['missing']
+    test_instances = sorted({r['test_instance_id'] for r in records}) + ['missing']
+    return {
+        'all': records,
+        'count': backend.count_records(PERFORMANCE_TABLE),
+        'iter': list(backend.iter_records(PERFORMANCE_TABLE)),
+        'student': {s: backend.query_records(PERFORMANCE_TABLE, student_id=s) for s in students},
+        'test_instance': {t: backend.query_records(PERFORMANCE_TABLE, test_instance_id=t) for t in test_instances},
+        'student_section': {(s, section): backend.query_records(PERFORMANCE_TABLE, student_id=s, gmat_section=section)
+                            for s in students for section in SECTIONS},
+        'subjective': backend.query_records(SUBJECTIVE_TABLE),
+        'subjective_student': {s: backend.query_records(SUBJECTIVE_TABLE, student_id=s) for s in students},
+    }
+
+
+def test_lookups_match_the_csv_backend(backends):
+    csv_backend, sqlite_backend = backends
+    expected = lookups(csv_backend)
+
+    assert expected['count'] == 300
+    assert lookups(sqlite_backend) == expected
+    # Values come back as the stored strings
+    first = sqlite_backend.query_records(PERFORMANCE_TABLE)[0]
+    assert all(isinstance(value, str) for value in first.values())
+    assert first['is_correct'] in ('0', '1')
+
+
+def test_lookups_match_after_updates_and_deletes(backends):
+    csv_backend, sqlite_backend = backends
+    for backend in backends:
+        assert backend.update_records(PERFORMANCE_TABLE, 's1-t0', {'is_correct': 0, 'content_domain': None}) > 0
+        backend.update_records(PERFORMANCE_TABLE, 's2-t1', {'test_instance_id': 's2-t9'})
+        backend.delete_records(PERFORMANCE_TABLE, 's3-t2')
+        backend.delete_records(SUBJECTIVE_TABLE, 't4')
+
+    assert lookups(sqlite_backend) == lookups(csv_backend)
+    for name in ('s1-t0', 's2-t1', 's2-t9', 's3-t2', 'missing'):
+        assert (sqlite_backend.update_records(PERFORMANCE_TABLE, name, {})
+                == csv_backend.update_records(PERFORMANCE_TABLE, name, {}))
+        assert (sqlite_backend.delete_records(PERFORMANCE_TABLE, name)
+                == csv_backend.delete_records(PERFORMANCE_TABLE, name))
+    assert lookups(sqlite_backend) == lookups(csv_backend)
+
+
+def test_duplicate_digests_match_the_csv_backend(backends):
+    csv_backend, sqlite_backend = backends
+    for backend in backends:
+        backend.update_records(PERFORMANCE_TABLE, 's2-t1', {'test_instance_id': 's2-t9'})
+    stored = csv_backend.query_records(PERFORMANCE_TABLE)
+    digests = {record_digest(record, PERFORMANCE_TABLE) for record in stored[::7]}
+    digests |= {record_digest(dict(stored[0], question_id='new'), PERFORMANCE_TABLE)}
+
+    found = sqlite_backend.find_existing_digests(PERFORMANCE_TABLE, digests)
+    assert found == csv_backend.find_existing_digests(PERFORMANCE_TABLE, digests)
+    assert len(found) == len(digests) - 1
+
+
+def test_migration_carries_over_counts_and_contents(backends, tmp_path):
+    csv_backend, _ = backends
+    target = SQLiteStorageBackend(str(tmp_path / 'migrated.db'))
+
+    results = migrate_storage(csv_backend, target)
+
+    assert results['tables'] == {
+        PERFORMANCE_TABLE: {'records_copied': 300, 'skipped': False},
+        SUBJECTIVE_TABLE: {'records_copied': 20, 'skipped': False},
+    }
+    assert lookups(target) == lookups(csv_backend)
+    # Digests are migrated with the rows, so re-importing the same data is detected
+    digests = {record_digest(r, PERFORMANCE_TABLE) for r in csv_backend.query_records(PERFORMANCE_TABLE)}
+    assert target.find_existing_digests(PERFORMANCE_TABLE, digests) == digests
+
+
+def test_migration_skips_or_replaces_a_non_empty_target(backends, tmp_path):
+    csv_backend, sqlite_backend = backends
+    target = SQLiteStorageBackend(str(tmp_path / 'migrated.db'))
+    target.initialize()
+    target.append_records(SUBJECTIVE_TABLE, [{'student_id': 'old', 'test_instance_id': 'old'}])
+
+    results = migrate_storage(csv_backend, target)
+    assert results['tables'][SUBJECTIVE_TABLE]['skipped']
+    assert target.query_records(SUBJECTIVE_TABLE) == [{'student_id': 'old', 'test_instance_id': 'old',
+                                                       'gmat_section': '', 'subjective_time_pressure': '',
+                                                       'report_collection_timestamp': ''}]
+    assert target.count_records(PERFORMANCE_TABLE) == 300
+
+    results = migrate_storage(csv_backend, target, overwrite=True)
+    assert results['tables'][SUBJECTIVE_TABLE] == {'records_copied': 20, 'skipped': False}
+    assert lookups(target) == lookups(csv_backend)
+
+
+def test_migration_back_to_csv(backends, tmp_path):
+    _, sqlite_backend = backends
+    target = CSVStorageBackend(str(tmp_path / 'back' / 'performance.csv'), str(tmp_path / 'back' / 'subjective.csv'))
+    (tmp_path / 'back').mkdir()
+
+    migrate_storage(sqlite_backend, target)
+
+    assert lookups(target) == lookups(sqlite_backend)
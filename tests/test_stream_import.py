@@ -0,0 +1,170 @@
+"""
+The streaming GMAT performance importer reads, validates and writes the import
+file in chunks of IMPORT_CHUNK_SIZE rows. With a small chunk size, test
+instances span several chunks; the result must be the same as one import of
+the whole file, with errors reported per chunk and a re-import adding nothing.
+"""
+
+import csv
+
+import pytest
+
+from gmat_diagnosis_app.services import csv_batch_processor, csv_data_service
+from gmat_diagnosis_app.services.storage import (
+    CSVStorageBackend,
+    GMAT_PERFORMANCE_HEADERS,
+    PERFORMANCE_TABLE,
+    SQLiteStorageBackend,
+    summarize_records,
+)
+
+IMPORT_HEADERS = [h for h in GMAT_PERFORMANCE_HEADERS if h != 'record_timestamp']
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def backend(request, tmp_path, monkeypatch):
+    if request.param == 'csv':
+        backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'))
+    else:
+        backend = SQLiteStorageBackend(str(tmp_path / 'gmat.db'))
+    monkeypatch.setattr(csv_data_service, 'GMAT_SUMMARY_DB_FILE', str(tmp_path / 'summary.sqlite3'))
+    monkeypatch.setattr(csv_data_service, '_summary_store', None)
+    monkeypatch.setattr(csv_data_service, '_storage_backend', backend)
+    monkeypatch.setattr(csv_batch_processor, 'IMPORT_CHUNK_SIZE', 4)
+    return backend
+
+
+def import_row(test_instance_id, position, student_id='s1', section='Q', **values):
+    row = {
+        'student_id': student_id,
+        'test_instance_id': test_instance_id,
+        'gmat_section': section,
+        'test_date': '2024-05-01',
+        'question_id': f"{test_instance_id}-q{position}",
+        'question_position': str(position),
+        'question_time_minutes': f"{1 + position / 10}",
+        'is_correct': str(position % 2),
+        'question_difficulty': f"{position / 4}",
+        'question_type': 'REAL',
+        'question_fundamental_skill': 'Rates',
+        'content_domain': 'Algebra',
+        'total_section_time_minutes': '45',
+        'max_allowed_section_time_minutes': '45',
+        'total_questions_in_section': '21',
+    }
+    row.update(values)
+    return row
+
+
+# Chunks of 4 rows: [tA 1-3, tB 1], [tB 2-4, tB 5 invalid], [tB 6, tC 1, tC 2 bad date, copy of tA 1];
+# the copy must be skipped by the digest index, as the first chunk already wrote it
+IMPORT_ROWS = (
+    [import_row('tA', position) for position in (1, 2, 3)]
+    + [import_row('tB', position, student_id='s2', section='V') for position in (1, 2, 3, 4)]
+    + [import_row('tB', 5, student_id='s2', section='V', is_correct='2')]
+    + [import_row('tB', 6, student_id='s2', section='V'), import_row('tC', 1),
+       import_row('tC', 2, test_date='2024/05/02')]
+    + [import_row('tA', 1)]
+)
+VALID_ROWS = [row for row in IMPORT_ROWS[:-1] if row['is_correct'] != '2' and row['test_date'] != '2024/05/02']
+
+
+@pytest.fixture
+def import_file(tmp_path):
+    path = tmp_path / 'import.csv'
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=IMPORT_HEADERS)
+        writer.writeheader()
+        writer.writerows(IMPORT_ROWS)
+    return str(path)
+
+
+def stored_rows(backend):
+    return [{header: record[header] for header in IMPORT_HEADERS}
+            for record in backend.query_records(PERFORMANCE_TABLE)]
+
+
+def test_chunks_give_the_same_records_as_one_import(backend, import_file):
+    result = csv_batch_processor.batch_import_gmat_performance_data(import_file)
+
+    assert [chunk['rows'] for chunk in result['chunks']] == [4, 4, 4]
+    assert stored_rows(backend) == VALID_ROWS
+    assert result['records_written'] == 9
+    assert result['records_duplicate'] == 1
+    assert result['records_failed'] == 2
+    assert not result['success']
+    assert result['test_instances_processed'] == 3
+    # tB was written by three chunks and has one summary with all its valid questions
+    summaries = csv_data_service.get_student_performance_summaries('s2')
+    assert [(s['test_instance_id'], s['total_questions']) for s in summaries] == [('tB', 5)]
+    assert csv_data_service.get_summary_store().all_summaries() == \
+        summarize_records(backend.query_frame(PERFORMANCE_TABLE))
+
+
+def test_errors_are_reported_per_chunk_with_their_line(backend, import_file):
+    reports = []
+    result = csv_batch_processor.stream_import_gmat_performance_data(import_file, progress_callback=reports.append)
+
+    assert reports == result['chunks']
+    assert [(r['chunk'], r['imported'], r['duplicates'], r['invalid']) for r in reports] == [
+        (1, 4, 0, 0), (2, 3, 0, 1), (3, 2, 1, 1),
+    ]
+    assert reports[0]['errors'] == []
+    assert reports[1]['errors'] == ["Line 9: Invalid value for is_correct. Must be 0 or 1."]
+    assert reports[2]['errors'] == ["Line 12: Invalid test_date format. Must be in YYYY-MM-DD format."]
+
+
+def test_error_messages_are_capped_per_chunk(backend, tmp_path, monkeypatch):
+    monkeypatch.setattr(csv_batch_processor, 'IMPORT_ERRORS_PER_CHUNK', 2)
+    path = tmp_path / 'invalid.csv'
+    with open(path, 'w', newline='') as csv_file:
+        writer = csv.DictWriter(csv_file, fieldnames=IMPORT_HEADERS)
+        writer.writeheader()
+        writer.writerows(import_row('tX', position, is_correct='x') for position in range(1, 7))
+
+    result = csv_batch_processor.stream_import_gmat_performance_data(str(path), progress_callback=lambda report: None)
+
+    assert [(r['invalid'], len(r['errors'])) for r in result['chunks']] == [(4, 2), (2, 2)]
+    assert result['records_failed'] == 6
+    assert backend.count_records(PERFORMANCE_TABLE) == 0
+
+
+def test_reimport_adds_no_rows(backend, import_file):
+    csv_batch_processor.batch_import_gmat_performance_data(import_file)
+    summaries = csv_data_service.get_summary_store().all_summaries()
+
+    result = csv_batch_processor.batch_import_gmat_performance_data(import_file)
+
+    assert result['records_written'] == 0
+    assert result['records_duplicate'] == 10
+    assert [chunk['imported'] for chunk in result['chunks']] == [0, 0, 0]
+    assert stored_rows(backend) == VALID_ROWS
+    assert csv_data_service.get_summary_store().all_summaries() == summaries
+
+
+def test_failed_chunk_write_is_reported_and_recovered_by_a_reimport(backend, import_file, monkeypatch):
+    add_frame = csv_batch_processor.add_gmat_performance_frame
+    calls = []
+
+    def failing_second_chunk(frame):
+        calls.append(len(frame))
+        if len(calls) == 2:
+            raise OSError("disk full")
+        return add_frame(frame)
+
+    monkeypatch.setattr(csv_batch_processor, 'add_gmat_performance_frame', failing_second_chunk)
+    result = csv_batch_processor.stream_import_gmat_performance_data(import_file, progress_callback=lambda report: None)
+
+    second = result['chunks'][1]
+    assert second['failed'] == 3 and second['imported'] == 0
+    assert second['errors'][-1] == "Error writing chunk: disk full"
+    # The other chunks are still written
+    assert [chunk['imported'] for chunk in result['chunks']] == [4, 0, 2]
+    assert result['records_failed'] == 5
+
+    monkeypatch.setattr(csv_batch_processor, 'add_gmat_performance_frame', add_frame)
+    result = csv_batch_processor.stream_import_gmat_performance_data(import_file, progress_callback=lambda report: None)
+    assert result['records_written'] == 3
+    # The retried chunk is appended after the others
+    question = lambda row: (row['test_instance_id'], int(row['question_position']))
+    assert sorted(stored_rows(backend), key=question) == sorted(VALID_ROWS, key=question)
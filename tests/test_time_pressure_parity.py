@@ -0,0 +1,191 @@
+"""
+Parity of the vectorized calculate_and_apply_invalid_logic with the per-row loop
+it replaced. The loop is kept below as a frozen reference and both are run on
+seeded random frames (shuffled rows, missing times and group ids, manual flags).
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from gmat_diagnosis_app.analysis_helpers.time_pressure_analyzer import calculate_and_apply_invalid_logic
+from gmat_diagnosis_app.constants.thresholds import THRESHOLDS
+
+QUESTION_TYPES = {
+    'Q': ['REAL', 'PURE'],
+    'V': ['Critical Reasoning', 'Reading Comprehension'],
+    'DI': ['MSR', 'Data Sufficiency', 'GT'],
+}
+SECTION_LENGTHS = {'Q': 21, 'V': 23, 'DI': 20}
+
+
+def reference_calculate_and_apply_invalid_logic(df_input, time_pressure_map_param, subject_thresholds_param):
+    """Frozen copy of the per-row implementation (before the vectorized rewrite)."""
+    df_output = df_input.copy(deep=False)
+    if 'is_invalid' not in df_output.columns:
+        df_output['is_invalid'] = False
+    else:
+        df_output['is_invalid'] = df_output['is_invalid'].replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False).astype(bool)
+
+    calculated_avg_times = {}
+    calculated_ft_avg_times = {}
+
+    for subject_code, is_pressure in time_pressure_map_param.items():
+        subj_df_mask = df_output['Subject'] == subject_code
+        if not subj_df_mask.any():
+            calculated_avg_times[subject_code] = {}
+            calculated_ft_avg_times[subject_code] = {}
+            continue
+
+        current_subj_df = df_output[subj_df_mask]
+        current_subj_df['question_time'] = pd.to_numeric(current_subj_df['question_time'], errors='coerce')
+        current_subj_df['question_position'] = pd.to_numeric(current_subj_df['question_position'], errors='coerce')
+        current_subj_df = current_subj_df.sort_values('question_position').reset_index(drop=True)
+
+        avg_time_per_type = {}
+        if not current_subj_df.empty:
+            avg_time_per_type = current_subj_df.groupby('question_type')['question_time'].mean().to_dict()
+        calculated_avg_times[subject_code] = avg_time_per_type
+
+        total_questions_subj = len(current_subj_df)
+        first_third_q_count = 0
+        if total_questions_subj > 0:
+            first_third_q_count = int(total_questions_subj / 3)
+
+        first_third_df = current_subj_df.head(first_third_q_count)
+        ft_avg_time = {}
+        if not first_third_df.empty:
+            ft_avg_time = first_third_df.groupby('question_type')['question_time'].mean().to_dict()
+        calculated_ft_avg_times[subject_code] = ft_avg_time
+
+        if is_pressure and total_questions_subj > 0:
+            last_third_fraction = subject_thresholds_param.get(subject_code, {}).get('LAST_THIRD_FRACTION', subject_thresholds_param['Q']['LAST_THIRD_FRACTION'])
+            last_third_start_index = int(total_questions_subj * last_third_fraction)
+
+            original_indices_to_check = df_output[subj_df_mask].iloc[last_third_start_index:].index
+
+            for original_idx in original_indices_to_check:
+                row = df_output.loc[original_idx]
+                q_time = pd.to_numeric(row['question_time'], errors='coerce')
+                q_type = row['question_type']
+
+                ft_avg_time_for_q_type = ft_avg_time.get(q_type, np.nan)
+                is_abnormally_fast = False
+
+                if subject_code == 'Q':
+                    if pd.notna(q_time) and q_time < 0.5:
+                        is_abnormally_fast = True
+                    if not is_abnormally_fast and pd.notna(q_time) and q_time < 1.0:
+                        is_abnormally_fast = True
+                    if not is_abnormally_fast and pd.notna(q_time) and pd.notna(ft_avg_time_for_q_type) and ft_avg_time_for_q_type > 0:
+                        if q_time < (ft_avg_time_for_q_type * 0.5):
+                            is_abnormally_fast = True
+                    if is_abnormally_fast and not df_output.loc[original_idx, 'is_invalid']:
+                        df_output.loc[original_idx, 'is_invalid'] = True
+                else:
+                    if pd.notna(q_time) and q_time < 0.5:
+                        is_abnormally_fast = True
+                    if not is_abnormally_fast and pd.notna(q_time) and q_time < 1.0:
+                        is_abnormally_fast = True
+                    if not is_abnormally_fast and pd.notna(q_time) and pd.notna(ft_avg_time_for_q_type) and ft_avg_time_for_q_type > 0:
+                        if q_time < (ft_avg_time_for_q_type * 0.5):
+                            is_abnormally_fast = True
+
+                    if not is_abnormally_fast and subject_code == 'V' and q_type == 'Reading Comprehension':
+                        rc_group_id_val = row.get('rc_group_id')
+                        if pd.notna(rc_group_id_val):
+                            current_rc_group_df = df_output[df_output['rc_group_id'] == rc_group_id_val]
+                            group_total_time = pd.to_numeric(current_rc_group_df['question_time'], errors='coerce').sum()
+                            num_q_in_group = len(current_rc_group_df)
+                            ft_avg_rc_time_v = ft_avg_time.get('Reading Comprehension', np.nan)
+                            if pd.notna(ft_avg_rc_time_v) and ft_avg_rc_time_v > 0 and num_q_in_group > 0:
+                                if group_total_time < (ft_avg_rc_time_v * num_q_in_group * 0.5):
+                                    for g_idx in current_rc_group_df.index:
+                                        if g_idx in original_indices_to_check:
+                                            df_output.loc[g_idx, 'is_invalid'] = True
+                                    is_abnormally_fast = True
+
+                    elif not is_abnormally_fast and subject_code == 'DI' and q_type == 'MSR':
+                        msr_group_id_val = row.get('msr_group_id')
+                        if pd.notna(msr_group_id_val):
+                            current_msr_group_df = df_output[df_output['msr_group_id'] == msr_group_id_val]
+                            group_total_time_msr = pd.to_numeric(current_msr_group_df['question_time'], errors='coerce').sum()
+                            num_q_in_msr_group = len(current_msr_group_df)
+                            ft_avg_msr_time_di = ft_avg_time.get('MSR', np.nan)
+                            if pd.notna(ft_avg_msr_time_di) and ft_avg_msr_time_di > 0 and num_q_in_msr_group > 0:
+                                if group_total_time_msr < (ft_avg_msr_time_di * num_q_in_msr_group * 0.5):
+                                    for g_idx in current_msr_group_df.index:
+                                        if g_idx in original_indices_to_check:
+                                            df_output.loc[g_idx, 'is_invalid'] = True
+                                    is_abnormally_fast = True
+
+                    if is_abnormally_fast and not df_output.loc[original_idx, 'is_invalid']:
+                        df_output.loc[original_idx, 'is_invalid'] = True
+
+    if 'is_manually_invalid' in df_output.columns:
+        df_output['is_manually_invalid'] = df_output['is_manually_invalid'].replace({pd.NA: False, None: False, np.nan: False}).infer_objects(copy=False).astype(bool)
+        df_output['is_invalid'] = df_output['is_invalid'] | df_output['is_manually_invalid']
+
+    return df_output, calculated_avg_times, calculated_ft_avg_times
+
+
+def random_frame(rng, seed):
+    rows = []
+    for subject, length in SECTION_LENGTHS.items():
+        if rng.random() < 0.2:
+            continue
+        for position in range(1, length + 1):
+            question_type = rng.choice(QUESTION_TYPES[subject])
+            if rng.random() < 0.1:
+                question_time = float(rng.choice([rng.uniform(0.2, 4), np.nan]))
+            else:
+                question_time = round(float(rng.uniform(0.2, 4)), 2)
+            rows.append({
+                'Subject': subject,
+                'question_position': position,
+                'question_type': question_type,
+                'question_time': question_time,
+                'rc_group_id': f"rc{rng.integers(0, 4)}" if question_type == 'Reading Comprehension' and rng.random() < 0.9 else None,
+                'msr_group_id': f"m{rng.integers(0, 3)}" if question_type == 'MSR' and rng.random() < 0.9 else None,
+                'is_manually_invalid': bool(rng.random() < 0.05),
+            })
+    df = pd.DataFrame(rows, columns=['Subject', 'question_position', 'question_type', 'question_time',
+                                     'rc_group_id', 'msr_group_id', 'is_manually_invalid'])
+    if rng.random() < 0.3:
+        df = df.sample(frac=1, random_state=seed)
+    if rng.random() < 0.2:
+        df = df.drop(columns=['rc_group_id'])
+    return df
+
+
+@pytest.mark.parametrize("seed", range(10))
+def test_matches_reference_loop(seed):
+    rng = np.random.default_rng(seed)
+    for _ in range(20):
+        df = random_frame(rng, seed)
+        time_pressure_map = {subject: bool(rng.random() < 0.7) for subject in ('Q', 'V', 'DI')}
+
+        expected = reference_calculate_and_apply_invalid_logic(df, time_pressure_map, THRESHOLDS)
+        result = calculate_and_apply_invalid_logic(df, time_pressure_map, THRESHOLDS)
+
+        pd.testing.assert_series_equal(result[0]['is_invalid'], expected[0]['is_invalid'])
+        # NaN averages compare unequal inside dicts, so compare the rendered dicts
+        assert repr(result[1:]) == repr(expected[1:])
+
+
+def test_group_at_the_boundary_is_not_fast():
+    # First third of V: RC questions of 2.0 minutes; the RC group at the end takes
+    # exactly half of that per question, which is not below the limit
+    rows = [{'Subject': 'V', 'question_position': position, 'question_type': 'Reading Comprehension',
+             'question_time': 2.0, 'rc_group_id': 'rc0'} for position in range(1, 7)]
+    rows += [{'Subject': 'V', 'question_position': position, 'question_type': 'Critical Reasoning',
+              'question_time': 2.0, 'rc_group_id': None} for position in range(7, 10)]
+    rows += [{'Subject': 'V', 'question_position': position, 'question_type': 'Reading Comprehension',
+              'question_time': time, 'rc_group_id': 'rc1'} for position, time in zip(range(10, 13), (1.0, 1.0, 1.0))]
+    df = pd.DataFrame(rows)
+
+    result, _, _ = calculate_and_apply_invalid_logic(df, {'V': True}, THRESHOLDS)
+    expected, _, _ = reference_calculate_and_apply_invalid_logic(df, {'V': True}, THRESHOLDS)
+
+    assert not result['is_invalid'].iloc[-3:].any()
+    pd.testing.assert_series_equal(result['is_invalid'], expected['is_invalid'])
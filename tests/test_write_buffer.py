@@ -0,0 +1,183 @@
+"""
+WriteBehindBuffer (batching, flush triggers, failed flushes) and the fsync
+policies of the CSV backend.
+"""
+
+import os
+import threading
+import time
+
+import pytest
+
+from gmat_diagnosis_app.services.storage import CSVStorageBackend, PERFORMANCE_TABLE, WriteBehindBuffer
+
+WAIT_TIMEOUT = 10
+
+
+class RecordingWriter:
+    """write_rows stand-in that records batches and can fail on demand."""
+
+    def __init__(self, failures=0):
+        self.batches = []
+        self.failures = failures
+        self.written = threading.Event()
+
+    def __call__(self, table, rows):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk full")
+        self.batches.append((table, [row['id'] for row in rows]))
+        self.written.set()
+
+    def ids(self, table='t'):
+        return [row_id for name, ids in self.batches if name == table for row_id in ids]
+
+
+def rows(*ids):
+    return [{'id': row_id} for row_id in ids]
+
+
+def test_flushes_when_batch_size_rows_are_queued():
+    writer = RecordingWriter()
+    buffer = WriteBehindBuffer(writer, batch_size=3, flush_interval=60)
+    try:
+        buffer.add('t', rows(1, 2))
+        assert not writer.written.wait(0.3)
+        assert buffer.pending('t') == rows(1, 2)
+
+        buffer.add('t', rows(3))
+        assert writer.written.wait(WAIT_TIMEOUT)
+        assert writer.ids() == [1, 2, 3]
+        assert buffer.pending('t') == []
+    finally:
+        buffer.close()
+
+
+def test_flushes_after_flush_interval():
+    writer = RecordingWriter()
+    buffer = WriteBehindBuffer(writer, batch_size=100, flush_interval=0.05)
+    try:
+        buffer.add('t', rows(1))
+        assert writer.written.wait(WAIT_TIMEOUT)
+        assert writer.ids() == [1]
+    finally:
+        buffer.close()
+
+
+def test_close_writes_everything_still_queued_and_stops_the_thread():
+    writer = RecordingWriter()
+    buffer = WriteBehindBuffer(writer, batch_size=100, flush_interval=60)
+    buffer.add('t', rows(1, 2))
+    buffer.add('u', rows(3))
+
+    buffer.close()
+
+    assert writer.ids('t') == [1, 2]
+    assert writer.ids('u') == [3]
+    assert not buffer._thread.is_alive()
+
+
+def test_flush_writes_only_the_given_table():
+    writer = RecordingWriter()
+    buffer = WriteBehindBuffer(writer, batch_size=100, flush_interval=60)
+    try:
+        buffer.add('t', rows(1))
+        buffer.add('u', rows(2))
+        buffer.flush('t')
+        assert writer.batches == [('t', [1])]
+        assert buffer.pending('u') == rows(2)
+    finally:
+        buffer.close()
+
+
+def test_failed_flush_puts_its_rows_back_in_order():
+    writer = RecordingWriter(failures=1)
+    buffer = WriteBehindBuffer(writer, batch_size=100, flush_interval=60)
+    try:
+        buffer.add('t', rows(1, 2))
+        with pytest.raises(OSError):
+            buffer.flush()
+        assert buffer.pending('t') == rows(1, 2)
+        assert buffer.stats['errors'] == 1
+
+        buffer.add('t', rows(3))
+        buffer.flush()
+        assert writer.ids() == [1, 2, 3]
+    finally:
+        buffer.close()
+
+
+def wait_for_flush_error(buffer):
+    deadline = time.monotonic() + WAIT_TIMEOUT
+    while buffer._flush_error is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert buffer._flush_error is not None
+
+
+def test_failed_background_flush_is_raised_to_the_next_caller():
+    writer = RecordingWriter(failures=1_000_000)
+    buffer = WriteBehindBuffer(writer, batch_size=1, flush_interval=0.05)
+    try:
+        buffer.add('t', rows(1))
+        wait_for_flush_error(buffer)
+
+        with pytest.raises(RuntimeError, match="still queued"):
+            buffer.add('t', rows(2))
+        # The failed rows are still queued; the rejected ones were never added
+        assert buffer.pending('t') == rows(1)
+
+        writer.failures = 0
+        buffer.flush()
+        assert writer.ids() == [1]
+    finally:
+        buffer.close()
+
+
+def test_background_thread_waits_between_retries_of_a_failing_flush():
+    writer = RecordingWriter(failures=1_000_000)
+    buffer = WriteBehindBuffer(writer, batch_size=1, flush_interval=0.1)
+    try:
+        buffer.add('t', rows(1))
+        time.sleep(0.5)
+        # Roughly one attempt per flush_interval, not a busy loop
+        assert 1 <= buffer.stats['errors'] <= 10
+    finally:
+        writer.failures = 0
+        buffer.close()
+    assert writer.ids() == [1]
+
+
+def performance_record(test_instance_id, position):
+    return {'student_id': 's1', 'test_instance_id': test_instance_id, 'gmat_section': 'Quantitative',
+            'question_position': position, 'is_correct': 1}
+
+
+@pytest.mark.parametrize("policy, expected_fsyncs", [
+    # append, update (change log), compaction
+    ("always", (1, 1, 1)),
+    ("batch", (1, 0, 1)),
+    ("never", (0, 0, 0)),
+])
+def test_fsync_policy(tmp_path, monkeypatch, policy, expected_fsyncs):
+    backend = CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'),
+                                compaction_threshold=0, fsync_policy=policy)
+    backend.initialize()
+    fsyncs = []
+    monkeypatch.setattr(os, 'fsync', lambda fd: fsyncs.append(fd))
+
+    counts = []
+    backend.append_records(PERFORMANCE_TABLE, [performance_record('t1', 1), performance_record('t1', 2)])
+    counts.append(len(fsyncs))
+    backend.update_records(PERFORMANCE_TABLE, 't1', {'is_correct': 0})
+    counts.append(len(fsyncs) - sum(counts))
+    backend.compact(PERFORMANCE_TABLE)
+    counts.append(len(fsyncs) - sum(counts))
+
+    assert tuple(counts) == expected_fsyncs
+    assert [record['is_correct'] for record in backend.query_records(PERFORMANCE_TABLE)] == ['0', '0']
+
+
+def test_unknown_fsync_policy_is_rejected(tmp_path):
+    with pytest.raises(ValueError, match="fsync policy"):
+        CSVStorageBackend(str(tmp_path / 'performance.csv'), str(tmp_path / 'subjective.csv'),
+                          fsync_policy="sometimes")